@@ -53,8 +53,9 @@ module.exports = {
     },
     {
       name: "rag-api",
-      script: "rag_py/api.py",
-      interpreter: "python3",
+      script: "python3",
+      args: "-m rag_py",
+      interpreter: "none",
       env: {
         PYTHONPATH: "/root/call-plugin-backend"
       },
@@ -82,6 +82,9 @@ const knowledgeSourceSchema = new mongoose.Schema({
     type: Boolean,
     default: false,
   },
+  lastTrainingJobId: {
+    type: String,
+  },
   workspace: {
     type: mongoose.Schema.Types.ObjectId,
     ref: "Workspace",
@@ -0,0 +1,32 @@
+"""
+Start the RAG API with uvicorn: python -m rag_py
+
+Processes the API spawns (uvicorn workers and reloader, shard search and
+document parser workers) re-import the script that started the server, with
+all of api.py's module-level setup if that script is api.py. A package's
+__main__ module is never re-imported, so this is the way to start the API.
+"""
+import os
+
+import uvicorn
+
+# Directory of this package; kept importable as when api.py is run as a script (crawler's "from storage import")
+_package_directory = os.path.dirname(os.path.abspath(__file__))
+
+
+def main() -> None:
+    """Serve rag_py.api:app on port 4003 with RAG_API_WORKERS worker processes, or with auto-reload if just one."""
+    api_workers = int(os.getenv("RAG_API_WORKERS") or 1)
+    uvicorn.run(
+        "rag_py.api:app",
+        host="0.0.0.0",
+        port=4003,
+        # Reload is not supported with several workers
+        workers=api_workers if api_workers > 1 else None,
+        reload=api_workers == 1,
+        app_dir=_package_directory
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+import json
+import logging
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import faiss
+import numpy as np
+
+from rag_py.vector_index import INDEX_HNSW, INDEX_IVF_PQ, apply_search_params, shard_indexes
+
+logger = logging.getLogger(__name__)
+
+# Per-KB report of the last tuning run
+TUNING_REPORT_FILENAME = "tuning_report.json"
+
+# Candidate values, in increasing cost order
+EF_SEARCH_SWEEP = [16, 24, 32, 48, 64, 96, 128, 192, 256, 384, 512]
+NPROBE_SWEEP = [1, 2, 4, 8, 12, 16, 24, 32, 48, 64, 96, 128, 256]
+
+
+def _neighbours_excluding_self(ids: np.ndarray, probe_ids: np.ndarray, k: int) -> List[List[int]]:
+    """Drop each probe's own ID from its results and keep the first k."""
+    return [
+        [int(i) for i in row if i != probe_id and i != -1][:k]
+        for row, probe_id in zip(ids, probe_ids)
+    ]
+
+
+def tune_search_params(
+    index: faiss.Index,
+    vectors: np.ndarray,
+    index_type: str,
+    config: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Sweep an approximate index's search parameter and pick the cheapest
+    setting that meets the recall floor and latency ceiling.
+
+    A sample of the corpus' own chunk embeddings serves as probe queries. Each
+    probe is held out of its own results, and recall@k is measured against
+    exact (flat) search over the same vectors. Latency is timed per single
+    query, the way queries are served.
+
+    Args:
+        index: Populated FAISS index whose IDs are row positions in vectors
+        vectors: float32 array of the indexed vectors
+        index_type: INDEX_HNSW or INDEX_IVF_PQ
+        config: Train config with optional keys ann_recall_target (default 0.95),
+            ann_latency_ceiling_ms (default 10), ann_tuning_k (default 4) and
+            ann_probe_queries (default 200)
+
+    Returns:
+        The tuning report; its "selected" entry holds the chosen search parameters
+    """
+    recall_target = config.get("ann_recall_target", 0.95)
+    latency_ceiling_ms = config.get("ann_latency_ceiling_ms", 10.0)
+    k = config.get("ann_tuning_k", 4)
+    num_probes = min(config.get("ann_probe_queries", 200), len(vectors))
+
+    if index_type == INDEX_HNSW:
+        parameter, sweep = "efSearch", EF_SEARCH_SWEEP
+    elif index_type == INDEX_IVF_PQ:
+        nlist = faiss.extract_index_ivf(shard_indexes(index)[0]).nlist
+        parameter, sweep = "nprobe", [value for value in NPROBE_SWEEP if value <= nlist]
+    else:
+        raise ValueError(f"Index type {index_type} has no search parameters to tune")
+
+    rng = np.random.default_rng(0)
+    probe_ids = np.sort(rng.choice(len(vectors), num_probes, replace=False))
+    probes = vectors[probe_ids]
+
+    exact_index = faiss.IndexFlatL2(vectors.shape[1])
+    exact_index.add(vectors)
+    _, exact_ids = exact_index.search(probes, k + 1)
+    ground_truth = _neighbours_excluding_self(exact_ids, probe_ids, k)
+
+    results = []
+    for value in sweep:
+        apply_search_params(index, {parameter: value})
+        latencies = []
+        hits = 0
+        expected = 0
+        for probe, probe_id, truth in zip(probes, probe_ids, ground_truth):
+            started_at = time.perf_counter()
+            _, ids = index.search(probe.reshape(1, -1), k + 1)
+            latencies.append((time.perf_counter() - started_at) * 1000)
+            found = _neighbours_excluding_self(ids, [probe_id], k)[0]
+            hits += len(set(found) & set(truth))
+            expected += len(truth)
+        results.append({
+            parameter: value,
+            "recall": round(hits / expected, 4) if expected else 1.0,
+            "p95_latency_ms": round(float(np.percentile(latencies, 95)), 4)
+        })
+
+    selected = _select(results, recall_target, latency_ceiling_ms)
+    target_met = selected["recall"] >= recall_target and selected["p95_latency_ms"] <= latency_ceiling_ms
+    if not target_met:
+        logger.warning(
+            f"No {parameter} setting met recall >= {recall_target} within {latency_ceiling_ms} ms; "
+            f"using {parameter}={selected[parameter]} (recall {selected['recall']}, p95 {selected['p95_latency_ms']} ms)"
+        )
+    apply_search_params(index, {parameter: selected[parameter]})
+
+    return {
+        "index_type": index_type,
+        "parameter": parameter,
+        "num_vectors": int(len(vectors)),
+        "probe_queries": int(num_probes),
+        "k": k,
+        "recall_target": recall_target,
+        "latency_ceiling_ms": latency_ceiling_ms,
+        "target_met": target_met,
+        "selected": {parameter: selected[parameter]},
+        "selected_measurements": selected,
+        "sweep": results,
+        "tuned_at": datetime.utcnow().isoformat()
+    }
+
+
+def _select(results: List[Dict[str, Any]], recall_target: float, latency_ceiling_ms: float) -> Dict[str, Any]:
+    """Pick the cheapest result meeting both targets, else the best recall within budget."""
+    for result in results:
+        if result["recall"] >= recall_target and result["p95_latency_ms"] <= latency_ceiling_ms:
+            return result
+    within_latency = [result for result in results if result["p95_latency_ms"] <= latency_ceiling_ms]
+    candidates = within_latency or results
+    return max(candidates, key=lambda result: result["recall"])
+
+
+def write_tuning_report(vector_store_path: Path, report: Dict[str, Any]) -> None:
+    """Write the tuning report for a vector store directory."""
+    with open(Path(vector_store_path) / TUNING_REPORT_FILENAME, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+
+
+def read_tuning_report(vector_store_path: Path) -> Optional[Dict[str, Any]]:
+    """Read the tuning report for a vector store directory, or None if it has none."""
+    report_path = Path(vector_store_path) / TUNING_REPORT_FILENAME
+    if not report_path.exists():
+        return None
+    with open(report_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
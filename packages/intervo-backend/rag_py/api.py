@@ -8,13 +8,41 @@ _parent_directory = os.path.dirname(_current_file_directory)
 if _parent_directory not in sys.path:
     sys.path.insert(0, _parent_directory)
 
+if __name__ == "__main__":
+    # Run as a script: serve before this process runs the setup below. Processes the
+    # server spawns still re-import this script as __mp_main__; "python -m rag_py" avoids that.
+    from rag_py.__main__ import main
+    main()
+    sys.exit(0)
+
 from fastapi import FastAPI, HTTPException, UploadFile, File, Form
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
-import uvicorn
+from typing import Callable, List, Dict, Any, Optional, Set, Tuple
 from rag_py.rag_service import RagTrainer, RagQuery # Absolute import
+from rag_py.query_executor import get_query_executor # Absolute import
+from rag_py.singleflight import SingleFlight # Absolute import
+from rag_py.embedding_batcher import get_embedding_batcher_stats # Absolute import
+from rag_py.prompt_layout import KB_SUMMARY_FILENAME, prompt_cache_stats # Absolute import
+from rag_py.ann_tuner import read_tuning_report # Absolute import
+from rag_py.chunk_store import iter_docstore # Absolute import
+from rag_py.embedding_compression import read_compression_report # Absolute import
+from rag_py.chunk_store import CHUNK_STORE_FILENAME # Absolute import
+from rag_py.vector_index import INDEX_FILENAME, LOAD_MODE_MMAP, can_mmap_all_index_types, has_faiss_index, read_manifest, write_manifest # Absolute import
+from rag_py.shard_search import get_shard_search_pool, shard_search_pool_started # Absolute import
+from rag_py.tenant_index import SHARED_DIRNAME, STORAGE_DEDICATED, STORAGE_SHARED, TenantIndex # Absolute import
+from rag_py.store_versions import collect_garbage, create_version, current_version, current_version_path, discard_version, publish_version # Absolute import
+from rag_py.index_sync import INDEX_SYNC_OFF, INDEX_SYNC_S3, IndexSync # Absolute import
+from rag_py.embedding_cache import embedding_cache_started, get_embedding_cache # Absolute import
+from rag_py.source_tracking import SOURCE_ID_FIELD, make_source_id # Absolute import
+from rag_py.enhancement_cache import enhancement_cache_started, get_enhancement_cache # Absolute import
+from rag_py.llm_scheduler import get_llm_scheduler_stats # Absolute import
+from rag_py.document_parser import document_parser_started, get_document_parser # Absolute import
+from rag_py.training_jobs import JOB_KIND_UPDATE_INDEX, JOBS_DIRNAME, STAGE_EMBEDDING, STAGE_ENHANCING, STAGE_LOADING_DOCUMENTS, STAGE_SAVING, TrainingJob, TrainingJobQueue # Absolute import
+from langchain_core.documents import Document as LangChainDocument
 import asyncio
 import logging
+import time
+from collections import defaultdict
 from contextlib import asynccontextmanager
 from pathlib import Path
 import shutil
@@ -22,14 +50,9 @@ from rag_py.storage import S3Storage, DocumentType # Absolute import
 import json
 from datetime import datetime
 from rag_py.crawler import WebCrawler # Absolute import
-import mammoth
-import pdfplumber
-import io
-from bs4 import BeautifulSoup
-from langchain_community.vectorstores import FAISS # Added import for FAISS
 
 # Import the new RAG Enhancement Service using absolute import
-from rag_py.rag_enhancements import RAGEnhancementService # Absolute import
+from rag_py.rag_enhancements import ENHANCEMENT_MODE_SEPARATE, RAGEnhancementService # Absolute import
 
 # Configure logging
 logging.basicConfig(
@@ -46,9 +69,50 @@ VECTOR_STORES_DIR.mkdir(exist_ok=True)
 trainer_instances: Dict[str, RagTrainer] = {}
 query_instances: Dict[str, RagQuery] = {}
 
+# Worker processes serving the API. In mmap load mode they share each index's
+# vectors (and HNSW graph / IVF lists) through the page cache; see mmap_io_flags
+API_WORKERS = int(os.getenv("RAG_API_WORKERS", "1") or 1)
+
+# Seconds between checks for versions published by other workers (0 disables)
+VERSION_WATCH_INTERVAL = float(os.getenv("RAG_VERSION_WATCH_INTERVAL", "2"))
+
+if API_WORKERS > 1 and os.getenv("RAG_INDEX_LOAD_MODE", LOAD_MODE_MMAP) != LOAD_MODE_MMAP:
+    logger.warning("RAG_INDEX_LOAD_MODE is not mmap: every API worker will hold its own copy of each index")
+elif API_WORKERS > 1 and not can_mmap_all_index_types():
+    logger.warning("This FAISS version maps only IVF indexes: every API worker will hold its own copy of flat and HNSW indexes")
+
+# Small knowledge bases can be packed into shared pools (RAG_STORAGE_MODE=shared)
+STORAGE_MODE = os.getenv("RAG_STORAGE_MODE", STORAGE_DEDICATED)
+tenant_index = TenantIndex(VECTOR_STORES_DIR / SHARED_DIRNAME)
+
+# Coalesce concurrent index loads and identical in-flight queries
+index_load_flights = SingleFlight("index_loads")
+query_flights = SingleFlight("queries")
+
 # Initialize S3 storage
 storage = S3Storage()
 
+# Trained indexes are published to S3 and fetched by other replicas (RAG_INDEX_SYNC=s3)
+INDEX_SYNC_MODE = os.getenv("RAG_INDEX_SYNC", INDEX_SYNC_OFF)
+index_sync = IndexSync(storage, VECTOR_STORES_DIR) if INDEX_SYNC_MODE == INDEX_SYNC_S3 else None
+index_sync_flights = SingleFlight("index_syncs")
+
+# Strong references to fire-and-forget tasks so they are not garbage-collected
+background_tasks: Set[asyncio.Task] = set()
+
+# Training runs and incremental index updates of a knowledgebase run one at a time
+# (across API workers too, see TrainingJobQueue.index_update_lock)
+index_update_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+
+# /train queues a background job; RAG_TRAIN_MAX_CONCURRENT_JOBS of them run at once
+training_jobs = TrainingJobQueue(
+    lambda job: apply_index_update(job.knowledgebase_id, job) if job.kind == JOB_KIND_UPDATE_INDEX else run_training_job(job),
+    index_update_locks.__getitem__,
+    VECTOR_STORES_DIR / JOBS_DIRNAME,
+    int(os.getenv("RAG_TRAIN_MAX_CONCURRENT_JOBS") or 2),
+    float(os.getenv("RAG_TRAIN_JOB_RETENTION_SECONDS") or 86400)
+)
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
@@ -59,8 +123,15 @@ async def lifespan(app: FastAPI):
         "chunk_overlap": 200,
     }
     
+    # Pick up retrains and pool updates made by other worker processes
+    version_watcher = None
+    if VERSION_WATCH_INTERVAL > 0:
+        version_watcher = asyncio.create_task(watch_published_versions(VERSION_WATCH_INTERVAL))
+    
     yield
     # Cleanup (if needed)
+    if version_watcher:
+        version_watcher.cancel()
 
 app = FastAPI(title="RAG API Service", lifespan=lifespan)
 
@@ -81,6 +152,11 @@ class QueryRequest(BaseModel):
     system_prompt: Optional[str] = None
     conversation_history: Optional[str] = None
 
+class WarmUpRequest(BaseModel):
+    # The config and system prompt the knowledgebase will be queried with, as in QueryRequest
+    config: Optional[Dict[str, Any]] = None
+    system_prompt: Optional[str] = None
+
 # New Pydantic models for document operations
 class TextDocument(BaseModel):
     text: str
@@ -161,365 +237,919 @@ def get_vector_store_path(knowledgebase_id: str) -> Path:
     path.mkdir(parents=True, exist_ok=True)
     return path
 
-def clean_vector_store_directory(path: Path) -> None:
-    """Clean the vector store directory before training."""
-    if path.exists():
-        # Remove all files in the directory
-        for file in path.glob("*"):
-            if file.is_file():
-                file.unlink()
-    else:
-        path.mkdir(parents=True, exist_ok=True)
+def get_published_store_path(knowledgebase_id: str) -> Optional[Path]:
+    """Get the directory of the knowledgebase's published vector store version, if any."""
+    return current_version_path(get_vector_store_path(knowledgebase_id))
 
 def create_trainer(knowledgebase_id: str, config: Dict[str, Any], force_new: bool = False) -> RagTrainer:
-    """Create a new trainer instance."""
-    vector_store_path = get_vector_store_path(knowledgebase_id)
-    if force_new:
-        clean_vector_store_directory(vector_store_path)
+    """
+    Create a trainer writing to a new, unpublished version of the vector store.
+    
+    The published version keeps serving queries until publish_trained_index
+    is called. Unless force_new is set, the new version starts as a copy of
+    the published one.
+    """
+    version_path = create_version(get_vector_store_path(knowledgebase_id), copy_current=not force_new)
     
     trainer = RagTrainer(
-        vector_store_path=str(vector_store_path),
+        vector_store_path=str(version_path),
         config=config
     )
+    if not force_new and trainer.vector_store is None and tenant_index.has_tenant(knowledgebase_id):
+        # KBs packed into a shared pool have no index files of their own
+        trainer.vector_store = tenant_index.writable_store(
+            knowledgebase_id,
+            trainer._index_embeddings(trainer.index_manifest.get("embedding_dimensions"))
+        )
     trainer_instances[knowledgebase_id] = trainer
     return trainer
 
+def is_trained(knowledgebase_id: str) -> bool:
+    """Whether the knowledgebase has a dedicated index or is packed into a shared pool."""
+    store_path = get_published_store_path(knowledgebase_id)
+    return (store_path is not None and has_faiss_index(store_path)) or tenant_index.has_tenant(knowledgebase_id)
+
+def place_trained_index(knowledgebase_id: str, trainer: RagTrainer) -> None:
+    """
+    Decide where a freshly trained knowledgebase is served from.
+    
+    In shared storage mode, small flat KBs are packed into a shared pool and
+    their dedicated index files are removed; larger ones are (re)promoted to
+    their dedicated index and dropped from the pool.
+    """
+    affected = set()
+    num_vectors = trainer.vector_store.index.ntotal
+    if STORAGE_MODE == STORAGE_SHARED and tenant_index.accepts(num_vectors, trainer.index_manifest):
+        pool_name, affected = tenant_index.put_tenant(knowledgebase_id, trainer.vector_store)
+        for filename in (INDEX_FILENAME, CHUNK_STORE_FILENAME):
+            (trainer.vector_store_path / filename).unlink(missing_ok=True)
+        trainer.index_manifest.update({"storage": STORAGE_SHARED, "tenant_pool": pool_name})
+    else:
+        if tenant_index.has_tenant(knowledgebase_id):
+            affected = tenant_index.remove_tenant(knowledgebase_id)
+        trainer.index_manifest.pop("tenant_pool", None)
+        trainer.index_manifest["storage"] = STORAGE_DEDICATED
+    write_manifest(trainer.vector_store_path, trainer.index_manifest)
+    
+    # Row ranges in a rewritten pool moved, so its tenants reload their views
+    for tenant in affected:
+        query_instances.pop(tenant, None)
+
+async def publish_trained_index(knowledgebase_id: str, trainer: RagTrainer) -> Optional[RagQuery]:
+    """
+    Publish a trainer's version of the vector store and switch queries to it.
+    
+    The new version is loaded off the event loop and then swapped into
+    query_instances. Queries already running keep their reference to the
+    previous RagQuery and finish against the previous version, which garbage
+    collection keeps on disk (see RAG_KEEP_VERSIONS).
+    
+    Returns:
+        The query interface serving the new version, or None if it failed to load
+    """
+    vector_store_path = get_vector_store_path(knowledgebase_id)
+    await asyncio.to_thread(publish_version, vector_store_path, trainer.vector_store_path)
+    query_interface = await asyncio.to_thread(create_query_interface, knowledgebase_id, trainer.config)
+    try:
+        await asyncio.to_thread(collect_garbage, vector_store_path)
+    except Exception as e:
+        logger.warning(f"Error removing old vector store versions of {knowledgebase_id}: {e}")
+    return query_interface
+
 def create_query_interface(knowledgebase_id: str, config: Dict[str, Any]) -> Optional[RagQuery]:
     """Create a new query interface."""
     vector_store_path = get_vector_store_path(knowledgebase_id)
-    if not (vector_store_path / "index.faiss").exists():
+    if not is_trained(knowledgebase_id):
         return None
     
     try:
         query_interface = RagQuery(
             vector_store_path=str(vector_store_path),
-            config=config
+            config=config,
+            tenant_index=tenant_index
         )
-        query_instances[knowledgebase_id] = query_interface
+        # A slow load of a version that was replaced meanwhile must not
+        # replace an instance already serving the newer one
+        if query_interface.version == current_version(vector_store_path):
+            query_instances[knowledgebase_id] = query_interface
         return query_interface
     except Exception as e:
         logger.error(f"Error creating query interface: {e}")
         return None
 
-@app.post("/train")
-async def train_rag(request: TrainRequest):
+def find_stale_query_interfaces() -> Tuple[List[str], List[str]]:
+    """
+    Find loaded query interfaces that no longer serve the published version.
+    
+    Returns:
+        Tuple of (knowledgebases to reload, knowledgebases deleted from disk)
+    """
+    stale = tenant_index.refresh()
+    reload, deleted = [], []
+    for knowledgebase_id, query_interface in list(query_instances.items()):
+        kb_path = VECTOR_STORES_DIR / knowledgebase_id
+        if not kb_path.exists():
+            deleted.append(knowledgebase_id)
+        elif knowledgebase_id in stale or query_interface.version != current_version(kb_path):
+            reload.append(knowledgebase_id)
+    return reload, deleted
+
+async def watch_published_versions(interval: float) -> None:
+    """
+    Switch loaded query interfaces to versions published by other processes.
+    
+    A retrain in one API worker is announced to the others through the files
+    it publishes: the knowledgebase's CURRENT pointer and, for shared pools,
+    the pool's tenant table. Each worker polls them and reloads off the event
+    loop; the reloaded index is memory-mapped from the same files, so its
+    pages are shared with the other workers.
+    """
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            reload, deleted = await asyncio.to_thread(find_stale_query_interfaces)
+            for knowledgebase_id in deleted:
+                query_instances.pop(knowledgebase_id, None)
+            for knowledgebase_id in reload:
+                query_interface = query_instances.get(knowledgebase_id)
+                if query_interface:
+                    logger.info(f"Reloading knowledgebase {knowledgebase_id} published by another worker")
+                    await asyncio.to_thread(create_query_interface, knowledgebase_id, query_interface.config)
+        except Exception as e:
+            logger.error(f"Error checking for published vector store versions: {e}")
+
+async def sync_published_index(knowledgebase_id: str, config: Optional[Dict[str, Any]] = None) -> Optional[str]:
+    """
+    Install the knowledgebase's version published to S3 if it is not the local one.
+    
+    Concurrent calls for a knowledgebase share one sync. When a query
+    interface is loaded, it is switched to the installed version using config.
+    
+    Returns:
+        The installed version, or None if nothing changed or sync is off
+    """
+    if index_sync is None:
+        return None
+    
+    async def sync_and_reload() -> Optional[str]:
+        version = await asyncio.to_thread(index_sync.sync, knowledgebase_id)
+        if version and config is not None and knowledgebase_id in query_instances:
+            await asyncio.to_thread(create_query_interface, knowledgebase_id, config)
+        return version
+    
     try:
-        o_trainer_config = request.config or {
-            "model_name": "gpt-3.5-turbo",
-            "temperature": 0.7,
-            "chunk_size": 1000,
-            "chunk_overlap": 200,
+        return await index_sync_flights.do(knowledgebase_id, sync_and_reload)
+    except Exception as e:
+        logger.error(f"Error syncing vector store of {knowledgebase_id} from S3: {e}")
+        return None
+
+async def ensure_trained(knowledgebase_id: str) -> bool:
+    """Whether the knowledgebase is trained, fetching it from S3 first if another replica trained it."""
+    if is_trained(knowledgebase_id):
+        return True
+    await sync_published_index(knowledgebase_id)
+    return is_trained(knowledgebase_id)
+
+def build_query_config(config: Optional[Dict[str, Any]], system_prompt: Optional[str]) -> Dict[str, Any]:
+    """Structure a request's config to match RagQuery's expectations, filling in the defaults."""
+    config = config or {}
+    return {
+        "llm_service": config.get("llm_service", "openai"),
+        "llm_config": {
+            "model_name": config.get("llm_config", {}).get("model_name", "gpt-4o"),
+            "temperature": config.get("llm_config", {}).get("temperature", 0.7),
+        },
+        "rerank_model": config.get("rerank_model", "rerank-lite-1"),
+        "top_k": config.get("top_k", 3),
+        "chunk_size": config.get("chunk_size", 1000),
+        "chunk_overlap": config.get("chunk_overlap", 200),
+        "prompt_layout": config.get("prompt_layout", os.getenv("RAG_PROMPT_LAYOUT", "legacy")),
+        "system_prompt": system_prompt  # Pass system prompt to config
+    }
+
+def serves_query_config(query_interface: RagQuery, config: Dict[str, Any]) -> bool:
+    """Whether a loaded query interface was created with config; the system prompt is passed per query, so it may differ."""
+    def without_system_prompt(query_config: Dict[str, Any]) -> Dict[str, Any]:
+        return {key: value for key, value in query_config.items() if key != "system_prompt"}
+    return without_system_prompt(query_interface.config) == without_system_prompt(config)
+
+async def get_or_load_query_interface(knowledgebase_id: str, config: Dict[str, Any]) -> Optional[RagQuery]:
+    """
+    Get the loaded query interface, sharing one load between concurrent callers.
+    
+    An interface loaded with a different config (LLM service, model, rerank
+    settings, prompt layout) is replaced by one created with this config.
+    """
+    query_interface = query_instances.get(knowledgebase_id)
+    if query_interface and not serves_query_config(query_interface, config):
+        logger.info(f"Reloading knowledgebase {knowledgebase_id} with a changed query config")
+        query_interface = None
+    if query_interface:
+        if index_sync and index_sync.check_due(knowledgebase_id):
+            # Checked in the background; queries keep using the loaded version meanwhile
+            task = asyncio.create_task(sync_published_index(knowledgebase_id, query_interface.config))
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
+        return query_interface
+    if index_sync and index_sync.check_due(knowledgebase_id):
+        # Nothing is loaded yet, so load the latest published version
+        await sync_published_index(knowledgebase_id)
+    return await index_load_flights.do(
+        knowledgebase_id,
+        lambda: asyncio.to_thread(create_query_interface, knowledgebase_id, config)
+    )
+
+async def load_knowledgebase_documents(
+    knowledgebase_id: str,
+    indexed_sources: Optional[Set[str]] = None,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> Tuple[List[LangChainDocument], Set[str], Dict[str, Any]]:
+    """
+    Fetch a knowledgebase's documents from storage.
+    
+    Every document records the ID of its source (see source_tracking) in its
+    metadata: the text, each Q&A pair, and each file or crawled page. Sources
+    listed in indexed_sources are already in the index and are neither
+    fetched nor parsed.
+    
+    The metadata of every document type is fetched concurrently, and so are
+    the files and crawled pages, each parsed as soon as it arrives. Storage
+    bounds the requests in flight to STORAGE_S3_MAX_SOCKETS. progress, if
+    given, is called with (files and pages loaded, files and pages to load).
+    
+    Returns:
+        Tuple of (documents of the sources not yet indexed, IDs of all sources
+        in storage, fetch statistics: files and pages fetched and failed,
+        bytes, seconds until the last one was downloaded and seconds overall)
+    """
+    indexed_sources = indexed_sources or set()
+    documents_by_type: Dict[DocumentType, List[LangChainDocument]] = {doc_type: [] for doc_type in DocumentType}
+    source_ids = set()
+    fetch_usage = {"objects": 0, "failed": 0, "bytes": 0, "fetch_seconds": 0.0, "seconds": 0.0}
+    started_at = time.perf_counter()
+    
+    # Fetch the metadata of all document types at once
+    all_docs = await asyncio.gather(
+        *(storage.get_documents(knowledgebase_id, doc_type) for doc_type in DocumentType),
+        return_exceptions=True
+    )
+    fetched_at = time.perf_counter()
+    
+    # Files and crawled pages not indexed yet: (document type, file info, custom metadata, source ID)
+    to_fetch = []
+    for doc_type, docs in zip(DocumentType, all_docs):
+        if isinstance(docs, Exception):
+            logger.warning(f"Error fetching {doc_type.value} documents: {str(docs)}")
+            continue
+        if not docs:
+            continue
+        custom_metadata = docs.get('custom_metadata', {})
+        if doc_type == DocumentType.TEXT:
+            # For text documents, use the content directly
+            if docs.get('content'):
+                source_id = make_source_id(doc_type.value, docs['content'])
+                source_ids.add(source_id)
+                if source_id not in indexed_sources:
+                    documents_by_type[doc_type].append(
+                        RagTrainer.create_document(
+                            text=docs['content'],
+                            metadata={'type': 'text', **custom_metadata, SOURCE_ID_FIELD: source_id}
+                        )
+                    )
+        elif doc_type == DocumentType.QA:
+            # For QA pairs, combine question and answer into a single document
+            if docs.get('content') and 'qa_pairs' in docs['content']:
+                for qa_pair in docs['content']['qa_pairs']:
+                    source_id = make_source_id(doc_type.value, qa_pair['question'], qa_pair['answer'])
+                    source_ids.add(source_id)
+                    if source_id in indexed_sources:
+                        continue
+                    documents_by_type[doc_type].append(
+                        RagTrainer.create_document(
+                            text=f"Question: {qa_pair['question']}\nAnswer: {qa_pair['answer']}",
+                            metadata={'type': 'qa', **custom_metadata, SOURCE_ID_FIELD: source_id}
+                        )
+                    )
+        else:
+            # Files and crawled pages are stored as separate objects; only new ones are fetched
+            for file_info in docs.get('files', []):
+                source_id = make_source_id(
+                    doc_type.value,
+                    file_info.get('path'),
+                    file_info.get('size'),
+                    file_info.get('last_updated')
+                )
+                source_ids.add(source_id)
+                if source_id not in indexed_sources:
+                    to_fetch.append((doc_type, file_info, custom_metadata, source_id))
+    
+    loaded = 0
+    if progress:
+        progress(loaded, len(to_fetch))
+    
+    async def load_file(
+        doc_type: DocumentType,
+        file_info: Dict[str, Any],
+        custom_metadata: Dict[str, Any],
+        source_id: str
+    ) -> Optional[LangChainDocument]:
+        nonlocal fetched_at, loaded
+        try:
+            content = await storage.read_object(file_info['path'])
+            fetched_at = max(fetched_at, time.perf_counter())
+            fetch_usage["objects"] += 1
+            fetch_usage["bytes"] += len(content)
+            if doc_type == DocumentType.FILES:
+                # Handle different file types
+                text_content = await get_document_parser().parse(file_info.get('filename', ''), content)
+            else:
+                # For crawled documents, content is already in text/HTML format
+                text_content = content.decode('utf-8')
+            
+            return RagTrainer.create_document(
+                text=text_content,
+                metadata={
+                    'type': doc_type.value,
+                    'filename': file_info.get('filename'),
+                    'path': file_info.get('path'),
+                    **custom_metadata,
+                    SOURCE_ID_FIELD: source_id
+                }
+            )
+        except Exception as e:
+            logger.warning(f"Error processing file {file_info.get('path')}: {str(e)}")
+            fetch_usage["failed"] += 1
+            # Not indexed, so an incremental update retries it
+            source_ids.discard(source_id)
+            return None
+        finally:
+            loaded += 1
+            if progress:
+                progress(loaded, len(to_fetch))
+    
+    file_documents = await asyncio.gather(*(load_file(*file) for file in to_fetch))
+    for (doc_type, *_), document in zip(to_fetch, file_documents):
+        if document is not None:
+            documents_by_type[doc_type].append(document)
+    
+    fetch_usage["fetch_seconds"] = round(fetched_at - started_at, 3)
+    fetch_usage["seconds"] = round(time.perf_counter() - started_at, 3)
+    logger.info(
+        f"Fetched {fetch_usage['objects']} files and pages ({fetch_usage['bytes']} bytes) of knowledgebase "
+        f"{knowledgebase_id} in {fetch_usage['fetch_seconds']}s, {fetch_usage['seconds']}s with parsing"
+    )
+    all_documents = [document for doc_type in DocumentType for document in documents_by_type[doc_type]]
+    return all_documents, source_ids, fetch_usage
+
+# Chunk metadata fields filled in by enhancement
+ENHANCEMENT_FIELDS = ('chunk_summary', 'chunk_priority', 'chunk_topics', 'chunk_topics_source')
+
+async def enhance_chunks(
+    enhancement_service: RAGEnhancementService,
+    chunk_docs: List[LangChainDocument],
+    knowledgebase_id: str,
+    use_cache: bool = True,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> Dict[str, int]:
+    """
+    Add a summary, priority and topics to the metadata of chunk documents.
+    
+    The documents are updated in place, so passing the docstore's own
+    documents enhances the stored chunks. Chunks whose text was enhanced
+    before with the same model, prompts and agent prompt get their results
+    from the enhancement cache; only the rest are sent to the LLM. With the
+    local enhancement engine no LLM is involved at all.
+    
+    A chunk whose enhancement still fails after the LLM scheduler's retries
+    is left without those fields instead of getting placeholder values.
+    progress, if given, is called with (chunks done, all chunks) as batches complete.
+    
+    Returns:
+        Number of chunks, how many of them came from the cache, the LLM
+        calls made and how many chunks could not be fully enhanced
+    """
+    usage = {"chunks": len(chunk_docs), "cache_hits": 0, "llm_calls": 0, "failed": 0}
+    if not chunk_docs:
+        return usage
+    
+    if enhancement_service.local_engine is not None:
+        # Cheap to recompute, and topics are weighted against the chunks enhanced together, so nothing is cached
+        enhancements = await asyncio.to_thread(
+            enhancement_service.local_engine.enhance,
+            [chunk_doc.page_content for chunk_doc in chunk_docs]
+        )
+        for chunk_doc, enhancement in zip(chunk_docs, enhancements):
+            chunk_doc.metadata.update(enhancement)
+        if progress:
+            progress(len(chunk_docs), len(chunk_docs))
+        logger.info(f"Enhanced {len(chunk_docs)} chunks in knowledgebase {knowledgebase_id} with the local engine.")
+        return usage
+    
+    cache = get_enhancement_cache() if use_cache else None
+    pending = chunk_docs
+    if cache is not None:
+        keys = [enhancement_service.cache_key(chunk_doc.page_content) for chunk_doc in chunk_docs]
+        cached = await asyncio.to_thread(cache.get_many, keys)
+        pending = []
+        for chunk_doc, key in zip(chunk_docs, keys):
+            if key in cached:
+                chunk_doc.metadata.update(cached[key])
+            else:
+                pending.append(chunk_doc)
+        usage["cache_hits"] = len(chunk_docs) - len(pending)
+    
+    def pending_progress(done: int) -> None:
+        progress(usage["cache_hits"] + done, len(chunk_docs))
+    
+    if progress:
+        pending_progress(0)
+    logger.info(
+        f"Starting chunk enhancement for {len(pending)} of {len(chunk_docs)} chunks in knowledgebase "
+        f"{knowledgebase_id} ({usage['cache_hits']} from cache)."
+    )
+    llm_calls = enhancement_service.llm_calls
+    if pending and enhancement_service.mode == ENHANCEMENT_MODE_SEPARATE:
+        await _generate_chunk_enhancements(enhancement_service, pending)
+    elif pending:
+        await _generate_combined_chunk_enhancements(enhancement_service, pending, pending_progress if progress else None)
+    
+    usage["llm_calls"] = enhancement_service.llm_calls - llm_calls
+    
+    # Chunks with a failed enhancement are not cached, so the next training run retries them
+    results = {}
+    for chunk_doc in pending:
+        metadata = chunk_doc.metadata
+        if any(field not in metadata for field in ENHANCEMENT_FIELDS):
+            usage["failed"] += 1
+            continue
+        if cache is not None:
+            results[enhancement_service.cache_key(chunk_doc.page_content)] = {
+                field: metadata[field] for field in ENHANCEMENT_FIELDS
+            }
+    if results:
+        await asyncio.to_thread(cache.put_many, results.items())
+    
+    if usage["failed"]:
+        logger.warning(f"{usage['failed']} chunks in knowledgebase {knowledgebase_id} could not be fully enhanced.")
+    logger.info(f"Finished chunk enhancement for knowledgebase {knowledgebase_id}.")
+    return usage
+
+async def _generate_combined_chunk_enhancements(
+    enhancement_service: RAGEnhancementService,
+    chunk_docs: List[LangChainDocument],
+    progress: Optional[Callable[[int], None]] = None
+) -> None:
+    """
+    Generate the enhancements of chunk documents in batches, one LLM call per batch.
+    
+    Chunks whose entry in a batch response could not be parsed are retried
+    one chunk per call. A batch whose call fails is not split up, since the
+    scheduler has already retried it. progress, if given, is called with the
+    chunks done so far after each first-pass batch.
+    """
+    batch_size = enhancement_service.batch_size
+    batches = [chunk_docs[start:start + batch_size] for start in range(0, len(chunk_docs), batch_size)]
+    done = 0
+    
+    async def enhance_batch(batch: List[LangChainDocument], report: bool) -> List[Optional[Dict[str, Any]]]:
+        nonlocal done
+        try:
+            return await enhancement_service.generate_chunk_enhancements([chunk_doc.page_content for chunk_doc in batch])
+        finally:
+            if report:
+                done += len(batch)
+                progress(done)
+    
+    async def enhance_batches(batches: List[List[LangChainDocument]], report: bool) -> List[LangChainDocument]:
+        """Enhance each batch and return the chunks left without a usable result."""
+        batch_results = await asyncio.gather(
+            *(enhance_batch(batch, report) for batch in batches),
+            return_exceptions=True
+        )
+        unparsed = []
+        for batch, batch_result in zip(batches, batch_results):
+            if isinstance(batch_result, Exception):
+                logger.error(f"Error enhancing a batch of {len(batch)} chunks: {batch_result}")
+                continue
+            for chunk_doc, enhancement in zip(batch, batch_result):
+                if enhancement is None:
+                    unparsed.append(chunk_doc)
+                else:
+                    chunk_doc.metadata.update(enhancement)
+        return unparsed
+    
+    unparsed = await enhance_batches(batches, progress is not None)
+    if unparsed and batch_size > 1:
+        logger.info(f"Retrying enhancement of {len(unparsed)} chunks one chunk per call")
+        await enhance_batches([[chunk_doc] for chunk_doc in unparsed], False)
+
+async def _generate_chunk_enhancements(
+    enhancement_service: RAGEnhancementService,
+    chunk_docs: List[LangChainDocument]
+) -> None:
+    """Generate a summary, priority and topics for each chunk document with the LLM."""
+    # First pass: Generate summaries for all chunks
+    summary_tasks = [
+        asyncio.create_task(enhancement_service.generate_chunk_summary(chunk_doc.page_content))
+        for chunk_doc in chunk_docs
+    ]
+    summary_results = await asyncio.gather(*summary_tasks, return_exceptions=True)
+    
+    # Apply summaries to chunks
+    for chunk_doc, summary_result in zip(chunk_docs, summary_results):
+        if isinstance(summary_result, Exception):
+            # Left unset rather than storing error text; priority and topics fall back to the chunk text
+            logger.error(f"Error generating summary for chunk {chunk_doc.id}: {summary_result}")
+        else:
+            chunk_doc.metadata['chunk_summary'] = summary_result
+    
+    # Second pass: Generate priorities and topics using the summaries
+    priority_topic_tasks = []
+    for chunk_doc in chunk_docs:
+        # Now we can use the summary that was just generated
+        chunk_summary = chunk_doc.metadata.get('chunk_summary')
+        priority_topic_tasks.append(asyncio.create_task(enhancement_service.generate_chunk_priority(chunk_doc.page_content, chunk_summary)))
+        priority_topic_tasks.append(asyncio.create_task(enhancement_service.generate_chunk_topics(chunk_doc.page_content, chunk_summary)))
+    
+    logger.info(f"Created {len(priority_topic_tasks)} tasks for {len(chunk_docs)} chunks")
+    priority_topic_results = await asyncio.gather(*priority_topic_tasks, return_exceptions=True)
+    logger.info(f"Received {len(priority_topic_results)} results from priority/topics generation")
+    
+    # Process priority and topic results: results will be [priority1, topics1, priority2, topics2, ...]
+    for i, chunk_doc in enumerate(chunk_docs):
+        chunk_id = chunk_doc.id
+        priority_result = priority_topic_results[i * 2]
+        topics_result = priority_topic_results[i * 2 + 1]
+
+        if isinstance(priority_result, Exception):
+            logger.error(f"Error generating priority for chunk {chunk_id}: {priority_result}")
+        else:
+            chunk_doc.metadata['chunk_priority'] = priority_result
+        
+        if isinstance(topics_result, Exception):
+            logger.error(f"Error generating topics for chunk {chunk_id}: {topics_result}")
+        elif isinstance(topics_result, dict) and "topics" in topics_result and "source" in topics_result:
+            # New format: dictionary with topics and source
+            chunk_doc.metadata['chunk_topics'] = topics_result["topics"]
+            chunk_doc.metadata['chunk_topics_source'] = topics_result["source"]
+        elif isinstance(topics_result, list):
+            # Legacy format: just a list of topics (for backward compatibility)
+            chunk_doc.metadata['chunk_topics'] = topics_result
+            chunk_doc.metadata['chunk_topics_source'] = "legacy"
+        else:
+            logger.warning(f"Topics result for chunk {chunk_id} was not in expected format: {topics_result}. Storing as empty list.")
+            chunk_doc.metadata['chunk_topics'] = []
+            chunk_doc.metadata['chunk_topics_source'] = "invalid_format"
+
+        logger.debug(f"Enhanced chunk {chunk_id} with summary, priority, and topics.")
+
+async def complete_index_update(
+    knowledgebase_id: str,
+    trainer: RagTrainer,
+    enhancement_service: RAGEnhancementService,
+    agent_prompt: Optional[str]
+) -> Tuple[Dict[str, Any], Optional[RagQuery]]:
+    """
+    Save a trainer's enhanced version, summarize the knowledgebase and publish the version.
+    
+    Returns:
+        Tuple of (knowledge base summary, query interface serving the new version)
+    """
+    chunk_docs = [chunk_doc for _, chunk_doc in iter_docstore(trainer.vector_store.docstore)]
+    
+    # ---- START: DEBUG FILE CREATION ----
+    debug_output_data = [
+        {
+            "chunk_id": chunk_doc.id,
+            "page_content": chunk_doc.page_content,
+            "metadata": chunk_doc.metadata
         }
+        for chunk_doc in chunk_docs
+    ]
+    debug_file_path = get_vector_store_path(knowledgebase_id) / f"{knowledgebase_id}_chunks_debug_output.json"
+    try:
+        with open(debug_file_path, 'w', encoding='utf-8') as f:
+            json.dump(debug_output_data, f, indent=4, ensure_ascii=False)
+        logger.info(f"Successfully wrote chunk debug information to {debug_file_path}")
+    except Exception as e:
+        logger.error(f"Failed to write chunk debug information to {debug_file_path}: {e}")
+    # ---- END: DEBUG FILE CREATION ----
+
+    # Incremental updates reuse the settings the knowledgebase was trained with
+    trainer.index_manifest["training"] = {"config": trainer.config, "agent_prompt": agent_prompt}
+
+    # Chunk metadata was updated in place in the docstore, so saving keeps the
+    # trained index (and its index type) instead of rebuilding it from scratch.
+    logger.info(f"Saving vector store for {knowledgebase_id} with updated chunk metadata.")
+    await asyncio.to_thread(trainer._save_vector_store)
+
+    # Generate knowledge base summary using the enhanced chunks
+    knowledge_base_summary = await enhancement_service.generate_knowledge_base_summary(chunk_docs)
+    logger.info(f"Generated knowledge base summary for {knowledgebase_id}.")
+
+    # Persist the summary next to the index; it is the static per-KB prompt context
+    kb_summary_path = trainer.vector_store_path / KB_SUMMARY_FILENAME
+    try:
+        with open(kb_summary_path, 'w', encoding='utf-8') as f:
+            json.dump(knowledge_base_summary, f, indent=4, ensure_ascii=False)
+    except Exception as e:
+        logger.error(f"Failed to write knowledge base summary to {kb_summary_path}: {e}")
+
+    # Upload the complete version for other replicas before it may be packed into a shared pool
+    if index_sync:
+        await asyncio.to_thread(index_sync.publish, knowledgebase_id, trainer.vector_store_path)
+
+    # Serve from a shared pool or a dedicated index depending on size and storage mode
+    await asyncio.to_thread(place_trained_index, knowledgebase_id, trainer)
+
+    # Atomically switch the knowledgebase to the new version
+    query_interface = await publish_trained_index(knowledgebase_id, trainer)
+    return knowledge_base_summary, query_interface
+
+async def update_knowledgebase_index(knowledgebase_id: str) -> Dict[str, Any]:
+    """
+    Bring a trained knowledgebase's index in line with its documents in storage without retraining.
+    
+    Chunks of sources deleted or replaced since the index was built are
+    removed, and only new sources are fetched, parsed, embedded and
+    enhanced. Unchanged sources keep their vectors and enhancements, so a
+    small edit costs a few embedding and LLM calls instead of a full /train.
+    
+    Returns:
+        Summary whose "status" is "updated", "unchanged", "not_trained", or
+        "retrain_required" for indexes trained before sources were tracked
+    """
+    async with training_jobs.index_update_lock(knowledgebase_id):
+        return await apply_index_update(knowledgebase_id)
+
+async def apply_index_update(knowledgebase_id: str, job: Optional[TrainingJob] = None) -> Dict[str, Any]:
+    """
+    Update a knowledgebase's index as update_knowledgebase_index does, for
+    callers already holding its index update lock, such as an index update job.
+    
+    Args:
+        knowledgebase_id: Knowledgebase to update
+        job: Job to report each stage's progress on, if any
+    """
+    if not await ensure_trained(knowledgebase_id):
+        return {"status": "not_trained"}
+    
+    def begin_stage(stage: str, total: Optional[int] = None) -> None:
+        if job is not None:
+            job.begin_stage(stage, total)
+    progress = job.progress if job is not None else None
+    
+    store_path = get_published_store_path(knowledgebase_id)
+    training = read_manifest(store_path).get("training") if store_path else None
+    if not training:
+        return {"status": "retrain_required"}
+    
+    # The new version starts as a copy of the published one
+    trainer = await asyncio.to_thread(create_trainer, knowledgebase_id, training["config"])
+    published = False
+    try:
+        if not trainer.tracks_sources():
+            return {"status": "retrain_required"}
+        indexed_sources = set(trainer.source_chunks)
+        begin_stage(STAGE_LOADING_DOCUMENTS)
+        documents, source_ids, fetch_usage = await load_knowledgebase_documents(knowledgebase_id, indexed_sources, progress)
+        removed_sources = indexed_sources - source_ids
+        if not documents and not removed_sources:
+            return {"status": "unchanged", "version": current_version(get_vector_store_path(knowledgebase_id))}
         
-        # Create new trainer instance
-        trainer = create_trainer(request.knowledgebase_id, o_trainer_config, force_new=True)
+        begin_stage(STAGE_EMBEDDING)
+        removed_chunks = await trainer.remove_sources(removed_sources)
+        chunk_ids = await trainer.add_documents(documents, progress) if documents else []
         
-        # Initialize an empty list to store all documents
-        all_documents = []
+        enhancement_service = RAGEnhancementService(
+            llm_config=trainer.config,
+            logger=logger,
+            agent_prompt=training.get("agent_prompt")
+        )
+        begin_stage(STAGE_ENHANCING, len(chunk_ids))
+        enhancement_usage = await enhance_chunks(
+            enhancement_service,
+            [trainer.vector_store.docstore.search(chunk_id) for chunk_id in chunk_ids],
+            knowledgebase_id,
+            trainer.config.get("enhancement_cache", True),
+            progress
+        )
+        begin_stage(STAGE_SAVING)
+        await complete_index_update(knowledgebase_id, trainer, enhancement_service, training.get("agent_prompt"))
+        published = True
         
-        # Fetch documents of each type
-        for doc_type in DocumentType:
-            try:
-                docs = await storage.get_documents(request.knowledgebase_id, doc_type)
-                if docs:
-                    if doc_type == DocumentType.TEXT:
-                        # For text documents, use the content directly
-                        if 'content' in docs:
-                            all_documents.append(
-                                RagTrainer.create_document(
-                                    text=docs['content'],
-                                    metadata={'type': 'text', **docs.get('custom_metadata', {})}
-                                )
-                            )
-                    elif doc_type == DocumentType.QA:
-                        # For QA pairs, combine question and answer into a single document
-                        if 'content' in docs and 'qa_pairs' in docs['content']:
-                            for qa_pair in docs['content']['qa_pairs']:
-                                all_documents.append(
-                                    RagTrainer.create_document(
-                                        text=f"Question: {qa_pair['question']}\nAnswer: {qa_pair['answer']}",
-                                        metadata={'type': 'qa', **docs.get('custom_metadata', {})}
-                                    )
-                                )
-                    elif doc_type == DocumentType.FILES:
-                        # For files, we need to fetch and potentially convert each file's content
-                        if 'files' in docs:
-                            for file_info in docs['files']:
-                                try:
-                                    response = await asyncio.to_thread(
-                                        storage.s3_client.get_object,
-                                        Bucket=storage.bucket,
-                                        Key=file_info['path']
-                                    )
-                                    content = await asyncio.to_thread(
-                                        lambda: response['Body'].read()
-                                    )
-                                    
-                                    # Handle different file types
-                                    filename = file_info.get('filename', '').lower()
-                                    if filename.endswith('.pdf'):
-                                        # Convert PDF to text using pdfplumber
-                                        text_content = await asyncio.to_thread(
-                                            lambda: "\n".join(
-                                                page.extract_text() 
-                                                for page in pdfplumber.open(io.BytesIO(content)).pages
-                                            )
-                                        )
-                                    elif filename.endswith('.docx'):
-                                        # Convert DOCX to HTML using mammoth, then extract text
-                                        result = await asyncio.to_thread(
-                                            lambda: mammoth.convert_to_html(io.BytesIO(content))
-                                        )
-                                        # Extract text from HTML
-                                        text_content = BeautifulSoup(result.value, 'html.parser').get_text(separator='\n')
-                                    elif filename.endswith('.doc'):
-                                        # Convert DOC to HTML using mammoth, then extract text
-                                        result = await asyncio.to_thread(
-                                            lambda: mammoth.convert_to_html(io.BytesIO(content))
-                                        )
-                                        # Extract text from HTML
-                                        text_content = BeautifulSoup(result.value, 'html.parser').get_text(separator='\n')
-                                    else:
-                                        # For other files, try to decode as UTF-8 text
-                                        text_content = content.decode('utf-8')
-
-                                    all_documents.append(
-                                        RagTrainer.create_document(
-                                            text=text_content,
-                                            metadata={
-                                                'type': doc_type.value,
-                                                'filename': file_info.get('filename'),
-                                                'path': file_info.get('path'),
-                                                **docs.get('custom_metadata', {})
-                                            }
-                                        )
-                                    )
-                                except Exception as e:
-                                    logger.warning(f"Error processing file {file_info.get('path')}: {str(e)}")
-                                    continue
-                    elif doc_type == DocumentType.CRAWLED:
-                        # For crawled documents, content is already in text/HTML format
-                        if 'files' in docs:
-                            for file_info in docs['files']:
-                                try:
-                                    response = await asyncio.to_thread(
-                                        storage.s3_client.get_object,
-                                        Bucket=storage.bucket,
-                                        Key=file_info['path']
-                                    )
-                                    content = await asyncio.to_thread(
-                                        lambda: response['Body'].read()
-                                    )
-                                    text_content = content.decode('utf-8')
-                                    all_documents.append(
-                                        RagTrainer.create_document(
-                                            text=text_content,
-                                            metadata={
-                                                'type': doc_type.value,
-                                                'filename': file_info.get('filename'),
-                                                'path': file_info.get('path'),
-                                                **docs.get('custom_metadata', {})
-                                            }
-                                        )
-                                    )
-                                except Exception as e:
-                                    logger.warning(f"Error reading file {file_info.get('path')}: {str(e)}")
-                                    continue
-            except Exception as e:
-                logger.warning(f"Error fetching {doc_type.value} documents: {str(e)}")
-                continue
+        logger.info(
+            f"Updated index of knowledgebase {knowledgebase_id}: removed {len(removed_sources)} sources "
+            f"({removed_chunks} chunks), added {len(documents)} documents ({len(chunk_ids)} chunks)"
+        )
+        return {
+            "status": "updated",
+            "removed_sources": len(removed_sources),
+            "removed_chunks": removed_chunks,
+            "added_documents": len(documents),
+            "added_chunks": len(chunk_ids),
+            "version": trainer.vector_store_path.name,
+            "fetch_usage": fetch_usage,
+            "embedding_usage": trainer.embedding_usage,
+            "enhancement_usage": enhancement_usage
+        }
+    finally:
+        # A run that failed or found nothing to do leaves no version behind
+        if not published:
+            await asyncio.to_thread(discard_version, trainer.vector_store_path)
+
+async def refresh_index(knowledgebase_id: str, reindex: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Queue an update of a knowledgebase's index after its documents changed in storage.
+    
+    The update runs as a background job, so the request changing the
+    documents does not wait for embedding and enhancement; poll
+    /train/jobs/{job_id} for its progress. Storage has already been changed,
+    so a failure is reported in the result instead of failing the request.
+    
+    Returns:
+        None if reindex is off, else a summary whose "status" is "queued"
+        (with "job_id" and "coalesced"), "not_trained" or "failed"
+    """
+    if not reindex:
+        return None
+    try:
+        if not await ensure_trained(knowledgebase_id):
+            return {"status": "not_trained"}
+        job, coalesced = training_jobs.submit(knowledgebase_id, None, None, JOB_KIND_UPDATE_INDEX)
+        return {"status": "queued", "job_id": job["job_id"], "coalesced": coalesced}
+    except Exception as e:
+        logger.error(f"Error queueing index update of knowledgebase {knowledgebase_id}: {e}")
+        return {"status": "failed", "detail": str(e)}
+
+async def run_training_job(job: TrainingJob) -> Dict[str, Any]:
+    """
+    Train a knowledgebase from scratch for a training job, reporting each stage's progress on the job.
+    
+    The job queue holds the knowledgebase's index update lock while this
+    runs. The new version keeps out of the way of the published one until
+    it is complete; a run that fails or is cancelled leaves nothing behind.
+    
+    Returns:
+        The job's result: knowledge base summary, version and usage
+    """
+    knowledgebase_id = job.knowledgebase_id
+    trainer = None
+    published = False
+    try:
+        # Create new trainer instance; it writes a new version while the current one keeps serving
+        trainer = await asyncio.to_thread(create_trainer, knowledgebase_id, job.config, True)
         
+        job.begin_stage(STAGE_LOADING_DOCUMENTS)
+        all_documents, _, fetch_usage = await load_knowledgebase_documents(knowledgebase_id, progress=job.progress)
         if not all_documents:
-            raise HTTPException(
-                status_code=400,
-                detail="No documents found in the knowledgebase. Please add some documents first."
-            )
+            raise ValueError("No documents found in the knowledgebase. Please add some documents first.")
         
         # Initialize with all documents
-        await trainer.initialize(all_documents)
-
+        job.begin_stage(STAGE_EMBEDDING)
+        await trainer.initialize(all_documents, job.progress)
+        
         # Initialize RAGEnhancementService with the trainer's config and agent_prompt
-        enhancement_service_config = trainer.config
         enhancement_service = RAGEnhancementService(
-            llm_config=enhancement_service_config, 
+            llm_config=trainer.config, 
             logger=logger,
-            agent_prompt=request.agent_prompt
+            agent_prompt=job.agent_prompt
         )
+        chunk_docs = [chunk_doc for _, chunk_doc in iter_docstore(trainer.vector_store.docstore)]
+        job.begin_stage(STAGE_ENHANCING, len(chunk_docs))
+        enhancement_usage = await enhance_chunks(
+            enhancement_service,
+            chunk_docs,
+            knowledgebase_id,
+            trainer.config.get("enhancement_cache", True),
+            job.progress
+        )
+        
+        job.begin_stage(STAGE_SAVING)
+        knowledge_base_summary, query_interface = await complete_index_update(
+            knowledgebase_id,
+            trainer,
+            enhancement_service,
+            job.agent_prompt
+        )
+        published = True
+        if not query_interface:
+            raise RuntimeError("Failed to create query interface after training")
+        
+        return {
+            "status": "success",
+            "message": f"Processed {len(all_documents)} documents for knowledgebase {knowledgebase_id}",
+            "knowledge_base_summary": knowledge_base_summary,
+            "version": trainer.vector_store_path.name,
+            "fetch_usage": fetch_usage,
+            "embedding_usage": trainer.embedding_usage,
+            "enhancement_usage": enhancement_usage
+        }
+    finally:
+        # A run that failed before publishing leaves no partial version behind
+        if trainer is not None and not published:
+            await asyncio.to_thread(discard_version, trainer.vector_store_path)
 
-        processed_chunks_for_kb_summary = []
-        if hasattr(trainer.vector_store, 'docstore') and hasattr(trainer.vector_store.docstore, '_dict'):
-            docstore_dict = trainer.vector_store.docstore._dict
-            logger.info(f"Starting chunk enhancement for {len(docstore_dict)} chunks in knowledgebase {request.knowledgebase_id}.")
-            
-            # First pass: Generate summaries for all chunks
-            summary_tasks = []
-            chunk_ids = []
-            for chunk_id, chunk_doc in docstore_dict.items():
-                summary_tasks.append(asyncio.create_task(enhancement_service.generate_chunk_summary(chunk_doc.page_content)))
-                chunk_ids.append(chunk_id)
-            
-            summary_results = await asyncio.gather(*summary_tasks, return_exceptions=True)
-            
-            # Apply summaries to chunks
-            for i, chunk_id in enumerate(chunk_ids):
-                chunk_doc = docstore_dict[chunk_id]
-                summary_result = summary_results[i]
-                
-                if isinstance(summary_result, Exception):
-                    logger.error(f"Error generating summary for chunk {chunk_id}: {summary_result}")
-                    chunk_doc.metadata['chunk_summary'] = "Error: Failed to generate summary."
-                else:
-                    chunk_doc.metadata['chunk_summary'] = summary_result
-            
-            # Second pass: Generate priorities and topics using the summaries
-            priority_topic_tasks = []
-            chunk_ids_to_update = []
-            
-            for chunk_id, chunk_doc in docstore_dict.items():
-                # Now we can use the summary that was just generated
-                chunk_summary = chunk_doc.metadata.get('chunk_summary')
-                logger.info(f"Creating priority/topics tasks for chunk {chunk_id[:8]}... with summary: '{chunk_summary[:50] if chunk_summary else 'None'}...'")
-                priority_topic_tasks.append(asyncio.create_task(enhancement_service.generate_chunk_priority(chunk_doc.page_content, chunk_summary)))
-                priority_topic_tasks.append(asyncio.create_task(enhancement_service.generate_chunk_topics(chunk_doc.page_content, chunk_summary)))
-                chunk_ids_to_update.append(chunk_id)
-            
-            logger.info(f"Created {len(priority_topic_tasks)} tasks for {len(chunk_ids_to_update)} chunks")
-            priority_topic_results = await asyncio.gather(*priority_topic_tasks, return_exceptions=True)
-            logger.info(f"Received {len(priority_topic_results)} results from priority/topics generation")
-            
-            # Process priority and topic results: results will be [priority1, topics1, priority2, topics2, ...]
-            for i, chunk_id in enumerate(chunk_ids_to_update):
-                chunk_doc = docstore_dict[chunk_id]
-                priority_result_idx = i * 2
-                topics_result_idx = i * 2 + 1
-
-                priority_result = priority_topic_results[priority_result_idx]
-                topics_result = priority_topic_results[topics_result_idx]
-
-                logger.info(f"Processing chunk {chunk_id[:8]}... - Priority result: {priority_result} (type: {type(priority_result)}), Topics result: {topics_result} (type: {type(topics_result)})")
+@app.post("/train", status_code=202)
+async def train_rag(request: TrainRequest):
+    """
+    Queue a training run of a knowledgebase and return its job right away.
+    
+    A request for a knowledgebase whose previous request is still waiting
+    to start joins that job. Poll /train/jobs/{job_id} for progress and,
+    once it has finished, the result.
+    """
+    o_trainer_config = request.config or {
+        "model_name": "gpt-3.5-turbo",
+        "temperature": 0.7,
+        "chunk_size": 1000,
+        "chunk_overlap": 200,
+    }
+    job, coalesced = training_jobs.submit(request.knowledgebase_id, o_trainer_config, request.agent_prompt)
+    return {
+        "status": "success",
+        "message": f"Training of knowledgebase {request.knowledgebase_id} is {'already queued' if coalesced else 'queued'}",
+        "job_id": job["job_id"],
+        "coalesced": coalesced,
+        "data": job
+    }
 
-                if isinstance(priority_result, Exception):
-                    logger.error(f"Error generating priority for chunk {chunk_id}: {priority_result}")
-                    chunk_doc.metadata['chunk_priority'] = 0 # Default error priority
-                else:
-                    chunk_doc.metadata['chunk_priority'] = priority_result
-                
-                if isinstance(topics_result, Exception):
-                    logger.error(f"Error generating topics for chunk {chunk_id}: {topics_result}")
-                    chunk_doc.metadata['chunk_topics'] = [] # Default error topics (empty list)
-                    chunk_doc.metadata['chunk_topics_source'] = "error"
-                elif isinstance(topics_result, dict) and "topics" in topics_result and "source" in topics_result:
-                    # New format: dictionary with topics and source
-                    chunk_doc.metadata['chunk_topics'] = topics_result["topics"]
-                    chunk_doc.metadata['chunk_topics_source'] = topics_result["source"]
-                    logger.info(f"Successfully set topics for chunk {chunk_id[:8]}...: {topics_result['topics']} (source: {topics_result['source']})")
-                elif isinstance(topics_result, list):
-                    # Legacy format: just a list of topics (for backward compatibility)
-                    chunk_doc.metadata['chunk_topics'] = topics_result
-                    chunk_doc.metadata['chunk_topics_source'] = "legacy"
-                    logger.info(f"Successfully set topics for chunk {chunk_id[:8]}...: {topics_result} (legacy format)")
-                else:
-                    logger.warning(f"Topics result for chunk {chunk_id} was not in expected format: {topics_result}. Storing as empty list.")
-                    chunk_doc.metadata['chunk_topics'] = []
-                    chunk_doc.metadata['chunk_topics_source'] = "invalid_format"
-
-                processed_chunks_for_kb_summary.append(chunk_doc)
-                logger.debug(f"Enhanced chunk {chunk_id} with summary, priority, and topics.")
-
-            logger.info(f"Finished chunk enhancement for knowledgebase {request.knowledgebase_id}.")
-
-            # ---- START: DEBUG FILE CREATION ----
-            debug_output_data = []
-            # Collect documents with updated metadata for re-creating the vector store
-            updated_documents_for_vector_store = [] 
-            for chunk_id, chunk_doc in docstore_dict.items():
-                debug_output_data.append({
-                    "chunk_id": chunk_id,
-                    "page_content": chunk_doc.page_content,
-                    "metadata": chunk_doc.metadata
-                })
-                updated_documents_for_vector_store.append(chunk_doc) # Add the updated doc
-            
-            debug_file_path = get_vector_store_path(request.knowledgebase_id) / f"{request.knowledgebase_id}_chunks_debug_output.json"
-            try:
-                with open(debug_file_path, 'w', encoding='utf-8') as f:
-                    json.dump(debug_output_data, f, indent=4, ensure_ascii=False)
-                logger.info(f"Successfully wrote chunk debug information to {debug_file_path}")
-            except Exception as e:
-                logger.error(f"Failed to write chunk debug information to {debug_file_path}: {e}")
-            # ---- END: DEBUG FILE CREATION ----
-
-            # ---- START: RE-CREATE VECTOR STORE WITH UPDATED METADATA ----
-            if updated_documents_for_vector_store:
-                logger.info(f"Re-creating vector store for {request.knowledgebase_id} with updated metadata before saving.")
-                # Ensure trainer has embeddings, which it should from its __init__
-                if hasattr(trainer, 'embeddings') and trainer.embeddings:
-                    trainer.vector_store = FAISS.from_documents(updated_documents_for_vector_store, trainer.embeddings)
-                    trainer._save_vector_store() # Save the newly created store with updated metadata
-                    logger.info(f"Successfully re-created and saved vector store with updated chunk metadata.")
-                else:
-                    logger.error("Trainer object is missing embeddings. Cannot re-create vector store. Metadata might not be persisted.")
-            else:
-                logger.warning("No documents found to re-create vector store. Skipping re-creation.")
-            # ---- END: RE-CREATE VECTOR STORE WITH UPDATED METADATA ----
+@app.get("/train/jobs/{job_id}")
+async def get_training_job(job_id: str):
+    """Report a training job's stage, progress per stage, ETA and, once finished, its result or error."""
+    snapshot = training_jobs.get(job_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail=f"Training job '{job_id}' not found")
+    return {
+        "status": "success",
+        "data": snapshot
+    }
 
-        else:
-            logger.warning(f"Docstore not found or not in expected format for knowledgebase {request.knowledgebase_id}. Skipping chunk enhancements and debug file creation.")
+@app.post("/train/jobs/{job_id}/cancel")
+async def cancel_training_job(job_id: str):
+    """Cancel a queued or running training job; the published index is left as it was."""
+    snapshot = training_jobs.cancel(job_id)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail=f"Training job '{job_id}' not found")
+    if not snapshot["cancel_requested"]:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Training job '{job_id}' can no longer be cancelled (status: {snapshot['status']}, stage: {snapshot['stage']})"
+        )
+    return {
+        "status": "success",
+        "data": snapshot
+    }
 
-        # Generate knowledge base summary using the enhanced chunks
-        # Ensure processed_chunks_for_kb_summary is correctly populated even if we re-created the store
-        # It was populated from docstore_dict before re-creation, so it should be fine.
-        knowledge_base_summary = await enhancement_service.generate_knowledge_base_summary(processed_chunks_for_kb_summary)
-        logger.info(f"Generated knowledge base summary for {request.knowledgebase_id}.")
+@app.get("/knowledgebase/{knowledgebase_id}/train-job")
+async def get_latest_training_job(knowledgebase_id: str, kind: Optional[str] = None):
+    """Report the knowledgebase's most recent job, or its most recent of a kind ("train" or "update_index")."""
+    snapshot = training_jobs.latest(knowledgebase_id, kind)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail=f"No {kind or 'training'} job found for knowledgebase '{knowledgebase_id}'")
+    return {
+        "status": "success",
+        "data": snapshot
+    }
 
-        # Create new query interface
-        query_interface = create_query_interface(request.knowledgebase_id, trainer.config)
-        if not query_interface:
+@app.post("/knowledgebase/{knowledgebase_id}/update-index")
+async def update_index(knowledgebase_id: str):
+    """Apply document changes made in storage to the knowledgebase's index without retraining it."""
+    try:
+        result = await update_knowledgebase_index(knowledgebase_id)
+        if result["status"] == "not_trained":
             raise HTTPException(
-                status_code=500,
-                detail="Failed to create query interface after training"
+                status_code=404,
+                detail=f"Knowledgebase '{knowledgebase_id}' has not been trained."
+            )
+        if result["status"] == "retrain_required":
+            raise HTTPException(
+                status_code=409,
+                detail=f"Knowledgebase '{knowledgebase_id}' was trained before incremental updates were supported. Please train it again."
             )
-            
         return {
             "status": "success",
-            "message": f"Processed {len(all_documents)} documents for knowledgebase {request.knowledgebase_id}",
-            "knowledge_base_summary": knowledge_base_summary # Add the summary to the response
+            "data": result
         }
-    
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Training error: {e}")
+        logger.error(f"Error updating index of knowledgebase {knowledgebase_id}: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/query", response_model=QueryResponse)
 async def query_rag(request: QueryRequest):
     try:
-        vector_store_path = get_vector_store_path(request.knowledgebase_id)
-        if not (vector_store_path / "index.faiss").exists():
+        if not await ensure_trained(request.knowledgebase_id):
             raise HTTPException(
                 status_code=400,
                 detail=f"No documents have been trained for knowledgebase {request.knowledgebase_id}. Please train the system first."
             )
         
+        llm_config = build_query_config(request.config, request.system_prompt)
+
         # Get or create query interface
-        query_interface = query_instances.get(request.knowledgebase_id)
-        if not query_interface:
-            # Structure config to match RagQuery's expectations
-            config = request.config or {}
-            llm_config = {
-                "llm_service": config.get("llm_service", "openai"),
-                "llm_config": {
-                    "model_name": config.get("llm_config", {}).get("model_name", "gpt-4o"),
-                    "temperature": config.get("llm_config", {}).get("temperature", 0.7),
-                },
-                "rerank_model": config.get("rerank_model", "rerank-lite-1"),
-                "top_k": config.get("top_k", 3),
-                "chunk_size": config.get("chunk_size", 1000),
-                "chunk_overlap": config.get("chunk_overlap", 200),
-                "system_prompt": request.system_prompt  # Pass system prompt to config
-            }
-            query_interface = create_query_interface(request.knowledgebase_id, llm_config)
+        query_interface = await get_or_load_query_interface(request.knowledgebase_id, llm_config)
             
         if not query_interface or not query_interface.vector_store:
             raise HTTPException(
@@ -527,10 +1157,20 @@ async def query_rag(request: QueryRequest):
                 detail=f"Error loading vector store for knowledgebase {request.knowledgebase_id}. Please try training again."
             )
             
-        result = await query_interface.query(
-            question=request.question,
-            system_prompt=request.system_prompt,
-            conversation_history=request.conversation_history
+        # Identical questions in flight for the same KB and prompt share one pipeline run
+        query_key = (
+            request.knowledgebase_id,
+            request.question,
+            request.system_prompt,
+            request.conversation_history
+        )
+        result = await query_flights.do(
+            query_key,
+            lambda: query_interface.query(
+                question=request.question,
+                system_prompt=request.system_prompt,
+                conversation_history=request.conversation_history
+            )
         )
         
         # Validate response structure
@@ -546,14 +1186,40 @@ async def query_rag(request: QueryRequest):
         logger.error(f"Query error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/stats")
+async def get_stats():
+    """Report runtime statistics for the query pipeline."""
+    return {
+        "status": "success",
+        "data": {
+            "query_executor": get_query_executor().stats(),
+            "embedding_batchers": get_embedding_batcher_stats(),
+            "prompt_cache": prompt_cache_stats.stats(),
+            "tenant_index": tenant_index.stats(),
+            "shard_search": get_shard_search_pool().stats() if shard_search_pool_started() else None,
+            "document_parser": get_document_parser().stats() if document_parser_started() else None,
+            "index_sync": index_sync.stats() if index_sync else None,
+            "embedding_cache": get_embedding_cache().stats() if embedding_cache_started() else None,
+            "enhancement_cache": get_enhancement_cache().stats() if enhancement_cache_started() else None,
+            "llm_schedulers": get_llm_scheduler_stats(),
+            "training_jobs": training_jobs.stats(),
+            "singleflight": {
+                "index_loads": index_load_flights.stats(),
+                "index_syncs": index_sync_flights.stats(),
+                "queries": query_flights.stats()
+            }
+        }
+    }
+
 # Document storage endpoints
 @app.post("/documents/{knowledgebase_id}/files")
 async def upload_files(
     knowledgebase_id: str,
     files: List[UploadFile] = File(...),
-    metadata: Optional[str] = Form(None)
+    metadata: Optional[str] = Form(None),
+    reindex: bool = False
 ):
-    """Upload multiple files to a knowledgebase."""
+    """Upload multiple files to a knowledgebase and, if reindex is set, add them to its index."""
     try:
         if not files:
             raise HTTPException(status_code=400, detail="No files provided")
@@ -607,6 +1273,7 @@ async def upload_files(
         }
         if duplicate_files:
             response["duplicates"] = duplicate_files
+        response["index"] = await refresh_index(knowledgebase_id, reindex)
 
         return response
 
@@ -624,8 +1291,8 @@ async def upload_files(
                 logger.error(f"Error closing file {file.filename}: {str(e)}")
 
 @app.post("/documents/{knowledgebase_id}/text")
-async def store_text(knowledgebase_id: str, document: TextDocument):
-    """Store text content in a knowledgebase."""
+async def store_text(knowledgebase_id: str, document: TextDocument, reindex: bool = False):
+    """Store text content in a knowledgebase and, if reindex is set, update its index."""
     try:
         if not document.text:
             raise HTTPException(status_code=400, detail="Text content cannot be empty")
@@ -639,7 +1306,7 @@ async def store_text(knowledgebase_id: str, document: TextDocument):
         # Clean up old timestamped files
         await storage.cleanup_old_files(knowledgebase_id, DocumentType.TEXT)
         
-        return {"status": "success", "data": result}
+        return {"status": "success", "data": result, "index": await refresh_index(knowledgebase_id, reindex)}
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
@@ -647,8 +1314,8 @@ async def store_text(knowledgebase_id: str, document: TextDocument):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/documents/{knowledgebase_id}/qa")
-async def store_qa(knowledgebase_id: str, document: QADocument):
-    """Store Q&A pairs in a knowledgebase."""
+async def store_qa(knowledgebase_id: str, document: QADocument, reindex: bool = False):
+    """Store Q&A pairs in a knowledgebase and, if reindex is set, update its index."""
     try:
         if not document.qa_pairs:
             raise HTTPException(status_code=400, detail="Q&A pairs cannot be empty")
@@ -670,7 +1337,8 @@ async def store_qa(knowledgebase_id: str, document: QADocument):
         return {
             "status": "success",
             "message": f"Stored {len(qa_pairs)} Q&A pairs in knowledgebase {knowledgebase_id}",
-            "data": result
+            "data": result,
+            "index": await refresh_index(knowledgebase_id, reindex)
         }
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -679,8 +1347,8 @@ async def store_qa(knowledgebase_id: str, document: QADocument):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/documents/{knowledgebase_id}/crawled")
-async def store_crawled(knowledgebase_id: str, batch: CrawledBatch):
-    """Store crawled documents in a knowledgebase."""
+async def store_crawled(knowledgebase_id: str, batch: CrawledBatch, reindex: bool = False):
+    """Store crawled documents in a knowledgebase and, if reindex is set, add them to its index."""
     try:
         if not batch.documents:
             raise HTTPException(status_code=400, detail="No crawled documents provided")
@@ -707,7 +1375,8 @@ async def store_crawled(knowledgebase_id: str, batch: CrawledBatch):
         return {
             "status": "success",
             "message": f"Stored {len(files)} crawled documents in knowledgebase {knowledgebase_id}",
-            "data": result
+            "data": result,
+            "index": await refresh_index(knowledgebase_id, reindex)
         }
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -767,8 +1436,8 @@ async def list_knowledgebases():
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/crawl")
-async def crawl_website(request: CrawlRequest):
-    """Crawl a website and store its content in the knowledgebase."""
+async def crawl_website(request: CrawlRequest, reindex: bool = False):
+    """Crawl a website, store its content in the knowledgebase and, if reindex is set, index it."""
     try:
         # Initialize crawler
         crawler = WebCrawler(
@@ -805,7 +1474,8 @@ async def crawl_website(request: CrawlRequest):
         return {
             "status": "success",
             "message": f"Successfully crawled and stored {len(crawled_pages)} pages",
-            "data": result
+            "data": result,
+            "index": await refresh_index(request.knowledgebase_id, reindex)
         }
         
     except Exception as e:
@@ -813,8 +1483,8 @@ async def crawl_website(request: CrawlRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/crawl-next")
-async def crawl_next_pages(request: CrawlNextRequest):
-    """Crawl the next set of pages from the previously crawled website."""
+async def crawl_next_pages(request: CrawlNextRequest, reindex: bool = False):
+    """Crawl the next set of pages from the previously crawled website and, if reindex is set, index them."""
     try:
         # Get existing crawled documents to fetch source URL and metadata
         existing_docs = await storage.get_documents(request.knowledgebase_id, DocumentType.CRAWLED)
@@ -871,7 +1541,8 @@ async def crawl_next_pages(request: CrawlNextRequest):
         return {
             "status": "success",
             "message": f"Successfully crawled and stored {len(crawled_pages)} new pages",
-            "data": result
+            "data": result,
+            "index": await refresh_index(request.knowledgebase_id, reindex)
         }
         
     except HTTPException:
@@ -881,8 +1552,8 @@ async def crawl_next_pages(request: CrawlNextRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.delete("/documents/{knowledgebase_id}/{doc_type}/{document_path:path}")
-async def delete_document(knowledgebase_id: str, doc_type: DocumentType, document_path: str):
-    """Delete a specific document from a knowledgebase."""
+async def delete_document(knowledgebase_id: str, doc_type: DocumentType, document_path: str, reindex: bool = False):
+    """Delete a specific document from a knowledgebase and, if reindex is set, from its index."""
     try:
         # Verify the document exists
         docs = await storage.get_documents(knowledgebase_id, doc_type)
@@ -907,7 +1578,7 @@ async def delete_document(knowledgebase_id: str, doc_type: DocumentType, documen
         
         # Delete from S3
         try:
-            await storage.s3_client.delete_object(
+            storage.s3_client.delete_object(
                 Bucket=storage.bucket,
                 Key=document_path
             )
@@ -931,16 +1602,17 @@ async def delete_document(knowledgebase_id: str, doc_type: DocumentType, documen
             "timestamp": datetime.utcnow().isoformat()
         }
         
-        await storage.s3_client.put_object(
+        storage.s3_client.put_object(
             Bucket=storage.bucket,
-            Key=f"{knowledgebase_id}/{doc_type}/metadata.json",
+            Key=f"{knowledgebase_id}/{doc_type.value}/metadata.json",
             Body=json.dumps(metadata_content),
             ContentType='application/json'
         )
         
         return {
             "status": "success",
-            "message": f"Successfully deleted document {document_path}"
+            "message": f"Successfully deleted document {document_path}",
+            "index": await refresh_index(knowledgebase_id, reindex)
         }
         
     except HTTPException:
@@ -989,8 +1661,8 @@ async def list_documents(knowledgebase_id: str, doc_type: DocumentType):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/recrawl")
-async def recrawl_existing_pages(request: RecrawlRequest):
-    """Recrawl all existing pages in a knowledgebase to update their content."""
+async def recrawl_existing_pages(request: RecrawlRequest, reindex: bool = False):
+    """Recrawl all existing pages in a knowledgebase to update their content and, if reindex is set, their chunks."""
     try:
         # Get list of existing pages
         existing_docs = await storage.get_documents(request.knowledgebase_id, DocumentType.CRAWLED)
@@ -1074,7 +1746,8 @@ async def recrawl_existing_pages(request: RecrawlRequest):
         return {
             "status": "success",
             "message": f"Successfully recrawled and updated {len(updated_files)} pages",
-            "data": metadata_content
+            "data": metadata_content,
+            "index": await refresh_index(request.knowledgebase_id, reindex)
         }
 
     except HTTPException:
@@ -1084,8 +1757,8 @@ async def recrawl_existing_pages(request: RecrawlRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/delete-files")
-async def delete_files(request: DeleteFilesRequest):
-    """Delete multiple files by their filenames from a knowledgebase."""
+async def delete_files(request: DeleteFilesRequest, reindex: bool = False):
+    """Delete multiple files by their filenames from a knowledgebase and, if reindex is set, from its index."""
     try:
         # Get existing documents
         existing_docs = await storage.get_documents(request.knowledgebase_id, DocumentType.FILES)
@@ -1144,7 +1817,8 @@ async def delete_files(request: DeleteFilesRequest):
             "status": "success",
             "message": f"Successfully deleted {len(files_to_delete)} files",
             "deleted_files": [file_info['filename'] for file_info in files_to_delete],
-            "remaining_files": len(files_to_keep)
+            "remaining_files": len(files_to_keep),
+            "index": await refresh_index(request.knowledgebase_id, reindex)
         }
 
     except HTTPException:
@@ -1154,8 +1828,8 @@ async def delete_files(request: DeleteFilesRequest):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/delete-urls")
-async def delete_urls(request: DeleteUrlsRequest):
-    """Delete multiple URLs and their associated files from a knowledgebase."""
+async def delete_urls(request: DeleteUrlsRequest, reindex: bool = False):
+    """Delete multiple URLs and their associated files from a knowledgebase and, if reindex is set, from its index."""
     try:
         # Get existing documents
         existing_docs = await storage.get_documents(request.knowledgebase_id, DocumentType.CRAWLED)
@@ -1215,7 +1889,8 @@ async def delete_urls(request: DeleteUrlsRequest):
             "status": "success",
             "message": f"Successfully deleted {len(files_to_delete)} files",
             "deleted_urls": [file_info['url'] for file_info in files_to_delete],
-            "remaining_files": len(files_to_keep)
+            "remaining_files": len(files_to_keep),
+            "index": await refresh_index(request.knowledgebase_id, reindex)
         }
 
     except HTTPException:
@@ -1257,6 +1932,11 @@ async def delete_knowledgebase(knowledgebase_id: str):
         if vector_store_path.exists():
             shutil.rmtree(vector_store_path)
             logger.info(f"Cleaned up vector store for knowledgebase {knowledgebase_id}")
+        if tenant_index.has_tenant(knowledgebase_id):
+            for tenant in await asyncio.to_thread(tenant_index.remove_tenant, knowledgebase_id):
+                query_instances.pop(tenant, None)
+        if index_sync:
+            index_sync.forget(knowledgebase_id)
             
         return {
             "status": "success",
@@ -1324,10 +2004,7 @@ async def get_character_count(knowledgebase_id: str):
 @app.get("/knowledgebase/{knowledgebase_id}/chunks", response_model=GetChunksResponse)
 async def get_knowledgebase_chunks(knowledgebase_id: str):
     """Retrieve all processed chunks for a given knowledgebase."""
-    vector_store_path = get_vector_store_path(knowledgebase_id)
-    index_file = vector_store_path / "index.faiss"
-
-    if not index_file.exists():
+    if not await ensure_trained(knowledgebase_id):
         raise HTTPException(
             status_code=404,
             detail=f"Knowledgebase '{knowledgebase_id}' has not been trained or its vector store is missing."
@@ -1347,7 +2024,7 @@ async def get_knowledgebase_chunks(knowledgebase_id: str):
             "top_k": 3
         }
         try:
-            query_interface = create_query_interface(knowledgebase_id, placeholder_config)
+            query_interface = await get_or_load_query_interface(knowledgebase_id, placeholder_config)
         except Exception as e:
             logger.error(f"Error creating query interface for chunks retrieval ({knowledgebase_id}): {str(e)}")
             raise HTTPException(
@@ -1362,21 +2039,13 @@ async def get_knowledgebase_chunks(knowledgebase_id: str):
         )
 
     try:
-        # FAISS docstore is typically a Dict[str, Document]
-        # The actual attribute might be _dict if it's a langchain_community.docstore.InMemoryDocstore
-        if not hasattr(query_interface.vector_store.docstore, '_dict'):
-             raise HTTPException(
-                status_code=500,
-                detail=f"Docstore for '{knowledgebase_id}' does not have the expected '_dict' attribute."
-            )
-        
-        docstore_dict = query_interface.vector_store.docstore._dict
-        
+        # The docstore is either the on-disk ChunkStore or, for stores loaded
+        # into memory, a langchain_community InMemoryDocstore
         response_chunks = []
         logger.info(f"Inspecting metadata from loaded docstore for KB: {knowledgebase_id}") # New log
         processed_count = 0 # Counter for logging a few items
 
-        for chunk_id, document in docstore_dict.items():
+        for chunk_id, document in iter_docstore(query_interface.vector_store.docstore):
             if processed_count < 3: # Log details for the first 3 chunks
                 logger.info(f"Chunk ID: {chunk_id} - Metadata Type: {type(document.metadata)}")
                 logger.info(f"Chunk ID: {chunk_id} - Metadata Content: {document.metadata}")
@@ -1411,5 +2080,84 @@ async def get_knowledgebase_chunks(knowledgebase_id: str):
             detail=f"An unexpected error occurred while retrieving chunks for '{knowledgebase_id}': {str(e)}"
         )
 
-if __name__ == "__main__":
-    uvicorn.run("api:app", host="0.0.0.0", port=4003, reload=True) 
\ No newline at end of file
+@app.post("/knowledgebase/{knowledgebase_id}/warm-up")
+async def warm_up_knowledgebase(knowledgebase_id: str, request: Optional[WarmUpRequest] = None):
+    """
+    Fetch the knowledgebase's latest published index (when index sync is on) and load it for queries.
+    
+    The interface is loaded with the config /query builds from the same
+    config and system prompt, so the queries that follow use it as is.
+    """
+    request = request or WarmUpRequest()
+    try:
+        if not await ensure_trained(knowledgebase_id):
+            raise HTTPException(
+                status_code=404,
+                detail=f"Knowledgebase '{knowledgebase_id}' has not been trained."
+            )
+        query_interface = query_instances.get(knowledgebase_id)
+        if query_interface:
+            await sync_published_index(knowledgebase_id, query_interface.config)
+        query_interface = await get_or_load_query_interface(
+            knowledgebase_id,
+            build_query_config(request.config, request.system_prompt)
+        )
+        if not query_interface:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Error loading vector store for knowledgebase {knowledgebase_id}."
+            )
+        return {
+            "status": "success",
+            "data": {
+                "knowledgebase_id": knowledgebase_id,
+                "version": query_interface.version
+            }
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error warming up knowledgebase {knowledgebase_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/knowledgebase/{knowledgebase_id}/tuning-report")
+async def get_tuning_report(knowledgebase_id: str):
+    """Get the ANN search parameter tuning report from the last training run."""
+    try:
+        store_path = get_published_store_path(knowledgebase_id)
+        report = read_tuning_report(store_path) if store_path else None
+        if report is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No tuning report found for knowledgebase {knowledgebase_id}. It is only produced for approximate (HNSW/IVF-PQ) indexes."
+            )
+        return {
+            "status": "success",
+            "data": report
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error reading tuning report: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/knowledgebase/{knowledgebase_id}/compression-report")
+async def get_compression_report(knowledgebase_id: str):
+    """Get the memory saved and recall lost by the knowledgebase's dimension reduction and quantization."""
+    try:
+        store_path = get_published_store_path(knowledgebase_id)
+        report = read_compression_report(store_path) if store_path else None
+        if report is None:
+            raise HTTPException(
+                status_code=404,
+                detail=f"No compression report found for knowledgebase {knowledgebase_id}. It is only produced when embedding_dimensions or quantization is set."
+            )
+        return {
+            "status": "success",
+            "data": report
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error reading compression report: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
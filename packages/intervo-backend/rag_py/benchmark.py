@@ -0,0 +1,229 @@
+"""
+Benchmarks for the RAG vector store.
+
+Usage:
+    python rag_py/benchmark.py index-load [--vectors 200000] [--dim 1536] [--index-type flat] [--vector-store-path PATH]
+    python rag_py/benchmark.py shards [--vectors 500000] [--dim 768] [--shards 1,2,4,8] [--index-type flat]
+
+index-load compares cold-start load time, resident memory, first query
+latency and top-k chunk fetch time of a vector store loaded into memory
+versus memory-mapped (with chunks left in the on-disk chunk store), for a
+flat, HNSW or IVF-PQ index. Each mode is measured in a fresh subprocess.
+"rss_after_load_mb.anon" is the heap each API worker holds on its own.
+
+shards compares single-query search latency of one corpus split into
+different shard counts, searched in parallel by the shard search pool's
+worker processes and, for reference, by threads in this process.
+"""
+import sys
+import os
+
+_current_file_directory = os.path.dirname(os.path.abspath(__file__))
+_parent_directory = os.path.dirname(_current_file_directory)
+if _parent_directory not in sys.path:
+    sys.path.insert(0, _parent_directory)
+
+import argparse
+import json
+import resource
+import subprocess
+import tempfile
+import time
+import uuid
+from pathlib import Path
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from rag_py.shard_search import ShardSearchPool
+from rag_py.vector_index import (
+    INDEX_FLAT,
+    INDEX_TYPES,
+    LOAD_MODE_MEMORY,
+    LOAD_MODE_MMAP,
+    apply_search_params,
+    build_index,
+    build_sharded_index,
+    load_faiss_store,
+    save_faiss_store,
+    shard_indexes
+)
+
+
+def _resident_memory_mb() -> dict:
+    """
+    Resident memory of this process in MB, split into private heap ("anon")
+    and file-backed pages ("file") that are shared through the page cache.
+    """
+    try:
+        memory = {}
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(("RssAnon:", "RssFile:")):
+                    name, value, _ = line.split()
+                    memory["anon" if name == "RssAnon:" else "file"] = int(value) / 1024
+        return memory
+    except OSError:
+        # Peak RSS only; kilobytes on Linux, bytes on macOS
+        return {"anon": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, "file": 0.0}
+
+
+def _memory_delta(before: dict, after: dict) -> dict:
+    return {name: round(after[name] - before[name], 2) for name in after}
+
+
+def build_synthetic_store(path: Path, num_vectors: int, dimension: int, index_type: str = INDEX_FLAT) -> None:
+    """Write a vector store of random vectors with short documents."""
+    vectors = np.random.default_rng(0).standard_normal((num_vectors, dimension), dtype=np.float32)
+    index, _, _ = build_index(vectors, index_type, {})
+    batch_size = 50_000
+    for start in range(0, num_vectors, batch_size):
+        index.add(vectors[start:start + batch_size])
+
+    ids = [str(uuid.uuid4()) for _ in range(num_vectors)]
+    docstore = InMemoryDocstore({
+        doc_id: Document(page_content=f"Synthetic chunk {i}", metadata={"type": "benchmark"})
+        for i, doc_id in enumerate(ids)
+    })
+    save_faiss_store(FAISS(None, index, docstore, dict(enumerate(ids))), path)
+
+
+def measure_load(path: Path, load_mode: str) -> dict:
+    """Load the store once in this process and report timings and memory."""
+    rss_before = _resident_memory_mb()
+    started_at = time.perf_counter()
+    vector_store = load_faiss_store(path, None, load_mode)
+    load_ms = (time.perf_counter() - started_at) * 1000
+    rss_after_load = _resident_memory_mb()
+
+    query = np.random.default_rng(1).standard_normal((1, vector_store.index.d), dtype=np.float32)
+    started_at = time.perf_counter()
+    _, ids = vector_store.index.search(query, 4)
+    first_query_ms = (time.perf_counter() - started_at) * 1000
+
+    started_at = time.perf_counter()
+    for faiss_id in ids[0]:
+        vector_store.docstore.search(vector_store.index_to_docstore_id[int(faiss_id)])
+    first_fetch_ms = (time.perf_counter() - started_at) * 1000
+
+    return {
+        "load_mode": load_mode,
+        "load_ms": round(load_ms, 2),
+        "rss_after_load_mb": _memory_delta(rss_before, rss_after_load),
+        "first_query_ms": round(first_query_ms, 2),
+        "first_fetch_ms": round(first_fetch_ms, 2),
+        "rss_after_query_mb": _memory_delta(rss_before, _resident_memory_mb()),
+    }
+
+
+def run_index_load(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if args.vector_store_path:
+            path = Path(args.vector_store_path)
+        else:
+            path = Path(tmp_dir)
+            print(f"Building synthetic {args.index_type} store with {args.vectors} vectors of dimension {args.dim}...")
+            build_synthetic_store(path, args.vectors, args.dim, args.index_type)
+
+        index_size_mb = (path / "index.faiss").stat().st_size / (1024 * 1024)
+        print(f"index.faiss: {index_size_mb:.1f} MB")
+        for load_mode in (LOAD_MODE_MEMORY, LOAD_MODE_MMAP):
+            output = subprocess.run(
+                [sys.executable, __file__, "_measure-load", str(path), load_mode],
+                check=True,
+                capture_output=True,
+                text=True
+            ).stdout
+            print(json.dumps(json.loads(output.strip().splitlines()[-1])))
+
+
+def _latency_summary(latencies: list) -> dict:
+    return {
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+    }
+
+
+def run_shards(args: argparse.Namespace) -> None:
+    rng = np.random.default_rng(0)
+    print(f"Generating {args.vectors} vectors of dimension {args.dim}...")
+    vectors = rng.standard_normal((args.vectors, args.dim), dtype=np.float32)
+    queries = rng.standard_normal((args.queries, args.dim), dtype=np.float32)
+    config = {"index_type": args.index_type}
+
+    for num_shards in [int(n) for n in args.shards.split(",")]:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            index, index_type, search_params = build_sharded_index(vectors, num_shards, config)
+            index.add(vectors)
+            apply_search_params(index, search_params)
+            paths = []
+            for shard, shard_index in enumerate(shard_indexes(index)):
+                path = Path(tmp_dir) / f"shard-{shard:03d}.faiss"
+                faiss.write_index(shard_index, str(path))
+                paths.append(path)
+            offsets = [int(offset) for offset in np.cumsum([0] + [s.ntotal for s in shard_indexes(index)][:-1])]
+
+            thread_latencies = []
+            for query in queries:
+                started_at = time.perf_counter()
+                index.search(query.reshape(1, -1), args.k)
+                thread_latencies.append((time.perf_counter() - started_at) * 1000)
+
+            pool = ShardSearchPool(num_workers=min(num_shards, args.workers or num_shards))
+            try:
+                # Warm up: workers start and map their shards
+                pool.search(paths, offsets, queries[:1], args.k, search_params)
+                process_latencies = []
+                for query in queries:
+                    started_at = time.perf_counter()
+                    pool.search(paths, offsets, query.reshape(1, -1), args.k, search_params)
+                    process_latencies.append((time.perf_counter() - started_at) * 1000)
+            finally:
+                pool.shutdown()
+
+            print(json.dumps({
+                "shards": num_shards,
+                "index_type": index_type,
+                "workers": pool.num_workers,
+                "process_pool": _latency_summary(process_latencies),
+                "threads": _latency_summary(thread_latencies),
+            }))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    index_load = subparsers.add_parser("index-load", help="Compare in-memory and memory-mapped index loading")
+    index_load.add_argument("--vectors", type=int, default=200_000)
+    index_load.add_argument("--dim", type=int, default=1536)
+    index_load.add_argument("--index-type", default=INDEX_FLAT, choices=INDEX_TYPES)
+    index_load.add_argument("--vector-store-path", help="Benchmark an existing vector store instead")
+
+    shards = subparsers.add_parser("shards", help="Compare search latency across shard counts")
+    shards.add_argument("--vectors", type=int, default=500_000)
+    shards.add_argument("--dim", type=int, default=768)
+    shards.add_argument("--shards", default="1,2,4,8", help="Comma-separated shard counts")
+    shards.add_argument("--index-type", default="flat")
+    shards.add_argument("--queries", type=int, default=200)
+    shards.add_argument("--k", type=int, default=4)
+    shards.add_argument("--workers", type=int, help="Worker processes (default: one per shard)")
+
+    measure = subparsers.add_parser("_measure-load")
+    measure.add_argument("path")
+    measure.add_argument("load_mode")
+
+    args = parser.parse_args()
+    if args.command == "index-load":
+        run_index_load(args)
+    elif args.command == "shards":
+        run_shards(args)
+    elif args.command == "_measure-load":
+        print(json.dumps(measure_load(Path(args.path), args.load_mode)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,410 @@
+import json
+import logging
+import os
+import re
+import sqlite3
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from langchain_community.docstore.base import Docstore
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+# File in a vector store directory holding the chunks
+CHUNK_STORE_FILENAME = "chunks.sqlite"
+
+_SCHEMA = """
+CREATE TABLE chunks (
+    faiss_id INTEGER PRIMARY KEY,
+    chunk_id TEXT NOT NULL UNIQUE,
+    page_content TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+"""
+
+# Chunk store shared by many knowledge bases; faiss_id is the ID in the pool's index
+_TENANT_SCHEMA = """
+CREATE TABLE chunks (
+    row_id INTEGER PRIMARY KEY,
+    tenant TEXT NOT NULL,
+    faiss_id INTEGER NOT NULL,
+    chunk_id TEXT NOT NULL,
+    page_content TEXT NOT NULL,
+    metadata TEXT NOT NULL,
+    UNIQUE (tenant, faiss_id),
+    UNIQUE (tenant, chunk_id)
+);
+"""
+
+# Full-text index over the chunk text for keyword search. It is an external
+# content table: it stores only which chunks contain each word (no text, no
+# positions) and the triggers keep it in sync with chunks.
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE chunks_fts USING fts5(page_content, content='chunks', detail=none);
+CREATE TRIGGER chunks_fts_insert AFTER INSERT ON chunks BEGIN
+    INSERT INTO chunks_fts (rowid, page_content) VALUES (new.rowid, new.page_content);
+END;
+CREATE TRIGGER chunks_fts_delete AFTER DELETE ON chunks BEGIN
+    INSERT INTO chunks_fts (chunks_fts, rowid, page_content) VALUES ('delete', old.rowid, old.page_content);
+END;
+"""
+
+# Runs of letters and digits, the tokens of the full-text index
+_WORD_PARTS = re.compile(r"[^\W_]+")
+
+_INSERT = "INSERT INTO chunks (faiss_id, chunk_id, page_content, metadata) VALUES (?, ?, ?, ?)"
+_TENANT_INSERT = "INSERT INTO chunks (tenant, faiss_id, chunk_id, page_content, metadata) VALUES (?, ?, ?, ?, ?)"
+
+
+def _chunk_rows(docstore: Docstore, index_to_docstore_id: Dict[int, str]) -> Iterator[Tuple[Any, ...]]:
+    """Rows of (faiss_id, chunk_id, page_content, metadata)."""
+    for faiss_id, chunk_id in index_to_docstore_id.items():
+        document = docstore.search(chunk_id)
+        if not isinstance(document, Document):
+            logger.warning(f"Chunk {chunk_id} missing from docstore; not written to chunk store")
+            continue
+        yield (
+            int(faiss_id),
+            chunk_id,
+            document.page_content,
+            json.dumps(document.metadata, ensure_ascii=False)
+        )
+
+
+def _fts_query(word: str) -> Optional[str]:
+    """
+    Full-text query for chunks containing a word, or None if it has no letters or digits.
+
+    Each letter/digit run of the word matches words it is a prefix of, as
+    the tokenizer splits on punctuation: "price?" matches "prices" and
+    "e-mail" matches "e-mails".
+    """
+    parts = _WORD_PARTS.findall(word)
+    if not parts:
+        return None
+    return " AND ".join(f'"{part}"*' for part in parts)
+
+
+class ChunkIdMap(Mapping):
+    """
+    Read-only FAISS ID to chunk ID mapping looked up in a chunk store.
+
+    Stands in for the index_to_docstore_id dict, which for large stores would
+    otherwise be rebuilt in the heap of every process serving the store; the
+    lookups hit SQLite pages shared through the OS page cache.
+    """
+
+    def __init__(self, store: "ChunkStore", size: int):
+        self._store = store
+        self._size = size
+
+    def __getitem__(self, faiss_id: int) -> str:
+        row = self._store._connection().execute(
+            f"SELECT chunk_id FROM chunks WHERE faiss_id = ?{self._store._tenant_filter}",
+            (int(faiss_id), *self._store._tenant_params)
+        ).fetchone()
+        if row is None:
+            raise KeyError(faiss_id)
+        return row[0]
+
+    def __iter__(self) -> Iterator[int]:
+        cursor = self._store._connection().execute(
+            f"SELECT faiss_id FROM chunks WHERE 1 = 1{self._store._tenant_filter} ORDER BY faiss_id",
+            self._store._tenant_params
+        )
+        return (row[0] for row in cursor)
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class ChunkStore(Docstore):
+    """
+    Read-only, SQLite-backed docstore keyed by FAISS ID.
+
+    Replaces the pickled InMemoryDocstore in index.pkl: opening a store only
+    counts its chunks. The FAISS ID to chunk ID mapping, chunk
+    text and metadata are looked up on demand for the top-k hits, with a
+    small LRU cache of documents in front.
+
+    A store shared by many knowledge bases (see tenant_index) is opened with
+    a tenant, which scopes every lookup to that tenant's chunks.
+    """
+
+    def __init__(self, path: Path, cache_size: int = 1024, tenant: Optional[str] = None):
+        """
+        Open a chunk store.
+
+        Args:
+            path: Path to the chunks.sqlite file
+            cache_size: Number of recently fetched documents kept in memory
+            tenant: Knowledge base ID, for chunk stores shared by many tenants
+        """
+        self.path = Path(path)
+        if not self.path.exists():
+            raise ValueError(f"Chunk store not found at {self.path}")
+        self.cache_size = cache_size
+        self.tenant = tenant
+        self._tenant_filter = " AND tenant = ?" if tenant is not None else ""
+        self._tenant_params: Tuple[str, ...] = (tenant,) if tenant is not None else ()
+        self._local = threading.local()
+        self._cache: "OrderedDict[str, Document]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+        (count,) = self._connection().execute(
+            f"SELECT COUNT(*) FROM chunks WHERE 1 = 1{self._tenant_filter}",
+            self._tenant_params
+        ).fetchone()
+        self.index_to_docstore_id = ChunkIdMap(self, count)
+        # Stores written before the full-text index are scanned instead
+        self._has_fts = self._connection().execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'chunks_fts'"
+        ).fetchone() is not None
+
+    def _connection(self) -> sqlite3.Connection:
+        """One read-only connection per thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(f"file:{self.path}?mode=ro", uri=True, check_same_thread=False)
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _to_document(chunk_id: str, page_content: str, metadata: str) -> Document:
+        return Document(id=chunk_id, page_content=page_content, metadata=json.loads(metadata))
+
+    def _cache_get(self, chunk_id: str) -> Optional[Document]:
+        with self._cache_lock:
+            document = self._cache.get(chunk_id)
+            if document is not None:
+                self._cache.move_to_end(chunk_id)
+            return document
+
+    def _cache_put(self, document: Document) -> None:
+        with self._cache_lock:
+            self._cache[document.id] = document
+            self._cache.move_to_end(document.id)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def search(self, search: str) -> Union[str, Document]:
+        """
+        Fetch a document by chunk ID (the LangChain docstore interface).
+
+        Args:
+            search: Chunk ID
+
+        Returns:
+            The Document, or a not-found message string
+        """
+        document = self._cache_get(search)
+        if document is not None:
+            return document
+        row = self._connection().execute(
+            f"SELECT chunk_id, page_content, metadata FROM chunks WHERE chunk_id = ?{self._tenant_filter}",
+            (search, *self._tenant_params)
+        ).fetchone()
+        if row is None:
+            return f"ID {search} not found."
+        document = self._to_document(*row)
+        self._cache_put(document)
+        return document
+
+    def get_by_faiss_ids(self, faiss_ids: Iterable[int]) -> List[Optional[Document]]:
+        """
+        Fetch documents by FAISS ID, preserving order.
+
+        Args:
+            faiss_ids: FAISS IDs, e.g. the result of an index search
+
+        Returns:
+            One Document per ID, or None for unknown IDs
+        """
+        faiss_ids = [int(faiss_id) for faiss_id in faiss_ids]
+        documents: Dict[int, Document] = {}
+        missing = []
+        for faiss_id, chunk_id in self.chunk_ids(faiss_ids).items():
+            document = self._cache_get(chunk_id)
+            if document is not None:
+                documents[faiss_id] = document
+            else:
+                missing.append(faiss_id)
+        if missing:
+            placeholders = ",".join("?" * len(missing))
+            rows = self._connection().execute(
+                f"SELECT faiss_id, chunk_id, page_content, metadata FROM chunks "
+                f"WHERE faiss_id IN ({placeholders}){self._tenant_filter}",
+                (*missing, *self._tenant_params)
+            ).fetchall()
+            for faiss_id, chunk_id, page_content, metadata in rows:
+                document = self._to_document(chunk_id, page_content, metadata)
+                self._cache_put(document)
+                documents[faiss_id] = document
+        return [documents.get(faiss_id) for faiss_id in faiss_ids]
+
+    def chunk_ids(self, faiss_ids: List[int]) -> Dict[int, str]:
+        """Look up the chunk IDs of several FAISS IDs in one query; unknown IDs are left out."""
+        if not faiss_ids:
+            return {}
+        placeholders = ",".join("?" * len(faiss_ids))
+        rows = self._connection().execute(
+            f"SELECT faiss_id, chunk_id FROM chunks WHERE faiss_id IN ({placeholders}){self._tenant_filter}",
+            (*faiss_ids, *self._tenant_params)
+        ).fetchall()
+        return dict(rows)
+
+    def id_mapping(self) -> Dict[int, str]:
+        """Read the whole FAISS ID to chunk ID mapping into a dict, e.g. to make the store writable."""
+        return dict(self._connection().execute(
+            f"SELECT faiss_id, chunk_id FROM chunks WHERE 1 = 1{self._tenant_filter}",
+            self._tenant_params
+        ).fetchall())
+
+    def keyword_search(self, words: List[str], limit: int) -> List[Tuple[Document, float]]:
+        """
+        Score chunks by the fraction of the given lowercase words they contain.
+
+        Words are looked up in the full-text index, which matches whole words
+        and words they are a prefix of ("price" matches "prices"), so only
+        matching chunks are visited and only the returned hits are loaded.
+        Stores written before the index existed are scanned for substrings.
+
+        Args:
+            words: Lowercased query words
+            limit: Maximum number of results
+
+        Returns:
+            List of (Document, score), best first
+        """
+        if not words:
+            return []
+        if self._has_fts:
+            terms = [query for query in map(_fts_query, words) if query is not None]
+            if not terms:
+                return []
+            matches = " UNION ALL ".join(["SELECT rowid FROM chunks_fts WHERE chunks_fts MATCH ?"] * len(terms))
+            rows = self._connection().execute(
+                f"SELECT faiss_id, COUNT(*) AS hits FROM ({matches}) AS matches "
+                f"JOIN chunks ON chunks.rowid = matches.rowid WHERE 1 = 1{self._tenant_filter} "
+                f"GROUP BY faiss_id ORDER BY hits DESC, faiss_id LIMIT ?",
+                (*terms, *self._tenant_params, limit)
+            ).fetchall()
+        else:
+            hits_expression = " + ".join(["(instr(lower(page_content), ?) > 0)"] * len(words))
+            rows = self._connection().execute(
+                f"SELECT faiss_id, hits FROM ("
+                f"SELECT faiss_id, {hits_expression} AS hits FROM chunks WHERE 1 = 1{self._tenant_filter}"
+                f") WHERE hits > 0 ORDER BY hits DESC, faiss_id LIMIT ?",
+                (*words, *self._tenant_params, limit)
+            ).fetchall()
+        documents = self.get_by_faiss_ids(row[0] for row in rows)
+        return [
+            (document, hits / len(words))
+            for document, (_, hits) in zip(documents, rows)
+            if document is not None
+        ]
+
+    def __len__(self) -> int:
+        return len(self.index_to_docstore_id)
+
+    def items(self) -> Iterator[Tuple[str, Document]]:
+        """Iterate over (chunk ID, Document) in FAISS ID order without caching."""
+        cursor = self._connection().execute(
+            f"SELECT chunk_id, page_content, metadata FROM chunks WHERE 1 = 1{self._tenant_filter} ORDER BY faiss_id",
+            self._tenant_params
+        )
+        for chunk_id, page_content, metadata in cursor:
+            yield chunk_id, self._to_document(chunk_id, page_content, metadata)
+
+    @staticmethod
+    def write(
+        path: Path,
+        docstore: Docstore,
+        index_to_docstore_id: Dict[int, str]
+    ) -> None:
+        """
+        Write a chunk store from a docstore and its FAISS ID mapping.
+
+        The file is written under a temporary name and renamed into place.
+
+        Args:
+            path: Destination chunks.sqlite path
+            docstore: Docstore holding the chunk documents
+            index_to_docstore_id: FAISS ID to chunk ID mapping
+        """
+        path = Path(path)
+        tmp_path = path.with_name(path.name + ".tmp")
+        if tmp_path.exists():
+            tmp_path.unlink()
+
+        connection = sqlite3.connect(tmp_path)
+        try:
+            connection.executescript(_SCHEMA)
+            connection.executemany(_INSERT, _chunk_rows(docstore, index_to_docstore_id))
+            # Building the full-text index in one pass is about twice as fast as row by row
+            connection.executescript(_FTS_SCHEMA)
+            connection.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+            connection.commit()
+        finally:
+            connection.close()
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def write_tenant(
+        path: Path,
+        tenant: str,
+        docstore: Optional[Docstore] = None,
+        index_to_docstore_id: Optional[Dict[int, str]] = None,
+        start: int = 0
+    ) -> None:
+        """
+        Replace one tenant's chunks in a shared chunk store.
+
+        The rows are replaced in place in one transaction. A new copy gets
+        new FAISS IDs, so readers still searching the previous pool index
+        find no chunks for its IDs rather than the wrong ones.
+
+        Args:
+            path: Shared chunks.sqlite path; created if missing
+            tenant: Knowledge base ID
+            docstore: Docstore holding the tenant's chunks, or None to remove the tenant
+            index_to_docstore_id: Tenant-local FAISS ID to chunk ID mapping
+            start: Pool FAISS ID of the tenant's first row; tenant-local IDs are offset by it
+        """
+        connection = sqlite3.connect(path)
+        try:
+            has_schema = connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'chunks'"
+            ).fetchone() is not None
+            if not has_schema:
+                connection.executescript(_TENANT_SCHEMA + _FTS_SCHEMA)
+            connection.execute("DELETE FROM chunks WHERE tenant = ?", (tenant,))
+            if docstore is not None:
+                connection.executemany(
+                    _TENANT_INSERT,
+                    (
+                        (tenant, start + faiss_id, *row)
+                        for faiss_id, *row in _chunk_rows(docstore, index_to_docstore_id)
+                    )
+                )
+            connection.commit()
+        finally:
+            connection.close()
+
+def iter_docstore(docstore: Docstore) -> Iterator[Tuple[str, Document]]:
+    """
+    Iterate over (chunk ID, Document) pairs of a ChunkStore or InMemoryDocstore.
+
+    Args:
+        docstore: The vector store's docstore
+
+    Returns:
+        Iterator of (chunk ID, Document)
+    """
+    if isinstance(docstore, ChunkStore):
+        return docstore.items()
+    return iter(docstore._dict.items())
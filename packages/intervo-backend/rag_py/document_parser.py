@@ -0,0 +1,263 @@
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, List, Optional
+
+import mammoth
+import pdfplumber
+from bs4 import BeautifulSoup
+
+from rag_py.query_executor import worker_cpu_share
+
+try:
+    import resource
+except ImportError:  # Not available on Windows, where memory is not capped
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Parser modes: a pool of worker processes, or threads in this process
+PARSER_PROCESS = "process"
+PARSER_THREAD = "thread"
+
+# Extensions of the documents parsed by the pool; anything else is decoded as UTF-8 in place
+PDF_EXTENSIONS = ('.pdf',)
+WORD_EXTENSIONS = ('.docx', '.doc')
+
+
+def needs_parser(filename: str) -> bool:
+    """Whether a file is a PDF or Word document, whose parsing is CPU-heavy."""
+    return filename.lower().endswith(PDF_EXTENSIONS + WORD_EXTENSIONS)
+
+
+def parse_document(filename: str, content: bytes) -> str:
+    """Convert an uploaded file to text according to its extension."""
+    filename = filename.lower()
+    if filename.endswith(PDF_EXTENSIONS):
+        # Convert PDF to text using pdfplumber; pages without a text layer give no text
+        with pdfplumber.open(io.BytesIO(content)) as pdf:
+            return "\n".join(page.extract_text() or "" for page in pdf.pages)
+    if filename.endswith(WORD_EXTENSIONS):
+        # Convert DOC/DOCX to HTML using mammoth, then extract text
+        result = mammoth.convert_to_html(io.BytesIO(content))
+        return BeautifulSoup(result.value, 'html.parser').get_text(separator='\n')
+    # For other files, try to decode as UTF-8 text
+    return content.decode('utf-8')
+
+
+def _init_worker(memory_limit_bytes: int) -> None:
+    """Cap the worker's address space, so a document that blows up in memory fails with MemoryError."""
+    if resource is None or not memory_limit_bytes:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        memory_limit_bytes = min(memory_limit_bytes, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (memory_limit_bytes, hard))
+
+
+class _ParseWorker:
+    """One worker process, run as a single-process executor so it can be killed on its own."""
+
+    def __init__(self, memory_limit_bytes: int):
+        # Forking a process that runs threads is unsafe
+        self.executor = ProcessPoolExecutor(
+            max_workers=1,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(memory_limit_bytes,)
+        )
+        self.pid: Optional[int] = None
+
+    async def start(self) -> None:
+        self.pid = await asyncio.wrap_future(self.executor.submit(os.getpid))
+
+    def kill(self) -> None:
+        """Stop the worker, even in the middle of a document."""
+        if self.pid is not None:
+            try:
+                os.kill(self.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class DocumentParser:
+    """
+    Parse PDF and Word documents in a pool of worker processes.
+
+    pdfplumber, mammoth and BeautifulSoup are pure Python and hold the GIL,
+    so in threads many documents parse on one core and slow down the event
+    loop serving queries. In worker processes they parse in parallel on as
+    many cores as there are workers. Each document gets timeout_seconds; a
+    worker that runs out of time is killed and replaced. Each worker's
+    address space is capped at memory_limit_mb, and a worker that runs out
+    of memory is replaced too.
+    """
+
+    def __init__(
+        self,
+        mode: Optional[str] = None,
+        num_workers: Optional[int] = None,
+        timeout_seconds: Optional[float] = None,
+        memory_limit_mb: Optional[int] = None
+    ):
+        """
+        Initialize the parser. Worker processes are started on demand.
+
+        Args:
+            mode: PARSER_PROCESS or PARSER_THREAD. Defaults to the
+                RAG_DOCUMENT_PARSER environment variable, or "process".
+            num_workers: Most documents parsed at once. Defaults to
+                RAG_PARSE_WORKERS, or this API worker's share of the CPU cores.
+            timeout_seconds: Time allowed per document. Defaults to
+                RAG_PARSE_TIMEOUT_SECONDS, or 120.
+            memory_limit_mb: Address space of each worker process. Defaults to
+                RAG_PARSE_MEMORY_MB, or 2048.
+        """
+        self.mode = mode or os.getenv("RAG_DOCUMENT_PARSER") or PARSER_PROCESS
+        self.num_workers = num_workers or int(os.getenv("RAG_PARSE_WORKERS") or worker_cpu_share())
+        self.timeout_seconds = timeout_seconds or float(os.getenv("RAG_PARSE_TIMEOUT_SECONDS") or 120)
+        self.memory_limit_mb = memory_limit_mb or int(os.getenv("RAG_PARSE_MEMORY_MB") or 2048)
+        self._idle: List[_ParseWorker] = []
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._lock = threading.Lock()
+        self.workers = 0
+        self.parsed = 0
+        self.failed = 0
+        self.timed_out = 0
+        self.out_of_memory = 0
+        self.bytes = 0
+        self._total_parse_time = 0.0
+        logger.info(
+            f"Document parser using {self.num_workers} {self.mode} workers, {self.timeout_seconds}s "
+            f"and {self.memory_limit_mb} MB per document"
+        )
+
+    async def parse(self, filename: str, content: bytes) -> str:
+        """
+        Convert a file to text according to its extension.
+
+        Args:
+            filename: File name, whose extension selects the parser
+            content: File content
+
+        Returns:
+            The document's text
+
+        Raises:
+            TimeoutError: Parsing took longer than timeout_seconds
+            MemoryError: The worker ran out of memory
+        """
+        if not needs_parser(filename):
+            return parse_document(filename, content)
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.num_workers)
+        async with self._slots:
+            started_at = time.perf_counter()
+            try:
+                if self.mode == PARSER_THREAD:
+                    # A thread cannot be stopped, so a timed out document still finishes in the background
+                    text = await asyncio.wait_for(
+                        asyncio.to_thread(parse_document, filename, content),
+                        self.timeout_seconds
+                    )
+                else:
+                    text = await self._parse_in_worker(filename, content)
+            except Exception:
+                with self._lock:
+                    self.failed += 1
+                raise
+            with self._lock:
+                self.parsed += 1
+                self.bytes += len(content)
+                self._total_parse_time += time.perf_counter() - started_at
+            return text
+
+    async def _parse_in_worker(self, filename: str, content: bytes) -> str:
+        worker = self._idle.pop() if self._idle else await self._start_worker()
+        healthy = False
+        try:
+            text = await asyncio.wait_for(
+                asyncio.wrap_future(worker.executor.submit(parse_document, filename, content)),
+                self.timeout_seconds
+            )
+            healthy = True
+            return text
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.timed_out += 1
+            raise TimeoutError(f"Parsing {filename} took longer than {self.timeout_seconds}s")
+        except (MemoryError, BrokenProcessPool) as e:
+            # The OS may kill a worker outright rather than let it raise MemoryError
+            with self._lock:
+                self.out_of_memory += 1
+            raise MemoryError(f"Parsing {filename} ran out of memory ({self.memory_limit_mb} MB): {e!r}")
+        except Exception:
+            # The document itself could not be parsed; the worker is fine
+            healthy = True
+            raise
+        finally:
+            if healthy:
+                self._idle.append(worker)
+            else:
+                # Timed out, out of memory or cancelled: the worker may still be busy or broken
+                worker.kill()
+                with self._lock:
+                    self.workers -= 1
+
+    async def _start_worker(self) -> _ParseWorker:
+        worker = _ParseWorker(self.memory_limit_mb * 1024 * 1024)
+        try:
+            await worker.start()
+        except BaseException:
+            worker.kill()
+            raise
+        with self._lock:
+            self.workers += 1
+        return worker
+
+    def stats(self) -> Dict[str, Any]:
+        """Return worker count, parse outcome counts and average parse latency."""
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "max_workers": self.num_workers,
+                "workers": self.workers,
+                "parsed": self.parsed,
+                "failed": self.failed,
+                "timed_out": self.timed_out,
+                "out_of_memory": self.out_of_memory,
+                "bytes": self.bytes,
+                "avg_parse_ms": round(self._total_parse_time / self.parsed * 1000, 3) if self.parsed else 0.0
+            }
+
+    def shutdown(self) -> None:
+        """Stop the worker processes."""
+        for worker in self._idle:
+            worker.executor.shutdown(wait=True)
+        self._idle.clear()
+
+
+_document_parser: Optional[DocumentParser] = None
+_document_parser_lock = threading.Lock()
+
+
+def document_parser_started() -> bool:
+    """Whether any document has been parsed with the document parser yet."""
+    return _document_parser is not None
+
+
+def get_document_parser() -> DocumentParser:
+    """Get the process-wide document parser, creating it on first use."""
+    global _document_parser
+    with _document_parser_lock:
+        if _document_parser is None:
+            _document_parser = DocumentParser()
+        return _document_parser
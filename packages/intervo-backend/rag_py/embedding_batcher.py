@@ -0,0 +1,167 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the batch size histogram buckets
+BATCH_SIZE_BUCKETS = [1, 2, 4, 8, 16, 32, 64, 128, 256]
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batch query embeddings across concurrent requests.
+
+    Texts submitted within a short window (or until the batch is full) are sent
+    to the provider as a single aembed_documents request, and the vectors are
+    fanned back out to the waiting callers.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        max_batch_size: Optional[int] = None,
+        max_wait_ms: Optional[float] = None
+    ):
+        """
+        Initialize the embedding batcher.
+
+        Args:
+            embeddings: Embeddings model used to embed each batch
+            max_batch_size: Maximum texts per request. Defaults to the
+                RAG_EMBED_BATCH_SIZE environment variable, or 64.
+            max_wait_ms: How long the first text of a batch may wait for others.
+                Defaults to the RAG_EMBED_BATCH_WAIT_MS environment variable, or 5.
+        """
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size or int(os.getenv("RAG_EMBED_BATCH_SIZE", "64"))
+        if max_wait_ms is None:
+            max_wait_ms = float(os.getenv("RAG_EMBED_BATCH_WAIT_MS", "5"))
+        self.max_wait_ms = max_wait_ms
+
+        self._pending: List[Tuple[str, asyncio.Future, float]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        # The event loop only holds weak references to tasks, so in-flight batches are kept here
+        self._batch_tasks: Set[asyncio.Task] = set()
+
+        self.requests = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.max_batch_size_seen = 0
+        self.batch_size_histogram = {bucket: 0 for bucket in BATCH_SIZE_BUCKETS}
+        self._total_wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+    async def embed_query(self, text: str) -> List[float]:
+        """
+        Embed a single text as part of the next batch.
+
+        Args:
+            text: Text to embed
+
+        Returns:
+            The embedding vector
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future, time.perf_counter()))
+        self.requests += 1
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait_ms / 1000, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        """Send everything pending as one batch."""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, []
+        task = asyncio.ensure_future(self._send_batch(batch))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def _send_batch(self, batch: List[Tuple[str, asyncio.Future, float]]) -> None:
+        sent_at = time.perf_counter()
+        self._record_batch(batch, sent_at)
+
+        # Identical texts in the same batch are embedded once
+        unique_texts = list(dict.fromkeys(text for text, _, _ in batch))
+        try:
+            vectors = await self.embeddings.aembed_documents(unique_texts)
+        except Exception as e:
+            self.failed_batches += 1
+            logger.error(f"Error embedding batch of {len(unique_texts)} texts: {e}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        vectors_by_text = dict(zip(unique_texts, vectors))
+        for text, future, _ in batch:
+            if not future.done():
+                future.set_result(vectors_by_text[text])
+
+    def _record_batch(self, batch: List[Tuple[str, asyncio.Future, float]], sent_at: float) -> None:
+        size = len(batch)
+        self.batches += 1
+        self.max_batch_size_seen = max(self.max_batch_size_seen, size)
+        for bucket in BATCH_SIZE_BUCKETS:
+            if size <= bucket:
+                self.batch_size_histogram[bucket] += 1
+                break
+        for _, _, submitted_at in batch:
+            wait = sent_at - submitted_at
+            self._total_wait_seconds += wait
+            self.max_wait_seconds = max(self.max_wait_seconds, wait)
+
+    def stats(self) -> Dict[str, Any]:
+        """Return batch size and wait time statistics."""
+        batched_requests = self.requests - len(self._pending)
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            "requests": self.requests,
+            "batches": self.batches,
+            "failed_batches": self.failed_batches,
+            "avg_batch_size": round(batched_requests / self.batches, 3) if self.batches else 0.0,
+            "max_batch_size_seen": self.max_batch_size_seen,
+            "batch_size_histogram": {f"le_{bucket}": count for bucket, count in self.batch_size_histogram.items()},
+            "avg_wait_ms": round(self._total_wait_seconds / batched_requests * 1000, 3) if batched_requests else 0.0,
+            "max_wait_ms_seen": round(self.max_wait_seconds * 1000, 3),
+        }
+
+
+_batchers: Dict[str, EmbeddingBatcher] = {}
+
+
+def get_embedding_batcher(embeddings: Embeddings) -> EmbeddingBatcher:
+    """
+    Get the batcher shared by every query using the same embedding model.
+
+    Args:
+        embeddings: Embeddings model; its model name identifies the batcher
+
+    Returns:
+        The shared EmbeddingBatcher
+    """
+    key = getattr(embeddings, "model", None) or type(embeddings).__name__
+    batcher = _batchers.get(key)
+    if batcher is None:
+        batcher = EmbeddingBatcher(embeddings)
+        _batchers[key] = batcher
+    return batcher
+
+
+def get_embedding_batcher_stats() -> Dict[str, Dict[str, Any]]:
+    """Return statistics for every embedding batcher, keyed by model."""
+    return {key: batcher.stats() for key, batcher in _batchers.items()}
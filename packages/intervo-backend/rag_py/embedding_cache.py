@@ -0,0 +1,206 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Default location, next to the knowledge base directories
+DEFAULT_EMBEDDING_CACHE_PATH = "vector_stores/_embedding_cache.sqlite"
+
+# Default size cap of the cache file
+DEFAULT_EMBEDDING_CACHE_MAX_MB = 1024
+
+# Share of the cap freed when the cache is full, so eviction does not run on every insert
+_EVICTION_HEADROOM = 0.1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key BLOB PRIMARY KEY,
+    vector BLOB NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used);
+"""
+
+
+def embedding_cache_key(model: str, dimensions: Optional[int], text: str) -> bytes:
+    """
+    Content address of an embedding: SHA-256 of model, dimension and text.
+
+    Args:
+        model: Embedding model name
+        dimensions: Dimension requested from the model, or None for its default
+        text: Embedded text
+
+    Returns:
+        32-byte key
+    """
+    return hashlib.sha256(f"{model}\0{dimensions or ''}\0{text}".encode('utf-8')).digest()
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache shared by every knowledge base and training run.
+
+    Embeddings are stored as float32 blobs keyed by embedding_cache_key, so a
+    chunk is embedded once no matter how often it is retrained or how many
+    KBs contain it. The file is capped in size; when it is full, the least
+    recently used embeddings are evicted. Several processes may use the same
+    file (SQLite WAL mode).
+    """
+
+    def __init__(self, path: Path, max_bytes: int):
+        """
+        Open or create the cache.
+
+        Args:
+            path: SQLite file path
+            max_bytes: Size cap of the cached embeddings
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, np.ndarray]:
+        """
+        Look up embeddings and mark the found ones as recently used.
+
+        Args:
+            keys: Keys from embedding_cache_key
+
+        Returns:
+            float32 vectors of the cached keys
+        """
+        connection = self._connection()
+        found: Dict[bytes, np.ndarray] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        # Stay well below SQLite's limit on bound parameters
+        for start in range(0, len(unique_keys), 500):
+            batch = unique_keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for key, vector in connection.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                batch
+            ):
+                found[key] = np.frombuffer(vector, dtype=np.float32)
+        if found:
+            with connection:
+                connection.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    ((time.time(), key) for key in found)
+                )
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(unique_keys) - len(found)
+        return found
+
+    def put_many(self, items: Iterable[Tuple[bytes, np.ndarray]]) -> None:
+        """
+        Store embeddings, evicting the least recently used ones beyond the size cap.
+
+        Args:
+            items: (key, vector) pairs
+        """
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                ((key, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, vector in items)
+            )
+        self._evict()
+
+    def _used_bytes(self, connection: sqlite3.Connection) -> int:
+        page_size = connection.execute("PRAGMA page_size").fetchone()[0]
+        page_count = connection.execute("PRAGMA page_count").fetchone()[0]
+        freelist_count = connection.execute("PRAGMA freelist_count").fetchone()[0]
+        return (page_count - freelist_count) * page_size
+
+    def _evict(self) -> None:
+        """Delete least recently used embeddings until the cache is below its cap with some headroom."""
+        connection = self._connection()
+        used_bytes = self._used_bytes(connection)
+        if used_bytes <= self.max_bytes:
+            return
+        count, total_bytes = connection.execute(
+            "SELECT COUNT(*), COALESCE(SUM(LENGTH(vector)), 0) FROM embeddings"
+        ).fetchone()
+        if not count:
+            return
+        # Rows to delete, estimated from the average row size
+        target_bytes = self.max_bytes * (1 - _EVICTION_HEADROOM)
+        bytes_per_row = used_bytes / count
+        to_delete = min(count, int((used_bytes - target_bytes) / bytes_per_row) + 1)
+        with connection:
+            connection.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (to_delete,)
+            )
+        with self._lock:
+            self.evicted += to_delete
+        logger.info(f"Evicted {to_delete} least recently used embeddings from the embedding cache")
+
+    def stats(self) -> Dict[str, Any]:
+        """Report hits, misses, evictions and size."""
+        connection = self._connection()
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": str(self.path),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evicted": self.evicted,
+                "used_bytes": self._used_bytes(connection),
+                "max_bytes": self.max_bytes
+            }
+
+
+_embedding_cache: Optional[EmbeddingCache] = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    """
+    Get the process-wide embedding cache, opening it on first use.
+
+    Its location and size cap come from RAG_EMBEDDING_CACHE_PATH and
+    RAG_EMBEDDING_CACHE_MAX_MB.
+    """
+    global _embedding_cache
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = EmbeddingCache(
+                Path(os.getenv("RAG_EMBEDDING_CACHE_PATH") or DEFAULT_EMBEDDING_CACHE_PATH),
+                int(float(os.getenv("RAG_EMBEDDING_CACHE_MAX_MB") or DEFAULT_EMBEDDING_CACHE_MAX_MB) * 1024 * 1024)
+            )
+        return _embedding_cache
+
+
+def embedding_cache_started() -> bool:
+    """Whether any trainer has opened the embedding cache yet."""
+    return _embedding_cache is not None
@@ -0,0 +1,230 @@
+import json
+import logging
+import os
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import faiss
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from rag_py.ann_tuner import _neighbours_excluding_self
+from rag_py.vector_index import INDEX_FLAT, QUANTIZATION_NONE, QUANTIZATION_TYPES, build_index, shard_indexes
+
+logger = logging.getLogger(__name__)
+
+# Per-KB report of memory saved and recall lost by compression
+COMPRESSION_REPORT_FILENAME = "compression_report.json"
+
+# Shortened dimensions compared when candidate evaluation is enabled
+CANDIDATE_DIMENSIONS = [1024, 768, 512, 256]
+
+
+def reduce_dimensions(vectors: np.ndarray, dimensions: Optional[int]) -> np.ndarray:
+    """
+    Shorten embeddings to their first `dimensions` components and re-normalize.
+
+    This is how text-embedding-3 models shorten embeddings when called with
+    the `dimensions` parameter, so full-size embeddings can be reduced locally
+    and still match what the API would return.
+
+    Args:
+        vectors: float32 array of shape (n, full dimension)
+        dimensions: Target dimension, or None to keep the full dimension
+
+    Returns:
+        float32 array of shape (n, dimensions)
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if not dimensions or dimensions >= vectors.shape[1]:
+        return vectors
+    reduced = np.ascontiguousarray(vectors[:, :dimensions])
+    norms = np.linalg.norm(reduced, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return reduced / norms
+
+
+class ReducedDimensionEmbeddings(Embeddings):
+    """Embeddings wrapper returning shortened, re-normalized embeddings."""
+
+    def __init__(self, embeddings: Embeddings, dimensions: int):
+        """
+        Initialize the wrapper.
+
+        Args:
+            embeddings: Full-dimension embeddings model
+            dimensions: Dimension of the returned embeddings
+        """
+        self.embeddings = embeddings
+        self.dimensions = dimensions
+        self.model = getattr(embeddings, "model", None)
+
+    def _reduce(self, vectors: List[List[float]]) -> List[List[float]]:
+        return reduce_dimensions(np.asarray(vectors, dtype=np.float32), self.dimensions).tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._reduce(self.embeddings.embed_documents(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._reduce([self.embeddings.embed_query(text)])[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._reduce(await self.embeddings.aembed_documents(texts))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return self._reduce([await self.embeddings.aembed_query(text)])[0]
+
+
+def _index_bytes(index: faiss.Index) -> int:
+    """Size of an index (all its shards) as written to disk."""
+    total = 0
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "index.faiss")
+        for shard_index in shard_indexes(index):
+            faiss.write_index(shard_index, path)
+            total += os.path.getsize(path)
+    return total
+
+
+def _recall(index: faiss.Index, probes: np.ndarray, probe_ids: np.ndarray, ground_truth: List[List[int]], k: int) -> float:
+    """recall@k of an index against exact ground truth, probes held out."""
+    _, ids = index.search(probes, k + 1)
+    found = _neighbours_excluding_self(ids, probe_ids, k)
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, ground_truth))
+    expected = sum(len(t) for t in ground_truth)
+    return round(hits / expected, 4) if expected else 1.0
+
+
+def _exact_ground_truth(vectors: np.ndarray, probe_ids: np.ndarray, k: int) -> List[List[int]]:
+    exact_index = faiss.IndexFlatL2(vectors.shape[1])
+    exact_index.add(vectors)
+    _, ids = exact_index.search(vectors[probe_ids], k + 1)
+    return _neighbours_excluding_self(ids, probe_ids, k)
+
+
+def _measurement(dimension: int, quantization: str, index_type: str, index_bytes: int,
+                 baseline_bytes: int, recall: float) -> Dict[str, Any]:
+    return {
+        "dimension": int(dimension),
+        "quantization": quantization,
+        "index_type": index_type,
+        "bytes": int(index_bytes),
+        "memory_saved": round(1 - index_bytes / baseline_bytes, 4) if baseline_bytes else 0.0,
+        "recall": recall,
+        "recall_lost": round(1 - recall, 4)
+    }
+
+
+def evaluate_compression(
+    index: faiss.Index,
+    full_vectors: np.ndarray,
+    manifest: Dict[str, Any],
+    config: Dict[str, Any]
+) -> Dict[str, Any]:
+    """
+    Measure memory saved and recall lost by a KB's dimension reduction and
+    quantization against an exact, full-dimension float32 flat index.
+
+    A sample of the KB's own chunk embeddings serves as probe queries, each
+    held out of its own results. The selected index's recall also includes
+    any loss from approximate (HNSW/IVF-PQ) search.
+
+    Args:
+        index: The built index; its IDs are row positions in full_vectors
+        full_vectors: float32 array of the full-dimension chunk embeddings
+        manifest: The index manifest (index_type, dimension, quantization)
+        config: Train config with optional keys compression_eval_k (default 4),
+            compression_eval_queries (default 200), compression_eval_candidates
+            (default False) and compression_eval_sample (default 20000)
+
+    Returns:
+        The compression report
+    """
+    k = config.get("compression_eval_k", 4)
+    num_vectors, full_dimension = full_vectors.shape
+    num_probes = min(config.get("compression_eval_queries", 200), num_vectors)
+    dimension = manifest["dimension"]
+
+    probe_ids = np.sort(np.random.default_rng(0).choice(num_vectors, num_probes, replace=False))
+    ground_truth = _exact_ground_truth(full_vectors, probe_ids, k)
+    baseline_bytes = num_vectors * full_dimension * 4
+
+    probes = reduce_dimensions(full_vectors[probe_ids], dimension)
+    selected = _measurement(
+        dimension,
+        manifest.get("quantization", QUANTIZATION_NONE),
+        manifest["index_type"],
+        _index_bytes(index),
+        baseline_bytes,
+        _recall(index, probes, probe_ids, ground_truth, k)
+    )
+
+    report = {
+        "num_vectors": int(num_vectors),
+        "probe_queries": int(num_probes),
+        "k": k,
+        "baseline": {
+            "dimension": int(full_dimension),
+            "quantization": QUANTIZATION_NONE,
+            "index_type": INDEX_FLAT,
+            "bytes": int(baseline_bytes)
+        },
+        "selected": selected,
+        "evaluated_at": datetime.utcnow().isoformat()
+    }
+    if config.get("compression_eval_candidates", False):
+        report["candidates"] = _evaluate_candidates(full_vectors, k, num_probes, config)
+
+    logger.info(
+        f"Compression: {selected['dimension']} dims, {selected['quantization']}: "
+        f"{selected['memory_saved']:.1%} memory saved, {selected['recall_lost']:.1%} recall lost"
+    )
+    return report
+
+
+def _evaluate_candidates(full_vectors: np.ndarray, k: int, num_probes: int, config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Evaluate every dimension and quantization combination on flat indexes."""
+    sample_size = config.get("compression_eval_sample", 20_000)
+    if sample_size < len(full_vectors):
+        sample = np.random.default_rng(1).choice(len(full_vectors), sample_size, replace=False)
+        full_vectors = full_vectors[np.sort(sample)]
+    num_vectors, full_dimension = full_vectors.shape
+    num_probes = min(num_probes, num_vectors)
+
+    probe_ids = np.sort(np.random.default_rng(0).choice(num_vectors, num_probes, replace=False))
+    ground_truth = _exact_ground_truth(full_vectors, probe_ids, k)
+    baseline_bytes = num_vectors * full_dimension * 4
+
+    candidates = []
+    dimensions = [full_dimension] + [d for d in CANDIDATE_DIMENSIONS if d < full_dimension]
+    for dimension in dimensions:
+        vectors = reduce_dimensions(full_vectors, dimension)
+        for quantization in QUANTIZATION_TYPES:
+            index, index_type, _ = build_index(vectors, INDEX_FLAT, config, quantization)
+            index.add(vectors)
+            candidates.append(_measurement(
+                dimension,
+                quantization,
+                index_type,
+                index.sa_code_size() * num_vectors,
+                baseline_bytes,
+                _recall(index, vectors[probe_ids], probe_ids, ground_truth, k)
+            ))
+    return candidates
+
+
+def write_compression_report(vector_store_path: Path, report: Dict[str, Any]) -> None:
+    """Write the compression report for a vector store directory."""
+    with open(Path(vector_store_path) / COMPRESSION_REPORT_FILENAME, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=4)
+
+
+def read_compression_report(vector_store_path: Path) -> Optional[Dict[str, Any]]:
+    """Read the compression report for a vector store directory, or None if it has none."""
+    report_path = Path(vector_store_path) / COMPRESSION_REPORT_FILENAME
+    if not report_path.exists():
+        return None
+    with open(report_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
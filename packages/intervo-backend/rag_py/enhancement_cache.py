@@ -0,0 +1,194 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Default location, next to the knowledge base directories
+DEFAULT_ENHANCEMENT_CACHE_PATH = "vector_stores/_enhancement_cache.sqlite"
+
+# Default number of chunks whose enhancements are kept
+DEFAULT_ENHANCEMENT_CACHE_MAX_ENTRIES = 1_000_000
+
+# Share of the cap freed when the cache is full, so eviction does not run on every insert
+_EVICTION_HEADROOM = 0.1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS enhancements (
+    key BLOB PRIMARY KEY,
+    result TEXT NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS enhancements_last_used ON enhancements (last_used);
+"""
+
+
+def enhancement_cache_key(model: str, prompt_version: str, mode: str, agent_prompt: Optional[str], text: str) -> bytes:
+    """
+    Content address of a chunk's enhancements.
+
+    Args:
+        model: Enhancement model name
+        prompt_version: Version of the enhancement prompts
+        mode: Enhancement mode, since combined and separate prompts word their results differently
+        agent_prompt: Agent prompt the priority was judged against, if any
+        text: Chunk text
+
+    Returns:
+        32-byte key
+    """
+    agent_prompt_hash = hashlib.sha256((agent_prompt or "").encode('utf-8')).hexdigest()
+    return hashlib.sha256(f"{model}\0{prompt_version}\0{mode}\0{agent_prompt_hash}\0{text}".encode('utf-8')).digest()
+
+
+class EnhancementCache:
+    """
+    On-disk cache of chunk enhancements (summary, priority and topics) shared
+    by every knowledge base and training run.
+
+    Results are keyed by enhancement_cache_key, so an unchanged chunk is not
+    sent to the LLM again on retrain. At most max_entries results are kept;
+    beyond that the least recently used ones are evicted. Several processes
+    may use the same file (SQLite WAL mode).
+    """
+
+    def __init__(self, path: Path, max_entries: int):
+        """
+        Open or create the cache.
+
+        Args:
+            path: SQLite file path
+            max_entries: Number of results kept
+        """
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        connection = self._connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.executescript(_SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._local.connection = connection
+        return connection
+
+    def get_many(self, keys: List[bytes]) -> Dict[bytes, Dict[str, Any]]:
+        """
+        Look up enhancements and mark the found ones as recently used.
+
+        Args:
+            keys: Keys from enhancement_cache_key
+
+        Returns:
+            Cached results of the found keys
+        """
+        connection = self._connection()
+        found: Dict[bytes, Dict[str, Any]] = {}
+        unique_keys = list(dict.fromkeys(keys))
+        # Stay well below SQLite's limit on bound parameters
+        for start in range(0, len(unique_keys), 500):
+            batch = unique_keys[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            for key, result in connection.execute(
+                f"SELECT key, result FROM enhancements WHERE key IN ({placeholders})",
+                batch
+            ):
+                found[key] = json.loads(result)
+        if found:
+            with connection:
+                connection.executemany(
+                    "UPDATE enhancements SET last_used = ? WHERE key = ?",
+                    ((time.time(), key) for key in found)
+                )
+        with self._lock:
+            self.hits += len(found)
+            self.misses += len(unique_keys) - len(found)
+        return found
+
+    def put_many(self, items: Iterable[Tuple[bytes, Dict[str, Any]]]) -> None:
+        """
+        Store enhancement results, evicting the least recently used ones beyond the cap.
+
+        Args:
+            items: (key, result) pairs
+        """
+        now = time.time()
+        connection = self._connection()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO enhancements (key, result, last_used) VALUES (?, ?, ?)",
+                ((key, json.dumps(result, ensure_ascii=False), now) for key, result in items)
+            )
+        self._evict()
+
+    def _evict(self) -> None:
+        """Delete least recently used results until the cache is below its cap with some headroom."""
+        connection = self._connection()
+        count = connection.execute("SELECT COUNT(*) FROM enhancements").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        to_delete = count - int(self.max_entries * (1 - _EVICTION_HEADROOM))
+        with connection:
+            connection.execute(
+                "DELETE FROM enhancements WHERE key IN "
+                "(SELECT key FROM enhancements ORDER BY last_used LIMIT ?)",
+                (to_delete,)
+            )
+        with self._lock:
+            self.evicted += to_delete
+        logger.info(f"Evicted {to_delete} least recently used results from the enhancement cache")
+
+    def stats(self) -> Dict[str, Any]:
+        """Report hits, misses, evictions and size."""
+        entries = self._connection().execute("SELECT COUNT(*) FROM enhancements").fetchone()[0]
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "path": str(self.path),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evicted": self.evicted,
+                "entries": entries,
+                "max_entries": self.max_entries
+            }
+
+
+_enhancement_cache: Optional[EnhancementCache] = None
+_enhancement_cache_lock = threading.Lock()
+
+
+def get_enhancement_cache() -> EnhancementCache:
+    """
+    Get the process-wide enhancement cache, opening it on first use.
+
+    Its location and size cap come from RAG_ENHANCEMENT_CACHE_PATH and
+    RAG_ENHANCEMENT_CACHE_MAX_ENTRIES.
+    """
+    global _enhancement_cache
+    with _enhancement_cache_lock:
+        if _enhancement_cache is None:
+            _enhancement_cache = EnhancementCache(
+                Path(os.getenv("RAG_ENHANCEMENT_CACHE_PATH") or DEFAULT_ENHANCEMENT_CACHE_PATH),
+                int(os.getenv("RAG_ENHANCEMENT_CACHE_MAX_ENTRIES") or DEFAULT_ENHANCEMENT_CACHE_MAX_ENTRIES)
+            )
+        return _enhancement_cache
+
+
+def enhancement_cache_started() -> bool:
+    """Whether the enhancement cache has been opened yet."""
+    return _enhancement_cache is not None
@@ -0,0 +1,341 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+from botocore.exceptions import ClientError
+
+from rag_py.store_versions import (
+    VERSIONS_DIRNAME,
+    collect_garbage,
+    current_version,
+    current_version_path,
+    publish_version
+)
+
+logger = logging.getLogger(__name__)
+
+# Index sync modes: off (each replica serves what it trained) or through S3
+INDEX_SYNC_OFF = "off"
+INDEX_SYNC_S3 = "s3"
+
+# Under each KB prefix: content-addressed artifacts, one manifest per
+# published version, and the manifest of the published version
+REMOTE_DIRNAME = "vector_store"
+PUBLISHED_KEY = "published.json"
+
+# Seconds between checks of a loaded KB for a newer published version
+DEFAULT_SYNC_INTERVAL = 30
+
+# Seconds a KB found not published at all is assumed to stay so
+DEFAULT_MISSING_TTL = 5
+
+# Unreferenced artifacts younger than this may belong to a publish in progress
+_ORPHAN_MIN_AGE = timedelta(hours=1)
+
+
+def file_sha256(path: Path) -> str:
+    """SHA-256 hex digest of a file, read in 1 MiB blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _is_not_modified(error: ClientError) -> bool:
+    return error.response.get("Error", {}).get("Code") in ("304", "NotModified")
+
+
+def _is_missing(error: ClientError) -> bool:
+    return error.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound")
+
+
+class IndexSync:
+    """
+    Publishes trained vector store versions to S3 and installs them on other
+    replicas.
+
+    Artifacts are stored once under their SHA-256 (objects/<sha256>), so
+    files a version shares with the previous one, such as unchanged shards,
+    are neither uploaded nor downloaded again. A version's manifest maps each
+    file to its checksum. The published manifest is written last, so replicas
+    never see a version whose artifacts are not all uploaded.
+
+    Replicas poll the published manifest with conditional GETs (If-None-Match
+    on its ETag); an unchanged manifest costs a 304 and no body. Downloaded
+    files are verified against their checksums before the version is
+    published locally through the CURRENT pointer.
+    """
+
+    def __init__(
+        self,
+        storage: Any,
+        root: Path,
+        sync_interval: Optional[float] = None,
+        missing_ttl: float = DEFAULT_MISSING_TTL
+    ):
+        """
+        Initialize the sync.
+
+        Args:
+            storage: S3Storage (or any object with s3_client and bucket)
+            root: Local vector stores directory
+            sync_interval: Seconds between checks for newer versions; defaults
+                to RAG_INDEX_SYNC_INTERVAL
+            missing_ttl: Seconds during which a KB with nothing published is
+                not looked up again, e.g. for queries to an untrained KB
+        """
+        self.s3_client = storage.s3_client
+        self.bucket = storage.bucket
+        self.root = Path(root)
+        self.sync_interval = sync_interval if sync_interval is not None else float(
+            os.getenv("RAG_INDEX_SYNC_INTERVAL", DEFAULT_SYNC_INTERVAL)
+        )
+        self.missing_ttl = missing_ttl
+        self._lock = threading.Lock()
+        # Per KB: when it was last found to have nothing published
+        self._missing_at: Dict[str, float] = {}
+        # Per KB: ETag of the last published manifest seen and when it was checked
+        self._etags: Dict[str, str] = {}
+        self._checked_at: Dict[str, float] = {}
+        self._stats = {
+            "published": 0,
+            "uploaded_files": 0,
+            "uploaded_bytes": 0,
+            "checks": 0,
+            "not_modified": 0,
+            "missing_cached": 0,
+            "installed": 0,
+            "downloaded_files": 0,
+            "downloaded_bytes": 0,
+            "reused_files": 0
+        }
+
+    def _key(self, knowledgebase_id: str, *parts: str) -> str:
+        return "/".join([knowledgebase_id, REMOTE_DIRNAME, *parts])
+
+    def _count(self, **increments: int) -> None:
+        with self._lock:
+            for name, value in increments.items():
+                self._stats[name] += value
+
+    def publish(self, knowledgebase_id: str, version_path: Path) -> Dict[str, Any]:
+        """
+        Upload a fully written version and make it the published one.
+
+        Args:
+            knowledgebase_id: Knowledge base ID
+            version_path: Local version directory
+
+        Returns:
+            The version manifest
+        """
+        version_path = Path(version_path)
+        files = {}
+        for path in sorted(version_path.rglob("*")):
+            if not path.is_file() or path.name.endswith(".tmp"):
+                continue
+            sha256 = file_sha256(path)
+            files[path.relative_to(version_path).as_posix()] = {"sha256": sha256, "size": path.stat().st_size}
+            object_key = self._key(knowledgebase_id, "objects", sha256)
+            try:
+                self.s3_client.head_object(Bucket=self.bucket, Key=object_key)
+                continue
+            except ClientError as e:
+                if not _is_missing(e):
+                    raise
+            self.s3_client.upload_file(str(path), self.bucket, object_key)
+            self._count(uploaded_files=1, uploaded_bytes=path.stat().st_size)
+
+        manifest = {
+            "version": version_path.name,
+            "files": files,
+            "published_at": datetime.utcnow().isoformat()
+        }
+        body = json.dumps(manifest, indent=4).encode('utf-8')
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self._key(knowledgebase_id, "versions", f"{version_path.name}.json"),
+            Body=body,
+            ContentType='application/json'
+        )
+        response = self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=self._key(knowledgebase_id, PUBLISHED_KEY),
+            Body=body,
+            ContentType='application/json'
+        )
+        with self._lock:
+            self._etags[knowledgebase_id] = response.get("ETag")
+            self._checked_at[knowledgebase_id] = time.monotonic()
+            self._missing_at.pop(knowledgebase_id, None)
+        self._count(published=1)
+        logger.info(f"Published vector store version {version_path.name} of {knowledgebase_id} to S3 ({len(files)} files)")
+
+        try:
+            self._collect_remote_garbage(knowledgebase_id)
+        except Exception as e:
+            logger.warning(f"Error removing old vector store versions of {knowledgebase_id} from S3: {e}")
+        return manifest
+
+    def _collect_remote_garbage(self, knowledgebase_id: str, keep: Optional[int] = None) -> None:
+        """Delete version manifests beyond the newest `keep` and artifacts no kept version references."""
+        keep = max(1, keep or int(os.getenv("RAG_KEEP_VERSIONS", 2)))
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        manifests = []
+        objects = []
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(knowledgebase_id, "")):
+            for obj in page.get('Contents', []):
+                if "/versions/" in obj['Key']:
+                    manifests.append(obj)
+                elif "/objects/" in obj['Key']:
+                    objects.append(obj)
+
+        manifests.sort(key=lambda obj: obj['LastModified'])
+        kept, expired = manifests[-keep:], manifests[:-keep]
+        if not expired:
+            return
+        referenced = set()
+        for obj in kept:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=obj['Key'])
+            manifest = json.loads(response['Body'].read())
+            referenced.update(self._key(knowledgebase_id, "objects", f["sha256"]) for f in manifest["files"].values())
+
+        orphaned_before = datetime.now(timezone.utc) - _ORPHAN_MIN_AGE
+        to_delete = [obj['Key'] for obj in expired] + [
+            obj['Key'] for obj in objects
+            if obj['Key'] not in referenced and obj['LastModified'] < orphaned_before
+        ]
+        for start in range(0, len(to_delete), 1000):
+            self.s3_client.delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': key} for key in to_delete[start:start + 1000]]}
+            )
+        logger.info(f"Removed {len(expired)} old vector store versions of {knowledgebase_id} from S3")
+
+    def check_due(self, knowledgebase_id: str) -> bool:
+        """Whether a loaded KB is due a check for a newer published version."""
+        with self._lock:
+            checked_at = self._checked_at.get(knowledgebase_id)
+            return checked_at is None or time.monotonic() - checked_at >= self.sync_interval
+
+    def sync(self, knowledgebase_id: str) -> Optional[str]:
+        """
+        Install the published version of a KB if it is not the local one.
+
+        Args:
+            knowledgebase_id: Knowledge base ID
+
+        Returns:
+            The newly installed version, or None if the local copy is current
+            or nothing has been published
+        """
+        kb_path = self.root / knowledgebase_id
+        now = time.monotonic()
+        with self._lock:
+            missing_at = self._missing_at.get(knowledgebase_id)
+            if missing_at is not None and now - missing_at < self.missing_ttl:
+                self._stats["missing_cached"] += 1
+                return None
+            etag = self._etags.get(knowledgebase_id)
+            self._checked_at[knowledgebase_id] = now
+        self._count(checks=1)
+
+        request = {"Bucket": self.bucket, "Key": self._key(knowledgebase_id, PUBLISHED_KEY)}
+        if etag and current_version(kb_path):
+            request["IfNoneMatch"] = etag
+        try:
+            response = self.s3_client.get_object(**request)
+        except ClientError as e:
+            if _is_not_modified(e):
+                self._count(not_modified=1)
+                return None
+            if _is_missing(e):
+                with self._lock:
+                    self._missing_at[knowledgebase_id] = time.monotonic()
+                return None
+            raise
+        manifest = json.loads(response['Body'].read())
+
+        version = manifest["version"]
+        if version != current_version(kb_path):
+            self._install(knowledgebase_id, kb_path, manifest)
+            installed = version
+        else:
+            installed = None
+        with self._lock:
+            self._etags[knowledgebase_id] = response.get("ETag")
+        return installed
+
+    def _install(self, knowledgebase_id: str, kb_path: Path, manifest: Dict[str, Any]) -> None:
+        """Fetch the files of a version not present locally, verify them and publish the version."""
+        version_path = kb_path / VERSIONS_DIRNAME / manifest["version"]
+        version_path.mkdir(parents=True, exist_ok=True)
+
+        # Files shared with the local version are linked instead of downloaded
+        local_files: Dict[str, Path] = {}
+        previous_path = current_version_path(kb_path)
+        if previous_path is not None:
+            for path in previous_path.rglob("*"):
+                if path.is_file() and not path.name.endswith(".tmp"):
+                    local_files[path.relative_to(previous_path).as_posix()] = path
+
+        for relative_path, file_info in manifest["files"].items():
+            path = version_path / relative_path
+            if path.exists() and file_sha256(path) == file_info["sha256"]:
+                continue
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Unique per process: several API workers may install the same version
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            candidate = local_files.get(relative_path)
+            if (
+                candidate is not None
+                and candidate.stat().st_size == file_info["size"]
+                and file_sha256(candidate) == file_info["sha256"]
+            ):
+                # Published files are replaced, never modified in place, so a hard link is safe
+                try:
+                    os.link(candidate, tmp_path)
+                except OSError:
+                    shutil.copy2(candidate, tmp_path)
+                self._count(reused_files=1)
+            else:
+                self.s3_client.download_file(
+                    self.bucket,
+                    self._key(knowledgebase_id, "objects", file_info["sha256"]),
+                    str(tmp_path)
+                )
+                if file_sha256(tmp_path) != file_info["sha256"]:
+                    tmp_path.unlink(missing_ok=True)
+                    raise ValueError(f"Checksum mismatch for {relative_path} of {knowledgebase_id} version {manifest['version']}")
+                self._count(downloaded_files=1, downloaded_bytes=file_info["size"])
+            os.replace(tmp_path, path)
+
+        publish_version(kb_path, version_path)
+        collect_garbage(kb_path)
+        self._count(installed=1)
+        logger.info(f"Installed vector store version {manifest['version']} of {knowledgebase_id} from S3")
+
+    def forget(self, knowledgebase_id: str) -> None:
+        """Drop sync state of a deleted KB."""
+        with self._lock:
+            self._etags.pop(knowledgebase_id, None)
+            self._checked_at.pop(knowledgebase_id, None)
+            self._missing_at.pop(knowledgebase_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Report publish, check and transfer counts."""
+        with self._lock:
+            return {
+                **self._stats,
+                "sync_interval": self.sync_interval,
+                "missing_ttl": self.missing_ttl,
+                "tracked_knowledgebases": len(self._etags)
+            }
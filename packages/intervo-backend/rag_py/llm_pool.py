@@ -0,0 +1,227 @@
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+from typing import Any, Dict, List, Optional, Set
+
+from rag_py.llm_scheduler import LLMScheduler, estimate_tokens, get_llm_scheduler, is_transient_error
+from rag_py.llm_services.factory import LLMServiceFactory
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for room on a member while every member is busy
+DISPATCH_POLL_SECONDS = 0.1
+
+# Seconds a member whose call had to fail over is passed over while others are available
+FAILOVER_COOLDOWN_SECONDS = 10
+
+
+def enhancement_provider_configs(llm_config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Providers to spread enhancement calls across.
+
+    They come from the "enhancement_providers" training option, or else the
+    RAG_ENHANCEMENT_PROVIDERS environment variable (a JSON list). Each entry
+    names a "provider" (an LLMServiceType value) and optionally its
+    "model_name", "api_key_env", "temperature" and budgets
+    ("requests_per_minute", "tokens_per_minute", "max_concurrency").
+
+    Returns:
+        Provider configs, empty to use the default Gemini model alone
+    """
+    providers = llm_config.get("enhancement_providers")
+    if providers is None:
+        raw = os.getenv("RAG_ENHANCEMENT_PROVIDERS")
+        providers = json.loads(raw) if raw else []
+    return [dict(provider) for provider in providers]
+
+
+class PoolMember:
+    """One provider account and model in an LLMProviderPool, with its own scheduler."""
+
+    def __init__(self, name: str, model_name: str, scheduler: LLMScheduler, client: Any = None, config: Optional[Dict[str, Any]] = None):
+        """
+        Initialize a pool member.
+
+        Args:
+            name: Identifies the provider account and model; also names its scheduler
+            model_name: Model the calls go to
+            scheduler: Paces this member's calls within its budgets
+            client: Service with an async generate(prompt, max_tokens), or None to create one from config
+            config: Provider config the client is created from
+        """
+        self.name = name
+        self.model_name = model_name
+        self.scheduler = scheduler
+        self.client = client
+        self.config = config or {}
+        # Until when (time.monotonic()) the member is passed over after a failover
+        self.cooldown_until = 0.0
+
+
+class LLMProviderPool:
+    """
+    Spread LLM calls across several providers, accounts and models.
+
+    Each member has its own LLMScheduler, so each stays within its own rate
+    limits. A call is handed to a member only once one has room for it: a
+    member takes about as many calls as it can run at its current
+    throughput (its rate budget after AIMD backoff, its concurrency cap and
+    observed latency) over one call's latency. Among members with room, the
+    call goes to the one expected to finish it soonest, i.e. with the
+    fewest calls queued per unit of throughput. Slow or rate-limited
+    members therefore take a small share and total throughput grows with
+    the number of members. A call that still fails with a transient error
+    after its member's retries is tried on another member, and the failing
+    member is passed over for FAILOVER_COOLDOWN_SECONDS while other members
+    are available.
+    """
+
+    def __init__(self, provider_configs: List[Dict[str, Any]], default_client: Any = None):
+        """
+        Initialize the pool.
+
+        Args:
+            provider_configs: Provider configs (see enhancement_provider_configs)
+            default_client: Client used alone when no providers are configured;
+                it must have model_name, initialize() and generate(prompt, max_tokens)
+        """
+        self.members: List[PoolMember] = []
+        for config in provider_configs:
+            provider = config["provider"].lower()
+            model_name = config.get("model_name") or provider
+            name = ":".join(part for part in (provider, model_name, config.get("api_key_env")) if part)
+            scheduler = get_llm_scheduler(
+                name,
+                config.get("requests_per_minute"),
+                config.get("tokens_per_minute"),
+                config.get("max_concurrency")
+            )
+            self.members.append(PoolMember(name, model_name, scheduler, config=config))
+        if not self.members:
+            if default_client is None:
+                raise ValueError("No enhancement providers configured")
+            self.members.append(PoolMember(
+                default_client.model_name,
+                default_client.model_name,
+                get_llm_scheduler(default_client.model_name),
+                client=default_client
+            ))
+        self._initialized = False
+        self._init_lock = asyncio.Lock()
+        self._dispatch = asyncio.Condition()
+
+    @property
+    def model_name(self) -> str:
+        """The pool's models, e.g. to key cached results by."""
+        return "+".join(sorted({member.model_name for member in self.members}))
+
+    async def initialize(self) -> None:
+        """
+        Create and initialize every member's client.
+
+        Members that cannot be initialized (e.g. a missing API key) are left
+        out with a warning; it is an error only if none is left.
+        """
+        if self._initialized:
+            return
+        async with self._init_lock:
+            if self._initialized:
+                return
+            ready = []
+            last_error: Optional[Exception] = None
+            for member in self.members:
+                try:
+                    if member.client is None:
+                        # Retries are left to the member's scheduler, which needs to see every 429
+                        config = {key: value for key, value in member.config.items() if key != "provider"}
+                        config["max_retries"] = 1
+                        member.client = await LLMServiceFactory.create_service(member.config["provider"], config)
+                    else:
+                        await member.client.initialize()
+                    ready.append(member)
+                except Exception as e:
+                    last_error = e
+                    logger.warning(f"Leaving enhancement provider {member.name} out of the pool: {e}")
+            if not ready:
+                raise last_error
+            self.members = ready
+            self._initialized = True
+            logger.info(f"Enhancement provider pool ready with {len(ready)} members: {[member.name for member in ready]}")
+
+    def _choose(self, estimated_tokens: int, exclude: Set[str]) -> Optional[PoolMember]:
+        """
+        The member expected to finish the call soonest, if it has room for it.
+
+        A member's expected delay is its calls queued, plus this one, over its
+        throughput. When that member is full, waiting for it beats handing
+        the call to a slower one, so None is returned. Members cooling down
+        after a failover are only considered when no other member is left.
+        """
+        candidates = [member for member in self.members if member.name not in exclude]
+        now = time.monotonic()
+        candidates = [member for member in candidates if member.cooldown_until <= now] or candidates
+        best: Optional[PoolMember] = None
+        best_delay = 0.0
+        for member in candidates:
+            throughput = member.scheduler.throughput(estimated_tokens)
+            delay = (member.scheduler.backlog + 1) / throughput if throughput > 0 else math.inf
+            if best is None or delay < best_delay:
+                best, best_delay = member, delay
+        if best.scheduler.backlog >= best.scheduler.concurrency_limit:
+            return None
+        return best
+
+    async def _acquire_member(self, estimated_tokens: int, exclude: Set[str]) -> PoolMember:
+        """Wait until the best member not yet tried has room for the call."""
+        async with self._dispatch:
+            while True:
+                member = self._choose(estimated_tokens, exclude)
+                if member is not None:
+                    return member
+                # Woken when a call of this pool finishes; the poll covers other pools sharing the schedulers
+                try:
+                    await asyncio.wait_for(self._dispatch.wait(), DISPATCH_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _notify(self) -> None:
+        async with self._dispatch:
+            self._dispatch.notify_all()
+
+    async def generate(self, prompt: str, max_tokens: Optional[int] = None, max_retries: int = 3) -> Dict[str, Any]:
+        """
+        Generate content from a string prompt on one of the pool's members.
+
+        Args:
+            prompt: The prompt
+            max_tokens: Optional maximum number of tokens for the response
+            max_retries: Retries on the chosen member before failing over
+
+        Returns:
+            A dictionary containing the generated text, e.g. {"text": "..."}
+
+        Raises:
+            The last member's error once every member failed, or a non-transient error
+        """
+        await self.initialize()
+        tokens = estimate_tokens(prompt, max_tokens)
+        tried: Set[str] = set()
+        while True:
+            member = await self._acquire_member(tokens, tried)
+            try:
+                return await member.scheduler.run(
+                    lambda: member.client.generate(prompt, max_tokens=max_tokens),
+                    tokens,
+                    max_retries
+                )
+            except Exception as e:
+                tried.add(member.name)
+                if len(tried) == len(self.members) or not is_transient_error(e):
+                    raise
+                member.cooldown_until = time.monotonic() + FAILOVER_COOLDOWN_SECONDS
+                logger.warning(f"Enhancement call failed on {member.name}, trying another provider: {e}")
+            finally:
+                await self._notify()
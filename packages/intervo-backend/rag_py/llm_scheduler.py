@@ -0,0 +1,348 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Seconds of budget a bucket may accumulate, so an idle scheduler can start with a short burst
+BURST_SECONDS = 5.0
+
+# Bounds of the jittered retry backoff, in seconds
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+# Lowest share of the configured budgets the scheduler backs off to
+MIN_RATE_FACTOR = 0.05
+
+# Share of the configured budgets regained per successful call
+RATE_RECOVERY_PER_SUCCESS = 0.01
+
+# Weight of the latest call in the latency moving average
+LATENCY_EWMA_ALPHA = 0.2
+
+# Minimum seconds between two multiplicative decreases, so one burst of 429s halves the rate once
+DECREASE_COOLDOWN_SECONDS = 2.0
+
+# Error class names and message fragments of rate limiting and transient failures
+_RATE_LIMIT_MARKERS = (
+    "ratelimit", "rate limit", "resourceexhausted", "resource_exhausted", "resource has been exhausted",
+    "toomanyrequests", "too many requests", "429", "quota"
+)
+_TRANSIENT_MARKERS = (
+    "timeout", "timed out", "deadline", "unavailable", "internalservererror", "internal error",
+    "overloaded", "connection"
+)
+
+
+def _error_status(exc: BaseException) -> Optional[int]:
+    """HTTP status carried by a provider error, if any."""
+    for attr in ("status_code", "code", "status"):
+        value = getattr(exc, attr, None)
+        if isinstance(value, int):
+            return value
+    return None
+
+
+def is_rate_limit_error(exc: BaseException) -> bool:
+    """Whether a provider error means the request was rejected for exceeding a rate limit or quota."""
+    if _error_status(exc) == 429:
+        return True
+    text = f"{type(exc).__name__} {exc}".lower()
+    return any(marker in text for marker in _RATE_LIMIT_MARKERS)
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """Whether a provider error is worth retrying (rate limits, timeouts, server and connection errors)."""
+    if isinstance(exc, (asyncio.TimeoutError, ConnectionError)):
+        return True
+    status = _error_status(exc)
+    if status is not None and (status == 429 or status >= 500):
+        return True
+    text = f"{type(exc).__name__} {exc}".lower()
+    return is_rate_limit_error(exc) or any(marker in text for marker in _TRANSIENT_MARKERS)
+
+
+def estimate_tokens(prompt: str, max_tokens: Optional[int]) -> int:
+    """Rough token cost of a call: prompt characters / 4 plus the output allowance."""
+    return len(prompt) // 4 + (max_tokens or 0)
+
+
+class LLMScheduler:
+    """
+    Admit LLM calls within requests-per-minute and tokens-per-minute budgets
+    and a cap on calls in flight.
+
+    Budgets are token buckets refilled continuously. The rate actually used
+    and the concurrency cap adapt with AIMD: they are halved when the
+    provider answers 429 and grow back additively with each success. A call
+    slower than the target latency shrinks the concurrency cap a little
+    instead, since the provider is queueing. Failed calls that are worth
+    retrying are retried with exponential backoff and full jitter, so
+    callers only see an error once the retries are exhausted.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: Optional[float] = None,
+        tokens_per_minute: Optional[float] = None,
+        max_concurrency: Optional[int] = None,
+        target_latency_ms: Optional[float] = None
+    ):
+        """
+        Initialize the scheduler.
+
+        Args:
+            requests_per_minute: Request budget. Defaults to the RAG_ENHANCE_RPM
+                environment variable, or 1000.
+            tokens_per_minute: Token budget. Defaults to the RAG_ENHANCE_TPM
+                environment variable, or 1000000.
+            max_concurrency: Most calls in flight. Defaults to the
+                RAG_ENHANCE_MAX_CONCURRENCY environment variable, or 32.
+            target_latency_ms: Latency above which the concurrency cap shrinks.
+                Defaults to the RAG_ENHANCE_TARGET_LATENCY_MS environment
+                variable, or 15000.
+        """
+        self.requests_per_minute = requests_per_minute or float(os.getenv("RAG_ENHANCE_RPM") or 1000)
+        self.tokens_per_minute = tokens_per_minute or float(os.getenv("RAG_ENHANCE_TPM") or 1_000_000)
+        self.max_concurrency = max_concurrency or int(os.getenv("RAG_ENHANCE_MAX_CONCURRENCY") or 32)
+        if target_latency_ms is None:
+            target_latency_ms = float(os.getenv("RAG_ENHANCE_TARGET_LATENCY_MS") or 15000)
+        self.target_latency_seconds = target_latency_ms / 1000
+
+        self._rate_factor = 1.0
+        self._concurrency_limit = float(self.max_concurrency)
+        self._in_flight = 0
+        self._request_bucket = self._request_capacity()
+        self._token_bucket = self._token_capacity()
+        self._refilled_at = time.monotonic()
+        self._decreased_at = 0.0
+        self._condition = asyncio.Condition()
+
+        self.calls = 0
+        self.completed = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self.waiting = 0
+        self._total_latency_seconds = 0.0
+        self._total_wait_seconds = 0.0
+        self._latency_ewma: Optional[float] = None
+
+    def _request_capacity(self) -> float:
+        return max(1.0, self.requests_per_minute * self._rate_factor / 60 * BURST_SECONDS)
+
+    def _token_capacity(self) -> float:
+        return max(1.0, self.tokens_per_minute * self._rate_factor / 60 * BURST_SECONDS)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        elapsed = now - self._refilled_at
+        self._refilled_at = now
+        self._request_bucket = min(
+            self._request_capacity(),
+            self._request_bucket + elapsed * self.requests_per_minute * self._rate_factor / 60
+        )
+        self._token_bucket = min(
+            self._token_capacity(),
+            self._token_bucket + elapsed * self.tokens_per_minute * self._rate_factor / 60
+        )
+
+    async def _acquire(self, tokens: int) -> None:
+        """Wait until the call fits the concurrency cap and both budgets, then take its share."""
+        waited_from = time.monotonic()
+        self.waiting += 1
+        try:
+            async with self._condition:
+                while True:
+                    self._refill()
+                    # A call larger than a full bucket only has to wait for a full bucket
+                    needed_tokens = min(tokens, self._token_capacity())
+                    if self._in_flight < int(self._concurrency_limit):
+                        if self._request_bucket >= 1 and self._token_bucket >= needed_tokens:
+                            self._request_bucket -= 1
+                            self._token_bucket -= tokens
+                            self._in_flight += 1
+                            self._total_wait_seconds += time.monotonic() - waited_from
+                            return
+                        rate = self._rate_factor / 60
+                        timeout = max(
+                            (1 - self._request_bucket) / (self.requests_per_minute * rate),
+                            (needed_tokens - self._token_bucket) / (self.tokens_per_minute * rate),
+                            0.01
+                        )
+                    else:
+                        # Woken when a call in flight finishes
+                        timeout = None
+                    try:
+                        await asyncio.wait_for(self._condition.wait(), timeout)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            self.waiting -= 1
+
+    async def _release(self, latency: float, rate_limited: bool = False) -> None:
+        """Return a concurrency slot and adapt the rate and cap to how the call went."""
+        async with self._condition:
+            self._in_flight -= 1
+            now = time.monotonic()
+            if rate_limited:
+                self.rate_limited += 1
+                if now - self._decreased_at >= DECREASE_COOLDOWN_SECONDS:
+                    self._decreased_at = now
+                    self._rate_factor = max(MIN_RATE_FACTOR, self._rate_factor / 2)
+                    self._concurrency_limit = max(1.0, self._concurrency_limit / 2)
+                    # Nothing more goes out until the reduced budget refills
+                    self._request_bucket = min(self._request_bucket, 0.0)
+                    self._token_bucket = min(self._token_bucket, 0.0)
+                    logger.warning(
+                        f"LLM provider is rate limiting; backing off to {self._rate_factor:.0%} of the budget "
+                        f"and {int(self._concurrency_limit)} calls in flight"
+                    )
+            elif latency > self.target_latency_seconds:
+                if now - self._decreased_at >= DECREASE_COOLDOWN_SECONDS:
+                    self._decreased_at = now
+                    self._concurrency_limit = max(1.0, self._concurrency_limit * 0.75)
+            else:
+                self._rate_factor = min(1.0, self._rate_factor + RATE_RECOVERY_PER_SUCCESS)
+                # About one more slot per cap's worth of successful calls
+                self._concurrency_limit = min(
+                    float(self.max_concurrency),
+                    self._concurrency_limit + 1 / self._concurrency_limit
+                )
+            self._condition.notify_all()
+
+    async def run(
+        self,
+        call: Callable[[], Awaitable[T]],
+        estimated_tokens: int = 0,
+        max_retries: int = 3
+    ) -> T:
+        """
+        Run an LLM call once it fits the budgets, retrying transient failures.
+
+        Args:
+            call: Makes the call; invoked again for each retry
+            estimated_tokens: Tokens the call is expected to use
+            max_retries: Retries after the first attempt
+
+        Returns:
+            The call's result
+
+        Raises:
+            The call's error, once it is not retryable or the retries are exhausted
+        """
+        self.calls += 1
+        attempt = 0
+        while True:
+            await self._acquire(estimated_tokens)
+            started_at = time.monotonic()
+            try:
+                result = await call()
+            except Exception as e:
+                latency = time.monotonic() - started_at
+                await self._release(latency, rate_limited=is_rate_limit_error(e))
+                if attempt >= max_retries or not is_transient_error(e):
+                    self.failed += 1
+                    raise
+                delay = random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+                attempt += 1
+                self.retries += 1
+                logger.info(f"Retrying LLM call in {delay:.1f}s (attempt {attempt + 1}) after error: {e}")
+                await asyncio.sleep(delay)
+                continue
+            latency = time.monotonic() - started_at
+            self._total_latency_seconds += latency
+            self._latency_ewma = latency if self._latency_ewma is None else (
+                LATENCY_EWMA_ALPHA * latency + (1 - LATENCY_EWMA_ALPHA) * self._latency_ewma
+            )
+            self.completed += 1
+            await self._release(latency)
+            return result
+
+    def throughput(self, estimated_tokens: int = 0) -> float:
+        """
+        Calls per second this scheduler can currently sustain.
+
+        The least of its request budget, its token budget for calls of this
+        size and its concurrency cap over the observed latency, all at the
+        rate AIMD has currently settled on.
+        """
+        limits = [self.requests_per_minute * self._rate_factor / 60]
+        if estimated_tokens:
+            limits.append(self.tokens_per_minute * self._rate_factor / 60 / estimated_tokens)
+        if self._latency_ewma:
+            limits.append(self._concurrency_limit / self._latency_ewma)
+        return min(limits)
+
+    @property
+    def concurrency_limit(self) -> int:
+        """Calls currently allowed in flight, after AIMD adaptation."""
+        return int(self._concurrency_limit)
+
+    @property
+    def backlog(self) -> int:
+        """Calls in flight or waiting for a slot."""
+        return self._in_flight + self.waiting
+
+    def stats(self) -> Dict[str, Any]:
+        """Return budgets, adaptive limits and call outcome counters."""
+        return {
+            "requests_per_minute": self.requests_per_minute,
+            "tokens_per_minute": self.tokens_per_minute,
+            "max_concurrency": self.max_concurrency,
+            "rate_factor": round(self._rate_factor, 3),
+            "concurrency_limit": self.concurrency_limit,
+            "in_flight": self._in_flight,
+            "waiting": self.waiting,
+            "calls": self.calls,
+            "completed": self.completed,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "failed": self.failed,
+            "avg_latency_ms": round(self._total_latency_seconds / self.completed * 1000, 3) if self.completed else 0.0,
+            "recent_latency_ms": round(self._latency_ewma * 1000, 3) if self._latency_ewma else 0.0,
+            "avg_wait_ms": round(self._total_wait_seconds / (self.completed + self.retries + self.failed) * 1000, 3)
+            if self.completed + self.retries + self.failed else 0.0,
+        }
+
+
+_schedulers: Dict[str, LLMScheduler] = {}
+
+
+def get_llm_scheduler(
+    name: str,
+    requests_per_minute: Optional[float] = None,
+    tokens_per_minute: Optional[float] = None,
+    max_concurrency: Optional[int] = None
+) -> LLMScheduler:
+    """
+    Get the scheduler shared by every call to the same model and account.
+
+    Provider rate limits apply per model and API key, so all knowledge bases
+    trained in this process draw on one budget. The budgets only apply when
+    the scheduler is first created; later callers share it as it is.
+
+    Args:
+        name: Model the calls go to, qualified by provider account when there are several
+        requests_per_minute: Request budget, or None for the default
+        tokens_per_minute: Token budget, or None for the default
+        max_concurrency: Most calls in flight, or None for the default
+
+    Returns:
+        The shared LLMScheduler
+    """
+    scheduler = _schedulers.get(name)
+    if scheduler is None:
+        scheduler = LLMScheduler(requests_per_minute, tokens_per_minute, max_concurrency)
+        _schedulers[name] = scheduler
+    return scheduler
+
+
+def get_llm_scheduler_stats() -> Dict[str, Dict[str, Any]]:
+    """Return statistics for every LLM scheduler, keyed by name."""
+    return {name: scheduler.stats() for name, scheduler in _schedulers.items()}
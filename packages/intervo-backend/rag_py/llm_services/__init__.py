@@ -6,6 +6,7 @@ from .openai_service import OpenAIService
 from .gemini_service import GeminiService
 from .groq_service import GroqService
 from .deepseek_service import DeepSeekService
+from .stub_service import StubService
 
 __all__ = [
     'BaseLLMService',
@@ -14,5 +15,6 @@ __all__ = [
     'OpenAIService',
     'GeminiService',
     'GroqService',
-    'DeepSeekService'
+    'DeepSeekService',
+    'StubService'
 ] 
\ No newline at end of file
@@ -1,11 +1,14 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
-from langchain_core.messages import BaseMessage
+from typing import List, Dict, Any, Optional, Tuple
+from langchain_core.messages import BaseMessage, HumanMessage
 from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
 
 class BaseLLMService(ABC):
     """Abstract base class for LLM services."""
     
+    # Keyword the chat model takes to cap output tokens per call
+    max_tokens_param = "max_tokens"
+    
     def __init__(self, config: Dict[str, Any] = None):
         """Initialize the LLM service with configuration"""
         self.config = config or {}
@@ -31,6 +34,45 @@ class BaseLLMService(ABC):
         """
         pass
         
+    async def invoke_with_usage(self, messages: List[BaseMessage]) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Invoke the LLM and also return the provider-reported token usage.
+        
+        Args:
+            messages: List of chat messages
+            
+        Returns:
+            Tuple of (response text, usage metadata or None if not reported)
+        """
+        model = getattr(self, "model", None)
+        if model is None:
+            return await self.invoke(messages), None
+        response = await model.ainvoke(messages)
+        return response.content, getattr(response, "usage_metadata", None)
+        
+    async def generate(self, prompt: str, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Generate content from a single string prompt.
+        
+        Args:
+            prompt: The prompt, sent as one user message
+            max_tokens: Optional maximum number of tokens for the response
+            
+        Returns:
+            A dictionary containing the generated text, e.g. {"text": "..."}
+            
+        Raises:
+            The provider's error if the call fails
+        """
+        messages = [HumanMessage(content=prompt)]
+        model = getattr(self, "model", None)
+        if model is None:
+            return {"text": await self.invoke(messages)}
+        if max_tokens is not None:
+            model = model.bind(**{self.max_tokens_param: max_tokens})
+        response = await model.ainvoke(messages)
+        return {"text": response.content}
+        
     def get_prompt_template(self) -> ChatPromptTemplate:
         """
         Get the chat prompt template. This provides a default implementation
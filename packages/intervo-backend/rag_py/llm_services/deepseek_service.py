@@ -11,9 +11,10 @@ class DeepSeekService(BaseLLMService):
     async def initialize(self) -> None:
         """Initialize the DeepSeek service."""
         load_dotenv(".env.development")
-        api_key = os.getenv("DEEPSEEK_API_KEY")
+        api_key_env = self.config.get("api_key_env", "DEEPSEEK_API_KEY")
+        api_key = os.getenv(api_key_env)
         if not api_key:
-            raise ValueError("DEEPSEEK_API_KEY is not set in environment variables")
+            raise ValueError(f"{api_key_env} is not set in environment variables")
             
         self.model = ChatDeepSeek(
             model_name=self.model_name or "deepseek-chat",
@@ -6,6 +6,7 @@ from rag_py.llm_services.openai_service import OpenAIService
 from rag_py.llm_services.gemini_service import GeminiService
 from rag_py.llm_services.groq_service import GroqService
 from rag_py.llm_services.deepseek_service import DeepSeekService
+from rag_py.llm_services.stub_service import StubService
 
 class LLMServiceType(Enum):
     """Supported LLM service types."""
@@ -13,6 +14,7 @@ class LLMServiceType(Enum):
     GEMINI = "gemini"
     GROQ = "groq"
     DEEPSEEK = "deepseek"
+    STUB = "stub"
     
 class LLMServiceFactory:
     """Factory for creating LLM service instances."""
@@ -41,7 +43,30 @@ class LLMServiceFactory:
         if service_type in cls._services:
             return cls._services[service_type]
             
-        # Create new service instance
+        service = await cls.create_service(service_type, config)
+        
+        # Cache the service instance
+        cls._services[service_type] = service
+        
+        return service
+    
+    @classmethod
+    async def create_service(
+        cls,
+        service_type: str,
+        config: Optional[Dict[str, Any]] = None
+    ) -> BaseLLMService:
+        """
+        Create and initialize a new LLM service instance, without caching it.
+        
+        Args:
+            service_type: Type of LLM service to use
+            config: Optional configuration for the service
+            
+        Returns:
+            An initialized LLM service instance
+        """
+        service_type = service_type.lower()
         service: BaseLLMService
         if service_type == LLMServiceType.OPENAI.value:
             service = OpenAIService(config)
@@ -51,13 +76,12 @@ class LLMServiceFactory:
             service = GroqService(config)
         elif service_type == LLMServiceType.DEEPSEEK.value:
             service = DeepSeekService(config)
+        elif service_type == LLMServiceType.STUB.value:
+            service = StubService(config)
         else:
             raise ValueError(f"Unsupported LLM service type: {service_type}")
             
         # Initialize the service
         await service.initialize()
         
-        # Cache the service instance
-        cls._services[service_type] = service
-        
-        return service 
\ No newline at end of file
+        return service
@@ -67,6 +67,9 @@ class GeminiInternalService:
 
         Returns:
             A dictionary containing the generated text, e.g., {"text": "..."}
+
+        Raises:
+            The provider's error if the call fails
         """
         if not self.llm_model:
             await self.initialize()
@@ -80,11 +83,6 @@ class GeminiInternalService:
         if max_tokens is not None:
             ainvoke_config = {"generation_config": {"max_output_tokens": max_tokens}}
             
-        try:
-            response = await self.llm_model.ainvoke(messages, config=ainvoke_config)
-            return {"text": response.content}
-        except Exception as e:
-            # Log this error appropriately in a real scenario
-            # print(f"Error during GeminiInternalService generate call: {e}")
-            # For now, return an error structure consistent with RAGEnhancementService expectations
-            return {"text": f"Error generating content: {str(e)}"} 
\ No newline at end of file
+        # Errors propagate, so callers can tell rate limiting and outages from generated text
+        response = await self.llm_model.ainvoke(messages, config=ainvoke_config)
+        return {"text": response.content} 
\ No newline at end of file
@@ -8,12 +8,15 @@ from rag_py.llm_services.base import BaseLLMService
 class GeminiService(BaseLLMService):
     """Google Gemini LLM service implementation."""
     
+    max_tokens_param = "max_output_tokens"
+    
     async def initialize(self) -> None:
         """Initialize the Gemini service."""
         load_dotenv(".env.development")
-        api_key = os.getenv("GOOGLE_API_KEY")
+        api_key_env = self.config.get("api_key_env", "GOOGLE_API_KEY")
+        api_key = os.getenv(api_key_env)
         if not api_key:
-            raise ValueError("GOOGLE_API_KEY is not set in environment variables")
+            raise ValueError(f"{api_key_env} is not set in environment variables")
             
         self.model = ChatGoogleGenerativeAI(
             model=self.model_name or "gemini-pro",
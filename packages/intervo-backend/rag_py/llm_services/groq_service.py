@@ -11,9 +11,10 @@ class GroqService(BaseLLMService):
     async def initialize(self) -> None:
         """Initialize the Groq service."""
         load_dotenv(".env.development")
-        api_key = os.getenv("GROQ_API_KEY")
+        api_key_env = self.config.get("api_key_env", "GROQ_API_KEY")
+        api_key = os.getenv(api_key_env)
         if not api_key:
-            raise ValueError("GROQ_API_KEY is not set in environment variables")
+            raise ValueError(f"{api_key_env} is not set in environment variables")
             
         self.model = ChatGroq(
             model_name=self.model_name or "mixtral-8x7b-32768",  # Groq's recommended model
@@ -11,9 +11,10 @@ class OpenAIService(BaseLLMService):
     async def initialize(self) -> None:
         """Initialize the OpenAI service."""
         load_dotenv(".env.development")
-        api_key = os.getenv("OPENAI_API_KEY")
+        api_key_env = self.config.get("api_key_env", "OPENAI_API_KEY")
+        api_key = os.getenv(api_key_env)
         if not api_key:
-            raise ValueError("OPENAI_API_KEY is not set in environment variables")
+            raise ValueError(f"{api_key_env} is not set in environment variables")
             
         self.model = ChatOpenAI(
             model_name=self.model_name or "gpt-3.5-turbo",
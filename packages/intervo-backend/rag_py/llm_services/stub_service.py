@@ -0,0 +1,71 @@
+import asyncio
+import time
+from collections import deque
+from typing import List, Dict, Any, Optional, Tuple
+from langchain_core.messages import BaseMessage
+from rag_py.llm_services.base import BaseLLMService
+
+
+class StubRateLimitError(Exception):
+    """Raised by the stub when its simulated rate limit is exceeded, like a provider's 429."""
+    status_code = 429
+
+class StubService(BaseLLMService):
+    """
+    Local stub LLM service that makes no network calls.
+
+    It records every prompt it receives and reports usage the way a provider
+    with prefix caching would: the characters shared with the previous prompt's
+    prefix count as cached input (at roughly 4 characters per token).
+
+    For load tests, generate() can also simulate a provider's latency
+    ("latency_ms") and rate limit ("rate_limit_per_minute"; calls beyond it
+    within a minute raise StubRateLimitError).
+    """
+
+    async def initialize(self) -> None:
+        """Initialize the stub service."""
+        self.response_text = self.config.get("response", "stub response")
+        self.latency_seconds = self.config.get("latency_ms", 0) / 1000
+        self.rate_limit_per_minute = self.config.get("rate_limit_per_minute")
+        self.prompts: List[str] = []
+        self._request_times: deque = deque()
+
+    async def generate(self, prompt: str, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """Answer a string prompt after the simulated latency, or fail as rate limited."""
+        now = time.monotonic()
+        while self._request_times and now - self._request_times[0] >= 60:
+            self._request_times.popleft()
+        if self.rate_limit_per_minute is not None and len(self._request_times) >= self.rate_limit_per_minute:
+            raise StubRateLimitError("429 Too Many Requests")
+        self._request_times.append(now)
+        self.prompts.append(prompt)
+        if self.latency_seconds:
+            await asyncio.sleep(self.latency_seconds)
+        return {"text": self.response_text}
+
+    async def invoke(self, messages: List[BaseMessage]) -> str:
+        """Invoke the stub model."""
+        response, _ = await self.invoke_with_usage(messages)
+        return response
+
+    async def invoke_with_usage(self, messages: List[BaseMessage]) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """Invoke the stub model and report simulated prefix-cache usage."""
+        prompt = "\n".join(f"{message.type}: {message.content}" for message in messages)
+        previous_prompt = self.prompts[-1] if self.prompts else ""
+        self.prompts.append(prompt)
+
+        shared_prefix = 0
+        for current_char, previous_char in zip(prompt, previous_prompt):
+            if current_char != previous_char:
+                break
+            shared_prefix += 1
+
+        input_tokens = len(prompt) // 4
+        usage = {
+            "input_tokens": input_tokens,
+            "output_tokens": len(self.response_text) // 4,
+            "total_tokens": input_tokens + len(self.response_text) // 4,
+            "input_token_details": {"cache_read": shared_prefix // 4}
+        }
+        return self.response_text, usage
@@ -0,0 +1,290 @@
+import logging
+import re
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Value of chunk_topics_source for topics computed by the local engine
+LOCAL_TOPICS_SOURCE = "local"
+
+# Extractive summaries keep this many top-ranked sentences, in their original order
+SUMMARY_SENTENCES = 2
+SUMMARY_MAX_LEN = 400
+
+# Sentences per chunk ranked with TextRank; longer chunks rank only their first ones
+MAX_RANKED_SENTENCES = 40
+
+TEXTRANK_DAMPING = 0.85
+TEXTRANK_ITERATIONS = 30
+TEXTRANK_TOLERANCE = 1e-4
+
+TOPICS_PER_CHUNK = 5
+KB_TOPICS = 10
+
+STOP_WORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing down during each even few for from further get got had
+has have having he her here hers herself him himself his how i if in into is it its itself just like
+made make many may me more most much must my myself new no nor not now of off on once one only or other
+our ours ourselves out over own per same she should since so some such than that the their theirs them
+themselves then there these they this those through to too two under until up upon us use used using
+very via was way we well were what when where which while who whom why will with within without would
+yet you your yours yourself yourselves com www http https html
+""".split())
+
+_WORD = re.compile(r"[a-z][a-z0-9'+-]*[a-z0-9]|[a-z]")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9\"'(])|\n{2,}|\n(?=\s*[-*•]\s)")
+
+# Priority signals, matched against the lowercased text. Plain phrases are
+# substring checks, which are much cheaper than regex alternations.
+_DIGIT = re.compile(r"\d")
+_EMAIL = re.compile(r"\b[\w.+-]+@[\w-]+\.[\w.-]+\b")
+_PHONE = re.compile(r"(?:\+?\d[\d\s().-]{7,}\d)")
+_ADDRESS = re.compile(r"\b\d{1,5}\s+(?:[a-z]+\s+){1,4}(?:street|st|avenue|ave|road|rd|boulevard|blvd|lane|ln|drive|dr|suite)\b")
+_PRICE = re.compile(r"[$€£₹]\s?\d|\b\d+(?:[.,]\d+)?\s?(?:usd|eur|gbp|inr|dollars?|euros?)\b|\bper (?:month|year|user|seat)\b|/(?:mo|month|yr|year)\b|\b(?:pricing|price|plans?|subscription|discount|free trial)\b")
+_HOURS = re.compile(r"\b(?:mon|tue|wed|thu|fri|sat|sun)\w*\s*(?:-|–|to)\s*(?:mon|tue|wed|thu|fri|sat|sun)\w*|\b\d{1,2}(?::\d{2})?\s?(?:am|pm)\b")
+_ENGAGEMENT_PHRASES = (
+    "?", "question:", "q:", "business hours", "opening hours", "contact us", "call us", "sign up",
+    "book a", "book your", "schedule", "get started", "buy now", "order now", "request a demo", "request a quote"
+)
+_BOILERPLATE_PHRASES = (
+    "all rights reserved", "©", "cookie", "privacy policy", "terms of service", "terms of use",
+    "skip to content", "skip to main content", "subscribe to our newsletter", "follow us", "home |"
+)
+
+
+def _tokenize(text: str) -> List[str]:
+    """Lowercase words of a text, without stop words."""
+    return [word for word in _WORD.findall(text.lower()) if word not in STOP_WORDS and len(word) > 2]
+
+
+def _has_phone_number(text: str) -> bool:
+    """Whether a text contains something shaped like a phone number (9 to 15 digits)."""
+    return any(9 <= sum(char.isdigit() for char in match) <= 15 for match in _PHONE.findall(text))
+
+
+def _split_sentences(text: str) -> List[str]:
+    """Sentences of a text, with whitespace normalized."""
+    sentences = (" ".join(sentence.split()) for sentence in _SENTENCE_END.split(text))
+    return [sentence for sentence in sentences if len(sentence) > 1]
+
+
+class LocalEnhancementEngine:
+    """
+    Enhance chunks on the CPU without any LLM calls.
+
+    Summaries are extractive: the sentences of a chunk are ranked with
+    TextRank over their word-overlap graph and the best ones are kept.
+    Topics are the chunk's highest TF-IDF unigrams and bigrams, with TF-IDF
+    computed in one vectorized pass over all chunks enhanced together.
+    Priority is scored from patterns that matter to a voice or chat agent
+    (contact details, pricing, opening hours, calls to action, words of the
+    agent prompt) and lowered for boilerplate and repetitive text.
+    """
+
+    def __init__(self, agent_prompt: Optional[str] = None):
+        """
+        Initialize the engine.
+
+        Args:
+            agent_prompt: Agent prompt; chunks sharing its vocabulary get a higher priority
+        """
+        self.agent_terms = frozenset(_tokenize(agent_prompt)) if agent_prompt else frozenset()
+
+    def enhance(self, chunk_texts: List[str]) -> List[Dict[str, Any]]:
+        """
+        Generate the summary, priority and topics of chunks.
+
+        Args:
+            chunk_texts: Texts of the chunks; they are also the corpus topics are weighted against
+
+        Returns:
+            For each chunk, its metadata fields (chunk_summary, chunk_priority,
+            chunk_topics, chunk_topics_source)
+        """
+        # Each chunk is split and tokenized once; its tokens are those of its sentences
+        sentences = [_split_sentences(text) for text in chunk_texts]
+        sentence_tokens = [[_tokenize(sentence) for sentence in chunk_sentences] for chunk_sentences in sentences]
+        tokens = [[token for tokens in chunk_sentence_tokens for token in tokens] for chunk_sentence_tokens in sentence_tokens]
+        topics = self._topics(tokens)
+        return [
+            {
+                "chunk_summary": self._summary(chunk_sentences, chunk_sentence_tokens),
+                "chunk_priority": self._priority(text, chunk_tokens),
+                "chunk_topics": chunk_topics,
+                "chunk_topics_source": LOCAL_TOPICS_SOURCE
+            }
+            for text, chunk_sentences, chunk_sentence_tokens, chunk_tokens, chunk_topics
+            in zip(chunk_texts, sentences, sentence_tokens, tokens, topics)
+        ]
+
+    def _topics(self, tokens: List[List[str]]) -> List[List[str]]:
+        """Top TF-IDF unigrams and bigrams of every chunk, computed over the whole batch at once."""
+        vocabulary: Dict[str, int] = {}
+        doc_ids: List[int] = []
+        term_ids: List[int] = []
+        for doc_id, chunk_tokens in enumerate(tokens):
+            terms = chunk_tokens + [f"{first} {second}" for first, second in zip(chunk_tokens, chunk_tokens[1:])]
+            term_ids.extend([vocabulary.setdefault(term, len(vocabulary)) for term in terms])
+            doc_ids.extend([doc_id] * len(terms))
+        if not term_ids:
+            return [[] for _ in tokens]
+
+        # Term IDs were assigned in insertion order
+        terms_by_id = list(vocabulary)
+        is_bigram = np.fromiter((" " in term for term in terms_by_id), dtype=bool, count=len(terms_by_id))
+
+        # Sparse term counts as (document, term) pairs
+        pairs = np.asarray(doc_ids, dtype=np.int64) * len(vocabulary) + np.asarray(term_ids, dtype=np.int64)
+        pairs, counts = np.unique(pairs, return_counts=True)
+        pair_docs = pairs // len(vocabulary)
+        pair_terms = pairs % len(vocabulary)
+
+        document_frequency = np.bincount(pair_terms, minlength=len(vocabulary))
+        idf = np.log((1 + len(tokens)) / (1 + document_frequency)) + 1
+        doc_lengths = np.bincount(pair_docs, weights=counts, minlength=len(tokens))
+        scores = counts / doc_lengths[pair_docs] * idf[pair_terms]
+        # A repeated phrase says more about a chunk than either of its words
+        scores = np.where(is_bigram[pair_terms] & (counts > 1), scores * 1.5, scores)
+
+        order = np.lexsort((-scores, pair_docs))
+        boundaries = np.searchsorted(pair_docs[order], np.arange(len(tokens) + 1))
+        topics = []
+        for doc_id in range(len(tokens)):
+            selected: List[str] = []
+            selected_words = set()
+            for term_id in pair_terms[order[boundaries[doc_id]:boundaries[doc_id + 1]]]:
+                term = terms_by_id[term_id]
+                # Skip words already covered by a chosen phrase, and phrases of chosen words
+                words = term.split()
+                if selected_words.intersection(words):
+                    continue
+                selected.append(term)
+                selected_words.update(words)
+                if len(selected) == TOPICS_PER_CHUNK:
+                    break
+            topics.append(selected)
+        return topics
+
+    def _summary(self, sentences: List[str], sentence_tokens: List[List[str]]) -> str:
+        """Extractive summary: the top TextRank sentences in their original order."""
+        sentences = sentences[:MAX_RANKED_SENTENCES]
+        if len(sentences) > SUMMARY_SENTENCES:
+            ranked = self._rank_sentences(sentence_tokens[:MAX_RANKED_SENTENCES])
+            keep = sorted(ranked[:SUMMARY_SENTENCES])
+            sentences = [sentences[index] for index in keep]
+        summary = " ".join(sentences)
+        if len(summary) > SUMMARY_MAX_LEN:
+            summary = summary[:SUMMARY_MAX_LEN].rsplit(" ", 1)[0] + "..."
+        return summary
+
+    def _rank_sentences(self, sentence_tokens: List[List[str]]) -> List[int]:
+        """Sentence indexes by TextRank score, best first."""
+        vocabulary: Dict[str, int] = {}
+        rows: List[int] = []
+        columns: List[int] = []
+        for row, terms in enumerate(sentence_tokens):
+            columns.extend([vocabulary.setdefault(term, len(vocabulary)) for term in terms])
+            rows.extend([row] * len(terms))
+        sentence_count = len(sentence_tokens)
+        if not vocabulary:
+            return list(range(sentence_count))
+        presence = np.zeros((sentence_count, len(vocabulary)), dtype=np.float32)
+        presence[rows, columns] = 1.0
+
+        # Word overlap normalized by sentence length, as in the original TextRank
+        overlap = presence @ presence.T
+        sizes = presence.sum(axis=1)
+        norm = np.log1p(sizes)[:, None] + np.log1p(sizes)[None, :]
+        similarity = np.divide(overlap, norm, out=np.zeros_like(overlap), where=norm > 0)
+        np.fill_diagonal(similarity, 0.0)
+
+        out_weight = similarity.sum(axis=1, keepdims=True)
+        transition = np.divide(similarity, out_weight, out=np.zeros_like(similarity), where=out_weight > 0)
+        scores = np.full(sentence_count, 1.0 / sentence_count, dtype=np.float32)
+        teleport = (1 - TEXTRANK_DAMPING) / sentence_count
+        transition = transition.T.copy()
+        for _ in range(TEXTRANK_ITERATIONS):
+            updated = teleport + TEXTRANK_DAMPING * (transition @ scores)
+            converged = np.abs(updated - scores).max() < TEXTRANK_TOLERANCE
+            scores = updated
+            if converged:
+                break
+        # Ties go to the earlier sentence
+        return np.lexsort((np.arange(sentence_count), -scores)).tolist()
+
+    def _priority(self, text: str, tokens: List[str]) -> int:
+        """Heuristic priority from 1 (boilerplate) to 5 (core business information)."""
+        if len(tokens) < 5:
+            return 1
+        text = text.lower()
+        has_digits = _DIGIT.search(text) is not None
+        priority = 3
+        if ("@" in text and _EMAIL.search(text)) or (has_digits and (_has_phone_number(text) or _ADDRESS.search(text))):
+            priority += 1
+        if _PRICE.search(text):
+            priority += 1
+        if any(phrase in text for phrase in _ENGAGEMENT_PHRASES) or (has_digits and _HOURS.search(text)):
+            priority += 1
+        if self.agent_terms and len(self.agent_terms.intersection(tokens)) >= 3:
+            priority += 1
+
+        boilerplate_hits = sum(text.count(phrase) for phrase in _BOILERPLATE_PHRASES)
+        # Navigation menus and repeated footers reuse the same few words
+        distinct_ratio = len(set(tokens)) / len(tokens)
+        if boilerplate_hits >= 2 or distinct_ratio < 0.3:
+            priority -= 2
+        elif boilerplate_hits == 1 or distinct_ratio < 0.45:
+            priority -= 1
+        return max(1, min(5, priority))
+
+    def knowledge_base_summary(self, chunk_documents: List[Any]) -> Dict[str, Any]:
+        """
+        Summarize a knowledge base from its enhanced chunks, in the same shape as the LLM summary.
+
+        Args:
+            chunk_documents: Chunk documents with enhancement metadata
+
+        Returns:
+            The structured knowledge base summary
+        """
+        if not chunk_documents:
+            return {
+                "overall_theme": "N/A - No content provided.",
+                "key_topics_entities": [],
+                "content_overview": "N/A - No content to summarize.",
+                "estimated_detail_level": "N/A",
+                "knowledge_base_topics": []
+            }
+
+        topic_counts: Counter = Counter()
+        for doc in chunk_documents:
+            topic_counts.update(doc.metadata.get("chunk_topics") or [])
+        key_topics = [topic for topic, _ in topic_counts.most_common(KB_TOPICS)]
+
+        # The highest-priority chunks, earliest first, describe the knowledge base best
+        ranked: List[Tuple[int, int, str]] = sorted(
+            (-(doc.metadata.get("chunk_priority") or 3), index, doc.metadata.get("chunk_summary") or "")
+            for index, doc in enumerate(chunk_documents)
+        )
+        summaries = [summary for _, _, summary in ranked if summary][:4]
+
+        qa_chunks = sum(1 for doc in chunk_documents if doc.metadata.get("type") == "qa")
+        average_length = sum(len(doc.page_content) for doc in chunk_documents) / len(chunk_documents)
+        if qa_chunks > len(chunk_documents) / 2:
+            detail_level = "Q&A format"
+        elif average_length > 600:
+            detail_level = "Detailed"
+        else:
+            detail_level = "Mixed: General introductions and specific examples"
+
+        return {
+            "overall_theme": summaries[0] if summaries else "",
+            "key_topics_entities": key_topics,
+            "content_overview": " ".join(summaries[1:]),
+            "estimated_detail_level": detail_level,
+            "knowledge_base_topics": sorted(topic_counts)
+        }
@@ -0,0 +1,112 @@
+import threading
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import BaseMessage, HumanMessage, SystemMessage
+
+# Prompt layouts supported by RagQuery
+LEGACY_LAYOUT = "legacy"
+PREFIX_CACHE_LAYOUT = "prefix_cache"
+
+# File in a vector store directory holding the KB summary written at training time
+KB_SUMMARY_FILENAME = "kb_summary.json"
+
+
+def format_kb_context(kb_summary: Optional[Dict[str, Any]]) -> str:
+    """
+    Format a knowledge base summary into static per-KB prompt context.
+
+    Args:
+        kb_summary: Summary produced by RAGEnhancementService.generate_knowledge_base_summary
+
+    Returns:
+        The formatted context, or an empty string if there is nothing useful
+    """
+    if not kb_summary:
+        return ""
+
+    parts = []
+    overall_theme = kb_summary.get("overall_theme")
+    if overall_theme and not overall_theme.startswith(("N/A", "Error")):
+        parts.append(f"Theme: {overall_theme}")
+    content_overview = kb_summary.get("content_overview")
+    if content_overview and not content_overview.startswith(("N/A", "Could not")):
+        parts.append(f"Overview: {content_overview}")
+    key_topics = kb_summary.get("key_topics_entities") or []
+    if key_topics:
+        parts.append(f"Key topics: {', '.join(key_topics)}")
+    return "\n".join(parts)
+
+
+def build_prefix_cached_messages(
+    system_prompt: str,
+    question: str,
+    context: str,
+    kb_context: Optional[str] = None,
+    conversation_history: Optional[str] = None
+) -> List[BaseMessage]:
+    """
+    Assemble prompt messages ordered from most to least stable, so that
+    provider-side prompt/prefix caching can reuse the longest possible prefix:
+    static system prompt, per-KB static context, session history,
+    retrieved context, question.
+
+    Args:
+        system_prompt: Static system prompt
+        question: The user's question
+        context: Retrieved context for this question
+        kb_context: Static per-KB context, such as the KB summary
+        conversation_history: Session history, which grows append-only across turns
+
+    Returns:
+        List of chat messages
+    """
+    system_content = system_prompt
+    if kb_context:
+        system_content += f"\n\nKnowledge base overview:\n{kb_context}"
+
+    messages: List[BaseMessage] = [SystemMessage(content=system_content)]
+    if conversation_history:
+        messages.append(HumanMessage(content=f"Previous conversation:\n{conversation_history}"))
+    messages.append(HumanMessage(content=f"Context: {context}\n\nQuestion: {question}"))
+    return messages
+
+
+class PromptCacheStats:
+    """Aggregate provider-reported prompt token and cached token counts."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.calls_with_usage = 0
+        self.input_tokens = 0
+        self.cached_input_tokens = 0
+
+    def record(self, usage: Optional[Dict[str, Any]]) -> None:
+        """
+        Record one LLM call's usage metadata.
+
+        Args:
+            usage: LangChain usage_metadata of the response, if the provider reported it
+        """
+        with self._lock:
+            self.calls += 1
+            if not usage:
+                return
+            self.calls_with_usage += 1
+            self.input_tokens += usage.get("input_tokens", 0) or 0
+            input_token_details = usage.get("input_token_details") or {}
+            self.cached_input_tokens += input_token_details.get("cache_read", 0) or 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return cached token counts and the cache hit ratio."""
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "calls_with_usage": self.calls_with_usage,
+                "input_tokens": self.input_tokens,
+                "cached_input_tokens": self.cached_input_tokens,
+                "cached_ratio": round(self.cached_input_tokens / self.input_tokens, 4) if self.input_tokens else 0.0,
+            }
+
+
+prompt_cache_stats = PromptCacheStats()
@@ -0,0 +1,133 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def worker_cpu_share() -> int:
+    """CPU cores available to this process when RAG_API_WORKERS processes share the host."""
+    api_workers = int(os.getenv("RAG_API_WORKERS", "1") or 1)
+    return max(1, (os.cpu_count() or 1) // max(1, api_workers))
+
+
+class QueryExecutor:
+    """
+    Dedicated, sized thread pool for the CPU-bound stages of a RAG query.
+
+    FAISS releases the GIL while it searches, so running vector search,
+    keyword scoring, fusion and context packing here keeps the asyncio event
+    loop free to serve other requests and lets query throughput scale with cores.
+    """
+
+    def __init__(self, max_workers: Optional[int] = None, thread_name_prefix: str = "rag-query"):
+        """
+        Initialize the query executor.
+
+        Args:
+            max_workers: Number of worker threads. Defaults to the RAG_QUERY_THREADS
+                environment variable, or this API worker's share of the CPU cores
+                if that is unset.
+            thread_name_prefix: Prefix for worker thread names
+        """
+        if not max_workers:
+            max_workers = int(os.getenv("RAG_QUERY_THREADS") or 0) or worker_cpu_share()
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers,
+            thread_name_prefix=thread_name_prefix
+        )
+
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+        self._max_queue_depth = 0
+        self._total_wait_seconds = 0.0
+        self._total_run_seconds = 0.0
+        logger.info(f"QueryExecutor initialized with {max_workers} worker threads")
+
+    async def run(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        """
+        Run a blocking function on the pool and await its result.
+
+        Args:
+            func: The function to run
+            *args: Positional arguments for the function
+            **kwargs: Keyword arguments for the function
+
+        Returns:
+            The function's return value
+        """
+        submitted_at = time.perf_counter()
+
+        def task() -> Any:
+            started_at = time.perf_counter()
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._total_wait_seconds += started_at - submitted_at
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                with self._lock:
+                    self._failed += 1
+                raise
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._completed += 1
+                    self._total_run_seconds += time.perf_counter() - started_at
+            return result
+
+        with self._lock:
+            self._queued += 1
+            self._max_queue_depth = max(self._max_queue_depth, self._queued)
+
+        future = self._executor.submit(task)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            # A task that never started will not decrement the queue itself
+            if future.cancel():
+                with self._lock:
+                    self._queued -= 1
+            raise
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool sizing, current queue depth and timing counters."""
+        with self._lock:
+            completed = self._completed
+            return {
+                "max_workers": self.max_workers,
+                "queue_depth": self._queued,
+                "max_queue_depth": self._max_queue_depth,
+                "running": self._running,
+                "completed": completed,
+                "failed": self._failed,
+                "avg_wait_ms": round(self._total_wait_seconds / completed * 1000, 3) if completed else 0.0,
+                "avg_run_ms": round(self._total_run_seconds / completed * 1000, 3) if completed else 0.0,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Shut down the underlying thread pool."""
+        self._executor.shutdown(wait=wait)
+
+
+_query_executor: Optional[QueryExecutor] = None
+_query_executor_lock = threading.Lock()
+
+
+def get_query_executor() -> QueryExecutor:
+    """Get the process-wide query executor, creating it on first use."""
+    global _query_executor
+    if _query_executor is None:
+        with _query_executor_lock:
+            if _query_executor is None:
+                _query_executor = QueryExecutor()
+    return _query_executor
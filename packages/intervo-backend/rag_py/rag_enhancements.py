@@ -6,6 +6,33 @@ import html # Added for HTML entity decoding
 
 # Import the new dedicated Gemini service
 from rag_py.llm_services.gemini_internal_service import GeminiInternalService
+from rag_py.enhancement_cache import enhancement_cache_key
+from rag_py.llm_pool import LLMProviderPool, enhancement_provider_configs
+from rag_py.local_enhancements import LocalEnhancementEngine
+
+# Scoring scale shared by the priority prompt and the combined enhancement prompt
+PRIORITY_GUIDELINES = """Consider these general guidelines for scoring:
+- 5: Crucial, core information; direct answers to likely primary questions; key definitions, solutions, main product features, or critical calls to action.
+- 4: Important supporting details; significant explanations, benefits, or secondary product features; contact information; detailed pricing or plans.
+- 3: Relevant contextual information; background details; general examples; "about us" information; business hours.
+- 2: Minor or tangential details; less critical elaborations; general company culture or policies (unless directly about customer interaction).
+- 1: Boilerplate; repetitive text; navigational links; or very low unique information content.
+"""
+
+ENHANCEMENT_ENGINE_LLM = "llm"
+ENHANCEMENT_ENGINE_LOCAL = "local"
+
+ENHANCEMENT_MODE_COMBINED = "combined"
+ENHANCEMENT_MODE_SEPARATE = "separate"
+
+# Max characters of each chunk's text put into the combined enhancement prompt
+COMBINED_CHUNK_INPUT_LEN = 2000
+
+# Output tokens allowed per chunk in a combined enhancement call
+COMBINED_TOKENS_PER_CHUNK = 300
+
+# Bump when the summary, priority or topics prompts change, so cached enhancements are regenerated
+ENHANCEMENT_PROMPT_VERSION = "1"
 
 class RAGEnhancementService:
     def __init__(self, llm_config: Dict[str, Any], logger: Optional[logging.Logger] = None, agent_prompt: Optional[str] = None):
@@ -24,12 +51,23 @@ class RAGEnhancementService:
         # API key environment variable name can also be made configurable if needed
         # api_key_env_var = llm_config.get("enhancements_api_key_env", "GOOGLE_API_KEY")
 
+        # Retries are left to the scheduler, which needs to see every 429 to adapt its rate
         self.llm_client = GeminiInternalService(
             model_name=enhancements_model_name,
             temperature=enhancements_temperature,
-            max_retries=enhancements_max_retries
+            max_retries=1
             # api_key_env_var=api_key_env_var # if you make it configurable
         )
+        self.max_retries = enhancements_max_retries
+        # Calls are spread across the configured enhancement providers, or go to the client above alone
+        self.pool = LLMProviderPool(enhancement_provider_configs(llm_config), default_client=self.llm_client)
+        self.llm_calls = 0
+        # "separate" makes three calls per chunk; "combined" asks for summary, priority and topics of several chunks in one call
+        self.mode = llm_config.get("enhancement_mode", ENHANCEMENT_MODE_SEPARATE)
+        self.batch_size = max(1, int(llm_config.get("enhancement_batch_size", 8)))
+        # The "local" engine enhances chunks and summarizes the knowledge base without any LLM calls
+        self.engine = llm_config.get("enhancement_engine", ENHANCEMENT_ENGINE_LLM)
+        self.local_engine = LocalEnhancementEngine(agent_prompt) if self.engine == ENHANCEMENT_ENGINE_LOCAL else None
         self.logger.info(f"RAGEnhancementService initialized with dedicated GeminiInternalService using model: {enhancements_model_name}. Agent prompt provided: {bool(self.agent_prompt)}")
 
         # It's important to initialize the GeminiService. 
@@ -47,11 +85,22 @@ class RAGEnhancementService:
         # The initialize call has been moved to where it's first used in the `api.py` or make methods below handle it.
 
     async def _ensure_llm_initialized(self):
-        # Check the specific attribute name used in GeminiInternalService
-        if not self.llm_client.llm_model: 
-            self.logger.info("LLM client (GeminiInternalService) not initialized. Initializing now...")
-            await self.llm_client.initialize()
-            self.logger.info("GeminiInternalService initialized successfully.")
+        await self.pool.initialize()
+
+    async def _generate(self, prompt: str, max_tokens: int) -> Dict[str, Any]:
+        """Call the LLM through the provider pool, whose schedulers pace and retry it."""
+        self.llm_calls += 1
+        return await self.pool.generate(prompt, max_tokens, self.max_retries)
+
+    def cache_key(self, chunk_text: str) -> bytes:
+        """Key of a chunk's enhancements in the enhancement cache."""
+        return enhancement_cache_key(
+            self.pool.model_name,
+            ENHANCEMENT_PROMPT_VERSION,
+            self.mode,
+            self.agent_prompt,
+            chunk_text
+        )
 
     async def generate_chunk_topics(self, chunk_text: str, chunk_summary: Optional[str] = None) -> Dict[str, Any]:
         """Generates a list of topics for a given text chunk."""
@@ -76,7 +125,7 @@ Respond ONLY with the raw JSON array of topic strings, without any surrounding t
 Topics (JSON array):
 """
         try:
-            response = await self.llm_client.generate(prompt, max_tokens=100)
+            response = await self._generate(prompt, max_tokens=100)
             raw_response_text = response.get("text", "[]").strip()
             
             self.logger.info(f"LLM raw response for topics: '{raw_response_text}'")
@@ -122,8 +171,8 @@ Topics (JSON array):
             self.logger.info(f"Generated chunk topics: {topics} (count: {len(topics)}, source: {source})")
             return {"topics": topics, "source": source}
         except Exception as e:
-            self.logger.error(f"Error in generate_chunk_topics: {e}", exc_info=True)
-            return {"topics": [], "source": "error"}
+            self.logger.error(f"Error in generate_chunk_topics: {e}")
+            raise
 
     def _extract_topics_fallback(self, response_text: str) -> List[str]:
         """Fallback method to extract topics from LLM response when JSON parsing fails."""
@@ -178,13 +227,31 @@ Chunk:
 
 Summary:"""
         try:
-            response = await self.llm_client.generate(current_prompt, max_tokens=150)
-            summary = response.get("text", "Error: Could not generate summary.").strip()
+            response = await self._generate(current_prompt, max_tokens=150)
+            summary = response.get("text", "").strip()
             self.logger.debug(f"Generated chunk summary: {summary[:100]}...")
             return summary
         except Exception as e:
-            self.logger.error(f"Error in generate_chunk_summary: {e}", exc_info=True)
-            return "Error: Could not generate summary due to an exception."
+            self.logger.error(f"Error in generate_chunk_summary: {e}")
+            raise
+
+    def _agent_priority_instructions(self) -> str:
+        """Priority instructions specific to the agent's role, or an empty string without an agent prompt."""
+        if not self.agent_prompt:
+            return ""
+        return f"""\nThis content is for an agent whose primary role/prompt is: "{self.agent_prompt[:500]}..."
+Given this agent's role, pay special attention to information directly related to its purpose. For example, if the agent is about sales, pricing and product features are very high priority. If it's about support, troubleshooting steps are high priority.
+
+Specifically, elevate the priority if the content directly addresses typical business-critical topics such as:
+- Detailed product/service descriptions, features, and benefits.
+- Pricing, plans, and purchase information.
+- Contact details (phone numbers, email addresses, physical addresses).
+- Business hours and availability.
+- "About Us" or company mission statements.
+- Key calls to action or next steps for a user.
+
+If the content clearly falls into one of these business-critical categories AND aligns with the agent's role, it should generally receive a higher score (4 or 5).
+"""
 
     async def generate_chunk_priority(self, chunk_text: str, chunk_summary: Optional[str] = None) -> int:
         await self._ensure_llm_initialized()
@@ -199,35 +266,15 @@ Summary:"""
 
 Assign a priority score from 1 (low) to 5 (high) to this content based on its perceived importance, information density, and direct relevance for answering user queries. 
 
-Consider these general guidelines for scoring:
-- 5: Crucial, core information; direct answers to likely primary questions; key definitions, solutions, main product features, or critical calls to action.
-- 4: Important supporting details; significant explanations, benefits, or secondary product features; contact information; detailed pricing or plans.
-- 3: Relevant contextual information; background details; general examples; "about us" information; business hours.
-- 2: Minor or tangential details; less critical elaborations; general company culture or policies (unless directly about customer interaction).
-- 1: Boilerplate; repetitive text; navigational links; or very low unique information content.
-"""
+{PRIORITY_GUIDELINES}"""
 
         # Add agent-specific instructions if an agent_prompt is available
-        agent_context_instructions = ""
-        if self.agent_prompt:
-            agent_context_instructions = f"""\nThis content is for an agent whose primary role/prompt is: "{self.agent_prompt[:500]}..."
-Given this agent's role, pay special attention to information directly related to its purpose. For example, if the agent is about sales, pricing and product features are very high priority. If it's about support, troubleshooting steps are high priority.
-
-Specifically, elevate the priority if the content directly addresses typical business-critical topics such as:
-- Detailed product/service descriptions, features, and benefits.
-- Pricing, plans, and purchase information.
-- Contact details (phone numbers, email addresses, physical addresses).
-- Business hours and availability.
-- "About Us" or company mission statements.
-- Key calls to action or next steps for a user.
-
-If the content clearly falls into one of these business-critical categories AND aligns with the agent's role, it should generally receive a higher score (4 or 5).
-"""
+        agent_context_instructions = self._agent_priority_instructions()
 
         final_prompt = f"{priority_prompt_core}{agent_context_instructions}\n\nReturn ONLY the integer priority score (1-5) and nothing else:"
 
         try:
-            response = await self.llm_client.generate(final_prompt, max_tokens=10)
+            response = await self._generate(final_prompt, max_tokens=10)
             priority_str = response.get("text", "3").strip()
             # Extract digits only, in case the LLM returns "Priority: 3" or similar
             digits = "".join(filter(str.isdigit, priority_str))
@@ -243,10 +290,128 @@ If the content clearly falls into one of these business-critical categories AND
             self.logger.warning(f"Could not parse priority from '{priority_str}'. Defaulting to 3.", exc_info=True)
             return 3
         except Exception as e:
-            self.logger.error(f"Error in generate_chunk_priority: {e}", exc_info=True)
-            return 3 
+            self.logger.error(f"Error in generate_chunk_priority: {e}")
+            raise
+
+    async def generate_chunk_enhancements(self, chunk_texts: List[str]) -> List[Optional[Dict[str, Any]]]:
+        """
+        Generate the summary, priority and topics of several chunks in one LLM call.
+
+        Args:
+            chunk_texts: Texts of the chunks, at most batch_size of them for a reasonable prompt
+
+        Returns:
+            For each chunk, its metadata fields (chunk_summary, chunk_priority,
+            chunk_topics, chunk_topics_source), or None if its entry in the
+            response was missing or malformed
+
+        Raises:
+            The LLM error if the call fails after the scheduler's retries
+        """
+        await self._ensure_llm_initialized()
+        chunk_sections = []
+        for number, chunk_text in enumerate(chunk_texts, start=1):
+            if len(chunk_text) > COMBINED_CHUNK_INPUT_LEN:
+                chunk_text = chunk_text[:COMBINED_CHUNK_INPUT_LEN] + "..."
+            chunk_sections.append(f'Chunk {number}:\n\"""{chunk_text}\"""')
+        chunks_text = "\n\n".join(chunk_sections)
+
+        prompt = f"""For each of the following {len(chunk_texts)} text chunks from a knowledge base, provide:
+- "summary": a concise summary of the chunk's main topic and key information in one or two sentences.
+- "priority": an integer from 1 (low) to 5 (high) scoring the chunk's importance, information density, and direct relevance for answering user queries.
+- "topics": the 3-5 primary topics the chunk covers, as short strings (1-3 words per topic if possible).
+
+{PRIORITY_GUIDELINES}{self._agent_priority_instructions()}
+{chunks_text}
+
+Respond ONLY with a raw JSON array containing one object per chunk, in order, without any surrounding text or markdown formatting. For example:
+[{{"chunk": 1, "summary": "...", "priority": 3, "topics": ["topic one", "topic two", "topic three"]}}]
+"""
+        response = await self._generate(prompt, max_tokens=COMBINED_TOKENS_PER_CHUNK * len(chunk_texts))
+        raw_response_text = response.get("text", "").strip()
+        entries = self._parse_combined_response(raw_response_text, len(chunk_texts))
+        results = [self._normalize_combined_entry(entries.get(number)) for number in range(1, len(chunk_texts) + 1)]
+        missing = sum(result is None for result in results)
+        if missing:
+            self.logger.warning(f"Combined enhancement response lacked valid entries for {missing} of {len(chunk_texts)} chunks: '{raw_response_text[:200]}'")
+        return results
+
+    def _parse_combined_response(self, response_text: str, chunk_count: int) -> Dict[int, Dict[str, Any]]:
+        """
+        Map chunk numbers to their objects in a combined enhancement response.
+
+        The whole response is parsed as a JSON array when possible. Otherwise
+        every JSON object found in the text is used, so one malformed entry or
+        a truncated tail only loses the chunks it covers.
+        """
+        cleaned_response_text = response_text
+        if cleaned_response_text.startswith("```json"):
+            cleaned_response_text = cleaned_response_text[len("```json"):]
+        if cleaned_response_text.startswith("```"):
+            cleaned_response_text = cleaned_response_text[len("```"):]
+        if cleaned_response_text.endswith("```"):
+            cleaned_response_text = cleaned_response_text[:-len("```")]
+        cleaned_response_text = cleaned_response_text.strip()
+
+        objects: List[Dict[str, Any]] = []
+        try:
+            parsed = json.loads(cleaned_response_text)
+            if isinstance(parsed, dict):
+                parsed = parsed.get("chunks", [parsed])
+            if isinstance(parsed, list):
+                objects = [item for item in parsed if isinstance(item, dict)]
+        except json.JSONDecodeError:
+            decoder = json.JSONDecoder()
+            position = cleaned_response_text.find("{")
+            while position != -1:
+                try:
+                    item, end = decoder.raw_decode(cleaned_response_text, position)
+                except json.JSONDecodeError:
+                    position = cleaned_response_text.find("{", position + 1)
+                    continue
+                if isinstance(item, dict):
+                    objects.append(item)
+                position = cleaned_response_text.find("{", end)
+
+        entries: Dict[int, Dict[str, Any]] = {}
+        for item in objects:
+            number = item.get("chunk", item.get("id"))
+            try:
+                number = int(number)
+            except (TypeError, ValueError):
+                continue
+            if 1 <= number <= chunk_count:
+                entries.setdefault(number, item)
+        # Entries without chunk numbers can only be matched by position when every chunk has one
+        if not entries and len(objects) == chunk_count:
+            entries = {number: item for number, item in enumerate(objects, start=1)}
+        return entries
+
+    def _normalize_combined_entry(self, entry: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Chunk metadata fields from one combined response entry, or None if it is unusable."""
+        if not entry:
+            return None
+        summary = entry.get("summary")
+        if not isinstance(summary, str) or not summary.strip():
+            return None
+        digits = "".join(filter(str.isdigit, str(entry.get("priority", ""))))
+        priority = int(digits) if digits else 3
+        if not 1 <= priority <= 5:
+            priority = 3
+        topics = entry.get("topics")
+        if not isinstance(topics, list):
+            return None
+        topics = [topic.strip().lower() for topic in topics if isinstance(topic, str) and topic.strip()][:7]
+        return {
+            "chunk_summary": summary.strip(),
+            "chunk_priority": priority,
+            "chunk_topics": topics,
+            "chunk_topics_source": "llm"
+        }
 
     async def generate_knowledge_base_summary(self, chunk_documents: List[Any]) -> Dict[str, Any]:
+        if self.local_engine is not None:
+            return await asyncio.to_thread(self.local_engine.knowledge_base_summary, chunk_documents)
         await self._ensure_llm_initialized()
         # '''Any''' here represents Langchain Document objects
         if not chunk_documents:
@@ -298,7 +463,7 @@ If the content clearly falls into one of these business-critical categories AND
         }
 
         try:
-            response = await self.llm_client.generate(prompt, max_tokens=600) # Allow more tokens for JSON
+            response = await self._generate(prompt, max_tokens=600) # Allow more tokens for JSON
             raw_response_text = response.get("text", "").strip()
             
             # Attempt to extract JSON even if it'''s embedded or slightly malformed
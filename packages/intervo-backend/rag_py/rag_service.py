@@ -1,8 +1,14 @@
-from typing import List, Dict, Any, Optional, Tuple
+from typing import Callable, List, Dict, Any, Iterable, Optional, Tuple
 import logging
 from pathlib import Path
 from dotenv import load_dotenv
 import os
+import json
+import asyncio
+import functools
+import faiss
+import numpy as np
+import tiktoken
 
 from langchain_core.documents import Document
 from langchain_core.embeddings import Embeddings
@@ -10,11 +16,54 @@ from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
 from langchain_core.vectorstores import VectorStore
 from langchain_community.vectorstores import FAISS
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_core.prompts import ChatPromptTemplate, SystemMessagePromptTemplate, HumanMessagePromptTemplate
 from langchain_voyageai import VoyageAIRerank
 from langchain.retrievers import ContextualCompressionRetriever
 from rag_py.llm_services.factory import LLMServiceFactory, LLMServiceType
 from rag_py.llm_services.base import BaseLLMService
+from rag_py.query_executor import get_query_executor
+from rag_py.ann_tuner import tune_search_params, write_tuning_report
+from rag_py.chunk_store import ChunkStore, iter_docstore
+from rag_py.embedding_compression import (
+    ReducedDimensionEmbeddings,
+    evaluate_compression,
+    reduce_dimensions,
+    write_compression_report
+)
+from rag_py.vector_index import (
+    INDEX_FLAT,
+    LOAD_MODE_MEMORY,
+    LOAD_MODE_MMAP,
+    QUANTIZATION_NONE,
+    add_embeddings_to_store,
+    apply_search_params,
+    build_index,
+    build_sharded_index,
+    choose_index_type,
+    choose_quantization,
+    has_faiss_index,
+    load_faiss_store,
+    read_manifest,
+    remove_rows,
+    save_faiss_store,
+    shard_indexes,
+    write_manifest
+)
+from rag_py.embedding_batcher import get_embedding_batcher
+from rag_py.embedding_cache import embedding_cache_key, get_embedding_cache
+from rag_py.tenant_index import TenantIndex
+from rag_py.shard_search import SHARD_SEARCH_PROCESS, load_sharded_store
+from rag_py.store_versions import current_version_path
+from rag_py.source_tracking import SOURCE_ID_FIELD, read_source_map, write_source_map
+from rag_py.prompt_layout import (
+    KB_SUMMARY_FILENAME,
+    LEGACY_LAYOUT,
+    PREFIX_CACHE_LAYOUT,
+    build_prefix_cached_messages,
+    format_kb_context,
+    prompt_cache_stats
+)
 
 # Configure logging
 logging.basicConfig(
@@ -23,6 +72,26 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@functools.lru_cache(maxsize=8)
+def _token_encoding(model: str) -> Optional[tiktoken.Encoding]:
+    """tiktoken encoding of an embedding model (cl100k_base for unknown models), or None if it cannot be loaded."""
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # tiktoken downloads encodings on first use; counting must not fail training
+        logger.warning(f"Could not load the tiktoken encoding for {model}; estimating token counts: {e}")
+        return None
+
+def count_tokens(texts: List[str], model: str) -> int:
+    """Count the tokens the embeddings API bills for texts (estimated at 4 characters per token without tiktoken)."""
+    encoding = _token_encoding(model)
+    if encoding is None:
+        return sum(max(1, len(text) // 4) for text in texts)
+    return sum(len(tokens) for tokens in encoding.encode_batch(texts, disallowed_special=()))
+
 class RagTrainer:
     def __init__(
         self,
@@ -59,6 +128,17 @@ class RagTrainer:
         # Initialize vector store
         self.vector_store: Optional[VectorStore] = None
         self.documents: List[Document] = []
+        self.index_manifest: Dict[str, Any] = {}
+        self.tuning_report: Optional[Dict[str, Any]] = None
+        self.compression_report: Optional[Dict[str, Any]] = None
+        
+        # Chunk IDs of each source document (see source_tracking); None for
+        # stores trained before sources were tracked
+        self.source_chunks: Optional[Dict[str, List[str]]] = None
+        
+        # Embedding API usage of this trainer: requests, texts embedded, tokens billed
+        # and chunks served from the embedding cache instead
+        self.embedding_usage: Dict[str, int] = {"calls": 0, "texts": 0, "tokens": 0, "cache_hits": 0}
         
         # Initialize text splitter
         self.text_splitter = RecursiveCharacterTextSplitter(
@@ -74,42 +154,250 @@ class RagTrainer:
     def _load_vector_store(self) -> None:
         """Load the vector store from disk if it exists."""
         try:
-            index_path = self.vector_store_path / "index.faiss"
-            if index_path.exists():
+            self.index_manifest = read_manifest(self.vector_store_path)
+            self.source_chunks = read_source_map(self.vector_store_path)
+            if has_faiss_index(self.vector_store_path):
                 logger.info(f"Loading vector store from {self.vector_store_path}")
-                self.vector_store = FAISS.load_local(
-                    str(self.vector_store_path),
-                    self.embeddings,
-                    allow_dangerous_deserialization=True
+                # The trainer modifies its index, so it is always loaded into memory
+                self.vector_store = load_faiss_store(
+                    self.vector_store_path,
+                    self._index_embeddings(self.index_manifest.get("embedding_dimensions")),
+                    LOAD_MODE_MEMORY
                 )
         except Exception as e:
             logger.error(f"Error loading vector store: {e}")
             self.vector_store = None
             
     def _save_vector_store(self) -> None:
-        """Save the vector store to disk."""
+        """Save the vector store and its manifest to disk."""
         if self.vector_store:
             logger.info(f"Saving vector store to {self.vector_store_path}")
             # Ensure directory exists
             self.vector_store_path.mkdir(parents=True, exist_ok=True)
-            self.vector_store.save_local(str(self.vector_store_path))
+            save_faiss_store(self.vector_store, self.vector_store_path)
+            self.index_manifest["num_vectors"] = self.vector_store.index.ntotal
+            if isinstance(self.vector_store.index, faiss.IndexShards):
+                self.index_manifest["shard_sizes"] = [
+                    shard_index.ntotal for shard_index in shard_indexes(self.vector_store.index)
+                ]
+            self.index_manifest["embedding_usage"] = self.embedding_usage
+            write_manifest(self.vector_store_path, self.index_manifest)
+            if self.source_chunks is not None:
+                write_source_map(self.vector_store_path, self.source_chunks)
+            if self.tuning_report:
+                write_tuning_report(self.vector_store_path, self.tuning_report)
+            if self.compression_report:
+                write_compression_report(self.vector_store_path, self.compression_report)
+                
+    def _index_embeddings(self, dimensions: Optional[int]) -> Embeddings:
+        """Embeddings matching the index: shortened when the KB uses reduced dimensions."""
+        if dimensions:
+            return ReducedDimensionEmbeddings(self.embeddings, dimensions)
+        return self.embeddings
+        
+    def _prepare_vectors(
+        self,
+        embeddings: np.ndarray,
+        new_index: bool
+    ) -> Tuple[np.ndarray, Optional[int]]:
+        """
+        Convert full-dimension embeddings to the index's dimension.
+        
+        A new index uses the "embedding_dimensions" config option; an existing
+        one keeps the dimension recorded in its manifest.
+        
+        Returns:
+            Tuple of (float32 vectors, reduced dimension or None if not reduced)
+        """
+        if new_index:
+            dimensions = self.config.get("embedding_dimensions")
+        else:
+            dimensions = self.index_manifest.get("embedding_dimensions")
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if not dimensions or dimensions >= vectors.shape[1]:
+            return vectors, None
+        return reduce_dimensions(vectors, dimensions), dimensions
+            
+    def _build_vector_store(
+        self,
+        documents: List[Document],
+        vectors: np.ndarray,
+        embedding_dimensions: Optional[int] = None
+    ) -> FAISS:
+        """
+        Build a FAISS vector store from documents and their precomputed embeddings.
+        
+        The index type (flat, HNSW or IVF-PQ) comes from the "index_type" config
+        option, or is chosen from the corpus size when it is "auto" or unset.
+        With "num_shards" above 1 the vectors are split into that many shard
+        indexes, each sized and typed for its share of the corpus. Vectors are stored as float32 unless the "quantization" option selects
+        fp16 or int8 scalar quantization.
+        
+        Args:
+            documents: Chunk documents
+            vectors: float32 array with one embedding per document, already
+                reduced to the configured dimension
+            embedding_dimensions: Dimension the embeddings were shortened to, if any
+            
+        Returns:
+            The populated FAISS vector store
+        """
+        dimension = int(vectors.shape[1])
+        quantization = choose_quantization(self.config)
+        num_shards = max(1, min(int(self.config.get("num_shards", 1)), len(vectors)))
+        if num_shards > 1:
+            index, index_type, search_params = build_sharded_index(vectors, num_shards, self.config, quantization)
+        else:
+            requested_type = choose_index_type(len(vectors), self.config)
+            index, index_type, search_params = build_index(vectors, requested_type, self.config, quantization)
+        logger.info(
+            f"Building {index_type} index for {len(vectors)} chunks in {num_shards} shard(s) "
+            f"({dimension} dims, {quantization})"
+        )
+        
+        vector_store = FAISS(
+            embedding_function=self._index_embeddings(embedding_dimensions),
+            index=index,
+            docstore=InMemoryDocstore(),
+            index_to_docstore_id={}
+        )
+        vector_store.add_embeddings(
+            text_embeddings=zip([doc.page_content for doc in documents], vectors),
+            metadatas=[doc.metadata for doc in documents]
+        )
+        
+        self.index_manifest = {
+            "index_type": index_type,
+            "search_params": search_params,
+            "dimension": dimension,
+            "embedding_dimensions": embedding_dimensions,
+            "quantization": quantization,
+            "num_shards": num_shards,
+            "embedding_model": self.embeddings.model
+        }
+        return vector_store
+        
+    def _evaluate_compression(self, embeddings: np.ndarray) -> None:
+        """
+        Report memory saved and recall lost by reduced dimensions and
+        quantization against the full float32 embeddings. Skipped when the KB
+        uses neither, or when compression_eval is off.
+        """
+        compressed = (
+            self.index_manifest.get("embedding_dimensions")
+            or self.index_manifest.get("quantization", QUANTIZATION_NONE) != QUANTIZATION_NONE
+        )
+        if not compressed or not self.config.get("compression_eval", True):
+            self.compression_report = None
+            return
+            
+        self.compression_report = evaluate_compression(
+            self.vector_store.index,
+            np.asarray(embeddings, dtype=np.float32),
+            self.index_manifest,
+            self.config
+        )
+        
+    def _tune_search_params(self, vectors: np.ndarray) -> None:
+        """
+        Auto-tune the approximate index's search parameters against the
+        configured recall floor and latency ceiling, and record the result
+        in the manifest. Skipped for flat indexes or when ann_auto_tune is off.
+        """
+        index_type = self.index_manifest.get("index_type", INDEX_FLAT)
+        if index_type == INDEX_FLAT or not self.config.get("ann_auto_tune", True):
+            self.tuning_report = None
+            return
+            
+        report = tune_search_params(
+            self.vector_store.index,
+            vectors,
+            index_type,
+            self.config
+        )
+        self.index_manifest["search_params"] = report["selected"]
+        self.tuning_report = report
+        logger.info(f"Tuned {index_type} search parameters: {report['selected_measurements']}")
             
-    async def _embed_texts(self, texts: List[str]) -> List[List[float]]:
-        """Helper method to embed texts and log the process."""
+    async def _embed_texts(
+        self,
+        texts: List[str],
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> np.ndarray:
+        """
+        Embed chunk texts, recording calls and tokens.
+        
+        Embeddings are looked up in the shared embedding cache first (unless
+        the "embedding_cache" option is off), and each distinct text missing
+        from it is embedded once. Texts are sent in batches of
+        "embedding_batch_size" (by default the embeddings client's own request
+        size), so each batch is one API call.
+        
+        Args:
+            texts: Chunk texts
+            progress: Called with (texts embedded or found in the cache, all texts) after each batch
+        
+        Returns:
+            float32 array with one full-dimension embedding per text
+        """
         logger.info(f"Generating embeddings for {len(texts)} text chunks...")
+        if not texts:
+            return np.empty((0, 0), dtype=np.float32)
+        model = self.embeddings.model
+        cache = get_embedding_cache() if self.config.get("embedding_cache", True) else None
+        keys = [
+            embedding_cache_key(model, getattr(self.embeddings, "dimensions", None), text)
+            for text in texts
+        ]
         try:
-            embeddings = await self.embeddings.aembed_documents(texts)
-            return embeddings
+            found = await asyncio.to_thread(cache.get_many, keys) if cache else {}
+            
+            # Distinct texts not in the cache, in first-seen order
+            missing: Dict[bytes, str] = {}
+            for key, text in zip(keys, texts):
+                if key not in found and key not in missing:
+                    missing[key] = text
+            
+            client_batch_size = getattr(self.embeddings, "chunk_size", None) or 1000
+            batch_size = min(self.config.get("embedding_batch_size", client_batch_size), client_batch_size)
+            missing_keys = list(missing)
+            tokens = 0
+            if progress:
+                progress(len(texts) - len(missing), len(texts))
+            for start in range(0, len(missing_keys), batch_size):
+                batch_keys = missing_keys[start:start + batch_size]
+                batch = [missing[key] for key in batch_keys]
+                vectors = np.asarray(await self.embeddings.aembed_documents(batch), dtype=np.float32)
+                found.update(zip(batch_keys, vectors))
+                if cache:
+                    await asyncio.to_thread(cache.put_many, zip(batch_keys, vectors))
+                tokens += count_tokens(batch, model)
+                self.embedding_usage["calls"] += 1
+                self.embedding_usage["texts"] += len(batch)
+                if progress:
+                    progress(len(texts) - len(missing) + start + len(batch), len(texts))
+            self.embedding_usage["tokens"] += tokens
+            self.embedding_usage["cache_hits"] += len(texts) - len(missing)
+            logger.info(
+                f"Embedded {len(missing)} of {len(texts)} chunks in {-(-len(missing) // batch_size)} calls "
+                f"({tokens} tokens); {len(texts) - len(missing)} served from the embedding cache"
+            )
+            return np.stack([found[key] for key in keys])
         except Exception as e:
             logger.error(f"Error generating embeddings: {e}")
             raise
 
-    async def initialize(self, documents: List[Document]) -> None:
+    async def initialize(
+        self,
+        documents: List[Document],
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> None:
         """
         Initialize the RAG system with the provided documents.
         
         Args:
             documents: List of Document objects to initialize the system with
+            progress: Called with (chunks embedded, all chunks) as embedding proceeds
         """
         try:
             # Store original documents
@@ -124,22 +412,40 @@ class RagTrainer:
             texts = [doc.page_content for doc in split_docs]
             
             # Generate and log embeddings
-            embeddings = await self._embed_texts(texts)
-            
-            # Create vector store from split documents
-            self.vector_store = FAISS.from_documents(split_docs, self.embeddings)
-            self._save_vector_store()
+            embeddings = await self._embed_texts(texts, progress)
+            
+            # Create vector store from split documents and their embeddings
+            vectors, embedding_dimensions = self._prepare_vectors(embeddings, new_index=True)
+            self.vector_store = await asyncio.to_thread(
+                self._build_vector_store,
+                split_docs,
+                vectors,
+                embedding_dimensions
+            )
+            await asyncio.to_thread(self._tune_search_params, vectors)
+            await asyncio.to_thread(self._evaluate_compression, embeddings)
+            self.source_chunks = {}
+            self._track_sources(self.vector_store.index_to_docstore_id.values())
+            await asyncio.to_thread(self._save_vector_store)
             
         except Exception as e:
             logger.error(f"Error initializing RAG system: {e}")
             raise
             
-    async def add_documents(self, documents: List[Document]) -> None:
+    async def add_documents(
+        self,
+        documents: List[Document],
+        progress: Optional[Callable[[int, int], None]] = None
+    ) -> List[str]:
         """
         Add new documents to the existing RAG system.
         
         Args:
             documents: List of Document objects to add
+            progress: Called with (chunks embedded, all chunks) as embedding proceeds
+            
+        Returns:
+            IDs of the chunks the documents were split into
         """
         if not isinstance(documents, list):
             documents = [documents]
@@ -151,24 +457,95 @@ class RagTrainer:
             # Split new documents into chunks
             split_docs = self.text_splitter.split_documents(documents)
             logger.info(f"Split new documents into {len(split_docs)} chunks")
-            
+            if not split_docs:
+                return []
             
             # Get text content for embedding
             texts = [doc.page_content for doc in split_docs]
             
             # Generate and log embeddings
-            embeddings = await self._embed_texts(texts)
+            embeddings = await self._embed_texts(texts, progress)
             
+            vectors, embedding_dimensions = self._prepare_vectors(embeddings, new_index=not self.vector_store)
+            # Building or growing an IVF or HNSW index takes a while, so it runs off the event loop
             if not self.vector_store:
-                self.vector_store = FAISS.from_documents(split_docs, self.embeddings)
+                self.vector_store = await asyncio.to_thread(
+                    self._build_vector_store,
+                    split_docs,
+                    vectors,
+                    embedding_dimensions
+                )
+                chunk_ids = list(self.vector_store.index_to_docstore_id.values())
             else:
-                self.vector_store.add_documents(split_docs)
+                chunk_ids = await asyncio.to_thread(
+                    add_embeddings_to_store,
+                    self.vector_store,
+                    texts,
+                    vectors,
+                    [doc.metadata for doc in split_docs]
+                )
+            self._track_sources(chunk_ids)
                 
-            self._save_vector_store()
+            await asyncio.to_thread(self._save_vector_store)
+            return chunk_ids
             
         except Exception as e:
             logger.error(f"Error adding documents: {e}")
             raise
+            
+    async def remove_sources(self, source_ids: Iterable[str]) -> int:
+        """
+        Remove the chunks of source documents from the index.
+        
+        The vectors are removed from the index in place (see remove_rows):
+        nothing is re-embedded or retrained, and the remaining chunks keep
+        their IDs and metadata, such as the enhancements.
+        
+        Args:
+            source_ids: IDs of the source documents to remove
+            
+        Returns:
+            Number of chunks removed
+        """
+        source_ids = set(source_ids)
+        removed = [
+            chunk_id
+            for source_id in source_ids
+            for chunk_id in self.source_chunks.pop(source_id, [])
+        ]
+        if not removed or not self.vector_store:
+            return 0
+            
+        removed_ids = set(removed)
+        index_to_docstore_id = self.vector_store.index_to_docstore_id
+        rows = [row for row, chunk_id in index_to_docstore_id.items() if chunk_id in removed_ids]
+        await asyncio.to_thread(remove_rows, self.vector_store.index, rows)
+        self.vector_store.docstore.delete(removed)
+        # Rows after a removed one moved up
+        self.vector_store.index_to_docstore_id = dict(enumerate(
+            chunk_id
+            for _, chunk_id in sorted(index_to_docstore_id.items())
+            if chunk_id not in removed_ids
+        ))
+            
+        logger.info(f"Removed {len(removed)} chunks of {len(source_ids)} source documents")
+        return len(removed)
+        
+    def _track_sources(self, chunk_ids: Iterable[str]) -> None:
+        """Record the chunks of each source document, read from the chunks' source_id metadata."""
+        if self.source_chunks is None:
+            self.source_chunks = {}
+        for chunk_id in chunk_ids:
+            document = self.vector_store.docstore.search(chunk_id)
+            source_id = document.metadata.get(SOURCE_ID_FIELD) if isinstance(document, Document) else None
+            if source_id:
+                self.source_chunks.setdefault(source_id, []).append(chunk_id)
+                
+    def tracks_sources(self) -> bool:
+        """Whether every chunk in the index belongs to a tracked source document, so it can be updated incrementally."""
+        if self.source_chunks is None or not self.vector_store:
+            return False
+        return sum(len(chunk_ids) for chunk_ids in self.source_chunks.values()) == self.vector_store.index.ntotal
 
     @staticmethod
     def create_document(
@@ -194,17 +571,22 @@ class RagQuery:
     def __init__(
         self,
         vector_store_path: str,
-        config: Dict[str, Any] = None
+        config: Dict[str, Any] = None,
+        tenant_index: Optional[TenantIndex] = None
     ):
         """
         Initialize the RAG query service with the specified configuration.
         
         Args:
-            vector_store_path: Path to the FAISS index
+            vector_store_path: Knowledge base directory; its published
+                version (see store_versions) is loaded
             config: Configuration dictionary for customizing the service
+            tenant_index: Shared tenant index; used when the knowledge base
+                (named by the last path component) is packed into it
         """
         self.config = config or {}
         self.vector_store_path = Path(vector_store_path)
+        self.tenant_index = tenant_index
         
         # Load environment variables
         load_dotenv(".env.development")
@@ -221,6 +603,9 @@ class RagQuery:
             api_key=api_key
         )
         
+        # Query embeddings are micro-batched across concurrent requests
+        self.embedding_batcher = get_embedding_batcher(self.embeddings)
+        
         # Initialize reranker and compression retriever if Voyage API key is provided
         self.compression_retriever = None
         if voyage_api_key:
@@ -234,6 +619,9 @@ class RagQuery:
         # Load vector store
         self._load_vector_store()
         
+        # Static per-KB context used by the prefix-cache prompt layout
+        self.kb_context = self._load_kb_context()
+        
     async def _get_llm_service(self) -> BaseLLMService:
         """Get the configured LLM service."""
         service_type = self.config.get("llm_service", "openai")
@@ -241,16 +629,53 @@ class RagQuery:
         return await LLMServiceFactory.get_service(service_type, service_config)
         
     def _load_vector_store(self) -> None:
-        """Load the vector store from disk."""
-        if not self.vector_store_path.exists():
+        """Load the published version of the vector store from disk."""
+        # Resolved once: this instance keeps serving this version until it is replaced
+        self.store_path = current_version_path(self.vector_store_path)
+        if self.store_path is None:
             raise ValueError(f"Vector store not found at {self.vector_store_path}")
+        self.version = self.store_path.name if self.store_path != self.vector_store_path else None
             
         try:
-            self.vector_store = FAISS.load_local(
-                str(self.vector_store_path),
-                self.embeddings,
-                allow_dangerous_deserialization=True
-            )
+            # Queries never modify the index, so by default it is memory-mapped
+            load_mode = self.config.get("index_load_mode", os.getenv("RAG_INDEX_LOAD_MODE", LOAD_MODE_MMAP))
+            self.index_manifest = read_manifest(self.store_path)
+            
+            # KBs trained with reduced dimensions are queried with embeddings shortened the same way
+            self.embedding_dimensions = self.index_manifest.get("embedding_dimensions")
+            index_embeddings = self.embeddings
+            if self.embedding_dimensions:
+                index_embeddings = ReducedDimensionEmbeddings(self.embeddings, self.embedding_dimensions)
+            knowledgebase_id = self.vector_store_path.name
+            if self.tenant_index and self.tenant_index.has_tenant(knowledgebase_id):
+                # Small KBs are served from a pool shared with other tenants
+                self.vector_store = self.tenant_index.vector_store(
+                    knowledgebase_id,
+                    index_embeddings,
+                    chunk_cache_size=self.config.get("chunk_cache_size", 1024)
+                )
+            elif (
+                self.index_manifest.get("num_shards", 1) > 1
+                and os.getenv("RAG_SHARD_SEARCH", SHARD_SEARCH_PROCESS) == SHARD_SEARCH_PROCESS
+            ):
+                # Shards are searched in parallel by worker processes, which apply the search parameters
+                self.vector_store = load_sharded_store(
+                    self.store_path,
+                    index_embeddings,
+                    self.index_manifest,
+                    chunk_cache_size=self.config.get("chunk_cache_size", 1024)
+                )
+            else:
+                self.vector_store = load_faiss_store(
+                    self.store_path,
+                    index_embeddings,
+                    load_mode,
+                    chunk_cache_size=self.config.get("chunk_cache_size", 1024)
+                )
+            
+            # Honour the search parameters (efSearch, nprobe) chosen at training time
+            if self.vector_store.index is not None:
+                apply_search_params(self.vector_store.index, self.index_manifest.get("search_params"))
             
             # Initialize compression retriever if compressor exists
             if hasattr(self, 'compressor'):
@@ -263,6 +688,41 @@ class RagQuery:
             logger.error(f"Error loading vector store: {e}")
             raise
             
+    def _keyword_search(
+        self,
+        query: str,
+        limit: int = 3
+    ) -> List[Tuple[Document, float]]:
+        """Score every chunk by the fraction of query words it contains."""
+        words = query.lower().split()
+        if not words:
+            return []
+        
+        # The on-disk chunk store scores chunks in SQL without loading them
+        if isinstance(self.vector_store.docstore, ChunkStore):
+            return self.vector_store.docstore.keyword_search(words, limit)
+        
+        scores = []
+        for _, doc in iter_docstore(self.vector_store.docstore):
+            content = doc.page_content.lower()
+            score = sum(1 for word in words if word in content) / len(words)
+            if score > 0:
+                scores.append((doc, score))
+                
+        return sorted(scores, key=lambda x: x[1], reverse=True)[:limit]
+
+    def _load_kb_context(self) -> str:
+        """Load the knowledge base summary written at training time, if any."""
+        summary_path = self.store_path / KB_SUMMARY_FILENAME
+        if not summary_path.exists():
+            return ""
+        try:
+            with open(summary_path, 'r', encoding='utf-8') as f:
+                return format_kb_context(json.load(f))
+        except Exception as e:
+            logger.warning(f"Could not load knowledge base summary from {summary_path}: {e}")
+            return ""
+            
     async def text_search(
         self,
         query: str,
@@ -278,18 +738,48 @@ class RagQuery:
         Returns:
             List of tuples containing (Document, score)
         """
-        # Get all documents from vector store
-        docs = self.vector_store.docstore._dict.values()
-        words = query.lower().split()
-        scores = []
+        return await get_query_executor().run(self._keyword_search, query, limit)
+
+    def _retrieve(
+        self,
+        question: str,
+        query_embedding: Optional[List[float]] = None,
+        vector_results: Optional[List[Tuple[Document, float]]] = None
+    ) -> Tuple[List[Tuple[Document, float]], str]:
+        """
+        Run the CPU-bound retrieval stages: vector search, keyword scoring,
+        fusion and context packing. Meant to run on the query executor.
         
-        for doc in docs:
-            content = doc.page_content.lower()
-            score = sum(1 for word in words if word in content) / len(words)
-            if score > 0:
-                scores.append((doc, score))
-                
-        return sorted(scores, key=lambda x: x[1], reverse=True)[:limit]
+        Args:
+            question: The question to retrieve context for
+            query_embedding: Embedding of the question, used for vector search
+            vector_results: Already retrieved (e.g. reranked) vector results
+            
+        Returns:
+            Tuple of (top results, formatted context)
+        """
+        if vector_results is None:
+            vector_results = self.vector_store.similarity_search_with_score_by_vector(
+                query_embedding,
+                k=4
+            )
+        
+        # Perform text search
+        text_results = self._keyword_search(question)
+        
+        # Combine results
+        combined_results = vector_results + text_results
+        
+        # Sort and take top results
+        combined_results.sort(key=lambda x: x[1], reverse=True)
+        top_results = combined_results[:2]
+        
+        # Format context
+        context = "\n".join(
+            f"{doc.page_content} (Relevance: {round(score * 100)}%)"
+            for doc, score in top_results
+        )
+        return top_results, context
         
     async def query(
         self,
@@ -309,70 +799,77 @@ class RagQuery:
             Dictionary containing the answer and sources
         """
         try:
+            query_embedding = None
+            vector_results = None
             if self.compression_retriever:
                 # Use compression retriever if available
                 docs = await self.compression_retriever.ainvoke(question)
                 vector_results = [(doc, 1.0) for doc in docs]  # Assuming max relevance for reranked docs
             else:
-                # Fallback to regular vector search
-                vector_results = self.vector_store.similarity_search_with_score(
-                    question,
-                    k=4
-                )
-            
-            # Perform text search
-            text_results = await self.text_search(question)
-            
-            # Combine results
-            combined_results = vector_results + text_results
-            
-            # Sort and take top results
-            combined_results.sort(key=lambda x: x[1], reverse=True)
-            top_results = combined_results[:2]
-            
-            # Format context
-            context = "\n".join(
-                f"{doc.page_content} (Relevance: {round(score * 100)}%)"
-                for doc, score in top_results
+                # Embed on the event loop (network I/O), search on the query executor.
+                # The batcher is shared across KBs, so it returns full-dimension embeddings.
+                query_embedding = await self.embedding_batcher.embed_query(question)
+                if self.embedding_dimensions:
+                    query_embedding = reduce_dimensions(
+                        np.asarray([query_embedding]),
+                        self.embedding_dimensions
+                    )[0].tolist()
+            
+            top_results, context = await get_query_executor().run(
+                self._retrieve,
+                question,
+                query_embedding,
+                vector_results
             )
             
             print(f"context: {context}")
             # Get LLM service
             llm_service = await self._get_llm_service()
             
-            # Create custom prompt template if system prompt is provided
-            if system_prompt:
-                system_template = system_prompt
-                if conversation_history:
-                    system_template += f"\n\nPrevious conversation:\n{conversation_history}"
-                    
-                prompt_template = ChatPromptTemplate.from_messages([
-                    SystemMessagePromptTemplate.from_template(system_template),
-                    HumanMessagePromptTemplate.from_template(
-                        "Context: {context}\n\nQuestion: {question}"
-                    )
-                ])
+            if self.config.get("prompt_layout", LEGACY_LAYOUT) == PREFIX_CACHE_LAYOUT:
+                # Most stable parts first so provider prefix caching can reuse them
+                messages = build_prefix_cached_messages(
+                    system_prompt=system_prompt or llm_service.get_prompt_template().messages[0].prompt.template,
+                    question=question,
+                    context=context,
+                    kb_context=self.kb_context,
+                    conversation_history=conversation_history
+                )
             else:
-                # Get default prompt template from service
-                prompt_template = llm_service.get_prompt_template()
-                if conversation_history:
-                    # Add conversation history to the default template
+                # Create custom prompt template if system prompt is provided
+                if system_prompt:
+                    system_template = system_prompt
+                    if conversation_history:
+                        system_template += f"\n\nPrevious conversation:\n{conversation_history}"
+                    
                     prompt_template = ChatPromptTemplate.from_messages([
-                        SystemMessagePromptTemplate.from_template(
-                            prompt_template.messages[0].prompt.template + 
-                            f"\n\nPrevious conversation:\n{conversation_history}"
-                        ),
-                        *prompt_template.messages[1:]
+                        SystemMessagePromptTemplate.from_template(system_template),
+                        HumanMessagePromptTemplate.from_template(
+                            "Context: {context}\n\nQuestion: {question}"
+                        )
                     ])
-            
-            # Create messages from template
-            messages = prompt_template.format_messages(
-                context=context,
-                question=question
-            )
+                else:
+                    # Get default prompt template from service
+                    prompt_template = llm_service.get_prompt_template()
+                    if conversation_history:
+                        # Add conversation history to the default template
+                        prompt_template = ChatPromptTemplate.from_messages([
+                            SystemMessagePromptTemplate.from_template(
+                                prompt_template.messages[0].prompt.template + 
+                                f"\n\nPrevious conversation:\n{conversation_history}"
+                            ),
+                            *prompt_template.messages[1:]
+                        ])
+                
+                # Create messages from template
+                messages = prompt_template.format_messages(
+                    context=context,
+                    question=question
+                )
             
             # Get response from model
-            response = await llm_service.invoke(messages)
+            response, usage = await llm_service.invoke_with_usage(messages)
+            prompt_cache_stats.record(usage)
             
             return {
                 "answer": response,
@@ -0,0 +1,291 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from rag_py.chunk_store import CHUNK_STORE_FILENAME, ChunkStore
+from rag_py.query_executor import worker_cpu_share
+from rag_py.store_versions import VERSIONS_DIRNAME
+from rag_py.vector_index import LOAD_MODE_MMAP, apply_search_params, read_faiss_index, shard_paths
+
+logger = logging.getLogger(__name__)
+
+# Shard search modes: a pool of worker processes, or threads in this process
+SHARD_SEARCH_PROCESS = "process"
+SHARD_SEARCH_THREAD = "thread"
+
+# Shard indexes opened by this worker process:
+# (KB directory, shard file name) -> (path, file identity, index)
+_worker_indexes: Dict[Tuple[str, str], Tuple[str, Tuple[int, int], faiss.Index]] = {}
+
+
+def _init_worker() -> None:
+    """Each worker searches one query at a time; parallelism comes from the pool."""
+    faiss.omp_set_num_threads(1)
+
+
+def _shard_key(path: str) -> Tuple[str, str]:
+    """
+    The logical shard a shard file holds: its KB directory and file name.
+
+    Every training run writes its shards under a new versions/<version>/
+    directory, so keying by KB rather than by path replaces a KB's previous
+    version instead of keeping it mapped next to the new one.
+    """
+    shard_path = Path(path)
+    store_path = shard_path.parent.parent
+    if store_path.parent.name == VERSIONS_DIRNAME:
+        store_path = store_path.parent.parent
+    return str(store_path), shard_path.name
+
+
+def _evict_deleted_shards() -> None:
+    """Drop shards whose files were deleted (old versions, deleted KBs) so their disk space is freed."""
+    for key, (path, _, _) in list(_worker_indexes.items()):
+        if not os.path.exists(path):
+            del _worker_indexes[key]
+
+
+def _search_shard(
+    path: str,
+    queries: np.ndarray,
+    k: int,
+    search_params: Optional[Dict[str, Any]]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Search one shard inside a worker process.
+
+    The shard is memory-mapped on first use and reopened when a new
+    training run replaces it; the previous version's mapping is released.
+    """
+    stat = os.stat(path)
+    identity = (stat.st_ino, stat.st_mtime_ns)
+    key = _shard_key(path)
+    cached = _worker_indexes.get(key)
+    if cached is None or cached[:2] != (path, identity):
+        _worker_indexes.pop(key, None)
+        _evict_deleted_shards()
+        cached = (path, identity, read_faiss_index(Path(path), LOAD_MODE_MMAP))
+        _worker_indexes[key] = cached
+    index = cached[2]
+    if index.ntotal == 0:
+        return np.empty((len(queries), 0), dtype=np.float32), np.empty((len(queries), 0), dtype=np.int64)
+    apply_search_params(index, search_params)
+    return index.search(queries, min(k, index.ntotal))
+
+
+def merge_shard_results(
+    results: Sequence[Tuple[np.ndarray, np.ndarray]],
+    offsets: Sequence[int],
+    k: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Merge per-shard (distances, local IDs) into the global top-k by L2 distance.
+
+    Args:
+        results: One (distances, IDs) pair per shard, each of shape (n_queries, <= k)
+        offsets: Global ID of each shard's first vector
+        k: Number of results per query
+
+    Returns:
+        Tuple of (distances, global IDs), each of shape (n_queries, k), padded with inf / -1
+    """
+    distances = np.concatenate([d for d, _ in results], axis=1)
+    ids = np.concatenate([
+        np.where(i >= 0, i + offset, -1)
+        for (_, i), offset in zip(results, offsets)
+    ], axis=1)
+    distances = np.where(ids >= 0, distances, np.inf)
+    if ids.shape[1] < k:
+        # Fewer vectors than k in all shards together
+        missing = k - ids.shape[1]
+        distances = np.pad(distances, ((0, 0), (0, missing)), constant_values=np.inf)
+        ids = np.pad(ids, ((0, 0), (0, missing)), constant_values=-1)
+    order = np.argsort(distances, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(distances, order, axis=1), np.take_along_axis(ids, order, axis=1)
+
+
+class ShardSearchPool:
+    """
+    Worker processes that search index shards in parallel.
+
+    Each worker is its own single-process executor standing in for a node,
+    and shard i is always sent to worker i % num_workers, so a worker only
+    maps the shards it owns.
+    """
+
+    def __init__(self, num_workers: Optional[int] = None):
+        """
+        Initialize the pool.
+
+        Args:
+            num_workers: Number of worker processes; defaults to RAG_SHARD_WORKERS or
+                this API worker's share of the CPU cores
+        """
+        self.num_workers = num_workers or int(os.getenv("RAG_SHARD_WORKERS") or worker_cpu_share())
+        # Forking a process that runs threads and FAISS/OpenMP is unsafe
+        context = multiprocessing.get_context("spawn")
+        self._executors = [
+            ProcessPoolExecutor(max_workers=1, mp_context=context, initializer=_init_worker)
+            for _ in range(self.num_workers)
+        ]
+        self._lock = threading.Lock()
+        self._searches = 0
+        self._shard_searches = 0
+        self._total_search_time = 0.0
+        logger.info(f"Shard search pool started with {self.num_workers} worker processes")
+
+    def search(
+        self,
+        paths: Sequence[Path],
+        offsets: Sequence[int],
+        queries: np.ndarray,
+        k: int,
+        search_params: Optional[Dict[str, Any]] = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Scatter a search to every shard and gather the merged top-k.
+
+        Args:
+            paths: Shard index files
+            offsets: Global ID of each shard's first vector
+            queries: float32 array of shape (n_queries, dimension)
+            k: Number of results per query
+            search_params: Search parameters (efSearch, nprobe) applied to each shard
+
+        Returns:
+            Tuple of (distances, global IDs)
+        """
+        started_at = time.perf_counter()
+        futures = [
+            self._executors[shard % self.num_workers].submit(_search_shard, str(path), queries, k, search_params)
+            for shard, path in enumerate(paths)
+        ]
+        merged = merge_shard_results([future.result() for future in futures], offsets, k)
+        with self._lock:
+            self._searches += 1
+            self._shard_searches += len(paths)
+            self._total_search_time += time.perf_counter() - started_at
+        return merged
+
+    def stats(self) -> Dict[str, Any]:
+        """Return search counts and average scatter-gather latency."""
+        with self._lock:
+            return {
+                "workers": self.num_workers,
+                "searches": self._searches,
+                "shard_searches": self._shard_searches,
+                "avg_search_ms": round(self._total_search_time / self._searches * 1000, 3) if self._searches else 0.0
+            }
+
+    def shutdown(self) -> None:
+        """Stop the worker processes."""
+        for executor in self._executors:
+            executor.shutdown(wait=True)
+
+
+_shard_search_pool: Optional[ShardSearchPool] = None
+_shard_search_pool_lock = threading.Lock()
+
+
+def shard_search_pool_started() -> bool:
+    """Whether any sharded store has started the shard search pool yet."""
+    return _shard_search_pool is not None
+
+
+def get_shard_search_pool() -> ShardSearchPool:
+    """Get the process-wide shard search pool, starting it on first use."""
+    global _shard_search_pool
+    with _shard_search_pool_lock:
+        if _shard_search_pool is None:
+            _shard_search_pool = ShardSearchPool()
+        return _shard_search_pool
+
+
+class ShardedVectorStore(FAISS):
+    """
+    Read-only vector store whose shards are searched by the shard search pool.
+
+    It holds no index itself; only the chunk store is opened in this process.
+    """
+
+    def __init__(
+        self,
+        embedding_function: Embeddings,
+        paths: List[Path],
+        offsets: List[int],
+        docstore: ChunkStore,
+        search_params: Optional[Dict[str, Any]],
+        pool: ShardSearchPool
+    ):
+        super().__init__(embedding_function, None, docstore, docstore.index_to_docstore_id)
+        self.paths = paths
+        self.offsets = offsets
+        self.search_params = search_params
+        self.pool = pool
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Any] = None,
+        fetch_k: int = 20,
+        **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """Scatter-gather search; returns (Document, L2 distance) like FAISS."""
+        if filter is not None:
+            logger.warning("Metadata filters are not supported on sharded indexes; ignoring filter")
+        queries = np.asarray([embedding], dtype=np.float32)
+        scores, ids = self.pool.search(self.paths, self.offsets, queries, k, self.search_params)
+        hits = [(int(i), float(score)) for i, score in zip(ids[0], scores[0]) if i != -1]
+        documents = self.docstore.get_by_faiss_ids(faiss_id for faiss_id, _ in hits)
+        return [
+            (document, score)
+            for document, (_, score) in zip(documents, hits)
+            if document is not None
+        ]
+
+
+def load_sharded_store(
+    vector_store_path: Path,
+    embeddings: Embeddings,
+    manifest: Dict[str, Any],
+    chunk_cache_size: int = 1024
+) -> ShardedVectorStore:
+    """
+    Open a sharded vector store for scatter-gather search.
+
+    Args:
+        vector_store_path: Directory holding shards/ and chunks.sqlite
+        embeddings: Embeddings used to embed queries
+        manifest: The store's manifest; "shard_sizes" gives each shard's vector count
+        chunk_cache_size: Number of chunks the chunk store keeps cached
+
+    Returns:
+        The ShardedVectorStore
+    """
+    vector_store_path = Path(vector_store_path)
+    paths = shard_paths(vector_store_path)
+    shard_sizes = manifest["shard_sizes"]
+    if len(shard_sizes) != len(paths):
+        raise ValueError(f"Manifest lists {len(shard_sizes)} shards but {len(paths)} shard files exist")
+    offsets = [int(offset) for offset in np.cumsum([0] + shard_sizes[:-1])]
+    chunk_store = ChunkStore(vector_store_path / CHUNK_STORE_FILENAME, cache_size=chunk_cache_size)
+    return ShardedVectorStore(
+        embeddings,
+        paths,
+        offsets,
+        chunk_store,
+        manifest.get("search_params"),
+        get_shard_search_pool()
+    )
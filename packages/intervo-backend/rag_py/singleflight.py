@@ -0,0 +1,69 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+logger = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls that share a key into a single execution.
+
+    The first caller for a key starts the work; callers arriving while it is
+    still in flight wait for the same result (or exception) instead of
+    repeating it. Nothing is cached once the call completes.
+    """
+
+    def __init__(self, name: str):
+        """
+        Initialize the single-flight group.
+
+        Args:
+            name: Name of the group, used in logs and statistics
+        """
+        self.name = name
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self.calls = 0
+        self.executions = 0
+        self.deduplicated = 0
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Run func for the given key, or join the execution already in flight.
+
+        Args:
+            key: Hashable key identifying identical work
+            func: Zero-argument coroutine function performing the work
+
+        Returns:
+            The shared result of the execution
+        """
+        self.calls += 1
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.deduplicated += 1
+            logger.debug(f"SingleFlight[{self.name}]: joining in-flight call for {key!r}")
+        else:
+            self.executions += 1
+            # Run as its own task so a cancelled caller does not cancel the
+            # work other callers are waiting on.
+            task = asyncio.ensure_future(func())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda t, k=key: self._on_done(k, t))
+        return await asyncio.shield(task)
+
+    def _on_done(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Mark the exception as retrieved in case every caller went away
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return call, execution and deduplication counts."""
+        return {
+            "calls": self.calls,
+            "executions": self.executions,
+            "deduplicated": self.deduplicated,
+            "in_flight": len(self._in_flight),
+        }
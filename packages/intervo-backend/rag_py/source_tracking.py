@@ -0,0 +1,55 @@
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Chunk metadata field naming the source document a chunk was split from
+SOURCE_ID_FIELD = "source_id"
+
+# File in a vector store directory mapping each source document to its chunk IDs
+SOURCES_FILENAME = "sources.json"
+
+
+def make_source_id(doc_type: str, *parts: Any) -> str:
+    """
+    ID of one version of a source document.
+
+    The ID is derived from whatever identifies that version (its text, or its
+    storage path, size and upload time), so an edited document gets a new ID
+    and incremental updates replace it like a deleted and an added one.
+
+    Args:
+        doc_type: Document type, e.g. "files" or "qa"
+        *parts: Values identifying this version of the document
+
+    Returns:
+        "<doc_type>:<digest>"
+    """
+    digest = hashlib.sha256("\0".join(str(part) for part in parts).encode('utf-8')).hexdigest()[:24]
+    return f"{doc_type}:{digest}"
+
+
+def write_source_map(vector_store_path: Path, source_chunks: Dict[str, List[str]]) -> None:
+    """Write the source document to chunk IDs mapping of a vector store directory."""
+    path = Path(vector_store_path) / SOURCES_FILENAME
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(source_chunks, f)
+    os.replace(tmp_path, path)
+
+
+def read_source_map(vector_store_path: Path) -> Optional[Dict[str, List[str]]]:
+    """Read the source mapping of a vector store directory, or None for stores trained before sources were tracked."""
+    path = Path(vector_store_path) / SOURCES_FILENAME
+    if not path.exists():
+        return None
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"Could not read source map at {path}: {e}")
+        return None
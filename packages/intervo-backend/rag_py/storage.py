@@ -1,5 +1,7 @@
 import os
 import json
+import asyncio
+import functools
 import boto3
 from datetime import datetime
 from typing import List, Dict, Any, Optional, BinaryIO
@@ -11,6 +13,7 @@ from dotenv import load_dotenv
 from pathlib import Path
 import botocore
 import io
+from concurrent.futures import ThreadPoolExecutor
 
 # Load environment variables - try production first, then development, then default .env
 base_path = Path(__file__).parent.parent
@@ -45,9 +48,13 @@ class S3Storage:
         if not self.bucket:
             raise ValueError("STORAGE_S3_BUCKET environment variable is not set")
 
+        # Most S3 requests in flight at once; also sizes the thread pool they run on
+        self.max_connections = int(os.getenv("STORAGE_S3_MAX_SOCKETS", 200))
+        self._executor = ThreadPoolExecutor(max_workers=self.max_connections, thread_name_prefix="s3")
+
         # Configure with explicit signature version and addressing style
         config = Config(
-            max_pool_connections=int(os.getenv("STORAGE_S3_MAX_SOCKETS", 200)),
+            max_pool_connections=self.max_connections,
             s3={'addressing_style': 'path'},
             signature_version='s3v4',
             retries = {'max_attempts': 3, 'mode': 'standard'}  # Add retries
@@ -94,6 +101,19 @@ class S3Storage:
             logger.error(f"Error accessing bucket {self.bucket}: {str(e)}")
             raise ValueError(f"Cannot access bucket {self.bucket}. Please ensure it exists and credentials are correct. Error: {str(e)}")
 
+    async def _run(self, func, *args, **kwargs):
+        """Run a blocking S3 call on the storage's own thread pool, so up to max_connections calls overlap."""
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor,
+            functools.partial(func, *args, **kwargs)
+        )
+
+    async def read_object(self, key: str) -> bytes:
+        """Download an object's content."""
+        def read() -> bytes:
+            return self.s3_client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+        return await self._run(read)
+
     def _get_base_path(self, knowledgebase_id: str, doc_type: DocumentType) -> str:
         """Get the base path for a specific knowledgebase and document type."""
         if not knowledgebase_id:
@@ -146,7 +166,8 @@ class S3Storage:
                     "filename": file.filename,
                     "path": file_key,
                     "content_type": file.content_type,
-                    "size": len(contents)
+                    "size": len(contents),
+                    "last_updated": datetime.utcnow().isoformat()
                 })
             except Exception as e:
                 logger.error(f"Error storing file {file.filename}: {str(e)}")
@@ -337,7 +358,8 @@ class S3Storage:
                     "filename": filename,
                     "path": file_key,
                     "url": file.get("url"),
-                    "size": len(content)
+                    "size": len(content),
+                    "last_updated": datetime.utcnow().isoformat()
                 })
             except Exception as e:
                 logger.error(f"Error storing crawled file {filename}: {str(e)}")
@@ -369,6 +391,9 @@ class S3Storage:
             raise HTTPException(status_code=500, detail=f"Error storing crawled files metadata: {str(e)}")
     async def get_documents(self, knowledgebase_id: str, doc_type: DocumentType) -> Optional[Dict[str, Any]]:
         """Retrieve documents of a specific type for a knowledgebase."""
+        return await self._run(self._read_documents, knowledgebase_id, doc_type)
+
+    def _read_documents(self, knowledgebase_id: str, doc_type: DocumentType) -> Optional[Dict[str, Any]]:
         if not knowledgebase_id:
             raise ValueError("knowledgebase_id cannot be empty")
 
@@ -0,0 +1,176 @@
+import logging
+import os
+import shutil
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import List, Optional
+
+from rag_py.ann_tuner import TUNING_REPORT_FILENAME
+from rag_py.chunk_store import CHUNK_STORE_FILENAME
+from rag_py.embedding_compression import COMPRESSION_REPORT_FILENAME
+from rag_py.prompt_layout import KB_SUMMARY_FILENAME
+from rag_py.vector_index import (
+    DOCSTORE_FILENAME,
+    INDEX_FILENAME,
+    MANIFEST_FILENAME,
+    SHARDS_DIRNAME,
+    has_faiss_index
+)
+
+logger = logging.getLogger(__name__)
+
+# Each training run writes a new directory under versions/ in the KB directory
+VERSIONS_DIRNAME = "versions"
+
+# Pointer file naming the published version; replaced atomically on publish
+CURRENT_FILENAME = "CURRENT"
+
+# Published versions kept on disk, including the current one
+DEFAULT_KEEP_VERSIONS = 2
+
+# Files of a KB directory written before stores were versioned
+_UNVERSIONED_FILENAMES = (
+    INDEX_FILENAME,
+    DOCSTORE_FILENAME,
+    CHUNK_STORE_FILENAME,
+    MANIFEST_FILENAME,
+    TUNING_REPORT_FILENAME,
+    COMPRESSION_REPORT_FILENAME,
+    KB_SUMMARY_FILENAME
+)
+
+
+def current_version(kb_path: Path) -> Optional[str]:
+    """Name of a KB's published version, or None if nothing was published yet."""
+    current_path = Path(kb_path) / CURRENT_FILENAME
+    try:
+        return current_path.read_text(encoding='utf-8').strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def current_version_path(kb_path: Path) -> Optional[Path]:
+    """
+    Directory of a KB's published vector store.
+
+    KB directories trained before stores were versioned hold the store
+    directly; they are served as they are until the next training run.
+
+    Args:
+        kb_path: Knowledge base directory, e.g. vector_stores/<knowledgebase_id>
+
+    Returns:
+        The published version directory, the KB directory itself for an
+        unversioned store, or None if the KB has no store
+    """
+    kb_path = Path(kb_path)
+    version = current_version(kb_path)
+    if version is not None:
+        return kb_path / VERSIONS_DIRNAME / version
+    if has_faiss_index(kb_path) or (kb_path / MANIFEST_FILENAME).exists():
+        return kb_path
+    return None
+
+
+def create_version(kb_path: Path, copy_current: bool = False) -> Path:
+    """
+    Create an unpublished version directory for a training run.
+
+    Version names sort by creation time, so later runs sort after earlier ones.
+
+    Args:
+        kb_path: Knowledge base directory
+        copy_current: Seed the version with a copy of the published store, for
+            runs that add to the existing index instead of rebuilding it
+
+    Returns:
+        The new version directory
+    """
+    versions_dir = Path(kb_path) / VERSIONS_DIRNAME
+    versions_dir.mkdir(parents=True, exist_ok=True)
+    version_path = versions_dir / f"{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}-{uuid.uuid4().hex[:8]}"
+
+    source_path = current_version_path(kb_path) if copy_current else None
+    if source_path is None:
+        version_path.mkdir()
+    elif source_path == Path(kb_path):
+        version_path.mkdir()
+        for filename in _UNVERSIONED_FILENAMES:
+            if (source_path / filename).exists():
+                shutil.copy2(source_path / filename, version_path / filename)
+        if (source_path / SHARDS_DIRNAME).exists():
+            shutil.copytree(source_path / SHARDS_DIRNAME, version_path / SHARDS_DIRNAME)
+    else:
+        shutil.copytree(source_path, version_path)
+    return version_path
+
+
+def publish_version(kb_path: Path, version_path: Path) -> None:
+    """
+    Make a fully written version the one served for a KB.
+
+    The CURRENT pointer is written under a temporary name and renamed over the
+    old one, so readers see either the previous or the new version, never a
+    partially written store.
+
+    Args:
+        kb_path: Knowledge base directory
+        version_path: Version directory returned by create_version
+    """
+    current_path = Path(kb_path) / CURRENT_FILENAME
+    tmp_path = current_path.with_name(f"{CURRENT_FILENAME}.{uuid.uuid4().hex[:8]}.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(Path(version_path).name)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, current_path)
+    logger.info(f"Published vector store version {Path(version_path).name} for {Path(kb_path).name}")
+
+
+def discard_version(version_path: Path) -> None:
+    """Remove an unpublished version, e.g. after a failed training run."""
+    version_path = Path(version_path)
+    if version_path.name == current_version(version_path.parent.parent):
+        return
+    shutil.rmtree(version_path, ignore_errors=True)
+
+
+def collect_garbage(kb_path: Path, keep: Optional[int] = None) -> List[str]:
+    """
+    Remove old versions of a KB's vector store.
+
+    The current version and the (keep - 1) versions published before it are
+    kept, so queries still running against a just-replaced store can finish.
+    Versions newer than the current one may belong to a training run that is
+    still writing and are never removed. Files of an unversioned store are
+    removed once a version has been published.
+
+    Args:
+        kb_path: Knowledge base directory
+        keep: Number of versions to keep; defaults to RAG_KEEP_VERSIONS
+
+    Returns:
+        Names of the removed versions
+    """
+    kb_path = Path(kb_path)
+    version = current_version(kb_path)
+    if version is None:
+        return []
+    keep = max(1, keep or int(os.getenv("RAG_KEEP_VERSIONS", DEFAULT_KEEP_VERSIONS)))
+
+    older = sorted(
+        path.name for path in (kb_path / VERSIONS_DIRNAME).iterdir()
+        if path.is_dir() and path.name < version
+    )
+    removed = older[:max(0, len(older) - (keep - 1))]
+    for name in removed:
+        shutil.rmtree(kb_path / VERSIONS_DIRNAME / name, ignore_errors=True)
+
+    for filename in _UNVERSIONED_FILENAMES:
+        (kb_path / filename).unlink(missing_ok=True)
+    shutil.rmtree(kb_path / SHARDS_DIRNAME, ignore_errors=True)
+
+    if removed:
+        logger.info(f"Removed {len(removed)} old vector store versions of {kb_path.name}")
+    return removed
@@ -0,0 +1,413 @@
+import fcntl
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from rag_py.chunk_store import CHUNK_STORE_FILENAME, ChunkStore
+from rag_py.vector_index import (
+    INDEX_FILENAME,
+    INDEX_FLAT,
+    LOAD_MODE_MMAP,
+    QUANTIZATION_NONE,
+    read_faiss_index
+)
+
+logger = logging.getLogger(__name__)
+
+# Storage modes for trained knowledge bases
+STORAGE_DEDICATED = "dedicated"
+STORAGE_SHARED = "shared"
+
+# Directory under the vector stores directory holding the shared pools
+SHARED_DIRNAME = "_shared"
+
+# Per-pool tenant table: dimension, next free FAISS ID and each tenant's ID range in the index
+TENANTS_FILENAME = "tenants.json"
+
+# Lock file serializing pool updates across processes (e.g. uvicorn workers)
+LOCK_FILENAME = ".lock"
+
+# KBs up to this many chunks are packed into a shared pool
+DEFAULT_SHARED_MAX_CHUNKS = 5_000
+
+# A pool is not grown past this many vectors; a new pool is started instead
+DEFAULT_POOL_MAX_VECTORS = 250_000
+
+
+class TenantVectorStore(FAISS):
+    """
+    Read-only view of one tenant's rows in a shared pool.
+
+    Searches are restricted to the tenant's contiguous ID range with an
+    IDSelectorRange. The flat index still visits every row of the pool to
+    test its ID, but only computes distances for the tenant's own vectors.
+    """
+
+    def __init__(
+        self,
+        embedding_function: Embeddings,
+        index: faiss.Index,
+        docstore: ChunkStore,
+        start: int,
+        count: int
+    ):
+        super().__init__(embedding_function, index, docstore, docstore.index_to_docstore_id)
+        self.start = start
+        self.count = count
+
+    def similarity_search_with_score_by_vector(
+        self,
+        embedding: List[float],
+        k: int = 4,
+        filter: Optional[Any] = None,
+        fetch_k: int = 20,
+        **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        """Search the tenant's rows; returns (Document, L2 distance) like FAISS."""
+        if filter is not None:
+            logger.warning("Metadata filters are not supported on shared tenant indexes; ignoring filter")
+        if self.count == 0:
+            return []
+        selector = faiss.IDSelectorRange(self.start, self.start + self.count, True)
+        vector = np.asarray([embedding], dtype=np.float32)
+        scores, ids = self.index.search(vector, min(k, self.count), params=faiss.SearchParameters(sel=selector))
+        hits = [(int(i), float(score)) for i, score in zip(ids[0], scores[0]) if i != -1]
+        documents = self.docstore.get_by_faiss_ids(faiss_id for faiss_id, _ in hits)
+        return [
+            (document, score)
+            for document, (_, score) in zip(documents, hits)
+            if document is not None
+        ]
+
+
+def _read_tenants(pool_path: Path) -> Dict[str, Any]:
+    tenants_path = pool_path / TENANTS_FILENAME
+    if not tenants_path.exists():
+        return {"dimension": None, "next_id": 0, "tenants": {}}
+    with open(tenants_path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _write_tenants(pool_path: Path, tenants: Dict[str, Any]) -> None:
+    tenants_path = pool_path / TENANTS_FILENAME
+    tmp_path = tenants_path.with_name(tenants_path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(tenants, f, indent=4)
+    os.replace(tmp_path, tenants_path)
+
+
+class TenantPool:
+    """A shared flat index with IDs and chunk store holding many small knowledge bases."""
+
+    def __init__(self, path: Path, load_mode: str = LOAD_MODE_MMAP):
+        """
+        Open a pool for querying.
+
+        Args:
+            path: Pool directory
+            load_mode: LOAD_MODE_MMAP or LOAD_MODE_MEMORY
+        """
+        self.path = Path(path)
+        self.name = self.path.name
+        table = _read_tenants(self.path)
+        self.dimension: Optional[int] = table["dimension"]
+        self.tenants: Dict[str, Dict[str, int]] = table["tenants"]
+        self.index: Optional[faiss.Index] = None
+        index_path = self.path / INDEX_FILENAME
+        if index_path.exists():
+            self.index = read_faiss_index(index_path, load_mode)
+
+    @property
+    def num_vectors(self) -> int:
+        return self.index.ntotal if self.index is not None else 0
+
+    def vector_store(self, tenant: str, embeddings: Embeddings, chunk_cache_size: int = 1024) -> TenantVectorStore:
+        """Get the read-only vector store of one tenant."""
+        rows = self.tenants[tenant]
+        chunk_store = ChunkStore(self.path / CHUNK_STORE_FILENAME, cache_size=chunk_cache_size, tenant=tenant)
+        return TenantVectorStore(embeddings, self.index, chunk_store, rows["start"], rows["count"])
+
+
+class TenantIndex:
+    """
+    Packs many small knowledge bases into shared pools instead of giving each
+    its own directory, index and chunk store.
+
+    Each pool is a flat index with IDs, where every tenant owns a contiguous
+    ID range, plus a chunk store keyed by the same IDs. Pools are opened once
+    and shared by every tenant's queries. Updating a tenant removes its old
+    range and adds its vectors under a fresh range, leaving the other tenants'
+    IDs as they are; the index is written once under a temporary name and
+    renamed into place, and the tenant's chunks are replaced in one
+    transaction. Views handed out earlier keep reading the previous index and
+    find no chunks for the tenant's old IDs until they are reloaded.
+
+    Several processes may share the shared directory: updates are serialized
+    with a file lock, and refresh() reopens pools another process rewrote,
+    under the same lock taken shared so it never sees half an update.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        load_mode: Optional[str] = None,
+        max_tenant_chunks: Optional[int] = None,
+        pool_max_vectors: Optional[int] = None
+    ):
+        """
+        Open every pool under the shared directory.
+
+        Args:
+            root: Shared directory, e.g. vector_stores/_shared
+            load_mode: How pools are loaded for queries; defaults to RAG_INDEX_LOAD_MODE or mmap
+            max_tenant_chunks: Largest KB packed into a pool; defaults to RAG_SHARED_MAX_CHUNKS
+            pool_max_vectors: Pool size cap; defaults to RAG_SHARED_POOL_MAX_VECTORS
+        """
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.load_mode = load_mode or os.getenv("RAG_INDEX_LOAD_MODE", LOAD_MODE_MMAP)
+        self.max_tenant_chunks = max_tenant_chunks or int(
+            os.getenv("RAG_SHARED_MAX_CHUNKS", DEFAULT_SHARED_MAX_CHUNKS)
+        )
+        self.pool_max_vectors = pool_max_vectors or int(
+            os.getenv("RAG_SHARED_POOL_MAX_VECTORS", DEFAULT_POOL_MAX_VECTORS)
+        )
+        self._lock = threading.Lock()
+        self._pools: Dict[str, TenantPool] = {}
+        self._tenant_pools: Dict[str, str] = {}
+        # Identity of each open pool's tenant table, to notice rewrites by other processes
+        self._pool_stamps: Dict[str, Tuple[int, int]] = {}
+        self.refresh()
+
+    @staticmethod
+    def _stamp(pool_path: Path) -> Optional[Tuple[int, int]]:
+        try:
+            stat = (pool_path / TENANTS_FILENAME).stat()
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        return stat.st_ino, stat.st_mtime_ns
+
+    def _open_pool(self, name: str) -> None:
+        # Stamped before reading, so a rewrite racing the read is picked up by the next refresh
+        stamp = self._stamp(self.root / name)
+        pool = TenantPool(self.root / name, self.load_mode)
+        self._pools[name] = pool
+        self._pool_stamps[name] = stamp
+        for tenant in pool.tenants:
+            self._tenant_pools[tenant] = name
+
+    def _refresh_pools(self) -> Set[str]:
+        """Open pools that are new or were rewritten since they were opened."""
+        changed = set()
+        for pool_path in sorted(self.root.iterdir()):
+            stamp = self._stamp(pool_path)
+            if stamp is None or self._pool_stamps.get(pool_path.name) == stamp:
+                continue
+            previous = self._pools.get(pool_path.name)
+            if previous is not None:
+                changed |= set(previous.tenants)
+            self._open_pool(pool_path.name)
+            changed |= set(self._pools[pool_path.name].tenants)
+        if changed:
+            # A tenant moved between pools must map to the pool holding it now
+            self._tenant_pools = {
+                tenant: name for name, pool in self._pools.items() for tenant in pool.tenants
+            }
+        return changed
+
+    def refresh(self) -> Set[str]:
+        """
+        Reopen pools rewritten by other processes.
+
+        Returns:
+            Tenants whose views should be reloaded
+        """
+        # Shared with other readers but not with an update, so a pool's index and tenant table are read as a pair
+        with self._update_lock(fcntl.LOCK_SH):
+            return self._refresh_pools()
+
+    @contextmanager
+    def _update_lock(self, mode: int = fcntl.LOCK_EX) -> Iterator[None]:
+        """Hold the thread lock and the cross-process pool lock, exclusive unless mode is LOCK_SH."""
+        with self._lock, open(self.root / LOCK_FILENAME, 'a') as lock_file:
+            fcntl.flock(lock_file, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def has_tenant(self, tenant: str) -> bool:
+        return tenant in self._tenant_pools
+
+    def accepts(self, num_vectors: int, manifest: Dict[str, Any]) -> bool:
+        """Whether a trained KB is small and plain enough to be packed into a pool."""
+        return (
+            num_vectors <= self.max_tenant_chunks
+            and manifest.get("index_type", INDEX_FLAT) == INDEX_FLAT
+            and manifest.get("quantization", QUANTIZATION_NONE) == QUANTIZATION_NONE
+            and manifest.get("num_shards", 1) == 1
+        )
+
+    def vector_store(self, tenant: str, embeddings: Embeddings, chunk_cache_size: int = 1024) -> TenantVectorStore:
+        """
+        Get a tenant's read-only vector store.
+
+        Args:
+            tenant: Knowledge base ID
+            embeddings: Embeddings used to embed queries
+            chunk_cache_size: Number of chunks the tenant's chunk store keeps cached
+
+        Returns:
+            The tenant's TenantVectorStore
+        """
+        pool = self._pools[self._tenant_pools[tenant]]
+        return pool.vector_store(tenant, embeddings, chunk_cache_size)
+
+    def writable_store(self, tenant: str, embeddings: Embeddings) -> FAISS:
+        """
+        Copy a tenant's rows out of its pool into an in-memory vector store,
+        e.g. to update the KB and pack it again with put_tenant.
+
+        Args:
+            tenant: Knowledge base ID
+            embeddings: Embeddings used to embed queries
+
+        Returns:
+            A flat vector store holding the tenant's vectors and chunks
+        """
+        pool = self._pools[self._tenant_pools[tenant]]
+        start = pool.tenants[tenant]["start"]
+        count = pool.tenants[tenant]["count"]
+        index = faiss.IndexFlatL2(pool.dimension)
+        if count:
+            ids = faiss.vector_to_array(pool.index.id_map)
+            rows = np.flatnonzero((ids >= start) & (ids < start + count))
+            rows = rows[np.argsort(ids[rows])]
+            index.add(faiss.downcast_index(pool.index.index).reconstruct_batch(rows))
+        chunk_store = ChunkStore(pool.path / CHUNK_STORE_FILENAME, tenant=tenant)
+        mapping = {faiss_id - start: chunk_id for faiss_id, chunk_id in chunk_store.id_mapping().items()}
+        return FAISS(embeddings, index, InMemoryDocstore(dict(chunk_store.items())), mapping)
+
+    def put_tenant(self, tenant: str, vector_store: FAISS) -> Tuple[str, Set[str]]:
+        """
+        Pack a trained KB into a pool, replacing any earlier copy of it.
+
+        Args:
+            tenant: Knowledge base ID
+            vector_store: The KB's trained flat, unquantized vector store
+
+        Returns:
+            Tuple of (pool name, tenants whose views should be reloaded)
+        """
+        index = vector_store.index
+        vectors = index.reconstruct_n(0, index.ntotal)
+        with self._update_lock():
+            # Pools may have been rewritten by another process
+            affected = self._refresh_pools()
+            previous_pool = self._tenant_pools.get(tenant)
+            name = self._choose_pool(tenant, index.d, index.ntotal)
+            if previous_pool and previous_pool != name:
+                affected |= self._update_pool(previous_pool, tenant, None, None, None)
+            affected |= self._update_pool(
+                name,
+                tenant,
+                vectors,
+                vector_store.docstore,
+                vector_store.index_to_docstore_id
+            )
+            logger.info(f"Packed {index.ntotal} vectors of knowledgebase {tenant} into shared pool {name}")
+            return name, affected
+
+    def remove_tenant(self, tenant: str) -> Set[str]:
+        """
+        Remove a KB from its pool, e.g. when it is promoted to a dedicated index.
+
+        Returns:
+            Tenants whose views should be reloaded
+        """
+        with self._update_lock():
+            affected = self._refresh_pools()
+            name = self._tenant_pools.get(tenant)
+            if name is None:
+                return affected
+            logger.info(f"Removing knowledgebase {tenant} from shared pool {name}")
+            return affected | self._update_pool(name, tenant, None, None, None)
+
+    def _choose_pool(self, tenant: str, dimension: int, num_vectors: int) -> str:
+        """Keep a tenant in its pool if it still fits, else pick the first pool with room."""
+        current = self._tenant_pools.get(tenant)
+        candidates = ([current] if current else []) + [name for name in self._pools if name != current]
+        for name in candidates:
+            pool = self._pools[name]
+            existing = pool.tenants.get(tenant, {}).get("count", 0)
+            if pool.dimension == dimension and pool.num_vectors - existing + num_vectors <= self.pool_max_vectors:
+                return name
+        return f"pool-{len(self._pools):04d}"
+
+    def _update_pool(
+        self,
+        name: str,
+        tenant: str,
+        vectors: Optional[np.ndarray],
+        docstore: Optional[Any],
+        index_to_docstore_id: Optional[Dict[int, str]]
+    ) -> Set[str]:
+        """Replace the tenant's rows in a pool (or remove them when vectors is None)."""
+        pool_path = self.root / name
+        pool_path.mkdir(parents=True, exist_ok=True)
+        table = _read_tenants(pool_path)
+        tenants = table["tenants"]
+        affected = set(tenants)
+
+        index_path = pool_path / INDEX_FILENAME
+        if index_path.exists():
+            # A private copy: the open pool's index may be memory-mapped and is searched by live views
+            index = faiss.read_index(str(index_path))
+        else:
+            index = faiss.IndexIDMap(faiss.IndexFlatL2(vectors.shape[1]))
+            table["dimension"] = int(vectors.shape[1])
+
+        if tenant in tenants:
+            old = tenants.pop(tenant)
+            index.remove_ids(faiss.IDSelectorRange(old["start"], old["start"] + old["count"]))
+
+        start = table.get("next_id", 0)
+        if vectors is not None:
+            tenants[tenant] = {"start": start, "count": int(len(vectors))}
+            index.add_with_ids(vectors, np.arange(start, start + len(vectors), dtype=np.int64))
+            table["next_id"] = start + len(vectors)
+            affected.add(tenant)
+
+        tmp_index_path = index_path.with_name(index_path.name + ".tmp")
+        faiss.write_index(index, str(tmp_index_path))
+        ChunkStore.write_tenant(pool_path / CHUNK_STORE_FILENAME, tenant, docstore, index_to_docstore_id, start)
+        os.replace(tmp_index_path, index_path)
+        _write_tenants(pool_path, table)
+
+        self._tenant_pools.pop(tenant, None)
+        self._open_pool(name)
+        return affected
+
+    def stats(self) -> Dict[str, Any]:
+        """Report pool, tenant and vector counts."""
+        return {
+            "pools": {
+                name: {"tenants": len(pool.tenants), "vectors": pool.num_vectors, "dimension": pool.dimension}
+                for name, pool in self._pools.items()
+            },
+            "tenants": len(self._tenant_pools),
+            "vectors": sum(pool.num_vectors for pool in self._pools.values()),
+            "max_tenant_chunks": self.max_tenant_chunks,
+            "pool_max_vectors": self.pool_max_vectors
+        }
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+
+from rag_py.ann_tuner import _select, read_tuning_report, tune_search_params, write_tuning_report
+from rag_py.vector_index import INDEX_FLAT, INDEX_HNSW, INDEX_IVF_PQ, build_index
+
+CONFIG = {"ivf_nlist": 32, "pq_m": 8, "hnsw_m": 8, "ann_probe_queries": 50, "ann_latency_ceiling_ms": 1000}
+
+
+def populated_index(index_type):
+    data = np.random.default_rng(0).standard_normal((2000, 32), dtype=np.float32)
+    index, _, _ = build_index(data, index_type, CONFIG)
+    index.add(data)
+    return index, data
+
+
+def test_hnsw_gets_the_cheapest_ef_search_meeting_the_recall_target():
+    index, data = populated_index(INDEX_HNSW)
+
+    report = tune_search_params(index, data, INDEX_HNSW, {**CONFIG, "ann_recall_target": 0.9})
+
+    selected = report["selected"]["efSearch"]
+    assert report["target_met"]
+    assert index.hnsw.efSearch == selected
+    # Every cheaper setting missed the target
+    assert all(result["recall"] < 0.9 for result in report["sweep"] if result["efSearch"] < selected)
+
+
+def test_nprobe_sweep_stops_at_the_list_count():
+    index, data = populated_index(INDEX_IVF_PQ)
+
+    report = tune_search_params(index, data, INDEX_IVF_PQ, {**CONFIG, "ann_recall_target": 0.5})
+
+    assert report["parameter"] == "nprobe"
+    assert max(result["nprobe"] for result in report["sweep"]) == 32
+    assert report["selected_measurements"]["recall"] >= 0.5
+
+
+def test_unmet_target_falls_back_to_the_best_recall_within_latency():
+    results = [
+        {"efSearch": 16, "recall": 0.7, "p95_latency_ms": 1.0},
+        {"efSearch": 32, "recall": 0.8, "p95_latency_ms": 2.0},
+        {"efSearch": 64, "recall": 0.9, "p95_latency_ms": 20.0},
+    ]
+
+    assert _select(results, 0.95, 5.0)["efSearch"] == 32
+    assert _select(results, 0.95, 0.5)["efSearch"] == 64
+
+
+def test_flat_indexes_are_not_tuned():
+    index, data = populated_index(INDEX_FLAT)
+
+    with pytest.raises(ValueError):
+        tune_search_params(index, data, INDEX_FLAT, CONFIG)
+
+
+def test_report_round_trip(tmp_path):
+    assert read_tuning_report(tmp_path) is None
+    write_tuning_report(tmp_path, {"selected": {"efSearch": 48}})
+
+    assert read_tuning_report(tmp_path) == {"selected": {"efSearch": 48}}
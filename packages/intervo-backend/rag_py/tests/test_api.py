@@ -0,0 +1,135 @@
+import asyncio
+import importlib
+import time
+import types
+
+import pytest
+
+moto = pytest.importorskip("moto")
+boto3 = pytest.importorskip("boto3")
+
+BUCKET = "rag-api-test"
+
+
+@pytest.fixture(scope="module")
+def api(tmp_path_factory):
+    """rag_py.api imported against moto's in-memory S3, with its vector stores in a temporary directory."""
+    with pytest.MonkeyPatch.context() as patch, moto.mock_aws():
+        patch.chdir(tmp_path_factory.mktemp("api"))
+        for name, value in {
+            "AWS_ACCESS_KEY_ID": "test",
+            "AWS_SECRET_ACCESS_KEY": "test",
+            "AWS_DEFAULT_REGION": "us-east-1",
+            "STORAGE_S3_BUCKET": BUCKET,
+            "STORAGE_S3_ENDPOINT": "https://s3.amazonaws.com",
+            "STORAGE_S3_REGION": "us-east-1",
+            "S3_PROTOCOL_ACCESS_KEY_ID": "test",
+            "S3_PROTOCOL_ACCESS_KEY_SECRET": "test",
+        }.items():
+            patch.setenv(name, value)
+        patch.delenv("RAG_INDEX_SYNC", raising=False)
+        boto3.client("s3", region_name="us-east-1").create_bucket(Bucket=BUCKET)
+        yield importlib.import_module("rag_py.api")
+
+
+@pytest.fixture
+def loads(api, monkeypatch):
+    """Configs the knowledgebase's query interfaces were created with, without loading an index."""
+    created = []
+
+    def create_query_interface(knowledgebase_id, config):
+        created.append(config)
+        query_interface = types.SimpleNamespace(config=config, version="v1", vector_store=object())
+        api.query_instances[knowledgebase_id] = query_interface
+        return query_interface
+
+    async def ensure_trained(knowledgebase_id):
+        return True
+
+    monkeypatch.setattr(api, "create_query_interface", create_query_interface)
+    monkeypatch.setattr(api, "ensure_trained", ensure_trained)
+    monkeypatch.setattr(api, "query_instances", {})
+    return created
+
+
+def test_warm_up_loads_with_the_query_config(api, loads, monkeypatch):
+    monkeypatch.setenv("RAG_PROMPT_LAYOUT", "prefix_cache")
+    config = {"llm_service": "gemini", "llm_config": {"model_name": "gemini-2.5-flash"}}
+
+    async def scenario():
+        await api.warm_up_knowledgebase("kb1", api.WarmUpRequest(config=config, system_prompt="Be brief."))
+        # The query that follows uses the warmed-up interface as is, whatever its system prompt
+        return await api.get_or_load_query_interface("kb1", api.build_query_config(config, "Be friendly."))
+
+    query_interface = asyncio.run(scenario())
+
+    assert len(loads) == 1
+    assert query_interface.config["llm_service"] == "gemini"
+    assert query_interface.config["llm_config"]["model_name"] == "gemini-2.5-flash"
+    assert query_interface.config["prompt_layout"] == "prefix_cache"
+
+
+def test_changed_query_config_reloads_the_interface(api, loads):
+    async def scenario():
+        await api.warm_up_knowledgebase("kb1")
+        return await api.get_or_load_query_interface("kb1", api.build_query_config({"llm_service": "gemini"}, None))
+
+    query_interface = asyncio.run(scenario())
+
+    assert [config["llm_service"] for config in loads] == ["openai", "gemini"]
+    assert api.query_instances["kb1"] is query_interface
+
+
+class SlowStorage:
+    """Crawled pages served with a delay per object, recording how many downloads overlap."""
+
+    def __init__(self, pages):
+        self.pages = pages
+        self.in_flight = 0
+        self.most_in_flight = 0
+
+    async def get_documents(self, knowledgebase_id, doc_type):
+        if doc_type.value == "crawled":
+            return {"files": [{"path": path, "filename": path, "size": len(text)} for path, text in self.pages.items()]}
+        if doc_type.value == "text":
+            return {"content": "We sell hiking boots."}
+        return None
+
+    async def read_object(self, key):
+        self.in_flight += 1
+        self.most_in_flight = max(self.most_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.05)
+            if key == "missing.html":
+                raise KeyError(key)
+            return self.pages[key].encode("utf-8")
+        finally:
+            self.in_flight -= 1
+
+
+def test_documents_are_fetched_concurrently_in_order(api, monkeypatch):
+    pages = {f"page-{i}.html": f"Page {i} text." for i in range(20)}
+    pages["missing.html"] = ""
+    slow_storage = SlowStorage(pages)
+    monkeypatch.setattr(api, "storage", slow_storage)
+
+    async def scenario():
+        first, source_ids, fetch_usage = await api.load_knowledgebase_documents("kb1")
+        indexed = {document.metadata[api.SOURCE_ID_FIELD] for document in first[:11]}
+        again, _, _ = await api.load_knowledgebase_documents("kb1", indexed)
+        return first, source_ids, fetch_usage, again
+
+    started_at = time.perf_counter()
+    documents, source_ids, fetch_usage, again = asyncio.run(scenario())
+    elapsed = time.perf_counter() - started_at
+
+    assert [document.page_content for document in documents] == (
+        ["We sell hiking boots."] + [f"Page {i} text." for i in range(20)]
+    )
+    assert slow_storage.most_in_flight == 21
+    assert (fetch_usage["objects"], fetch_usage["failed"]) == (20, 1)
+    # Two loads of 21 downloads each, far below 42 sequential round trips
+    assert elapsed < 1.0
+    # A page that failed to download is not counted as a source, so the next update retries it
+    assert len(source_ids) == 21
+    assert [document.page_content for document in again] == [f"Page {i} text." for i in range(10, 20)]
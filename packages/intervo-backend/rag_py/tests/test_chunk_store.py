@@ -0,0 +1,103 @@
+import json
+import sqlite3
+
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_core.documents import Document
+
+from rag_py.chunk_store import ChunkStore
+
+TEXTS = [
+    "Our prices start at ten dollars per month.",
+    "Support is open on weekdays from nine to five.",
+    "Refunds are processed within five business days.",
+]
+
+
+def docstore_for(texts, prefix="chunk"):
+    ids = [f"{prefix}-{i}" for i in range(len(texts))]
+    docstore = InMemoryDocstore({
+        chunk_id: Document(page_content=text, metadata={"source": "faq.txt", "chunk_priority": i + 1})
+        for i, (chunk_id, text) in enumerate(zip(ids, texts))
+    })
+    return docstore, dict(enumerate(ids))
+
+
+def test_round_trip(tmp_path):
+    path = tmp_path / "chunks.sqlite"
+    ChunkStore.write(path, *docstore_for(TEXTS))
+
+    store = ChunkStore(path)
+
+    assert len(store) == 3
+    assert store.index_to_docstore_id[1] == "chunk-1"
+    assert dict(store.index_to_docstore_id) == store.id_mapping() == {0: "chunk-0", 1: "chunk-1", 2: "chunk-2"}
+    document = store.search("chunk-2")
+    assert document.page_content == TEXTS[2]
+    assert document.metadata == {"source": "faq.txt", "chunk_priority": 3}
+    assert [doc.id if doc else None for doc in store.get_by_faiss_ids([2, 7, 0])] == ["chunk-2", None, "chunk-0"]
+    assert [chunk_id for chunk_id, _ in store.items()] == ["chunk-0", "chunk-1", "chunk-2"]
+    assert store.search("missing") == "ID missing not found."
+
+
+def test_keyword_search_scores_by_matched_words(tmp_path):
+    path = tmp_path / "chunks.sqlite"
+    ChunkStore.write(path, *docstore_for(TEXTS))
+    store = ChunkStore(path)
+
+    results = store.keyword_search(["five", "business", "price?"], limit=3)
+
+    assert [(document.id, round(score, 2)) for document, score in results] == [
+        ("chunk-2", 0.67),
+        ("chunk-0", 0.33),
+        ("chunk-1", 0.33),
+    ]
+    assert store.keyword_search(["?"], limit=3) == []
+
+
+def test_text_is_stored_once(tmp_path):
+    path = tmp_path / "chunks.sqlite"
+    ChunkStore.write(path, *docstore_for(TEXTS))
+
+    columns = [row[1] for row in sqlite3.connect(path).execute("PRAGMA table_info(chunks)")]
+
+    assert columns == ["faiss_id", "chunk_id", "page_content", "metadata"]
+
+
+def test_tenants_only_see_their_own_chunks(tmp_path):
+    path = tmp_path / "chunks.sqlite"
+    ChunkStore.write_tenant(path, "kb1", *docstore_for(TEXTS[:2], prefix="kb1"))
+    ChunkStore.write_tenant(path, "kb2", *docstore_for(TEXTS[1:], prefix="kb2"))
+
+    kb1 = ChunkStore(path, tenant="kb1")
+    kb2 = ChunkStore(path, tenant="kb2")
+
+    assert kb1.id_mapping() == {0: "kb1-0", 1: "kb1-1"}
+    assert [document.id for document, _ in kb2.keyword_search(["weekdays", "refunds"], limit=5)] == ["kb2-0", "kb2-1"]
+    assert [document.id for document, _ in kb1.keyword_search(["refunds"], limit=5)] == []
+
+    # Replacing a tenant's chunks drops the old ones from the full-text index
+    ChunkStore.write_tenant(path, "kb1", *docstore_for(["Refunds need a receipt."], prefix="kb1-new"))
+    kb1 = ChunkStore(path, tenant="kb1")
+    assert [document.id for document, _ in kb1.keyword_search(["weekdays", "refunds"], limit=5)] == ["kb1-new-0"]
+    ChunkStore.write_tenant(path, "kb1")
+    assert len(ChunkStore(path, tenant="kb1")) == 0
+    assert len(ChunkStore(path, tenant="kb2")) == 2
+
+
+def test_stores_without_full_text_index_are_scanned(tmp_path):
+    path = tmp_path / "chunks.sqlite"
+    connection = sqlite3.connect(path)
+    connection.execute(
+        "CREATE TABLE chunks (faiss_id INTEGER PRIMARY KEY, chunk_id TEXT NOT NULL UNIQUE, "
+        "page_content TEXT NOT NULL, search_text TEXT NOT NULL, metadata TEXT NOT NULL, chunk_priority INTEGER)"
+    )
+    connection.executemany(
+        "INSERT INTO chunks VALUES (?, ?, ?, ?, ?, NULL)",
+        [(i, f"chunk-{i}", text, text.lower(), json.dumps({})) for i, text in enumerate(TEXTS)]
+    )
+    connection.commit()
+    connection.close()
+
+    results = ChunkStore(path).keyword_search(["refunds"], limit=3)
+
+    assert [(document.id, score) for document, score in results] == [("chunk-2", 1.0)]
@@ -0,0 +1,76 @@
+import asyncio
+
+import pytest
+
+from rag_py.document_parser import PARSER_PROCESS, DocumentParser
+
+
+def pdf_with_text(text):
+    """A one-page PDF showing text in Helvetica."""
+    stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode("latin-1")
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+        b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 4 0 R "
+        b"/Resources << /Font << /F1 5 0 R >> >> >>",
+        b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_at = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_at)
+    return pdf
+
+
+@pytest.fixture
+def parser():
+    parser = DocumentParser(PARSER_PROCESS, num_workers=2, timeout_seconds=60)
+    yield parser
+    parser.shutdown()
+
+
+def test_pdfs_are_parsed_in_reused_worker_processes(parser):
+    async def scenario():
+        return [await parser.parse(f"doc-{i}.pdf", pdf_with_text(f"Refunds take {i} days")) for i in range(3)]
+
+    texts = asyncio.run(scenario())
+
+    assert texts == [f"Refunds take {i} days" for i in range(3)]
+    stats = parser.stats()
+    assert (stats["workers"], stats["parsed"], stats["failed"]) == (1, 3, 0)
+
+
+def test_plain_files_are_decoded_without_a_worker(parser):
+    assert asyncio.run(parser.parse("notes.txt", "Opening hours".encode("utf-8"))) == "Opening hours"
+    assert parser.stats()["workers"] == 0
+
+
+def test_a_broken_document_fails_without_losing_the_worker(parser):
+    async def scenario():
+        with pytest.raises(Exception):
+            await parser.parse("broken.pdf", b"not a pdf")
+        return await parser.parse("doc.pdf", pdf_with_text("Still working"))
+
+    assert asyncio.run(scenario()) == "Still working"
+    assert (parser.stats()["workers"], parser.stats()["failed"]) == (1, 1)
+
+
+def test_a_document_over_its_time_is_stopped_and_its_worker_replaced(parser):
+    async def scenario():
+        await parser.parse("warm-up.pdf", pdf_with_text("Warm up"))
+        parser.timeout_seconds = 0.0001
+        with pytest.raises(TimeoutError):
+            await parser.parse("slow.pdf", pdf_with_text("Too slow"))
+        assert parser.stats()["workers"] == 0
+        parser.timeout_seconds = 60
+        return await parser.parse("doc.pdf", pdf_with_text("Fresh worker"))
+
+    assert asyncio.run(scenario()) == "Fresh worker"
+    stats = parser.stats()
+    assert (stats["timed_out"], stats["workers"]) == (1, 1)
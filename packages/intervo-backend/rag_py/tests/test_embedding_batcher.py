@@ -0,0 +1,69 @@
+import asyncio
+
+from langchain_core.embeddings import Embeddings
+
+from rag_py.embedding_batcher import EmbeddingBatcher
+
+
+class RecordingEmbeddings(Embeddings):
+    """Embeds a text as [len(text)], recording each request's texts."""
+
+    def __init__(self, error=None):
+        self.requests = []
+        self.error = error
+
+    def embed_documents(self, texts):
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text))]
+
+    async def aembed_documents(self, texts):
+        self.requests.append(list(texts))
+        if self.error:
+            raise self.error
+        return self.embed_documents(texts)
+
+
+def test_concurrent_queries_share_one_request():
+    embeddings = RecordingEmbeddings()
+    batcher = EmbeddingBatcher(embeddings, max_batch_size=64, max_wait_ms=20)
+    texts = ["pricing", "refunds", "pricing", "opening hours"]
+
+    async def scenario():
+        return await asyncio.gather(*(batcher.embed_query(text) for text in texts))
+
+    vectors = asyncio.run(scenario())
+
+    assert vectors == [[7.0], [7.0], [7.0], [13.0]]
+    # Identical texts in a batch are embedded once
+    assert embeddings.requests == [["pricing", "refunds", "opening hours"]]
+    assert batcher.stats()["batches"] == 1
+    assert batcher.stats()["avg_batch_size"] == 4
+
+
+def test_a_full_batch_is_sent_without_waiting():
+    embeddings = RecordingEmbeddings()
+    batcher = EmbeddingBatcher(embeddings, max_batch_size=2, max_wait_ms=10_000)
+
+    async def scenario():
+        return await asyncio.wait_for(
+            asyncio.gather(*(batcher.embed_query(f"query {i}") for i in range(4))),
+            timeout=1
+        )
+
+    asyncio.run(scenario())
+
+    assert embeddings.requests == [["query 0", "query 1"], ["query 2", "query 3"]]
+
+
+def test_a_failed_batch_fails_every_waiting_query():
+    batcher = EmbeddingBatcher(RecordingEmbeddings(error=RuntimeError("rate limited")), max_wait_ms=1)
+
+    async def scenario():
+        return await asyncio.gather(batcher.embed_query("a"), batcher.embed_query("b"), return_exceptions=True)
+
+    errors = asyncio.run(scenario())
+
+    assert [str(error) for error in errors] == ["rate limited", "rate limited"]
+    assert batcher.stats()["failed_batches"] == 1
@@ -0,0 +1,33 @@
+import numpy as np
+
+from rag_py.embedding_cache import EmbeddingCache, embedding_cache_key
+
+
+def test_vectors_round_trip_by_content_address(tmp_path):
+    cache = EmbeddingCache(tmp_path / "embeddings.sqlite", max_bytes=1024 * 1024)
+    key = embedding_cache_key("text-embedding-3-small", None, "Our prices start at ten dollars.")
+    vector = np.arange(8, dtype=np.float32)
+    cache.put_many([(key, vector)])
+
+    # Another process opening the same file sees the same vectors
+    found = EmbeddingCache(tmp_path / "embeddings.sqlite", max_bytes=1024 * 1024).get_many([key, b"missing"])
+
+    np.testing.assert_array_equal(found[key], vector)
+    assert list(found) == [key]
+    assert embedding_cache_key("text-embedding-3-small", 512, "Our prices start at ten dollars.") != key
+    assert embedding_cache_key("text-embedding-3-large", None, "Our prices start at ten dollars.") != key
+
+
+def test_least_recently_used_vectors_are_evicted_past_the_cap(tmp_path):
+    cache = EmbeddingCache(tmp_path / "embeddings.sqlite", max_bytes=256 * 1024)
+    keys = [embedding_cache_key("model", None, f"chunk {i}") for i in range(200)]
+    vectors = np.ones((200, 256), dtype=np.float32)
+    cache.put_many(zip(keys[:100], vectors[:100]))
+    cache.get_many(keys[:10])
+
+    cache.put_many(zip(keys[100:], vectors[100:]))
+
+    stats = cache.stats()
+    assert stats["evicted"] > 0
+    assert stats["used_bytes"] <= stats["max_bytes"]
+    assert set(cache.get_many(keys[-10:])) == set(keys[-10:])
@@ -0,0 +1,78 @@
+import asyncio
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from rag_py.embedding_compression import ReducedDimensionEmbeddings, evaluate_compression, reduce_dimensions
+from rag_py.vector_index import INDEX_FLAT, QUANTIZATION_FP16, QUANTIZATION_INT8, QUANTIZATION_NONE, build_index
+
+
+class FixedEmbeddings(Embeddings):
+    """Embeds every text as [3, 4, 12]."""
+
+    def embed_documents(self, texts):
+        return [[3.0, 4.0, 12.0] for _ in texts]
+
+    def embed_query(self, text):
+        return [3.0, 4.0, 12.0]
+
+
+def normalized_vectors(count, dimension=64):
+    data = np.random.default_rng(0).standard_normal((count, dimension), dtype=np.float32)
+    return data / np.linalg.norm(data, axis=1, keepdims=True)
+
+
+def test_reduced_embeddings_are_truncated_and_renormalized():
+    embeddings = ReducedDimensionEmbeddings(FixedEmbeddings(), 2)
+
+    assert embeddings.embed_query("text") == pytest.approx([0.6, 0.8])
+    assert asyncio.run(embeddings.aembed_documents(["a", "b"])) == [pytest.approx([0.6, 0.8])] * 2
+    # Asking for the full dimension or more leaves vectors as they are
+    np.testing.assert_array_equal(reduce_dimensions(np.ones((1, 3)), 3), np.ones((1, 3), dtype=np.float32))
+
+
+@pytest.mark.parametrize("quantization, code_bytes", [
+    (QUANTIZATION_NONE, 4 * 32),
+    (QUANTIZATION_FP16, 2 * 32),
+    (QUANTIZATION_INT8, 32),
+])
+def test_compression_report_measures_memory_and_recall(quantization, code_bytes):
+    full_vectors = normalized_vectors(1000)
+    vectors = reduce_dimensions(full_vectors, 32)
+    index, index_type, _ = build_index(vectors, INDEX_FLAT, {}, quantization)
+    index.add(vectors)
+
+    report = evaluate_compression(
+        index,
+        full_vectors,
+        {"index_type": index_type, "dimension": 32, "quantization": quantization},
+        {"compression_eval_queries": 100}
+    )
+
+    selected = report["selected"]
+    assert index.sa_code_size() == code_bytes
+    assert report["baseline"]["bytes"] == 1000 * 64 * 4
+    # Halving the dimension alone saves about half the memory
+    assert selected["memory_saved"] > 0.45
+    # Recall is against the full-dimension exact search, so truncation costs some
+    assert selected["recall"] < 1.0
+    assert selected["recall_lost"] == pytest.approx(1 - selected["recall"])
+
+
+def test_quantized_indexes_keep_full_dimension_recall():
+    vectors = normalized_vectors(1000)
+    recalls = {}
+    for quantization in (QUANTIZATION_FP16, QUANTIZATION_INT8):
+        index, index_type, _ = build_index(vectors, INDEX_FLAT, {}, quantization)
+        index.add(vectors)
+        report = evaluate_compression(
+            index,
+            vectors,
+            {"index_type": index_type, "dimension": 64, "quantization": quantization},
+            {"compression_eval_queries": 100}
+        )
+        recalls[quantization] = report["selected"]["recall"]
+
+    assert recalls[QUANTIZATION_FP16] >= 0.99
+    assert recalls[QUANTIZATION_INT8] >= 0.9
@@ -0,0 +1,51 @@
+from rag_py.enhancement_cache import EnhancementCache, enhancement_cache_key
+from rag_py.rag_enhancements import ENHANCEMENT_MODE_COMBINED, ENHANCEMENT_MODE_SEPARATE, RAGEnhancementService
+
+RESULT = {"chunk_summary": "Prices start at ten dollars.", "chunk_priority": 4, "chunk_topics": ["pricing"]}
+
+
+def test_hits_and_misses(tmp_path):
+    cache = EnhancementCache(tmp_path / "cache.sqlite", max_entries=100)
+    cached_key = enhancement_cache_key("model", "1", ENHANCEMENT_MODE_SEPARATE, None, "Our prices start at ten dollars.")
+    missing_key = enhancement_cache_key("model", "1", ENHANCEMENT_MODE_SEPARATE, None, "Support is open on weekdays.")
+    cache.put_many([(cached_key, RESULT)])
+
+    found = cache.get_many([cached_key, missing_key, cached_key])
+
+    assert found == {cached_key: RESULT}
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (1, 1)
+
+
+def test_least_recently_used_results_are_evicted(tmp_path):
+    cache = EnhancementCache(tmp_path / "cache.sqlite", max_entries=10)
+    keys = [enhancement_cache_key("model", "1", ENHANCEMENT_MODE_SEPARATE, None, f"chunk {i}") for i in range(11)]
+    cache.put_many((key, RESULT) for key in keys[:10])
+    cache.get_many([keys[0]])
+
+    cache.put_many([(keys[10], RESULT)])
+
+    kept = cache.get_many(keys)
+    assert keys[0] in kept and keys[10] in kept
+    assert len(kept) == cache.stats()["entries"] == 9
+    assert cache.stats()["evicted"] == 2
+
+
+def test_key_covers_everything_the_result_depends_on():
+    key = enhancement_cache_key("model", "1", ENHANCEMENT_MODE_SEPARATE, "Sell plans.", "text")
+
+    assert key == enhancement_cache_key("model", "1", ENHANCEMENT_MODE_SEPARATE, "Sell plans.", "text")
+    assert len({
+        key,
+        enhancement_cache_key("other-model", "1", ENHANCEMENT_MODE_SEPARATE, "Sell plans.", "text"),
+        enhancement_cache_key("model", "2", ENHANCEMENT_MODE_SEPARATE, "Sell plans.", "text"),
+        enhancement_cache_key("model", "1", ENHANCEMENT_MODE_COMBINED, "Sell plans.", "text"),
+        enhancement_cache_key("model", "1", ENHANCEMENT_MODE_SEPARATE, None, "text"),
+        enhancement_cache_key("model", "1", ENHANCEMENT_MODE_SEPARATE, "Sell plans.", "other text"),
+    }) == 6
+
+
+def test_services_in_different_modes_use_different_keys():
+    separate = RAGEnhancementService({"enhancement_mode": ENHANCEMENT_MODE_SEPARATE})
+    combined = RAGEnhancementService({"enhancement_mode": ENHANCEMENT_MODE_COMBINED})
+
+    assert separate.cache_key("text") != combined.cache_key("text")
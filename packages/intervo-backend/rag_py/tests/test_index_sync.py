@@ -0,0 +1,100 @@
+import types
+
+import pytest
+
+from rag_py.index_sync import IndexSync
+from rag_py.store_versions import create_version, current_version, current_version_path, publish_version
+
+moto = pytest.importorskip("moto")
+boto3 = pytest.importorskip("boto3")
+
+BUCKET = "rag-index-sync-test"
+KB = "kb1"
+
+
+@pytest.fixture
+def storage(monkeypatch):
+    """An S3Storage stand-in backed by moto's in-memory S3."""
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        s3_client = boto3.client("s3", region_name="us-east-1")
+        s3_client.create_bucket(Bucket=BUCKET)
+        yield types.SimpleNamespace(s3_client=s3_client, bucket=BUCKET)
+
+
+def train(root, files):
+    """Write and publish a local version holding the given files."""
+    kb_path = root / KB
+    version_path = create_version(kb_path)
+    for name, content in files.items():
+        (version_path / name).parent.mkdir(parents=True, exist_ok=True)
+        (version_path / name).write_bytes(content)
+    publish_version(kb_path, version_path)
+    return version_path
+
+
+def test_publish_and_install(storage, tmp_path):
+    trainer = IndexSync(storage, tmp_path / "trainer")
+    replica = IndexSync(storage, tmp_path / "replica")
+    files = {"index.faiss": b"vectors", "chunks.sqlite": b"chunks", "shards/0/index.faiss": b"shard"}
+    version_path = train(tmp_path / "trainer", files)
+
+    trainer.publish(KB, version_path)
+
+    assert replica.sync(KB) == version_path.name
+    assert current_version(tmp_path / "replica" / KB) == version_path.name
+    installed = current_version_path(tmp_path / "replica" / KB)
+    assert {name: (installed / name).read_bytes() for name in files} == files
+    assert replica.stats()["downloaded_files"] == len(files)
+
+
+def test_unchanged_manifest_is_a_conditional_get(storage, tmp_path):
+    trainer = IndexSync(storage, tmp_path / "trainer")
+    replica = IndexSync(storage, tmp_path / "replica")
+    trainer.publish(KB, train(tmp_path / "trainer", {"index.faiss": b"vectors"}))
+    replica.sync(KB)
+
+    assert replica.sync(KB) is None
+    assert replica.stats()["not_modified"] == 1
+
+
+def test_new_version_reuses_unchanged_files(storage, tmp_path):
+    trainer = IndexSync(storage, tmp_path / "trainer")
+    replica = IndexSync(storage, tmp_path / "replica")
+    trainer.publish(KB, train(tmp_path / "trainer", {"index.faiss": b"v1", "shards/0/index.faiss": b"shard"}))
+    replica.sync(KB)
+
+    second = train(tmp_path / "trainer", {"index.faiss": b"v2", "shards/0/index.faiss": b"shard"})
+    trainer.publish(KB, second)
+
+    assert replica.sync(KB) == second.name
+    assert (current_version_path(tmp_path / "replica" / KB) / "index.faiss").read_bytes() == b"v2"
+    assert replica.stats()["reused_files"] == 1
+
+
+def test_corrupt_download_is_not_installed(storage, tmp_path):
+    trainer = IndexSync(storage, tmp_path / "trainer")
+    replica = IndexSync(storage, tmp_path / "replica")
+    manifest = trainer.publish(KB, train(tmp_path / "trainer", {"index.faiss": b"vectors"}))
+    sha256 = manifest["files"]["index.faiss"]["sha256"]
+    storage.s3_client.put_object(Bucket=BUCKET, Key=f"{KB}/vector_store/objects/{sha256}", Body=b"tampered")
+
+    with pytest.raises(ValueError, match="Checksum mismatch"):
+        replica.sync(KB)
+    assert current_version(tmp_path / "replica" / KB) is None
+
+
+def test_unpublished_knowledgebase_is_looked_up_once_per_ttl(storage, tmp_path):
+    replica = IndexSync(storage, tmp_path / "replica", missing_ttl=60)
+
+    assert replica.sync(KB) is None
+    assert replica.sync(KB) is None
+    assert replica.stats()["checks"] == 1
+    assert replica.stats()["missing_cached"] == 1
+
+    # Publishing from this replica makes the KB known right away
+    replica.publish(KB, train(tmp_path / "replica", {"index.faiss": b"vectors"}))
+    assert replica.sync(KB) is None
+    assert replica.stats()["checks"] == 2
@@ -0,0 +1,49 @@
+import asyncio
+import uuid
+
+from rag_py.llm_pool import LLMProviderPool
+
+
+def stub_member(**config):
+    # Schedulers are shared per member name across pools, so each test gets fresh ones
+    return {"provider": "stub", "model_name": f"stub-{uuid.uuid4().hex[:8]}", **config}
+
+
+async def generate_all(pool, calls):
+    return await asyncio.gather(*(pool.generate("prompt", max_tokens=10, max_retries=0) for _ in range(calls)))
+
+
+def test_calls_fail_over_from_rate_limited_member():
+    limited = stub_member(response="limited", rate_limit_per_minute=0)
+    healthy = stub_member(response="healthy", latency_ms=20)
+    pool = LLMProviderPool([limited, healthy])
+
+    results = asyncio.run(generate_all(pool, 20))
+
+    assert [result["text"] for result in results] == ["healthy"] * 20
+    limited_member, healthy_member = pool.members
+    assert limited_member.scheduler.stats()["rate_limited"] >= 1
+    assert healthy_member.scheduler.stats()["completed"] == 20
+
+
+def test_load_shifts_away_from_rate_limited_member():
+    limited = stub_member(response="limited", latency_ms=20, rate_limit_per_minute=2)
+    healthy = stub_member(response="healthy", latency_ms=20)
+    pool = LLMProviderPool([limited, healthy])
+    limited_member, healthy_member = pool.members
+
+    def attempts():
+        return limited_member.scheduler.stats()["rate_limited"] + len(limited_member.client.prompts)
+
+    async def two_rounds():
+        first = await generate_all(pool, 20)
+        first_attempts = attempts()
+        second = await generate_all(pool, 20)
+        return first + second, first_attempts, attempts() - first_attempts
+
+    results, first_attempts, second_attempts = asyncio.run(two_rounds())
+
+    assert [result["text"] for result in results].count("healthy") >= 38
+    # Both members start out alike; after the 429s the limited member is passed over
+    assert first_attempts >= 2
+    assert second_attempts < first_attempts / 2
@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+
+from rag_py.llm_scheduler import LLMScheduler, is_rate_limit_error, is_transient_error
+
+
+class RateLimitError(Exception):
+    status_code = 429
+
+
+@pytest.fixture(autouse=True)
+def short_backoff(monkeypatch):
+    monkeypatch.setattr("rag_py.llm_scheduler.BACKOFF_BASE_SECONDS", 0.01)
+
+
+def test_a_429_halves_the_rate_and_concurrency_then_the_call_is_retried():
+    scheduler = LLMScheduler(requests_per_minute=6000, tokens_per_minute=10_000_000, max_concurrency=8)
+    attempts = []
+
+    async def call():
+        attempts.append(len(attempts))
+        if len(attempts) == 1:
+            raise RateLimitError("Too many requests")
+        return "summary"
+
+    result = asyncio.run(scheduler.run(call))
+
+    stats = scheduler.stats()
+    assert result == "summary"
+    assert (stats["retries"], stats["rate_limited"], stats["failed"]) == (1, 1, 0)
+    # Halved by the 429, then one additive step back up for the success
+    assert stats["rate_factor"] == 0.51
+    assert stats["concurrency_limit"] == 4
+
+
+def test_one_burst_of_429s_backs_off_once():
+    scheduler = LLMScheduler(requests_per_minute=60_000, tokens_per_minute=10_000_000, max_concurrency=8)
+
+    async def call():
+        raise RateLimitError("Too many requests")
+
+    async def scenario():
+        return await asyncio.gather(*(scheduler.run(call, max_retries=0) for _ in range(4)), return_exceptions=True)
+
+    errors = asyncio.run(scenario())
+
+    assert all(isinstance(error, RateLimitError) for error in errors)
+    assert scheduler.stats()["rate_limited"] == 4
+    assert scheduler.stats()["rate_factor"] == 0.5
+
+
+def test_calls_in_flight_stay_under_the_concurrency_cap():
+    scheduler = LLMScheduler(requests_per_minute=60_000, tokens_per_minute=10_000_000, max_concurrency=3)
+    in_flight = []
+    most = []
+
+    async def call():
+        in_flight.append(1)
+        most.append(len(in_flight))
+        await asyncio.sleep(0.01)
+        in_flight.pop()
+
+    async def scenario():
+        await asyncio.gather(*(scheduler.run(call) for _ in range(12)))
+
+    asyncio.run(scenario())
+
+    assert max(most) == 3
+    assert scheduler.stats()["completed"] == 12
+
+
+def test_permanent_errors_are_not_retried():
+    scheduler = LLMScheduler(requests_per_minute=6000, tokens_per_minute=10_000_000, max_concurrency=4)
+    attempts = []
+
+    async def call():
+        attempts.append(1)
+        raise ValueError("Invalid prompt")
+
+    with pytest.raises(ValueError):
+        asyncio.run(scheduler.run(call))
+
+    assert len(attempts) == 1
+    assert scheduler.stats()["failed"] == 1
+
+
+def test_error_classification():
+    assert is_rate_limit_error(Exception("429 Resource has been exhausted"))
+    assert is_transient_error(asyncio.TimeoutError())
+    assert is_transient_error(Exception("503 Service Unavailable"))
+    assert not is_transient_error(ValueError("Invalid prompt"))
@@ -0,0 +1,66 @@
+from langchain_core.documents import Document
+
+from rag_py.local_enhancements import LOCAL_TOPICS_SOURCE, SUMMARY_MAX_LEN, LocalEnhancementEngine
+
+PRICING = (
+    "Our plans start at $10 per month. The team plan costs $25 per month per user. "
+    "Every plan includes a free trial of fourteen days. Annual billing saves twenty percent on every plan."
+)
+CONTACT = (
+    "Contact us at support@example.com or call +1 415 555 0100. "
+    "Our office is open Monday to Friday, 9am to 5pm."
+)
+FOOTER = "Home | About | Blog | Home | About | Blog. Privacy policy. Cookie settings. All rights reserved."
+
+
+def test_chunks_get_summary_topics_and_priority():
+    engine = LocalEnhancementEngine()
+
+    pricing, contact, footer = engine.enhance([PRICING, CONTACT, FOOTER])
+
+    # The summary is two whole sentences of the chunk, in their original order
+    sentences = [sentence.rstrip(".") for sentence in PRICING.split(". ")]
+    kept = [sentence.rstrip(".") for sentence in pricing["chunk_summary"].split(". ")]
+    assert len(kept) == 2
+    assert sentences.index(kept[0]) < sentences.index(kept[1])
+    assert "plan" in " ".join(pricing["chunk_topics"])
+    assert pricing["chunk_topics_source"] == LOCAL_TOPICS_SOURCE
+    assert pricing["chunk_priority"] >= 4
+    assert contact["chunk_priority"] >= 4
+    assert footer["chunk_priority"] <= 2
+
+
+def test_agent_prompt_vocabulary_raises_priority():
+    text = "Hiking boots come in leather and canvas, with waterproof membranes and padded ankle support."
+
+    plain = LocalEnhancementEngine().enhance([text])[0]
+    boosted = LocalEnhancementEngine("You help customers choose leather hiking boots with ankle support.").enhance([text])[0]
+
+    assert boosted["chunk_priority"] == plain["chunk_priority"] + 1
+
+
+def test_long_chunks_get_a_bounded_summary():
+    text = " ".join(f"Sentence {i} talks about delivery times and shipping costs at length." for i in range(100))
+
+    result = LocalEnhancementEngine().enhance([text, ""])
+
+    assert len(result[0]["chunk_summary"]) <= SUMMARY_MAX_LEN + 3
+    assert result[1] == {"chunk_summary": "", "chunk_priority": 1, "chunk_topics": [], "chunk_topics_source": LOCAL_TOPICS_SOURCE}
+
+
+def test_knowledge_base_summary_has_the_llm_summary_shape():
+    engine = LocalEnhancementEngine()
+    documents = [
+        Document(page_content=text, metadata=enhancement)
+        for text, enhancement in zip([PRICING, CONTACT, FOOTER], engine.enhance([PRICING, CONTACT, FOOTER]))
+    ]
+
+    summary = engine.knowledge_base_summary(documents)
+
+    assert set(summary) == {
+        "overall_theme", "key_topics_entities", "content_overview", "estimated_detail_level", "knowledge_base_topics"
+    }
+    # The highest-priority chunk leads
+    top = max(documents, key=lambda document: document.metadata["chunk_priority"])
+    assert summary["overall_theme"] == top.metadata["chunk_summary"]
+    assert engine.knowledge_base_summary([])["key_topics_entities"] == []
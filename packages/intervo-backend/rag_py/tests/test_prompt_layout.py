@@ -0,0 +1,61 @@
+import asyncio
+
+from rag_py.llm_services.stub_service import StubService
+from rag_py.prompt_layout import build_prefix_cached_messages, format_kb_context
+
+SYSTEM_PROMPT = "You are a helpful sales agent for Acme. Answer from the context."
+KB_SUMMARY = {
+    "overall_theme": "Acme pricing and support",
+    "content_overview": "Plans, prices and support hours.",
+    "key_topics_entities": ["Pro plan", "support hours"]
+}
+
+
+def render(messages):
+    """Serialize messages the way the stub provider sees them."""
+    return "\n".join(f"{message.type}: {message.content}" for message in messages)
+
+
+def build(question, context, conversation_history=None):
+    return build_prefix_cached_messages(
+        system_prompt=SYSTEM_PROMPT,
+        question=question,
+        context=context,
+        kb_context=format_kb_context(KB_SUMMARY),
+        conversation_history=conversation_history
+    )
+
+
+def test_static_prefix_is_identical_across_questions():
+    first = build("What does Pro cost?", "The Pro plan costs $49 per month.")
+    second = build("When is support open?", "Support answers Mon-Fri 9am to 5pm.")
+
+    assert first[0].content == second[0].content
+    prefix = render(first[:1])
+    assert render(first).startswith(prefix)
+    assert render(second).startswith(prefix)
+
+
+def test_history_extends_prefix_across_turns():
+    history = "User: Hi\nAgent: Hello, how can I help?"
+    first = build("What does Pro cost?", "The Pro plan costs $49 per month.", history)
+    second = build(
+        "And support hours?",
+        "Support answers Mon-Fri 9am to 5pm.",
+        history + "\nUser: What does Pro cost?\nAgent: $49 per month."
+    )
+
+    assert render(second).startswith(render(first[:1]) + "\n" + render(first[1:2]))
+
+
+def test_stub_reports_shared_prefix_as_cached():
+    stub = StubService({"model_name": "stub"})
+    asyncio.run(stub.initialize())
+    first = build("What does Pro cost?", "The Pro plan costs $49 per month.")
+    second = build("When is support open?", "Support answers Mon-Fri 9am to 5pm.")
+
+    asyncio.run(stub.invoke_with_usage(first))
+    _, usage = asyncio.run(stub.invoke_with_usage(second))
+
+    assert usage["input_token_details"]["cache_read"] >= len(render(second[:1])) // 4
+    assert stub.prompts[0][:len(render(first[:1]))] == stub.prompts[1][:len(render(second[:1]))]
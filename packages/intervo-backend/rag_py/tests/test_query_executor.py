@@ -0,0 +1,58 @@
+import asyncio
+import threading
+
+import pytest
+
+from rag_py.query_executor import QueryExecutor
+
+
+def test_blocking_work_runs_off_the_event_loop():
+    executor = QueryExecutor(max_workers=2)
+    released = threading.Event()
+
+    async def scenario():
+        loop_thread = threading.get_ident()
+        blocked = asyncio.ensure_future(executor.run(released.wait, 5))
+        # The loop keeps serving while a worker thread blocks
+        worker_thread = await executor.run(threading.get_ident)
+        released.set()
+        return loop_thread, worker_thread, await blocked
+
+    try:
+        loop_thread, worker_thread, waited = asyncio.run(scenario())
+    finally:
+        executor.shutdown()
+
+    assert waited is True
+    assert worker_thread != loop_thread
+    stats = executor.stats()
+    assert (stats["completed"], stats["failed"], stats["queue_depth"], stats["running"]) == (2, 0, 0, 0)
+
+
+def test_errors_reach_the_caller_and_are_counted():
+    executor = QueryExecutor(max_workers=1)
+
+    def fail():
+        raise ValueError("bad query")
+
+    try:
+        with pytest.raises(ValueError, match="bad query"):
+            asyncio.run(executor.run(fail))
+    finally:
+        executor.shutdown()
+
+    assert executor.stats()["failed"] == 1
+
+
+def test_pool_size_defaults_to_the_worker_share_of_cores(monkeypatch):
+    monkeypatch.setenv("RAG_QUERY_THREADS", "")
+    monkeypatch.setenv("RAG_API_WORKERS", "1")
+    monkeypatch.setattr("os.cpu_count", lambda: 8)
+    executor = QueryExecutor()
+    executor.shutdown()
+
+    monkeypatch.setenv("RAG_QUERY_THREADS", "3")
+    sized = QueryExecutor()
+    sized.shutdown()
+
+    assert (executor.max_workers, sized.max_workers) == (8, 3)
@@ -0,0 +1,63 @@
+import asyncio
+import json
+
+from rag_py.rag_enhancements import ENHANCEMENT_MODE_COMBINED, ENHANCEMENT_MODE_SEPARATE, RAGEnhancementService
+
+
+def service(config=None, response_text=""):
+    """An enhancement service whose LLM answers every call with response_text."""
+    enhancement_service = RAGEnhancementService(config or {})
+
+    async def generate(prompt, max_tokens):
+        enhancement_service.llm_calls += 1
+        return {"text": response_text}
+
+    async def ensure_llm_initialized():
+        pass
+
+    enhancement_service._generate = generate
+    enhancement_service._ensure_llm_initialized = ensure_llm_initialized
+    return enhancement_service
+
+
+def entry(number, **fields):
+    return {"chunk": number, "summary": f"Summary {number}", "priority": 4, "topics": ["Pricing", " plans "], **fields}
+
+
+def test_separate_mode_is_the_default():
+    assert service().mode == ENHANCEMENT_MODE_SEPARATE
+    assert service({"enhancement_mode": ENHANCEMENT_MODE_COMBINED}).mode == ENHANCEMENT_MODE_COMBINED
+
+
+def test_combined_response_fills_every_chunk_in_one_call():
+    enhancement_service = service(response_text="```json\n" + json.dumps([entry(2), entry(1, priority="5 (crucial)")]) + "\n```")
+
+    results = asyncio.run(enhancement_service.generate_chunk_enhancements(["first", "second"]))
+
+    assert enhancement_service.llm_calls == 1
+    assert results == [
+        {"chunk_summary": "Summary 1", "chunk_priority": 5, "chunk_topics": ["pricing", "plans"], "chunk_topics_source": "llm"},
+        {"chunk_summary": "Summary 2", "chunk_priority": 4, "chunk_topics": ["pricing", "plans"], "chunk_topics_source": "llm"},
+    ]
+
+
+def test_malformed_combined_response_keeps_the_entries_it_can_parse():
+    # The second entry lacks topics and the response is cut off in the third
+    response_text = json.dumps(entry(1)) + ", " + json.dumps(entry(2, topics=None)) + ', {"chunk": 3, "summary": "Summ'
+    enhancement_service = service(response_text=response_text)
+
+    results = asyncio.run(enhancement_service.generate_chunk_enhancements(["first", "second", "third"]))
+
+    assert results[0]["chunk_summary"] == "Summary 1"
+    assert results[1:] == [None, None]
+
+
+def test_entries_without_chunk_numbers_are_matched_by_position():
+    enhancement_service = service(response_text=json.dumps([
+        {"summary": "First", "priority": 9, "topics": ["a"]},
+        {"summary": "Second", "priority": 2, "topics": ["b"]},
+    ]))
+
+    results = asyncio.run(enhancement_service.generate_chunk_enhancements(["first", "second"]))
+
+    assert [(result["chunk_summary"], result["chunk_priority"]) for result in results] == [("First", 3), ("Second", 2)]
@@ -0,0 +1,119 @@
+import asyncio
+import hashlib
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from rag_py.embedding_cache import EmbeddingCache
+from rag_py.rag_service import RagTrainer
+from rag_py.source_tracking import SOURCE_ID_FIELD
+from rag_py.vector_index import INDEX_HNSW, read_manifest
+
+DIMENSION = 16
+
+
+class RecordingEmbeddings:
+    """Embedding client with a fixed vector per text, recording each request's texts."""
+
+    model = "text-embedding-3-small"
+    dimensions = None
+    chunk_size = 1000
+
+    def __init__(self):
+        self.requests = []
+
+    async def aembed_documents(self, texts):
+        self.requests.append(list(texts))
+        return [
+            np.random.default_rng(int.from_bytes(hashlib.sha256(text.encode()).digest()[:4], "little"))
+            .standard_normal(DIMENSION).tolist()
+            for text in texts
+        ]
+
+
+@pytest.fixture
+def trainer(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    trainer = RagTrainer(tmp_path / "kb1", {"index_type": INDEX_HNSW, "chunk_size": 1000, "chunk_overlap": 0})
+    trainer.embedded = []
+    trainer.vectors = {}
+    rng = np.random.default_rng(0)
+
+    async def embed_texts(texts, progress=None):
+        # A random vector per text, recording what was embedded
+        trainer.embedded.extend(texts)
+        for text in texts:
+            trainer.vectors.setdefault(text, rng.standard_normal(DIMENSION, dtype=np.float32))
+        return np.stack([trainer.vectors[text] for text in texts])
+
+    monkeypatch.setattr(trainer, "_embed_texts", embed_texts)
+    return trainer
+
+
+def test_removing_sources_keeps_the_other_vectors_without_reembedding(trainer):
+    documents = [
+        Document(page_content=f"Document {source} says {i}", metadata={SOURCE_ID_FIELD: source})
+        for source in ("a", "b", "c")
+        for i in range(3)
+    ]
+
+    async def scenario():
+        await trainer.add_documents(documents)
+        embedded = len(trainer.embedded)
+        removed = await trainer.remove_sources(["b"])
+        return embedded, removed
+
+    embedded, removed = asyncio.run(scenario())
+
+    assert removed == 3
+    assert len(trainer.embedded) == embedded
+    store = trainer.vector_store
+    assert store.index.ntotal == len(store.index_to_docstore_id) == 6
+    # Every remaining chunk is still found at its own row
+    for row, chunk_id in store.index_to_docstore_id.items():
+        document = store.docstore.search(chunk_id)
+        assert document.metadata[SOURCE_ID_FIELD] != "b"
+        vector = trainer.vectors[document.page_content][np.newaxis]
+        assert store.index.search(vector, 1)[1][0][0] == row
+
+
+def test_training_embeds_each_chunk_once(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    trainer = RagTrainer(tmp_path / "kb1", {"chunk_size": 1000, "embedding_batch_size": 4, "embedding_cache": False})
+    trainer.embeddings = RecordingEmbeddings()
+    documents = [Document(page_content=f"Answer number {i}.", metadata={}) for i in range(10)]
+
+    asyncio.run(trainer.initialize(documents))
+
+    sent = [text for request in trainer.embeddings.requests for text in request]
+    assert sorted(sent) == sorted(document.page_content for document in documents)
+    assert [len(request) for request in trainer.embeddings.requests] == [4, 4, 2]
+    usage = read_manifest(tmp_path / "kb1")["embedding_usage"]
+    assert (usage["calls"], usage["texts"], usage["cache_hits"]) == (3, 10, 0)
+    assert usage["tokens"] > 0
+    # The index holds the vectors the API returned, not a second embedding of the chunks
+    store = trainer.vector_store
+    for row, chunk_id in store.index_to_docstore_id.items():
+        text = store.docstore.search(chunk_id).page_content
+        vector = np.asarray(asyncio.run(RecordingEmbeddings().aembed_documents([text])), dtype=np.float32)
+        assert store.index.search(vector, 1)[1][0][0] == row
+
+
+def test_retraining_and_other_knowledgebases_reuse_cached_embeddings(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    cache = EmbeddingCache(tmp_path / "embeddings.sqlite", max_bytes=1024 * 1024)
+    monkeypatch.setattr("rag_py.rag_service.get_embedding_cache", lambda: cache)
+    shared = Document(page_content="Support is open on weekdays.", metadata={})
+
+    first = RagTrainer(tmp_path / "kb1", {"chunk_size": 1000})
+    first.embeddings = RecordingEmbeddings()
+    asyncio.run(first.initialize([shared, Document(page_content="Prices start at ten dollars.", metadata={})]))
+    second = RagTrainer(tmp_path / "kb2", {"chunk_size": 1000})
+    second.embeddings = RecordingEmbeddings()
+    asyncio.run(second.initialize([shared, Document(page_content="Refunds take five days.", metadata={})]))
+
+    assert second.embeddings.requests == [["Refunds take five days."]]
+    assert (second.embedding_usage["texts"], second.embedding_usage["cache_hits"]) == (1, 1)
+    vector = np.asarray(asyncio.run(RecordingEmbeddings().aembed_documents([shared.page_content])), dtype=np.float32)
+    assert second.vector_store.index.search(vector, 1)[0][0][0] < 1e-6
@@ -0,0 +1,92 @@
+import shutil
+
+import faiss
+import numpy as np
+import pytest
+
+from rag_py import shard_search
+from rag_py.shard_search import ShardSearchPool, merge_shard_results
+
+DIMENSION = 16
+
+
+@pytest.fixture(autouse=True)
+def worker_indexes(monkeypatch):
+    """A fresh per-process shard cache, as in a newly started worker."""
+    monkeypatch.setattr(shard_search, "_worker_indexes", {})
+    return shard_search._worker_indexes
+
+
+def write_shards(store_path, shards):
+    (store_path / "shards").mkdir(parents=True)
+    paths = []
+    for shard, vectors in enumerate(shards):
+        index = faiss.IndexFlatL2(DIMENSION)
+        index.add(vectors)
+        path = store_path / "shards" / f"shard-{shard:03d}.faiss"
+        faiss.write_index(index, str(path))
+        paths.append(path)
+    return paths
+
+
+def test_merge_orders_by_distance_and_offsets_ids():
+    first = (np.array([[0.5, 2.0]], dtype=np.float32), np.array([[1, 0]]))
+    second = (np.array([[0.1, np.inf]], dtype=np.float32), np.array([[3, -1]]))
+
+    distances, ids = merge_shard_results([first, second], [0, 10], 3)
+
+    assert ids.tolist() == [[13, 1, 0]]
+    assert distances[0].tolist() == pytest.approx([0.1, 0.5, 2.0])
+
+
+def test_merge_pads_missing_results():
+    distances, ids = merge_shard_results([(np.array([[1.0]], dtype=np.float32), np.array([[0]]))], [5], 3)
+
+    assert ids.tolist() == [[5, -1, -1]]
+    assert distances[0, 1:].tolist() == [np.inf, np.inf]
+
+
+def test_pool_scatter_gather_matches_exact_search(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((300, DIMENSION), dtype=np.float32)
+    queries = rng.standard_normal((3, DIMENSION), dtype=np.float32)
+    paths = write_shards(tmp_path, [vectors[:100], vectors[100:180], vectors[180:]])
+    exact = faiss.IndexFlatL2(DIMENSION)
+    exact.add(vectors)
+
+    pool = ShardSearchPool(num_workers=2)
+    try:
+        _, ids = pool.search(paths, [0, 100, 180], queries, 5)
+    finally:
+        pool.shutdown()
+
+    assert ids.tolist() == exact.search(queries, 5)[1].tolist()
+    assert pool.stats()["shard_searches"] == 3
+
+
+def test_new_version_replaces_cached_shard(tmp_path, worker_indexes):
+    rng = np.random.default_rng(0)
+    query = rng.standard_normal((1, DIMENSION), dtype=np.float32)
+    kb_path = tmp_path / "kb1"
+    old_paths = write_shards(kb_path / "versions" / "v1", [rng.standard_normal((10, DIMENSION), dtype=np.float32)] * 2)
+    for path in old_paths:
+        shard_search._search_shard(str(path), query, 4, None)
+
+    new_paths = write_shards(kb_path / "versions" / "v2", [rng.standard_normal((10, DIMENSION), dtype=np.float32)] * 2)
+    shard_search._search_shard(str(new_paths[0]), query, 4, None)
+
+    assert len(worker_indexes) == 2
+    assert {path for path, _, _ in worker_indexes.values()} == {str(new_paths[0]), str(old_paths[1])}
+
+
+def test_deleted_versions_are_evicted(tmp_path, worker_indexes):
+    rng = np.random.default_rng(0)
+    query = rng.standard_normal((1, DIMENSION), dtype=np.float32)
+    deleted_path, = write_shards(tmp_path / "kb1" / "versions" / "v1", [rng.standard_normal((10, DIMENSION), dtype=np.float32)])
+    shard_search._search_shard(str(deleted_path), query, 4, None)
+    shutil.rmtree(tmp_path / "kb1")
+
+    other_path, = write_shards(tmp_path / "kb2" / "versions" / "v1", [rng.standard_normal((10, DIMENSION), dtype=np.float32)])
+    shard_search._search_shard(str(other_path), query, 4, None)
+
+    assert [path for path, _, _ in worker_indexes.values()] == [str(other_path)]
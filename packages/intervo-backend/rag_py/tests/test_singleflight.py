@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from rag_py.singleflight import SingleFlight
+
+
+def test_concurrent_calls_with_one_key_run_once():
+    group = SingleFlight("queries")
+    runs = []
+
+    async def search(query):
+        runs.append(query)
+        await asyncio.sleep(0.01)
+        return f"results for {query}"
+
+    async def scenario():
+        first = await asyncio.gather(*(group.do("kb1:pricing", lambda: search("pricing")) for _ in range(5)))
+        other = await group.do("kb1:refunds", lambda: search("refunds"))
+        # Nothing is cached once the call is done
+        again = await group.do("kb1:pricing", lambda: search("pricing"))
+        return first, other, again
+
+    first, other, again = asyncio.run(scenario())
+
+    assert first == ["results for pricing"] * 5
+    assert (other, again) == ("results for refunds", "results for pricing")
+    assert runs == ["pricing", "refunds", "pricing"]
+    assert group.stats() == {"calls": 7, "executions": 3, "deduplicated": 4, "in_flight": 0}
+
+
+def test_waiters_share_the_exception():
+    group = SingleFlight("loads")
+
+    async def load():
+        await asyncio.sleep(0.01)
+        raise ValueError("index missing")
+
+    async def scenario():
+        return await asyncio.gather(*(group.do("kb1", load) for _ in range(3)), return_exceptions=True)
+
+    errors = asyncio.run(scenario())
+
+    assert [str(error) for error in errors] == ["index missing"] * 3
+    assert group.stats()["executions"] == 1
+
+
+def test_a_cancelled_caller_does_not_cancel_the_others():
+    group = SingleFlight("loads")
+
+    async def load():
+        await asyncio.sleep(0.05)
+        return "index"
+
+    async def scenario():
+        impatient = asyncio.ensure_future(group.do("kb1", load))
+        patient = asyncio.ensure_future(group.do("kb1", load))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await impatient
+        return await patient
+
+    assert asyncio.run(scenario()) == "index"
@@ -0,0 +1,69 @@
+from rag_py.store_versions import (
+    VERSIONS_DIRNAME,
+    collect_garbage,
+    create_version,
+    current_version,
+    current_version_path,
+    discard_version,
+    publish_version
+)
+from rag_py.vector_index import INDEX_FILENAME
+
+
+def trained_version(kb_path, content, copy_current=False):
+    version_path = create_version(kb_path, copy_current)
+    (version_path / INDEX_FILENAME).write_text(content)
+    return version_path
+
+
+def test_publishing_swaps_the_served_version(tmp_path):
+    first = trained_version(tmp_path, "first")
+    assert current_version_path(tmp_path) is None
+
+    publish_version(tmp_path, first)
+    # A run in progress is not served until it is published
+    second = trained_version(tmp_path, "second")
+    assert current_version_path(tmp_path) == first
+
+    publish_version(tmp_path, second)
+    assert current_version(tmp_path) == second.name
+    assert (current_version_path(tmp_path) / INDEX_FILENAME).read_text() == "second"
+    assert list(tmp_path.glob("*.tmp")) == []
+
+
+def test_unversioned_stores_are_served_and_seed_the_first_version(tmp_path):
+    (tmp_path / INDEX_FILENAME).write_text("unversioned")
+    assert current_version_path(tmp_path) == tmp_path
+
+    version_path = create_version(tmp_path, copy_current=True)
+    publish_version(tmp_path, version_path)
+    collect_garbage(tmp_path)
+
+    assert (version_path / INDEX_FILENAME).read_text() == "unversioned"
+    assert not (tmp_path / INDEX_FILENAME).exists()
+
+
+def test_garbage_collection_keeps_recent_and_in_progress_versions(tmp_path):
+    published = []
+    for i in range(4):
+        published.append(trained_version(tmp_path, f"run {i}", copy_current=True))
+        publish_version(tmp_path, published[-1])
+    in_progress = trained_version(tmp_path, "run 4")
+
+    removed = collect_garbage(tmp_path, keep=2)
+
+    assert removed == [published[0].name, published[1].name]
+    remaining = sorted(path.name for path in (tmp_path / VERSIONS_DIRNAME).iterdir())
+    assert remaining == [published[2].name, published[3].name, in_progress.name]
+
+
+def test_discarding_never_removes_the_published_version(tmp_path):
+    published = trained_version(tmp_path, "published")
+    publish_version(tmp_path, published)
+    failed = trained_version(tmp_path, "failed")
+
+    discard_version(failed)
+    discard_version(published)
+
+    assert not failed.exists()
+    assert published.exists()
@@ -0,0 +1,66 @@
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import FakeEmbeddings
+
+from rag_py.tenant_index import TenantIndex
+
+DIMENSION = 8
+EMBEDDINGS = FakeEmbeddings(size=DIMENSION)
+
+
+def flat_store(tenant, vectors):
+    index = faiss.IndexFlatL2(DIMENSION)
+    index.add(vectors)
+    ids = [f"{tenant}-{i}" for i in range(len(vectors))]
+    docstore = InMemoryDocstore({chunk_id: Document(page_content=chunk_id) for chunk_id in ids})
+    return FAISS(EMBEDDINGS, index, docstore, dict(enumerate(ids)))
+
+
+def nearest(tenant_index, tenant, vector, k=3):
+    store = tenant_index.vector_store(tenant, EMBEDDINGS)
+    return [document.page_content for document, _ in store.similarity_search_with_score_by_vector(vector.tolist(), k)]
+
+
+def test_tenants_only_find_their_own_vectors(tmp_path):
+    rng = np.random.default_rng(0)
+    vectors = {tenant: rng.standard_normal((4, DIMENSION), dtype=np.float32) for tenant in ("kb1", "kb2")}
+    tenant_index = TenantIndex(tmp_path, max_tenant_chunks=10, pool_max_vectors=100)
+    for tenant, tenant_vectors in vectors.items():
+        tenant_index.put_tenant(tenant, flat_store(tenant, tenant_vectors))
+
+    # kb2's closest vector is kb1's; kb2 still only gets its own chunks
+    assert nearest(tenant_index, "kb2", vectors["kb1"][0])[0].startswith("kb2-")
+    assert nearest(tenant_index, "kb1", vectors["kb1"][2], k=1) == ["kb1-2"]
+    assert nearest(tenant_index, "kb2", vectors["kb2"][3], k=1) == ["kb2-3"]
+    assert tenant_index.stats()["pools"]["pool-0000"] == {"tenants": 2, "vectors": 8, "dimension": DIMENSION}
+
+
+def test_updating_a_tenant_leaves_the_others_in_place(tmp_path):
+    rng = np.random.default_rng(1)
+    kb1, kb2 = (rng.standard_normal((3, DIMENSION), dtype=np.float32) for _ in range(2))
+    tenant_index = TenantIndex(tmp_path, max_tenant_chunks=10, pool_max_vectors=100)
+    tenant_index.put_tenant("kb1", flat_store("kb1", kb1))
+    tenant_index.put_tenant("kb2", flat_store("kb2", kb2))
+    kb2_rows = dict(tenant_index._pools["pool-0000"].tenants["kb2"])
+    stale_view = tenant_index.vector_store("kb1", EMBEDDINGS)
+
+    updated = rng.standard_normal((2, DIMENSION), dtype=np.float32)
+    tenant_index.put_tenant("kb1", flat_store("kb1", updated))
+
+    assert tenant_index._pools["pool-0000"].tenants["kb2"] == kb2_rows
+    assert nearest(tenant_index, "kb2", kb2[1], k=1) == ["kb2-1"]
+    assert nearest(tenant_index, "kb1", updated[1], k=1) == ["kb1-1"]
+    # A view of the old copy finds nothing rather than the new copy's chunks
+    assert stale_view.similarity_search_with_score_by_vector(kb1[1].tolist(), 1) == []
+
+    writable = tenant_index.writable_store("kb1", EMBEDDINGS)
+    np.testing.assert_array_equal(writable.index.reconstruct_n(0, 2), updated)
+    assert writable.index_to_docstore_id == {0: "kb1-0", 1: "kb1-1"}
+
+    tenant_index.remove_tenant("kb1")
+    assert not tenant_index.has_tenant("kb1")
+    assert tenant_index.stats()["vectors"] == 3
+    assert TenantIndex(tmp_path).has_tenant("kb2")
@@ -0,0 +1,141 @@
+import asyncio
+from collections import defaultdict
+
+from rag_py.training_jobs import (
+    JOB_CANCELLED,
+    JOB_KIND_TRAIN,
+    JOB_KIND_UPDATE_INDEX,
+    JOB_SUCCEEDED,
+    TrainingJobQueue
+)
+
+
+class Runner:
+    """Records the jobs run and how many ran at once; each run waits for release()."""
+
+    def __init__(self):
+        self.runs = []
+        self.running = 0
+        self.most_running = 0
+        self.released = asyncio.Event()
+
+    async def __call__(self, job):
+        self.runs.append((job.id, job.kind, job.config, job.requests))
+        self.running += 1
+        self.most_running = max(self.most_running, self.running)
+        try:
+            await self.released.wait()
+        finally:
+            self.running -= 1
+        return {"status": "success"}
+
+
+def worker_queue(jobs_dir, runner):
+    """A queue as one API worker has it, with its own in-process locks."""
+    return TrainingJobQueue(runner, defaultdict(asyncio.Lock).__getitem__, jobs_dir, 2, 3600)
+
+
+async def until(condition):
+    for _ in range(200):
+        if condition():
+            return
+        await asyncio.sleep(0.01)
+    raise AssertionError("condition not reached")
+
+
+def test_requests_coalesce_into_the_waiting_job(tmp_path):
+    async def scenario():
+        runner = Runner()
+        queue = worker_queue(tmp_path, runner)
+        running, _ = queue.submit("kb1", {"chunk_size": 100}, None)
+        await until(lambda: runner.running == 1)
+
+        waiting, coalesced = queue.submit("kb1", None, None, JOB_KIND_UPDATE_INDEX)
+        assert not coalesced
+        joined, coalesced = queue.submit("kb1", {"chunk_size": 200}, "prompt")
+        assert coalesced and joined["job_id"] == waiting["job_id"]
+
+        runner.released.set()
+        await until(lambda: queue.get(waiting["job_id"])["status"] == JOB_SUCCEEDED)
+        return runner, queue, running, waiting
+
+    runner, queue, running, waiting = asyncio.run(scenario())
+
+    assert runner.runs == [
+        (running["job_id"], JOB_KIND_TRAIN, {"chunk_size": 100}, 1),
+        (waiting["job_id"], JOB_KIND_TRAIN, {"chunk_size": 200}, 2),
+    ]
+    assert queue.stats()["coalesced"] == 1
+
+
+def test_workers_share_the_knowledgebase_lock_and_waiting_job(tmp_path):
+    async def scenario():
+        runner = Runner()
+        first_worker = worker_queue(tmp_path, runner)
+        second_worker = worker_queue(tmp_path, runner)
+        running, _ = first_worker.submit("kb1", {"chunk_size": 100}, None)
+        await until(lambda: runner.running == 1)
+
+        # Waits for the first worker's run instead of building a version alongside it
+        waiting, coalesced = second_worker.submit("kb1", None, None, JOB_KIND_UPDATE_INDEX)
+        assert not coalesced
+        await asyncio.sleep(0.2)
+        assert second_worker.get(waiting["job_id"])["status"] == "queued"
+
+        joined, coalesced = first_worker.submit("kb1", {"chunk_size": 200}, None)
+        assert coalesced and joined["job_id"] == waiting["job_id"]
+
+        runner.released.set()
+        await until(lambda: first_worker.get(waiting["job_id"])["status"] == JOB_SUCCEEDED)
+        return runner, running, waiting
+
+    runner, running, waiting = asyncio.run(scenario())
+
+    assert runner.most_running == 1
+    assert runner.runs == [
+        (running["job_id"], JOB_KIND_TRAIN, {"chunk_size": 100}, 1),
+        (waiting["job_id"], JOB_KIND_TRAIN, {"chunk_size": 200}, 2),
+    ]
+
+
+def test_cancel_through_another_worker_stops_waiting_job(tmp_path):
+    async def scenario():
+        runner = Runner()
+        first_worker = worker_queue(tmp_path, runner)
+        second_worker = worker_queue(tmp_path, runner)
+        first_worker.submit("kb1", {}, None)
+        await until(lambda: runner.running == 1)
+        waiting, _ = second_worker.submit("kb1", {}, None)
+
+        assert first_worker.cancel(waiting["job_id"])["cancel_requested"]
+        runner.released.set()
+        await until(lambda: second_worker.get(waiting["job_id"])["status"] == JOB_CANCELLED)
+
+        # The cancelled job no longer takes requests
+        _, coalesced = first_worker.submit("kb1", {}, None)
+        return runner, waiting, coalesced
+
+    runner, waiting, coalesced = asyncio.run(scenario())
+
+    assert waiting["job_id"] not in [job_id for job_id, _, _, _ in runner.runs]
+    assert not coalesced
+
+
+def test_latest_job_of_a_kind(tmp_path):
+    async def scenario():
+        runner = Runner()
+        first_worker = worker_queue(tmp_path, runner)
+        second_worker = worker_queue(tmp_path, runner)
+        training, _ = first_worker.submit("kb1", {}, None)
+        await until(lambda: runner.running == 1)
+        update, _ = second_worker.submit("kb1", None, None, JOB_KIND_UPDATE_INDEX)
+        runner.released.set()
+        return training, update
+
+    training, update = asyncio.run(scenario())
+    queue = worker_queue(tmp_path, Runner())
+
+    assert queue.latest("kb1")["job_id"] == update["job_id"]
+    assert queue.latest("kb1", JOB_KIND_TRAIN)["job_id"] == training["job_id"]
+    assert queue.latest("kb1", "../kb1") is None
+    assert queue.latest("kb2") is None
@@ -0,0 +1,171 @@
+import os
+import subprocess
+import sys
+import uuid
+
+import faiss
+import numpy as np
+import pytest
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+from rag_py.vector_index import (
+    INDEX_FLAT,
+    INDEX_HNSW,
+    INDEX_IVF_PQ,
+    INDEX_FILENAME,
+    LOAD_MODE_MEMORY,
+    LOAD_MODE_MMAP,
+    apply_search_params,
+    build_index,
+    build_sharded_index,
+    choose_index_type,
+    load_faiss_store,
+    mmap_io_flags,
+    remove_rows,
+    save_faiss_store
+)
+
+DIMENSION = 32
+CONFIG = {"ivf_nlist": 16, "pq_m": 8, "hnsw_m": 8}
+
+
+def vectors(count, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, DIMENSION), dtype=np.float32)
+
+
+def save_store(path, index_type, data):
+    index, _, _ = build_index(data, index_type, CONFIG)
+    index.add(data)
+    ids = [str(uuid.uuid4()) for _ in range(len(data))]
+    docstore = InMemoryDocstore({doc_id: Document(page_content=f"chunk {i}") for i, doc_id in enumerate(ids)})
+    save_faiss_store(FAISS(None, index, docstore, dict(enumerate(ids))), path)
+
+
+def test_auto_index_type_follows_corpus_size():
+    thresholds = {"hnsw_min_chunks": 100, "ivf_pq_min_chunks": 1000}
+
+    assert [choose_index_type(n, thresholds) for n in (99, 100, 999, 1000)] == [
+        INDEX_FLAT, INDEX_HNSW, INDEX_HNSW, INDEX_IVF_PQ
+    ]
+    assert choose_index_type(10, {"index_type": "HNSW"}) == INDEX_HNSW
+    with pytest.raises(ValueError):
+        choose_index_type(10, {"index_type": "lsh"})
+
+
+@pytest.mark.parametrize("index_type", [INDEX_FLAT, INDEX_HNSW, INDEX_IVF_PQ])
+def test_index_types_find_the_nearest_vectors(index_type):
+    data = vectors(2000)
+    index, built_type, search_params = build_index(data, index_type, CONFIG)
+    index.add(data)
+    apply_search_params(index, search_params)
+
+    found = index.search(data[:100] + 0.01, 1)[1][:, 0]
+
+    assert built_type == index_type
+    assert np.mean(found == np.arange(100)) >= 0.9
+
+
+def test_ivf_pq_falls_back_to_hnsw_on_small_corpora():
+    index, built_type, search_params = build_index(vectors(100), INDEX_IVF_PQ, CONFIG)
+
+    assert built_type == INDEX_HNSW
+    assert isinstance(index, faiss.IndexHNSW)
+    assert search_params == {"efSearch": 64}
+
+
+@pytest.mark.parametrize("index_type", [INDEX_FLAT, INDEX_HNSW, INDEX_IVF_PQ])
+def test_mmap_load_searches_like_memory_load(tmp_path, index_type):
+    save_store(tmp_path, index_type, vectors(1000))
+    queries = vectors(5, seed=1)
+
+    in_memory = load_faiss_store(tmp_path, None, LOAD_MODE_MEMORY)
+    mapped = load_faiss_store(tmp_path, None, LOAD_MODE_MMAP)
+
+    assert mapped.index.ntotal == 1000
+    np.testing.assert_array_equal(mapped.index.search(queries, 4)[1], in_memory.index.search(queries, 4)[1])
+    assert mapped.docstore.search(mapped.index_to_docstore_id[0]).page_content == "chunk 0"
+
+
+def test_ivf_lists_are_mapped_without_precomputed_table(tmp_path):
+    save_store(tmp_path, INDEX_IVF_PQ, vectors(1000))
+
+    assert mmap_io_flags(tmp_path / INDEX_FILENAME) & faiss.IO_FLAG_MMAP == faiss.IO_FLAG_MMAP
+    vector_store = load_faiss_store(tmp_path, None, LOAD_MODE_MMAP)
+    index = faiss.downcast_index(vector_store.index)
+    assert isinstance(faiss.downcast_InvertedLists(index.invlists), faiss.OnDiskInvertedLists)
+    assert index.precomputed_table.size() == 0
+
+
+def search_exhaustively(index, queries, k):
+    sub_indexes = [faiss.downcast_index(index.at(i)) for i in range(index.count())] if isinstance(index, faiss.IndexShards) else [index]
+    for sub_index in sub_indexes:
+        if isinstance(sub_index, faiss.IndexIVF):
+            sub_index.nprobe = sub_index.nlist
+        if isinstance(sub_index, faiss.IndexHNSW):
+            sub_index.hnsw.efSearch = 1000
+    return index.search(queries, k)[1]
+
+
+@pytest.mark.parametrize("index_type", [INDEX_FLAT, INDEX_HNSW, INDEX_IVF_PQ, "sharded"])
+def test_removed_rows_leave_the_others_renumbered(index_type):
+    data = vectors(1000)
+    queries = vectors(5, seed=1)
+    if index_type == "sharded":
+        index, _, _ = build_sharded_index(data, 3, CONFIG)
+    else:
+        index, _, _ = build_index(data, index_type, CONFIG)
+    index.add(data)
+    before = search_exhaustively(index, queries, 1000)
+    removed = np.random.default_rng(2).choice(1000, 250, replace=False)
+    kept = np.setdiff1d(np.arange(1000), removed)
+
+    remove_rows(index, removed.tolist())
+
+    assert index.ntotal == 750
+    # The same neighbours in the same order, under their new row IDs
+    expected = [[int(np.searchsorted(kept, row)) for row in rows if row in kept][:20] for rows in before]
+    assert search_exhaustively(index, queries, 20).tolist() == expected
+
+
+# Reads an index in a fresh process and prints the private heap it allocated, in KB
+HEAP_PROBE = """
+import sys
+import faiss
+
+def heap_kb():
+    with open("/proc/self/status") as f:
+        return next(int(line.split()[1]) for line in f if line.startswith("RssAnon:"))
+
+before = heap_kb()
+index = faiss.read_index(sys.argv[1], int(sys.argv[2]))
+print(heap_kb() - before)
+"""
+
+
+def heap_after_read_kb(path, io_flags):
+    output = subprocess.run(
+        [sys.executable, "-c", HEAP_PROBE, str(path), str(io_flags)],
+        check=True,
+        capture_output=True,
+        text=True
+    ).stdout
+    return int(output.strip().splitlines()[-1])
+
+
+@pytest.mark.skipif(not os.path.exists("/proc/self/status"), reason="needs /proc to read resident memory")
+@pytest.mark.parametrize("index_type", [INDEX_FLAT, INDEX_HNSW, INDEX_IVF_PQ])
+def test_mmap_load_leaves_index_out_of_worker_heap(tmp_path, index_type):
+    # What each API worker holds on its own; mapped pages are shared through the page cache
+    data = np.random.default_rng(0).standard_normal((10_000, 128), dtype=np.float32)
+    index, _, _ = build_index(data, index_type, {"ivf_nlist": 256, "pq_m": 16, "ivf_train_size": 10_000, "hnsw_m": 16})
+    index.add(data)
+    path = tmp_path / INDEX_FILENAME
+    faiss.write_index(index, str(path))
+
+    in_memory_kb = heap_after_read_kb(path, 0)
+    mapped_kb = heap_after_read_kb(path, mmap_io_flags(path))
+
+    assert in_memory_kb > 2 * 1024
+    assert mapped_kb < in_memory_kb / 4
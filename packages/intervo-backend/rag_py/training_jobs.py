@@ -0,0 +1,529 @@
+import asyncio
+import fcntl
+import json
+import logging
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import IO, Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Job kinds: a full training run, or an incremental update after documents changed
+JOB_KIND_TRAIN = "train"
+JOB_KIND_UPDATE_INDEX = "update_index"
+
+# Job states
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+FINISHED_STATES = (JOB_SUCCEEDED, JOB_FAILED, JOB_CANCELLED)
+
+# Stages of a training run, in order
+STAGE_LOADING_DOCUMENTS = "loading_documents"
+STAGE_EMBEDDING = "embedding"
+STAGE_ENHANCING = "enhancing"
+STAGE_SAVING = "saving"
+
+# Once saving has started the new version is being published, so the job runs to the end
+UNCANCELLABLE_STAGES = (STAGE_SAVING,)
+
+# Directory, under the vector stores directory, holding job snapshots shared by all API workers
+JOBS_DIRNAME = "_jobs"
+
+# Directory, under the jobs directory, of per-knowledgebase lock files and queued-job markers; never pruned
+LOCKS_DIRNAME = "locks"
+
+# How often a job waits before checking again whether another worker's run of its knowledgebase has finished
+LOCK_POLL_SECONDS = 0.5
+
+# Most frequent snapshot writes and cancel checks while a stage reports progress
+SNAPSHOT_INTERVAL_SECONDS = 1.0
+
+
+def _timestamp(value: Optional[float]) -> Optional[str]:
+    return datetime.fromtimestamp(value).isoformat() if value else None
+
+
+class TrainingJob:
+    """
+    A training run or index update of one knowledgebase, with its progress stage by stage.
+
+    Each stage records how many of its items (documents, chunks) are done
+    out of how many, from which an ETA for the stage is estimated.
+    """
+
+    def __init__(
+        self,
+        knowledgebase_id: str,
+        config: Optional[Dict[str, Any]],
+        agent_prompt: Optional[str],
+        kind: str = JOB_KIND_TRAIN
+    ):
+        """
+        Initialize a queued job.
+
+        Args:
+            knowledgebase_id: Knowledgebase to train
+            config: Trainer configuration; None for index updates, which reuse the trained one
+            agent_prompt: Agent prompt chunk priorities are judged against, if any
+            kind: JOB_KIND_TRAIN or JOB_KIND_UPDATE_INDEX
+        """
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.knowledgebase_id = knowledgebase_id
+        self.config = config
+        self.agent_prompt = agent_prompt
+        self.status = JOB_QUEUED
+        self.stage: Optional[str] = None
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        # Requests served by this run, counting those coalesced into it
+        self.requests = 1
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.cancel_requested = False
+        self._task: Optional[asyncio.Task] = None
+        self._on_update: Optional[Callable[["TrainingJob", bool], None]] = None
+
+    def begin_stage(self, stage: str, total: Optional[int] = None) -> None:
+        """
+        Finish the current stage and start the next one.
+
+        Args:
+            stage: Stage name (one of the STAGE_* constants)
+            total: Items the stage will process, if known
+        """
+        self._finish_stage()
+        self.stage = stage
+        self.stages[stage] = {"done": 0, "total": total, "started_at": time.time(), "finished_at": None}
+        self._updated(force=True)
+
+    def progress(self, done: int, total: Optional[int] = None) -> None:
+        """
+        Report the items of the current stage done so far.
+
+        Args:
+            done: Items done
+            total: Items the stage will process, if it changed or was not known yet
+        """
+        current = self.stages.get(self.stage)
+        if current is None:
+            return
+        current["done"] = done
+        if total is not None:
+            current["total"] = total
+        self._updated()
+
+    def _finish_stage(self) -> None:
+        current = self.stages.get(self.stage)
+        if current is not None and current["finished_at"] is None:
+            current["finished_at"] = time.time()
+            if current["total"] is not None:
+                current["done"] = current["total"]
+
+    def _updated(self, force: bool = False) -> None:
+        if self._on_update is not None:
+            self._on_update(self, force)
+
+    def eta_seconds(self) -> Optional[float]:
+        """Seconds the current stage should still take at its rate so far, if it can be told."""
+        current = self.stages.get(self.stage)
+        if self.status != JOB_RUNNING or current is None or not current["total"] or not current["done"]:
+            return None
+        elapsed = time.time() - current["started_at"]
+        return round(elapsed / current["done"] * (current["total"] - current["done"]), 1)
+
+    @property
+    def cancellable(self) -> bool:
+        return self.status == JOB_QUEUED or (self.status == JOB_RUNNING and self.stage not in UNCANCELLABLE_STAGES)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Return the job's state, progress and, once finished, its result or error."""
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "knowledgebase_id": self.knowledgebase_id,
+            "status": self.status,
+            "stage": self.stage,
+            "stages": {
+                stage: {
+                    "done": record["done"],
+                    "total": record["total"],
+                    "started_at": _timestamp(record["started_at"]),
+                    "finished_at": _timestamp(record["finished_at"]),
+                    "seconds": round((record["finished_at"] or time.time()) - record["started_at"], 1)
+                }
+                for stage, record in self.stages.items()
+            },
+            "eta_seconds": self.eta_seconds(),
+            "cancellable": self.cancellable,
+            "cancel_requested": self.cancel_requested,
+            "requests": self.requests,
+            "created_at": _timestamp(self.created_at),
+            "started_at": _timestamp(self.started_at),
+            "finished_at": _timestamp(self.finished_at),
+            "result": self.result,
+            "error": self.error
+        }
+
+
+class TrainingJobQueue:
+    """
+    Run training jobs in the background, one at a time per knowledgebase.
+
+    A request for a knowledgebase that already has a job waiting to start
+    is coalesced into that job instead of queueing another run: a train
+    request with the latest request's config and agent prompt, turning a
+    waiting index update into a training run, and an index update as is,
+    since a waiting run of either kind picks up every document change. A
+    request arriving once the job has started queues a new one, since
+    documents may have changed.
+    At most max_concurrent jobs run at once across knowledgebases.
+
+    Job snapshots are written to jobs_dir so that any API worker can report
+    a job's progress, and cancelling through another worker leaves a marker
+    the owning worker picks up. Finished jobs are forgotten after
+    retention_seconds.
+
+    Runs of a knowledgebase are also serialized across API workers with a
+    lock file per knowledgebase under jobs_dir. The worker whose job is
+    waiting to start keeps a marker there, so requests reaching other
+    workers are coalesced into it too: they leave their config and agent
+    prompt in a request file the owning worker applies when the job starts.
+    """
+
+    def __init__(
+        self,
+        runner: Callable[[TrainingJob], Awaitable[Dict[str, Any]]],
+        knowledgebase_lock: Callable[[str], asyncio.Lock],
+        jobs_dir: Path,
+        max_concurrent: int,
+        retention_seconds: float
+    ):
+        """
+        Initialize the queue.
+
+        Args:
+            runner: Trains or updates the job's knowledgebase, reporting progress on the job, and returns its result
+            knowledgebase_lock: Returns this worker's lock serializing index changes of a knowledgebase
+            jobs_dir: Directory of the job snapshots
+            max_concurrent: Most jobs running at once
+            retention_seconds: How long finished jobs can still be looked up
+        """
+        self.runner = runner
+        self.knowledgebase_lock = knowledgebase_lock
+        self.jobs_dir = Path(jobs_dir)
+        self.locks_dir = self.jobs_dir / LOCKS_DIRNAME
+        self.locks_dir.mkdir(parents=True, exist_ok=True)
+        self.max_concurrent = max_concurrent
+        self.retention_seconds = retention_seconds
+        self._slots = asyncio.Semaphore(max_concurrent)
+        self._jobs: Dict[str, TrainingJob] = {}
+        self._pending: Dict[str, TrainingJob] = {}
+        self._written_at: Dict[str, float] = {}
+        # Open queued-job markers of this worker's pending jobs, share-locked while the job waits
+        self._markers: Dict[str, IO[str]] = {}
+        self.submitted = 0
+        self.coalesced = 0
+        self.finished = {state: 0 for state in FINISHED_STATES}
+
+    def submit(
+        self,
+        knowledgebase_id: str,
+        config: Optional[Dict[str, Any]],
+        agent_prompt: Optional[str],
+        kind: str = JOB_KIND_TRAIN
+    ) -> Tuple[Dict[str, Any], bool]:
+        """
+        Queue a training run or index update, or coalesce the request into the run already waiting for this knowledgebase.
+
+        Returns:
+            Tuple of (the job's snapshot, whether the request was coalesced into an existing job)
+        """
+        self._prune()
+        self.submitted += 1
+        with self._queue_lock(knowledgebase_id):
+            job = self._pending.get(knowledgebase_id)
+            if job is not None:
+                if kind == JOB_KIND_TRAIN:
+                    job.kind = JOB_KIND_TRAIN
+                    job.config = config
+                    job.agent_prompt = agent_prompt
+                    self._record_latest(job.id, knowledgebase_id, kind)
+                job.requests += 1
+                self.coalesced += 1
+                self._write_snapshot(job)
+                logger.info(f"Coalesced {kind} request for knowledgebase {knowledgebase_id} into job {job.id}")
+                return job.to_dict(), True
+
+            job_id = self._queued_elsewhere(knowledgebase_id)
+            snapshot = self._read_snapshot(job_id) if job_id else None
+            if snapshot is not None:
+                self._add_request(job_id, config, agent_prompt, kind)
+                if kind == JOB_KIND_TRAIN:
+                    self._record_latest(job_id, knowledgebase_id, kind)
+                self.coalesced += 1
+                logger.info(f"Coalesced {kind} request for knowledgebase {knowledgebase_id} into job {job_id} of another worker")
+                return snapshot, True
+
+            job = TrainingJob(knowledgebase_id, config, agent_prompt, kind)
+            job._on_update = self._job_updated
+            self._jobs[job.id] = job
+            self._pending[knowledgebase_id] = job
+            self._write_snapshot(job)
+            self._record_latest(job.id, knowledgebase_id, kind)
+            self._mark_queued(job)
+        job._task = asyncio.create_task(self._run(job))
+        logger.info(f"Queued {kind} job {job.id} for knowledgebase {knowledgebase_id}")
+        return job.to_dict(), False
+
+    @asynccontextmanager
+    async def index_update_lock(self, knowledgebase_id: str) -> AsyncIterator[None]:
+        """
+        Hold a knowledgebase's index update lock, in this worker and across API workers.
+
+        This worker's lock keeps its own jobs in order; the knowledgebase's
+        lock file then waits out runs of other workers, which build their
+        versions in the same directory.
+        """
+        async with self.knowledgebase_lock(knowledgebase_id):
+            with open(self.locks_dir / f"{knowledgebase_id}.lock", "a") as lock_file:
+                # Polled rather than blocking, so a waiting job can still be cancelled
+                while True:
+                    try:
+                        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                        break
+                    except BlockingIOError:
+                        await asyncio.sleep(LOCK_POLL_SECONDS)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    async def _run(self, job: TrainingJob) -> None:
+        try:
+            async with self.index_update_lock(job.knowledgebase_id):
+                async with self._slots:
+                    # From here on new requests need a run of their own
+                    self._start(job)
+                    logger.info(f"Started training job {job.id} for knowledgebase {job.knowledgebase_id}")
+                    job.result = await self.runner(job)
+                    job._finish_stage()
+                    job.status = JOB_SUCCEEDED
+        except asyncio.CancelledError:
+            job.status = JOB_CANCELLED
+            logger.info(f"Cancelled training job {job.id} for knowledgebase {job.knowledgebase_id}")
+        except Exception as e:
+            job.status = JOB_FAILED
+            job.error = str(e)
+            logger.error(f"Training job {job.id} for knowledgebase {job.knowledgebase_id} failed: {e}")
+        finally:
+            with self._queue_lock(job.knowledgebase_id):
+                if self._pending.get(job.knowledgebase_id) is job:
+                    del self._pending[job.knowledgebase_id]
+                    self._unmark_queued(job)
+            job.finished_at = time.time()
+            if job.status in self.finished:
+                self.finished[job.status] += 1
+            self._write_snapshot(job)
+            (self.jobs_dir / f"{job.id}.cancel").unlink(missing_ok=True)
+            (self.jobs_dir / f"{job.id}.requests.json").unlink(missing_ok=True)
+
+    def _start(self, job: TrainingJob) -> None:
+        """
+        Stop coalescing requests into the job, taking in those other workers left for it, and mark it running.
+
+        Raises:
+            asyncio.CancelledError: If the job was cancelled through another worker while waiting
+        """
+        with self._queue_lock(job.knowledgebase_id):
+            if self._pending.get(job.knowledgebase_id) is job:
+                del self._pending[job.knowledgebase_id]
+                self._unmark_queued(job)
+            requests_path = self.jobs_dir / f"{job.id}.requests.json"
+            try:
+                requests = json.loads(requests_path.read_text())
+            except (OSError, ValueError):
+                requests = None
+            requests_path.unlink(missing_ok=True)
+        if requests is not None:
+            if requests["kind"] == JOB_KIND_TRAIN:
+                job.kind = JOB_KIND_TRAIN
+                job.config = requests["config"]
+                job.agent_prompt = requests["agent_prompt"]
+            job.requests += requests["requests"]
+        if (self.jobs_dir / f"{job.id}.cancel").exists():
+            # Cancelled through another worker while it was waiting
+            job.cancel_requested = True
+            raise asyncio.CancelledError
+        job.status = JOB_RUNNING
+        job.started_at = time.time()
+        self._write_snapshot(job)
+
+    @contextmanager
+    def _queue_lock(self, knowledgebase_id: str) -> Iterator[None]:
+        """Lock the knowledgebase's queued-job marker and request files across API workers, briefly."""
+        with open(self.locks_dir / f"{knowledgebase_id}.queue.lock", "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _mark_queued(self, job: TrainingJob) -> None:
+        """Record the job as the knowledgebase's waiting one, holding the marker open for as long as it waits."""
+        marker = open(self.locks_dir / f"{job.knowledgebase_id}.queued", "w")
+        marker.write(job.id)
+        marker.flush()
+        fcntl.flock(marker, fcntl.LOCK_SH)
+        self._markers[job.knowledgebase_id] = marker
+
+    def _unmark_queued(self, job: TrainingJob) -> None:
+        marker = self._markers.pop(job.knowledgebase_id, None)
+        if marker is not None:
+            (self.locks_dir / f"{job.knowledgebase_id}.queued").unlink(missing_ok=True)
+            marker.close()
+
+    def _queued_elsewhere(self, knowledgebase_id: str) -> Optional[str]:
+        """Return the ID of a job another worker has waiting for the knowledgebase, if any."""
+        path = self.locks_dir / f"{knowledgebase_id}.queued"
+        try:
+            with open(path) as marker:
+                try:
+                    fcntl.flock(marker, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return marker.read().strip()
+        except FileNotFoundError:
+            return None
+        # Nobody holds the marker: left behind by a worker that exited before starting its job
+        path.unlink(missing_ok=True)
+        return None
+
+    def _add_request(
+        self,
+        job_id: str,
+        config: Optional[Dict[str, Any]],
+        agent_prompt: Optional[str],
+        kind: str
+    ) -> None:
+        """Leave a coalesced request for the worker owning the job, the latest train request's config winning."""
+        path = self.jobs_dir / f"{job_id}.requests.json"
+        try:
+            requests = json.loads(path.read_text())
+        except (OSError, ValueError):
+            requests = {"kind": JOB_KIND_UPDATE_INDEX, "config": None, "agent_prompt": None, "requests": 0}
+        if kind == JOB_KIND_TRAIN:
+            requests.update(kind=JOB_KIND_TRAIN, config=config, agent_prompt=agent_prompt)
+        requests["requests"] += 1
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps(requests, ensure_ascii=False, default=str))
+        os.replace(tmp_path, path)
+
+    def _record_latest(self, job_id: str, knowledgebase_id: str, kind: str) -> None:
+        """Record the job as the knowledgebase's most recent one, overall and of its kind."""
+        (self.jobs_dir / f"latest-{knowledgebase_id}").write_text(job_id)
+        (self.jobs_dir / f"latest-{kind}-{knowledgebase_id}").write_text(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Return a job's snapshot, also for jobs run by another API worker."""
+        job = self._jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        return self._read_snapshot(job_id)
+
+    def latest(self, knowledgebase_id: str, kind: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Return the snapshot of the knowledgebase's most recently queued job, of the given kind if any, by any worker."""
+        if kind not in (None, JOB_KIND_TRAIN, JOB_KIND_UPDATE_INDEX):
+            return None
+        name = f"latest-{kind}-{knowledgebase_id}" if kind else f"latest-{knowledgebase_id}"
+        try:
+            job_id = (self.jobs_dir / name).read_text().strip()
+        except OSError:
+            return None
+        return self.get(job_id)
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Cancel a queued or running job.
+
+        A job being saved cannot be cancelled any more, and neither can a
+        finished one; their snapshot is returned unchanged with
+        "cancellable" false.
+
+        Returns:
+            The job's snapshot, or None if there is no such job
+        """
+        job = self._jobs.get(job_id)
+        if job is None:
+            snapshot = self._read_snapshot(job_id)
+            if snapshot is not None and snapshot["cancellable"]:
+                # Run by another worker, which checks for the marker as the job progresses
+                (self.jobs_dir / f"{job_id}.cancel").touch()
+                snapshot["cancel_requested"] = True
+            return snapshot
+        if job.cancellable:
+            job.cancel_requested = True
+            job._task.cancel()
+        return job.to_dict()
+
+    def _job_updated(self, job: TrainingJob, force: bool) -> None:
+        """Write the job's snapshot and check for a cancel marker, at most every SNAPSHOT_INTERVAL_SECONDS unless forced."""
+        if not force and time.monotonic() - self._written_at.get(job.id, 0.0) < SNAPSHOT_INTERVAL_SECONDS:
+            return
+        self._write_snapshot(job)
+        if job.cancellable and (self.jobs_dir / f"{job.id}.cancel").exists():
+            job.cancel_requested = True
+            job._task.cancel()
+
+    def _write_snapshot(self, job: TrainingJob) -> None:
+        self._written_at[job.id] = time.monotonic()
+        path = self.jobs_dir / f"{job.id}.json"
+        tmp_path = path.with_suffix(".tmp")
+        try:
+            tmp_path.write_text(json.dumps(job.to_dict(), ensure_ascii=False, default=str))
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not write snapshot of training job {job.id}: {e}")
+
+    def _read_snapshot(self, job_id: str) -> Optional[Dict[str, Any]]:
+        # Job IDs are hex, so they cannot point outside the jobs directory
+        if not job_id.isalnum():
+            return None
+        try:
+            return json.loads((self.jobs_dir / f"{job_id}.json").read_text())
+        except (OSError, ValueError):
+            return None
+
+    def _prune(self) -> None:
+        """Forget finished jobs, and delete snapshots of any worker's jobs, older than the retention period."""
+        cutoff = time.time() - self.retention_seconds
+        for job_id, job in list(self._jobs.items()):
+            if job.status in FINISHED_STATES and job.finished_at < cutoff:
+                del self._jobs[job_id]
+                self._written_at.pop(job_id, None)
+        for path in self.jobs_dir.iterdir():
+            try:
+                if path.is_file() and path.stat().st_mtime < cutoff:
+                    path.unlink()
+            except OSError:
+                continue
+
+    def stats(self) -> Dict[str, Any]:
+        """Report queued and running jobs of this worker and how submitted jobs ended."""
+        statuses = [job.status for job in self._jobs.values()]
+        return {
+            "max_concurrent": self.max_concurrent,
+            "queued": statuses.count(JOB_QUEUED),
+            "running": statuses.count(JOB_RUNNING),
+            "submitted": self.submitted,
+            "coalesced": self.coalesced,
+            **self.finished
+        }
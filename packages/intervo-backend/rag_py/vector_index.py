@@ -0,0 +1,524 @@
+import json
+import logging
+import math
+import os
+import pickle
+import uuid
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.docstore.in_memory import InMemoryDocstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from rag_py.chunk_store import CHUNK_STORE_FILENAME, ChunkStore
+
+logger = logging.getLogger(__name__)
+
+# Supported FAISS index types
+INDEX_AUTO = "auto"
+INDEX_FLAT = "flat"
+INDEX_HNSW = "hnsw"
+INDEX_IVF_PQ = "ivf_pq"
+INDEX_TYPES = (INDEX_FLAT, INDEX_HNSW, INDEX_IVF_PQ)
+
+# Scalar quantization of stored vectors (flat and HNSW indexes)
+QUANTIZATION_NONE = "none"
+QUANTIZATION_FP16 = "fp16"
+QUANTIZATION_INT8 = "int8"
+QUANTIZATION_TYPES = (QUANTIZATION_NONE, QUANTIZATION_FP16, QUANTIZATION_INT8)
+
+# Corpus sizes at which "auto" switches to an approximate index
+DEFAULT_HNSW_MIN_CHUNKS = 20_000
+DEFAULT_IVF_PQ_MIN_CHUNKS = 500_000
+
+# Manifest describing how a vector store directory was built
+MANIFEST_FILENAME = "manifest.json"
+
+# Files written by FAISS.save_local; index.pkl is only read from stores
+# saved before the chunk store existed
+INDEX_FILENAME = "index.faiss"
+DOCSTORE_FILENAME = "index.pkl"
+
+# Sharded stores keep one index file per shard in this subdirectory
+SHARDS_DIRNAME = "shards"
+
+# Index load modes
+LOAD_MODE_MEMORY = "memory"
+LOAD_MODE_MMAP = "mmap"
+
+
+def choose_index_type(num_vectors: int, config: Dict[str, Any]) -> str:
+    """
+    Pick the FAISS index type for a corpus.
+
+    Args:
+        num_vectors: Number of vectors to index
+        config: Train config; "index_type" overrides the automatic choice
+
+    Returns:
+        One of INDEX_TYPES
+    """
+    index_type = (config.get("index_type") or INDEX_AUTO).lower()
+    if index_type in INDEX_TYPES:
+        return index_type
+    if index_type != INDEX_AUTO:
+        raise ValueError(f"Unsupported index type: {index_type}")
+
+    if num_vectors >= config.get("ivf_pq_min_chunks", DEFAULT_IVF_PQ_MIN_CHUNKS):
+        return INDEX_IVF_PQ
+    if num_vectors >= config.get("hnsw_min_chunks", DEFAULT_HNSW_MIN_CHUNKS):
+        return INDEX_HNSW
+    return INDEX_FLAT
+
+
+def choose_quantization(config: Dict[str, Any]) -> str:
+    """
+    Read the scalar quantization setting from a train config.
+
+    Args:
+        config: Train config; "quantization" is one of QUANTIZATION_TYPES
+
+    Returns:
+        One of QUANTIZATION_TYPES
+    """
+    quantization = (config.get("quantization") or QUANTIZATION_NONE).lower()
+    if quantization not in QUANTIZATION_TYPES:
+        raise ValueError(f"Unsupported quantization: {quantization}")
+    return quantization
+
+
+def _scalar_quantizer_type(quantization: str) -> int:
+    if quantization == QUANTIZATION_FP16:
+        return faiss.ScalarQuantizer.QT_fp16
+    return faiss.ScalarQuantizer.QT_8bit
+
+
+def _training_sample(vectors: np.ndarray, train_size: int) -> np.ndarray:
+    """Return a reproducible random sample of at most train_size vectors."""
+    if train_size >= len(vectors):
+        return vectors
+    sample = np.random.default_rng(0).choice(len(vectors), train_size, replace=False)
+    return vectors[np.sort(sample)]
+
+
+def _default_pq_m(dimension: int) -> int:
+    """Pick a PQ sub-quantizer count that divides the dimension."""
+    for m in (96, 64, 48, 32, 16, 8, 4, 2):
+        if m <= dimension and dimension % m == 0:
+            return m
+    return 1
+
+
+def build_index(
+    vectors: np.ndarray,
+    index_type: str,
+    config: Dict[str, Any],
+    quantization: str = QUANTIZATION_NONE
+) -> Tuple[faiss.Index, str, Dict[str, Any]]:
+    """
+    Create an empty, trained FAISS index suitable for the given vectors.
+
+    IVF and int8 scalar quantizers are trained from (a sample of) the corpus
+    itself. The returned index still has to have the vectors added to it.
+
+    Args:
+        vectors: float32 array of shape (n, dimension)
+        index_type: One of INDEX_TYPES
+        config: Train config with optional tuning keys (hnsw_m, hnsw_ef_construction,
+            hnsw_ef_search, ivf_nlist, ivf_nprobe, pq_m, ivf_train_size, sq_train_size)
+        quantization: One of QUANTIZATION_TYPES; stores flat and HNSW vectors
+            as fp16 or int8 instead of float32. IVF-PQ is already quantized
+            and ignores it.
+
+    Returns:
+        Tuple of (index, effective index type, search parameters to persist)
+    """
+    num_vectors, dimension = vectors.shape
+
+    if index_type == INDEX_IVF_PQ:
+        nlist = config.get("ivf_nlist") or min(max(int(4 * math.sqrt(num_vectors)), 16), 65536)
+        pq_m = config.get("pq_m") or _default_pq_m(dimension)
+        # 8-bit PQ codebooks need at least 256 training points, IVF at least one per list
+        if num_vectors < max(nlist, 256):
+            logger.warning(
+                f"Only {num_vectors} vectors; too few to train IVF-PQ with {nlist} lists. Using HNSW instead."
+            )
+            index_type = INDEX_HNSW
+        else:
+            quantizer = faiss.IndexFlatL2(dimension)
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, 8)
+            training_vectors = _training_sample(vectors, config.get("ivf_train_size", max(nlist * 64, 50_000)))
+            logger.info(f"Training IVF-PQ index (nlist={nlist}, m={pq_m}) on {len(training_vectors)} vectors")
+            index.train(training_vectors)
+            search_params = {"nprobe": min(config.get("ivf_nprobe", 16), nlist)}
+            return index, INDEX_IVF_PQ, search_params
+
+    if index_type == INDEX_HNSW:
+        if quantization == QUANTIZATION_NONE:
+            index = faiss.IndexHNSWFlat(dimension, config.get("hnsw_m", 32))
+        else:
+            index = faiss.IndexHNSWSQ(dimension, _scalar_quantizer_type(quantization), config.get("hnsw_m", 32))
+        index.hnsw.efConstruction = config.get("hnsw_ef_construction", 80)
+        search_params = {"efSearch": config.get("hnsw_ef_search", 64)}
+    elif quantization == QUANTIZATION_NONE:
+        return faiss.IndexFlatL2(dimension), INDEX_FLAT, {}
+    else:
+        index = faiss.IndexScalarQuantizer(dimension, _scalar_quantizer_type(quantization))
+        index_type = INDEX_FLAT
+        search_params = {}
+
+    if not index.is_trained:
+        # int8 needs each dimension's value range
+        index.train(_training_sample(vectors, config.get("sq_train_size", 100_000)))
+    return index, index_type, search_params
+
+
+def shard_bounds(num_vectors: int, num_shards: int) -> List[int]:
+    """Row boundaries of each shard, matching how IndexShards splits an add."""
+    return [i * num_vectors // num_shards for i in range(num_shards + 1)]
+
+
+def build_sharded_index(
+    vectors: np.ndarray,
+    num_shards: int,
+    config: Dict[str, Any],
+    quantization: str = QUANTIZATION_NONE
+) -> Tuple[faiss.IndexShards, str, Dict[str, Any]]:
+    """
+    Create an empty IndexShards of num_shards trained sub-indexes.
+
+    The index type is chosen from the shard size. Adding all vectors in one
+    call splits them into contiguous blocks, one per shard, and search
+    results use successive IDs, so IDs stay the vectors' row positions.
+
+    Args:
+        vectors: float32 array of shape (n, dimension)
+        num_shards: Number of shards
+        config: Train config, as for build_index
+        quantization: One of QUANTIZATION_TYPES
+
+    Returns:
+        Tuple of (index, effective index type, search parameters to persist)
+    """
+    bounds = shard_bounds(len(vectors), num_shards)
+    index_type = choose_index_type(len(vectors) // num_shards, config)
+    sharded_index = faiss.IndexShards(vectors.shape[1], True, True)
+    effective_type, search_params = index_type, {}
+    for shard in range(num_shards):
+        shard_index, effective_type, search_params = build_index(
+            vectors[bounds[shard]:bounds[shard + 1]],
+            index_type,
+            config,
+            quantization
+        )
+        sharded_index.add_shard(shard_index)
+    return sharded_index, effective_type, search_params
+
+
+def shard_indexes(index: faiss.Index) -> List[faiss.Index]:
+    """The sub-indexes of an IndexShards, or [index] for an unsharded index."""
+    if isinstance(index, faiss.IndexShards):
+        return [faiss.downcast_index(index.at(i)) for i in range(index.count())]
+    return [index]
+
+
+def add_embeddings_to_store(
+    vector_store: FAISS,
+    texts: Iterable[str],
+    vectors: np.ndarray,
+    metadatas: List[Dict[str, Any]]
+) -> List[str]:
+    """
+    Add embedded chunks to a vector store.
+
+    IndexShards would split a later add across all shards and shift every
+    shard's IDs, so sharded stores append to their last shard instead.
+
+    Returns:
+        The new chunks' docstore IDs
+    """
+    index = vector_store.index
+    if not isinstance(index, faiss.IndexShards):
+        return vector_store.add_embeddings(text_embeddings=zip(texts, vectors), metadatas=metadatas)
+
+    start = index.ntotal
+    shard_indexes(index)[-1].add(np.asarray(vectors, dtype=np.float32))
+    index.syncWithSubIndexes()
+    ids = [str(uuid.uuid4()) for _ in metadatas]
+    vector_store.docstore.add({
+        doc_id: Document(id=doc_id, page_content=text, metadata=metadata)
+        for doc_id, text, metadata in zip(ids, texts, metadatas)
+    })
+    vector_store.index_to_docstore_id.update({start + i: doc_id for i, doc_id in enumerate(ids)})
+    return ids
+
+
+def _renumber_ivf_lists(index: faiss.IndexIVF, removed_rows: np.ndarray) -> None:
+    """Shift the IDs stored in an IVF index's inverted lists down past the removed rows."""
+    invlists = index.invlists
+    for list_no in range(index.nlist):
+        size = invlists.list_size(list_no)
+        if size == 0:
+            continue
+        ids = faiss.rev_swig_ptr(invlists.get_ids(list_no), size).copy()
+        codes = faiss.rev_swig_ptr(invlists.get_codes(list_no), size * invlists.code_size).copy()
+        ids -= np.searchsorted(removed_rows, ids)
+        invlists.update_entries(list_no, 0, size, faiss.swig_ptr(ids), faiss.swig_ptr(codes))
+
+
+def remove_rows(index: faiss.Index, rows: Iterable[int]) -> None:
+    """
+    Remove rows from an index in place, renumbering later rows so IDs stay row positions.
+
+    Nothing is re-embedded or retrained. Flat indexes compact themselves;
+    IVF indexes drop the rows from their inverted lists, whose IDs are
+    then shifted down. HNSW graphs cannot drop nodes, so an HNSW index is
+    refilled with its remaining vectors decoded from its storage
+    (reconstruct_n). Sharded indexes do this shard by shard.
+
+    Args:
+        index: Index loaded into memory (mmap-loaded indexes are read-only)
+        rows: Row IDs to remove
+    """
+    removed_rows = np.unique(np.fromiter(rows, dtype=np.int64))
+    if len(removed_rows) == 0:
+        return
+    index = faiss.downcast_index(index)
+    if isinstance(index, faiss.IndexShards):
+        start = 0
+        for shard_index in shard_indexes(index):
+            end = start + shard_index.ntotal
+            in_shard = removed_rows[(removed_rows >= start) & (removed_rows < end)]
+            remove_rows(shard_index, in_shard - start)
+            start = end
+        index.syncWithSubIndexes()
+    elif isinstance(index, faiss.IndexFlatCodes):
+        index.remove_ids(removed_rows)
+    elif isinstance(index, faiss.IndexIVF):
+        index.remove_ids(removed_rows)
+        _renumber_ivf_lists(index, removed_rows)
+    elif isinstance(index, faiss.IndexHNSW):
+        kept = np.delete(index.reconstruct_n(0, index.ntotal), removed_rows, axis=0)
+        index.reset()
+        if len(kept):
+            index.add(kept)
+    else:
+        raise ValueError(f"Cannot remove rows from a {type(index).__name__} index")
+
+
+def apply_search_params(index: faiss.Index, search_params: Optional[Dict[str, Any]]) -> None:
+    """
+    Apply persisted search parameters (efSearch, nprobe) to a loaded index.
+
+    Args:
+        index: The FAISS index
+        search_params: Mapping of FAISS parameter names to values
+    """
+    if not search_params:
+        return
+    parameter_space = faiss.ParameterSpace()
+    for name, value in search_params.items():
+        try:
+            parameter_space.set_index_parameter(index, name, value)
+        except Exception as e:
+            logger.warning(f"Could not apply search parameter {name}={value}: {e}")
+
+
+def write_manifest(vector_store_path: Path, manifest: Dict[str, Any]) -> None:
+    """Write the manifest for a vector store directory."""
+    with open(Path(vector_store_path) / MANIFEST_FILENAME, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=4)
+
+
+def read_manifest(vector_store_path: Path) -> Dict[str, Any]:
+    """Read the manifest for a vector store directory, or {} if it has none."""
+    manifest_path = Path(vector_store_path) / MANIFEST_FILENAME
+    if not manifest_path.exists():
+        return {}
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception as e:
+        logger.warning(f"Could not read manifest at {manifest_path}: {e}")
+        return {}
+
+
+def _is_ivf_index_file(index_path: Path) -> bool:
+    """Whether an index file holds an IVF index; their FAISS headers start with "Iw" (or legacy "Iv")."""
+    with open(index_path, 'rb') as f:
+        return f.read(2) in (b"Iw", b"Iv")
+
+
+def can_mmap_all_index_types() -> bool:
+    """Whether this FAISS version can memory-map flat and HNSW indexes, not only IVF ones."""
+    return hasattr(faiss, "IO_FLAG_MMAP_IFC")
+
+
+def mmap_io_flags(index_path: Path) -> Optional[int]:
+    """
+    IO flags that memory-map an index file read-only, or None if this FAISS
+    version cannot map it.
+
+    IVF inverted lists are mapped with IO_FLAG_MMAP, which every FAISS
+    version supports. The IVF-PQ precomputed residual table (nlist * m * 256
+    floats, rebuilt in every process that loads the index) is skipped; search
+    then computes distance tables per query, at about the same latency.
+    Other indexes are mapped with IO_FLAG_MMAP_IFC, which covers flat and
+    scalar-quantized codes and the HNSW graph. FAISS before 1.11 has no such
+    flag, so flat and HNSW indexes (graph and vectors, about
+    (2 * hnsw_m * 4 + vector size) bytes per vector) are then read into every
+    process's heap.
+
+    Args:
+        index_path: The index file
+
+    Returns:
+        IO flags for faiss.read_index, or None
+    """
+    if _is_ivf_index_file(index_path):
+        return faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_SKIP_PRECOMPUTE_TABLE", 0)
+    if not can_mmap_all_index_types():
+        return None
+    return faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY
+
+
+def read_faiss_index(index_path: Path, load_mode: str = LOAD_MODE_MEMORY) -> faiss.Index:
+    """
+    Read an index file into memory, or memory-mapped in mmap mode.
+
+    Args:
+        index_path: The index file
+        load_mode: LOAD_MODE_MEMORY or LOAD_MODE_MMAP; falls back to memory
+            if this FAISS version cannot map the index
+
+    Returns:
+        The FAISS index
+    """
+    io_flags = 0
+    if load_mode == LOAD_MODE_MMAP:
+        io_flags = mmap_io_flags(index_path)
+        if io_flags is None:
+            logger.warning(f"This FAISS version cannot memory-map {index_path}; loading it into memory instead.")
+            io_flags = 0
+    return faiss.read_index(str(index_path), io_flags)
+
+
+def shard_paths(vector_store_path: Path) -> List[Path]:
+    """Shard index files of a sharded store in shard order, or [] if it is not sharded."""
+    shards_dir = Path(vector_store_path) / SHARDS_DIRNAME
+    if not shards_dir.exists():
+        return []
+    return sorted(shards_dir.glob("shard-*.faiss"))
+
+
+def has_faiss_index(vector_store_path: Path) -> bool:
+    """Whether a vector store directory holds a saved (single or sharded) index."""
+    return (Path(vector_store_path) / INDEX_FILENAME).exists() or bool(shard_paths(vector_store_path))
+
+
+def load_faiss_store(
+    vector_store_path: Path,
+    embeddings: Embeddings,
+    load_mode: str = LOAD_MODE_MEMORY,
+    chunk_cache_size: int = 1024
+) -> FAISS:
+    """
+    Load a FAISS vector store saved by save_faiss_store or FAISS.save_local.
+
+    In mmap mode the index's vector data is memory-mapped read-only instead of
+    being read into the heap: pages are loaded lazily and shared through the
+    OS page cache, and chunks stay in the on-disk chunk store and are fetched
+    on demand. Such a store must never be modified (adding to it aborts).
+    See mmap_io_flags for what each index type maps; with FAISS before 1.11
+    only IVF indexes can be mapped.
+    In memory mode the chunks are read into an InMemoryDocstore so the store
+    can be updated and saved again.
+
+    Args:
+        vector_store_path: Directory holding index.faiss (or shards/) and
+            chunks.sqlite (or index.pkl for stores saved by older versions)
+        embeddings: Embeddings used to embed queries
+        load_mode: LOAD_MODE_MEMORY or LOAD_MODE_MMAP
+        chunk_cache_size: Number of chunks the chunk store keeps cached in mmap mode
+
+    Returns:
+        The loaded FAISS vector store
+    """
+    vector_store_path = Path(vector_store_path)
+    paths = shard_paths(vector_store_path)
+    if paths:
+        # Searched in-process with one thread per shard; see shard_search for the process pool
+        shards = [read_faiss_index(path, load_mode) for path in paths]
+        index = faiss.IndexShards(shards[0].d, True, True)
+        for shard_index in shards:
+            index.add_shard(shard_index)
+    else:
+        index = read_faiss_index(vector_store_path / INDEX_FILENAME, load_mode)
+
+    chunk_store_path = vector_store_path / CHUNK_STORE_FILENAME
+    if chunk_store_path.exists():
+        chunk_store = ChunkStore(chunk_store_path, cache_size=chunk_cache_size)
+        if load_mode == LOAD_MODE_MMAP:
+            docstore = chunk_store
+            index_to_docstore_id = chunk_store.index_to_docstore_id
+        else:
+            docstore = InMemoryDocstore(dict(chunk_store.items()))
+            index_to_docstore_id = chunk_store.id_mapping()
+    else:
+        # Legacy stores: the docstore is a pickle we wrote ourselves at training time
+        with open(vector_store_path / DOCSTORE_FILENAME, 'rb') as f:
+            docstore, index_to_docstore_id = pickle.load(f)
+
+    return FAISS(embeddings, index, docstore, index_to_docstore_id)
+
+
+def save_faiss_store(vector_store: FAISS, vector_store_path: Path) -> None:
+    """
+    Save a FAISS vector store as index.faiss (or one shards/shard-NNN.faiss
+    per shard of an IndexShards) plus a chunks.sqlite chunk store.
+
+    Each file is written under a temporary name and renamed into place, so a
+    reader that memory-mapped the previous index keeps a valid mapping and
+    never sees a half-written file. Files of a previous layout, including a
+    legacy index.pkl, are removed.
+
+    Args:
+        vector_store: The vector store to save
+        vector_store_path: Destination directory
+    """
+    vector_store_path = Path(vector_store_path)
+    vector_store_path.mkdir(parents=True, exist_ok=True)
+
+    index_path = vector_store_path / INDEX_FILENAME
+    shards_dir = vector_store_path / SHARDS_DIRNAME
+    if isinstance(vector_store.index, faiss.IndexShards):
+        # One file per shard; IndexShards itself cannot be serialized
+        shards_dir.mkdir(exist_ok=True)
+        replacements = []
+        for shard, shard_index in enumerate(shard_indexes(vector_store.index)):
+            shard_path = shards_dir / f"shard-{shard:03d}.faiss"
+            tmp_shard_path = shard_path.with_name(shard_path.name + ".tmp")
+            faiss.write_index(shard_index, str(tmp_shard_path))
+            replacements.append((tmp_shard_path, shard_path))
+    else:
+        tmp_index_path = index_path.with_name(index_path.name + ".tmp")
+        faiss.write_index(vector_store.index, str(tmp_index_path))
+        replacements = [(tmp_index_path, index_path)]
+
+    ChunkStore.write(
+        vector_store_path / CHUNK_STORE_FILENAME,
+        vector_store.docstore,
+        vector_store.index_to_docstore_id
+    )
+    for tmp_path, path in replacements:
+        os.replace(tmp_path, path)
+
+    # Remove files left over from a differently sharded (or legacy) store
+    written = {path for _, path in replacements}
+    for stale_path in [index_path, vector_store_path / DOCSTORE_FILENAME, *shard_paths(vector_store_path)]:
+        if stale_path not in written and stale_path.exists():
+            stale_path.unlink()
@@ -23,6 +23,91 @@ const pythonClient = axios.create({
     },
 });
 
+// Store a finished training job's results once, however many status polls and watchers see it succeed
+const applyTrainingResult = async (source, job) => {
+    // Claiming the job on the source makes later polls of the same job a no-op
+    const claimed = await Source.findOneAndUpdate(
+        { _id: source._id, lastTrainingJobId: { $ne: job.job_id } },
+        { needsTraining: false, lastTrainingJobId: job.job_id }
+    );
+    if (!claimed) {
+        return;
+    }
+    console.log(`Reset needsTraining flag for source ${source._id} after successful training`);
+
+    // Store the knowledge_base_summary and topics in the Agent model
+    const result = job.result;
+    if (result && result.knowledge_base_summary) {
+        const kbSummaryData = result.knowledge_base_summary;
+        try {
+            const agentToUpdate = await Agent.findOne({ "knowledgeBase.sources": source._id });
+            if (agentToUpdate) {
+                agentToUpdate.kbArtifacts = {
+                    summary: {
+                        overall_theme: kbSummaryData.overall_theme,
+                        key_topics_entities: kbSummaryData.key_topics_entities,
+                        content_overview: kbSummaryData.content_overview,
+                        estimated_detail_level: kbSummaryData.estimated_detail_level,
+                        error_details: kbSummaryData.error_details // Will be undefined if no error
+                    },
+                    topics: kbSummaryData.knowledge_base_topics || [], // Ensure topics is an array
+                    lastTrained: job.finished_at ? new Date(job.finished_at) : new Date()
+                };
+                await agentToUpdate.save();
+                console.log(`Successfully saved kbArtifacts for agent ${agentToUpdate._id}`);
+            } else {
+                console.warn(`Could not find agent associated with source ${source._id} to save kbArtifacts.`);
+            }
+        } catch (saveError) {
+            console.error(`Error saving kbArtifacts to agent for source ${source._id}:`, saveError);
+            // Do not fail the status request if saving artifacts fails, but log it.
+        }
+    }
+};
+
+// How often, and for how long at most, a queued training job is followed in the background
+const TRAINING_WATCH_INTERVAL_MS = 5000;
+const TRAINING_WATCH_TIMEOUT_MS = 6 * 60 * 60 * 1000;
+const FINISHED_JOB_STATES = ["succeeded", "failed", "cancelled"];
+
+// Jobs this process is already following, so coalesced train requests share one watcher
+const watchedTrainingJobs = new Set();
+
+// Follow a training job until it finishes and store its results, so needsTraining is reset even if nobody polls its status
+const watchTrainingJob = async (source, jobId) => {
+    if (watchedTrainingJobs.has(jobId)) {
+        return;
+    }
+    watchedTrainingJobs.add(jobId);
+    try {
+        const deadline = Date.now() + TRAINING_WATCH_TIMEOUT_MS;
+        while (Date.now() < deadline) {
+            await new Promise((resolve) => setTimeout(resolve, TRAINING_WATCH_INTERVAL_MS));
+            let job;
+            try {
+                job = (await pythonClient.get(`/train/jobs/${encodeURIComponent(jobId)}`)).data.data;
+            } catch (error) {
+                if (error?.response?.status === 404) {
+                    return;
+                }
+                // The Python API may be restarting; try again on the next tick
+                continue;
+            }
+            if (FINISHED_JOB_STATES.includes(job.status)) {
+                if (job.kind === "train" && job.status === "succeeded") {
+                    await applyTrainingResult(source, job);
+                }
+                return;
+            }
+        }
+        console.warn(`Stopped following training job ${jobId} for source ${source._id} after ${TRAINING_WATCH_TIMEOUT_MS} ms`);
+    } catch (error) {
+        console.error(`Error following training job ${jobId} for source ${source._id}:`, error);
+    } finally {
+        watchedTrainingJobs.delete(jobId);
+    }
+};
+
 // Configure multer for file uploads
 const storage = multer.memoryStorage();
 const upload = multer({ storage });
@@ -500,53 +585,83 @@ router.post("/sources/:sourceId/train", async (req, res) => {
             pythonPayload.agent_prompt = agentPrompt;
         }
 
-        const response = await pythonClient.post("/train", pythonPayload);
+        // Training runs as a background job; a request for a source already waiting to train joins its job.
+        // Poll GET /sources/:sourceId/train/status?jobId= for progress; its results are stored once it succeeds.
+        const queued = await pythonClient.post("/train", pythonPayload);
+        watchTrainingJob(source, queued.data.job_id);
+        res.status(202).json({
+            message: queued.data.coalesced ? "Training already queued" : "Training queued",
+            data: queued.data
+        });
+    } catch (error) {
+        console.error(error);
+        if (error?.response?.data) {
+            res.status(500).json({ error: error.response.data.detail || error.response.data.message });
+            return;
+        }
+        res.status(500).json({ error: error.message });
+    }
+});
 
-        // Store the knowledge_base_summary and topics in the Agent model
-        if (response.data && response.data.knowledge_base_summary) {
-            const kbSummaryData = response.data.knowledge_base_summary;
-            try {
-                const agentToUpdate = await Agent.findOne({ "knowledgeBase.sources": source._id });
-                if (agentToUpdate) {
-                    agentToUpdate.kbArtifacts = {
-                        summary: {
-                            overall_theme: kbSummaryData.overall_theme,
-                            key_topics_entities: kbSummaryData.key_topics_entities,
-                            content_overview: kbSummaryData.content_overview,
-                            estimated_detail_level: kbSummaryData.estimated_detail_level,
-                            error_details: kbSummaryData.error_details // Will be undefined if no error
-                        },
-                        topics: kbSummaryData.knowledge_base_topics || [], // Ensure topics is an array
-                        lastTrained: new Date()
-                    };
-                    await agentToUpdate.save();
-                    console.log(`Successfully saved kbArtifacts for agent ${agentToUpdate._id}`);
-                } else {
-                    console.warn(`Could not find agent associated with source ${source._id} to save kbArtifacts.`);
-                }
-            } catch (saveError) {
-                console.error(`Error saving kbArtifacts to agent for source ${source._id}:`, saveError);
-                // Do not fail the entire request if saving artifacts fails, but log it.
-            }
+// Progress of the source's latest (or a given) training job; stores the results once it has succeeded
+router.get("/sources/:sourceId/train/status", async (req, res) => {
+    try {
+        const source = await verifySourceWorkspace(
+            req.params.sourceId,
+            req.user.id
+        );
+        if (!source) {
+            return res.status(404).json({ error: "Source not found or unauthorized" });
         }
 
-        // Reset the needsTraining flag since training completed successfully
-        try {
-            await Source.findByIdAndUpdate(source._id, { needsTraining: false });
-            console.log(`Reset needsTraining flag for source ${source._id} after successful training`);
-        } catch (resetError) {
-            console.error(`Error resetting needsTraining flag for source ${source._id}:`, resetError);
-            // Don't fail the entire request if this fails
+        // ?jobId= follows the job the train request returned, even after later jobs for the source
+        const response = req.query.jobId
+            ? await pythonClient.get(`/train/jobs/${encodeURIComponent(req.query.jobId)}`)
+            : await pythonClient.get(`/knowledgebase/${source._id}/train-job`);
+        const job = response.data.data;
+        if (job.knowledgebase_id !== source._id.toString()) {
+            return res.status(404).json({ error: "Training job not found for this source" });
+        }
+        if (job.kind === "train" && job.status === "succeeded") {
+            await applyTrainingResult(source, job);
         }
+        res.status(200).json(response.data);
+    } catch (error) {
+        console.error(error);
+        if (error?.response?.data) {
+            res.status(error.response.status).json({ error: error.response.data.detail || error.response.data.message });
+            return;
+        }
+        res.status(500).json({ error: error.message });
+    }
+});
 
-        res.status(200).json({
-            message: "Training completed successfully",
-            data: response.data
-        });
+// Cancel a training job of the source: the given one (jobId in the body or query) or its latest training run
+router.post("/sources/:sourceId/train/cancel", async (req, res) => {
+    try {
+        const source = await verifySourceWorkspace(
+            req.params.sourceId,
+            req.user.id
+        );
+        if (!source) {
+            return res.status(404).json({ error: "Source not found or unauthorized" });
+        }
+
+        // Without a jobId, an index update queued after the training run is left alone
+        const jobId = req.body?.jobId || req.query.jobId;
+        const found = jobId
+            ? await pythonClient.get(`/train/jobs/${encodeURIComponent(jobId)}`)
+            : await pythonClient.get(`/knowledgebase/${source._id}/train-job`, { params: { kind: "train" } });
+        const job = found.data.data;
+        if (job.knowledgebase_id !== source._id.toString()) {
+            return res.status(404).json({ error: "Training job not found for this source" });
+        }
+        const response = await pythonClient.post(`/train/jobs/${job.job_id}/cancel`);
+        res.status(200).json(response.data);
     } catch (error) {
         console.error(error);
         if (error?.response?.data) {
-            res.status(500).json({ error: error.response.data.detail || error.response.data.message });
+            res.status(error.response.status).json({ error: error.response.data.detail || error.response.data.message });
             return;
         }
         res.status(500).json({ error: error.message });
@@ -13,8 +13,15 @@ setup(
         "langchain-google-genai>=0.0.7",
         "langchain-groq>=0.1.2",
         "langchain-deepseek>=0.1.0",
-        "faiss-cpu>=1.8.0",
+        "faiss-cpu>=1.11.0",
         "python-dotenv>=1.0.1",
     ],
+    extras_require={
+        # Tests in rag_py/tests; moto provides the in-memory S3 they run against
+        "test": [
+            "pytest>=7.4.0",
+            "moto[s3]>=5.0.0",
+        ],
+    },
     python_requires=">=3.8",
 ) 
\ No newline at end of file
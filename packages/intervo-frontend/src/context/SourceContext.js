@@ -1,5 +1,5 @@
 "use client";
-import React, { createContext, useContext, useEffect, useState } from "react";
+import React, { createContext, useContext, useEffect, useRef, useState } from "react";
 import returnAPIUrl from "@/config/config";
 import { usePlayground } from "./AgentContext";
 
@@ -7,6 +7,24 @@ const backendAPIUrl = returnAPIUrl();
 //const backendAPIUrl = "http://localhost:3003";
 const SourceContext = createContext();
 
+// How often, and for how long at most, a training job's status is polled
+const TRAINING_POLL_INTERVAL_MS = 2000;
+const TRAINING_POLL_TIMEOUT_MS = 60 * 60 * 1000;
+
+// Resolves after ms, or rejects as soon as signal is aborted
+const wait = (ms, signal) =>
+  new Promise((resolve, reject) => {
+    const onAbort = () => {
+      clearTimeout(timer);
+      reject(signal.reason);
+    };
+    const timer = setTimeout(() => {
+      signal.removeEventListener("abort", onAbort);
+      resolve();
+    }, ms);
+    signal.addEventListener("abort", onAbort, { once: true });
+  });
+
 export function SourceProvider({ children }) {
   const [sourceId, setSourceId] = useState(null);
   const [
@@ -15,6 +33,16 @@ export function SourceProvider({ children }) {
   ] = useState(false);
   const [totalDetectedCharacters, setTotalDetectedCharacters] = useState(0);
   const [needsTraining, setNeedsTraining] = useState(false);
+  // Training status polls in flight, aborted when the provider unmounts
+  const trainingPolls = useRef(new Set());
+
+  useEffect(() => {
+    const polls = trainingPolls.current;
+    return () => {
+      polls.forEach((controller) => controller.abort());
+      polls.clear();
+    };
+  }, []);
 
   // Safely access playground context - it might not be available initially
   let aiConfig = null;
@@ -288,14 +316,52 @@ export function SourceProvider({ children }) {
         body: JSON.stringify({ dataType }),
       }
     );
-    const result = await response.json();
-
-    // If training was successful, update needsTraining state
-    if (result.success || !result.error) {
-      setNeedsTraining(false);
+    const queued = await response.json();
+    if (queued.error) {
+      return queued;
     }
 
-    return result;
+    // Training runs in the background; poll its job until it finishes.
+    // The backend stores the results when it succeeds even if polling stops first.
+    const jobId = queued.data.job_id;
+    const controller = new AbortController();
+    trainingPolls.current.add(controller);
+    const deadline = Date.now() + TRAINING_POLL_TIMEOUT_MS;
+    try {
+      while (Date.now() < deadline) {
+        await wait(TRAINING_POLL_INTERVAL_MS, controller.signal);
+        const statusResponse = await fetch(
+          `${backendAPIUrl}/knowledge-source/sources/${_id}/train/status?jobId=${jobId}`,
+          { credentials: "include", signal: controller.signal }
+        );
+        if (statusResponse.status === 404) {
+          return { error: "Training job not found" };
+        }
+        const status = await statusResponse.json();
+        if (status.error) {
+          return status;
+        }
+        const job = status.data;
+        if (job.status === "succeeded") {
+          setNeedsTraining(false);
+          return { message: "Training completed successfully", data: job.result };
+        }
+        if (job.status === "failed") {
+          return { error: job.error };
+        }
+        if (job.status === "cancelled") {
+          return { error: "Training was cancelled" };
+        }
+      }
+      return { error: "Training is still running; check back later" };
+    } catch (error) {
+      if (controller.signal.aborted) {
+        return { error: "Stopped waiting for training" };
+      }
+      throw error;
+    } finally {
+      trainingPolls.current.delete(controller);
+    }
   };
 
   // Function to set training needs when user makes edits